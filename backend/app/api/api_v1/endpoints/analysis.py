@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 import logging
 from typing import Dict, Any, Optional
 
-from app.core.database import get_db
+from app.core.llm_scheduler import llm_priority, PRIORITY_BULK
+from app.core.singleflight import analysis_flight
+from app.core.database import get_db, get_read_db
 from app.models import schemas
-from app.services import analysis_service, novel_service
+from app.services import analysis_service, cooccurrence_service, novel_service, summary_service
 from app.core.openai_client import OpenAIClient
 from app.core.config import settings
+from app.core.responses import trusted_response
+from app.core.http_cache import cached_json_response
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -26,34 +31,39 @@ async def get_relationship_graph(
     logger.info(f"处理后的force_refresh={force_refresh}")
     
     # 检查小说是否存在
-    novel = novel_service.get_novel(db=db, novel_id=data.novel_id)
+    novel = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=data.novel_id)
     if not novel:
         raise HTTPException(status_code=404, detail="小说不存在")
     
     # 如果指定了角色ID，检查角色是否存在
     if data.character_id:
-        character = novel_service.get_character(db=db, character_id=data.character_id)
+        character = await run_in_threadpool(novel_service.get_character, db=db, character_id=data.character_id)
         if not character:
             raise HTTPException(status_code=404, detail="角色不存在")
     
     # 调用分析服务获取关系网络图
     try:
-        result = await analysis_service.get_relationship_graph(
-            db=db, 
-            novel_id=data.novel_id,
-            character_id=data.character_id,
-            depth=data.depth,
-            force_refresh=force_refresh  # 使用处理后的值
-        )
-        return result
+        with llm_priority(PRIORITY_BULK):
+            result = await analysis_flight.do_with_session(
+                ("relationship_graph", data.novel_id, data.character_id, data.depth, force_refresh),
+                lambda session: analysis_service.get_relationship_graph(
+                    db=session, 
+                    novel_id=data.novel_id,
+                    character_id=data.character_id,
+                    depth=data.depth,
+                    force_refresh=force_refresh  # 使用处理后的值
+                ),
+                exclusive=("characters", data.novel_id)
+            )
+        return trusted_response(result)
     except Exception as e:
         logger.error(f"获取关系网络图失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取关系网络图失败: {str(e)}")
 
 @router.post("/timeline", response_model=schemas.TimelineResponse)
-async def get_timeline(
+def get_timeline(
     data: schemas.TimelineRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """获取时间线"""
     # 检查小说是否存在
@@ -76,16 +86,17 @@ async def get_timeline(
             start_chapter=data.start_chapter,
             end_chapter=data.end_chapter
         )
-        return timeline_data
+        return trusted_response(timeline_data)
     except Exception as e:
         logger.error(f"获取时间线失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取时间线失败: {str(e)}")
 
 @router.get("/character-journey/{novel_id}/{character_id}", response_model=dict)
-async def get_character_journey(
+def get_character_journey(
     novel_id: int,
     character_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_read_db)
 ):
     """获取角色旅程"""
     # 检查小说是否存在
@@ -99,22 +110,27 @@ async def get_character_journey(
         raise HTTPException(status_code=404, detail="角色不存在")
     
     try:
-        # 获取角色旅程数据
-        journey_data = analysis_service.get_character_journey(
-            db=db,
-            novel_id=novel_id,
-            character_id=character_id
+        # 获取角色旅程数据，数据未变化时返回304或进程内缓存的响应
+        return cached_json_response(
+            request,
+            novel_id,
+            novel.data_version,
+            lambda: analysis_service.get_character_journey(
+                db=db,
+                novel_id=novel_id,
+                character_id=character_id
+            )
         )
-        return journey_data
     except Exception as e:
         logger.error(f"获取角色旅程失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取角色旅程失败: {str(e)}")
 
 @router.get("/item-lineage/{novel_id}/{item_id}", response_model=dict)
-async def get_item_lineage(
+def get_item_lineage(
     novel_id: int,
     item_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_read_db)
 ):
     """获取物品传承历史"""
     # 检查小说是否存在
@@ -128,22 +144,27 @@ async def get_item_lineage(
         raise HTTPException(status_code=404, detail="物品不存在")
     
     try:
-        # 获取物品传承数据
-        lineage_data = analysis_service.get_item_lineage(
-            db=db,
-            novel_id=novel_id,
-            item_id=item_id
+        # 获取物品传承数据，数据未变化时返回304或进程内缓存的响应
+        return cached_json_response(
+            request,
+            novel_id,
+            novel.data_version,
+            lambda: analysis_service.get_item_lineage(
+                db=db,
+                novel_id=novel_id,
+                item_id=item_id
+            )
         )
-        return lineage_data
     except Exception as e:
         logger.error(f"获取物品传承历史失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取物品传承历史失败: {str(e)}")
 
 @router.get("/location-events/{novel_id}/{location_id}", response_model=dict)
-async def get_location_events(
+def get_location_events(
     novel_id: int,
     location_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_read_db)
 ):
     """获取地点相关事件"""
     # 检查小说是否存在
@@ -157,19 +178,151 @@ async def get_location_events(
         raise HTTPException(status_code=404, detail="地点不存在")
     
     try:
-        # 获取地点事件数据
-        events_data = analysis_service.get_location_events(
-            db=db,
-            novel_id=novel_id,
-            location_id=location_id
+        # 获取地点事件数据，数据未变化时返回304或进程内缓存的响应
+        return cached_json_response(
+            request,
+            novel_id,
+            novel.data_version,
+            lambda: analysis_service.get_location_events(
+                db=db,
+                novel_id=novel_id,
+                location_id=location_id
+            )
         )
-        return events_data
     except Exception as e:
         logger.error(f"获取地点事件失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取地点事件失败: {str(e)}")
 
+@router.get("/cooccurrence/{novel_id}/partners/{character_id}", response_model=dict)
+def get_cooccurrence_partners(
+    novel_id: int,
+    character_id: int,
+    request: Request,
+    weighting: str = Query("dice", description="权重：count、pmi、ppmi、npmi、dice"),
+    window: int = Query(0, ge=0, description="共现窗口（单元数），0表示同一单元"),
+    start_chapter: Optional[int] = Query(None, description="起始章节序号"),
+    end_chapter: Optional[int] = Query(None, description="结束章节序号"),
+    unit: str = Query("chapter", description="共现单元：chapter按章节，chunk按章节内的文本块"),
+    limit: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_read_db)
+):
+    """获取与指定角色一起出现最多的角色"""
+    novel = novel_service.get_novel(db=db, novel_id=novel_id)
+    if not novel:
+        raise HTTPException(status_code=404, detail="小说不存在")
+    
+    try:
+        return cached_json_response(
+            request,
+            novel_id,
+            novel.data_version,
+            lambda: cooccurrence_service.get_partners(
+                db=db,
+                novel_id=novel_id,
+                character_id=character_id,
+                weighting=weighting,
+                window=window,
+                start_chapter=start_chapter,
+                end_chapter=end_chapter,
+                unit=unit,
+                limit=limit
+            )
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"获取角色共现失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"获取角色共现失败: {str(e)}")
+
+@router.get("/cooccurrence/{novel_id}/heatmap", response_model=dict)
+def get_cooccurrence_heatmap(
+    novel_id: int,
+    request: Request,
+    top: int = Query(30, ge=1, le=200, description="取出场最多的角色数"),
+    characters: Optional[str] = Query(None, description="逗号分隔的角色ID，指定时忽略top"),
+    weighting: str = Query("count", description="权重：count、pmi、ppmi、npmi、dice"),
+    window: int = Query(0, ge=0, description="共现窗口（单元数），0表示同一单元"),
+    start_chapter: Optional[int] = Query(None, description="起始章节序号"),
+    end_chapter: Optional[int] = Query(None, description="结束章节序号"),
+    unit: str = Query("chapter", description="共现单元：chapter按章节，chunk按章节内的文本块"),
+    slice_size: Optional[int] = Query(None, ge=1, description="按每N章切片，返回各时间片的矩阵"),
+    db: Session = Depends(get_read_db)
+):
+    """获取角色共现热力图"""
+    novel = novel_service.get_novel(db=db, novel_id=novel_id)
+    if not novel:
+        raise HTTPException(status_code=404, detail="小说不存在")
+    
+    try:
+        character_ids = [int(value) for value in characters.split(",") if value.strip()] if characters else None
+        return cached_json_response(
+            request,
+            novel_id,
+            novel.data_version,
+            lambda: cooccurrence_service.get_heatmap(
+                db=db,
+                novel_id=novel_id,
+                top=top,
+                weighting=weighting,
+                window=window,
+                start_chapter=start_chapter,
+                end_chapter=end_chapter,
+                unit=unit,
+                slice_size=slice_size,
+                character_ids=character_ids
+            )
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"获取共现热力图失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"获取共现热力图失败: {str(e)}")
+
+@router.post("/summary-tree/{novel_id}", response_model=Dict[str, Any])
+async def build_summary_tree(
+    novel_id: int,
+    force_refresh: bool = False,
+    db: Session = Depends(get_db)
+):
+    """构建或增量更新小说的分层摘要（章节摘要、情节段摘要、全书梗概）"""
+    novel = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=novel_id)
+    if not novel:
+        raise HTTPException(status_code=404, detail="小说不存在")
+
+    try:
+        with llm_priority(PRIORITY_BULK):
+            return await analysis_flight.do_with_session(
+                ("summary_tree", novel_id, force_refresh),
+                lambda session: summary_service.build_summary_tree(
+                    db=session,
+                    novel_id=novel_id,
+                    force_refresh=force_refresh
+                ),
+                exclusive=("summary", novel_id)
+            )
+    except Exception as e:
+        logger.error(f"构建分层摘要失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"构建分层摘要失败: {str(e)}")
+
+@router.get("/summary-tree/{novel_id}", response_model=Dict[str, Any])
+def get_summary_tree(
+    novel_id: int,
+    level: Optional[int] = None,
+    db: Session = Depends(get_read_db)
+):
+    """获取已保存的分层摘要，level为0时只返回章节摘要，为1时只返回情节段摘要"""
+    novel = novel_service.get_novel(db=db, novel_id=novel_id)
+    if not novel:
+        raise HTTPException(status_code=404, detail="小说不存在")
+
+    try:
+        return trusted_response(summary_service.get_summary_tree(db=db, novel_id=novel_id, level=level))
+    except Exception as e:
+        logger.error(f"获取分层摘要失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"获取分层摘要失败: {str(e)}")
+
 @router.get("/api-status", response_model=Dict[str, Any])
-async def check_api_status():
+def check_api_status():
     """检查OpenAI API的连接状态"""
     results = OpenAIClient.check_api_connectivity()
     return results 
\ No newline at end of file
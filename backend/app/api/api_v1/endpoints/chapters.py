@@ -1,18 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Path, Query
+from fastapi import APIRouter, Depends, HTTPException, Body, Path, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db, run_write
+from app.core.pagination import decode_cursor, list_response, next_cursor, parse_fields
 from app.models.novel import Chapter
 from app.schemas.chapter import ChapterCreate, ChapterResponse, ChapterUpdate
-from app.services.chapter_service import get_chapter, get_chapters_by_novel_id, create_chapter, update_chapter, delete_chapter
+from app.services.chapter_service import CHAPTER_CURSOR_FIELDS, get_chapter, get_chapters_by_novel_id, create_chapter, update_chapter, delete_chapter
 
 router = APIRouter()
 
 @router.get("/{chapter_id}", response_model=ChapterResponse)
-async def read_chapter(
+def read_chapter(
     chapter_id: int = Path(..., title="章节ID"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """获取指定ID的章节"""
     chapter = get_chapter(db, chapter_id)
@@ -21,27 +22,36 @@ async def read_chapter(
     return chapter
 
 @router.get("/", response_model=List[ChapterResponse])
-async def read_chapters(
+def read_chapters(
+    response: Response,
     novel_id: int = Query(..., title="小说ID"),
     skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = Query(None, title="分页游标", description="上一页响应头X-Next-Cursor的值，指定时忽略skip"),
+    fields: Optional[str] = Query(None, title="返回字段", description="逗号分隔，如 id,number,title"),
+    db: Session = Depends(get_read_db)
 ):
-    """获取指定小说的所有章节"""
-    chapters = get_chapters_by_novel_id(db, novel_id, skip=skip, limit=limit)
-    return chapters
+    """获取指定小说的章节，按章节序号排序"""
+    try:
+        columns = parse_fields(fields, list(ChapterResponse.__fields__))
+        after = decode_cursor(cursor, len(CHAPTER_CURSOR_FIELDS)) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    chapters = get_chapters_by_novel_id(db, novel_id, skip=skip, limit=limit, after=after, fields=columns)
+    return list_response(response, chapters, columns, next_cursor(chapters, limit, CHAPTER_CURSOR_FIELDS))
 
 @router.post("/", response_model=ChapterResponse)
-async def create_novel_chapter(
+def create_novel_chapter(
     chapter_in: ChapterCreate,
     db: Session = Depends(get_db)
 ):
     """创建新章节"""
-    chapter = create_chapter(db, obj_in=chapter_in)
+    chapter = run_write(create_chapter, db, obj_in=chapter_in)
     return chapter
 
 @router.put("/{chapter_id}", response_model=ChapterResponse)
-async def update_chapter_api(
+def update_chapter_api(
     chapter_id: int = Path(..., title="章节ID"),
     chapter_in: ChapterUpdate = Body(...),
     db: Session = Depends(get_db)
@@ -50,11 +60,11 @@ async def update_chapter_api(
     chapter = get_chapter(db, chapter_id)
     if chapter is None:
         raise HTTPException(status_code=404, detail="章节不存在")
-    chapter = update_chapter(db, db_obj=chapter, obj_in=chapter_in)
+    chapter = run_write(update_chapter, db, db_obj=chapter, obj_in=chapter_in)
     return chapter
 
 @router.delete("/{chapter_id}")
-async def delete_chapter_api(
+def delete_chapter_api(
     chapter_id: int = Path(..., title="章节ID"),
     db: Session = Depends(get_db)
 ):
@@ -62,5 +72,5 @@ async def delete_chapter_api(
     chapter = get_chapter(db, chapter_id)
     if chapter is None:
         raise HTTPException(status_code=404, detail="章节不存在")
-    delete_chapter(db, chapter_id)
+    run_write(delete_chapter, db, chapter_id)
     return {"success": True} 
\ No newline at end of file
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Request
 from sqlalchemy.orm import Session
 from typing import List
 
-from app.core.database import get_db
+from app.core.llm_scheduler import llm_priority, PRIORITY_BULK
+from app.core.singleflight import analysis_flight
+from app.core.database import get_db, get_read_db
+from app.core.http_cache import cached_json_response
 from app.schemas.character_analysis import CharacterAnalysisResponse, CharacterPersonality, CharacterDetail, NovelCharactersResponse
+from app.services import novel_service
 from app.services.character_analysis_service import analyze_novel_characters, get_character_details, analyze_character_personality, analyze_characters_by_chapter, get_novel_characters_without_analysis, analyze_single_chapter
 
 router = APIRouter()
@@ -11,8 +15,7 @@ router = APIRouter()
 @router.get("/novels/{novel_id}/characters/analyze", response_model=List[CharacterAnalysisResponse])
 async def analyze_characters(
     novel_id: int = Path(..., title="小说ID"),
-    force_refresh: bool = Query(False, title="强制刷新"),
-    db: Session = Depends(get_db)
+    force_refresh: bool = Query(False, title="强制刷新")
 ):
     """
     分析小说中的人物角色
@@ -24,7 +27,12 @@ async def analyze_characters(
     - 角色列表，包含每个角色出现的章节信息
     """
     try:
-        result = await analyze_novel_characters(db, novel_id, force_refresh)
+        with llm_priority(PRIORITY_BULK):
+            result = await analysis_flight.do_with_session(
+                ("characters.analyze", novel_id, force_refresh),
+                lambda db: analyze_novel_characters(db, novel_id, force_refresh),
+                exclusive=("characters", novel_id)
+            )
         return result
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -35,8 +43,7 @@ async def analyze_characters(
 async def analyze_characters_by_chapter_range(
     novel_id: int = Path(..., title="小说ID"),
     start_chapter: int = Query(..., title="起始章节ID"),
-    end_chapter: int = Query(..., title="结束章节ID"),
-    db: Session = Depends(get_db)
+    end_chapter: int = Query(..., title="结束章节ID")
 ):
     """
     分析指定章节范围内的人物角色
@@ -49,7 +56,12 @@ async def analyze_characters_by_chapter_range(
     - 角色列表，包含每个角色出现的章节信息
     """
     try:
-        result = await analyze_characters_by_chapter(db, novel_id, start_chapter, end_chapter)
+        with llm_priority(PRIORITY_BULK):
+            result = await analysis_flight.do_with_session(
+                ("characters.analyze_by_chapter", novel_id, start_chapter, end_chapter),
+                lambda db: analyze_characters_by_chapter(db, novel_id, start_chapter, end_chapter),
+                exclusive=("characters", novel_id)
+            )
         return result
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -57,7 +69,8 @@ async def analyze_characters_by_chapter_range(
         raise HTTPException(status_code=500, detail=f"章节角色分析失败: {str(e)}")
 
 @router.get("/novels/{novel_id}/characters", response_model=NovelCharactersResponse)
-async def get_novel_characters(
+def get_novel_characters(
+    request: Request,
     novel_id: int = Path(..., title="小说ID"),
     db: Session = Depends(get_db)
 ):
@@ -70,20 +83,28 @@ async def get_novel_characters(
     - 小说ID和角色列表，如果没有角色则返回空列表
     """
     try:
-        characters = get_novel_characters_without_analysis(db, novel_id)
-        return {
-            "novel_id": novel_id,
-            "characters": characters
-        }
+        data_version = novel_service.get_data_version(db, novel_id)
+        if data_version is None:
+            raise ValueError("小说不存在")
+        return cached_json_response(
+            request,
+            novel_id,
+            data_version,
+            lambda: {
+                "novel_id": novel_id,
+                "characters": get_novel_characters_without_analysis(db, novel_id)
+            },
+            response_model=NovelCharactersResponse
+        )
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取角色列表失败: {str(e)}")
 
 @router.get("/characters/{character_id}/details", response_model=CharacterDetail)
-async def get_character_detail(
+def get_character_detail(
     character_id: int = Path(..., title="角色ID"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     获取角色详细信息
@@ -91,7 +112,7 @@ async def get_character_detail(
     - **character_id**: 角色ID
     """
     try:
-        result = await get_character_details(db, character_id)
+        result = get_character_details(db, character_id)
         return result
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -119,8 +140,7 @@ async def get_character_personality(
 @router.get("/novels/{novel_id}/chapters/{chapter_id}/analyze", response_model=List[CharacterAnalysisResponse])
 async def analyze_chapter_characters(
     novel_id: int = Path(..., title="小说ID"),
-    chapter_id: int = Path(..., title="章节ID"),
-    db: Session = Depends(get_db)
+    chapter_id: int = Path(..., title="章节ID")
 ):
     """
     分析单个章节的角色
@@ -132,7 +152,12 @@ async def analyze_chapter_characters(
     - 章节中的角色列表
     """
     try:
-        result = await analyze_single_chapter(db, novel_id, chapter_id)
+        with llm_priority(PRIORITY_BULK):
+            result = await analysis_flight.do_with_session(
+                ("characters.analyze_chapter", novel_id, chapter_id),
+                lambda db: analyze_single_chapter(db, novel_id, chapter_id),
+                exclusive=("characters", novel_id)
+            )
         return result
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
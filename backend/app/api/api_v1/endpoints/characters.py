@@ -1,18 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Path, Query
+from fastapi import APIRouter, Depends, HTTPException, Body, Path, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db, run_write
+from app.core.pagination import decode_cursor, list_response, next_cursor, parse_fields
 from app.models.novel import Character
 from app.schemas.character import CharacterCreate, CharacterResponse, CharacterUpdate
-from app.services.character_service import get_character, get_characters_by_novel_id, create_character, update_character, delete_character
+from app.services.character_service import CHARACTER_CURSOR_FIELDS, get_character, get_characters_by_novel_id, create_character, update_character, delete_character
 
 router = APIRouter()
 
 @router.get("/{character_id}", response_model=CharacterResponse)
-async def read_character(
+def read_character(
     character_id: int = Path(..., title="角色ID"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """获取指定ID的角色"""
     character = get_character(db, character_id)
@@ -21,27 +22,36 @@ async def read_character(
     return character
 
 @router.get("/", response_model=List[CharacterResponse])
-async def read_characters(
+def read_characters(
+    response: Response,
     novel_id: int = Query(..., title="小说ID"),
     skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = Query(None, title="分页游标", description="上一页响应头X-Next-Cursor的值，指定时忽略skip"),
+    fields: Optional[str] = Query(None, title="返回字段", description="逗号分隔，如 id,name"),
+    db: Session = Depends(get_read_db)
 ):
-    """获取指定小说的所有角色"""
-    characters = get_characters_by_novel_id(db, novel_id, skip=skip, limit=limit)
-    return characters
+    """获取指定小说的角色，按角色ID排序"""
+    try:
+        columns = parse_fields(fields, list(CharacterResponse.__fields__))
+        after = decode_cursor(cursor, len(CHARACTER_CURSOR_FIELDS)) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    characters = get_characters_by_novel_id(db, novel_id, skip=skip, limit=limit, after=after, fields=columns)
+    return list_response(response, characters, columns, next_cursor(characters, limit, CHARACTER_CURSOR_FIELDS))
 
 @router.post("/", response_model=CharacterResponse)
-async def create_novel_character(
+def create_novel_character(
     character_in: CharacterCreate,
     db: Session = Depends(get_db)
 ):
     """创建新角色"""
-    character = create_character(db, obj_in=character_in)
+    character = run_write(create_character, db, obj_in=character_in)
     return character
 
 @router.put("/{character_id}", response_model=CharacterResponse)
-async def update_character_api(
+def update_character_api(
     character_id: int = Path(..., title="角色ID"),
     character_in: CharacterUpdate = Body(...),
     db: Session = Depends(get_db)
@@ -50,11 +60,11 @@ async def update_character_api(
     character = get_character(db, character_id)
     if character is None:
         raise HTTPException(status_code=404, detail="角色不存在")
-    character = update_character(db, db_obj=character, obj_in=character_in)
+    character = run_write(update_character, db, db_obj=character, obj_in=character_in)
     return character
 
 @router.delete("/{character_id}")
-async def delete_character_api(
+def delete_character_api(
     character_id: int = Path(..., title="角色ID"),
     db: Session = Depends(get_db)
 ):
@@ -62,5 +72,5 @@ async def delete_character_api(
     character = get_character(db, character_id)
     if character is None:
         raise HTTPException(status_code=404, detail="角色不存在")
-    delete_character(db, character_id)
+    run_write(delete_character, db, character_id)
     return {"success": True} 
\ No newline at end of file
@@ -2,7 +2,9 @@ from fastapi import APIRouter, Depends, HTTPException, Query, Path
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any
 
-from app.core.database import get_db
+from app.core.llm_scheduler import llm_priority, PRIORITY_BULK
+from app.core.singleflight import analysis_flight
+from app.core.database import get_db, get_read_db
 from app.services.event_analysis_service import get_novel_events, get_event_details, analyze_event_significance
 
 router = APIRouter()
@@ -10,8 +12,7 @@ router = APIRouter()
 @router.get("/novels/{novel_id}/events", response_model=Dict[str, Any])
 async def get_events(
     novel_id: int = Path(..., title="小说ID"),
-    force_refresh: bool = Query(False, title="强制刷新"),
-    db: Session = Depends(get_db)
+    force_refresh: bool = Query(False, title="强制刷新")
 ):
     """
     获取小说中的所有事件
@@ -20,7 +21,12 @@ async def get_events(
     - **force_refresh**: 是否强制刷新分析结果
     """
     try:
-        result = await get_novel_events(db, novel_id, force_refresh)
+        with llm_priority(PRIORITY_BULK):
+            result = await analysis_flight.do_with_session(
+                ("events.list", novel_id, force_refresh),
+                lambda db: get_novel_events(db, novel_id, force_refresh),
+                exclusive=("events", novel_id)
+            )
         return result
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -28,9 +34,9 @@ async def get_events(
         raise HTTPException(status_code=500, detail=f"获取事件列表失败: {str(e)}")
 
 @router.get("/events/{event_id}/details", response_model=Dict[str, Any])
-async def get_event_detail(
+def get_event_detail(
     event_id: int = Path(..., title="事件ID"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     获取事件详细信息
@@ -38,7 +44,7 @@ async def get_event_detail(
     - **event_id**: 事件ID
     """
     try:
-        result = await get_event_details(db, event_id)
+        result = get_event_details(db, event_id)
         return result
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
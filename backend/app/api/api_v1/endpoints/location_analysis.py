@@ -2,7 +2,9 @@ from fastapi import APIRouter, Depends, HTTPException, Query, Path
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any
 
-from app.core.database import get_db
+from app.core.llm_scheduler import llm_priority, PRIORITY_BULK
+from app.core.singleflight import analysis_flight
+from app.core.database import get_db, get_read_db
 from app.schemas.location_analysis import LocationAnalysisResponse, LocationSignificance, LocationDetail, NovelLocationsResponse
 from app.models.schemas import TimelineResponse
 from app.services.location_analysis_service import analyze_novel_locations, get_location_details, analyze_location_significance, analyze_all_location_events, analyze_single_chapter, analyze_locations_by_chapter
@@ -14,8 +16,7 @@ router = APIRouter()
 @router.get("/novels/{novel_id}/locations/analyze", response_model=List[LocationAnalysisResponse])
 async def analyze_locations(
     novel_id: int = Path(..., title="小说ID"),
-    force_refresh: bool = Query(False, title="强制刷新"),
-    db: Session = Depends(get_db)
+    force_refresh: bool = Query(False, title="强制刷新")
 ):
     """
     分析小说中的地点
@@ -24,7 +25,12 @@ async def analyze_locations(
     - **force_refresh**: 是否强制刷新分析结果
     """
     try:
-        result = await analyze_novel_locations(db, novel_id, force_refresh)
+        with llm_priority(PRIORITY_BULK):
+            result = await analysis_flight.do_with_session(
+                ("locations.analyze", novel_id, force_refresh),
+                lambda db: analyze_novel_locations(db, novel_id, force_refresh),
+                exclusive=("locations", novel_id)
+            )
         return result
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -32,9 +38,9 @@ async def analyze_locations(
         raise HTTPException(status_code=500, detail=f"地点分析失败: {str(e)}")
 
 @router.get("/locations/{location_id}/details", response_model=LocationDetail)
-async def get_location_detail(
+def get_location_detail(
     location_id: int = Path(..., title="地点ID"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     获取地点详细信息
@@ -42,7 +48,7 @@ async def get_location_detail(
     - **location_id**: 地点ID
     """
     try:
-        result = await get_location_details(db, location_id)
+        result = get_location_details(db, location_id)
         return result
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -69,8 +75,7 @@ async def get_location_significance(
 
 @router.get("/novels/{novel_id}/locations", response_model=NovelLocationsResponse)
 async def get_novel_locations(
-    novel_id: int = Path(..., title="小说ID"),
-    db: Session = Depends(get_db)
+    novel_id: int = Path(..., title="小说ID")
 ):
     """
     获取小说中的所有地点
@@ -78,7 +83,12 @@ async def get_novel_locations(
     - **novel_id**: 小说ID
     """
     try:
-        locations = await analyze_novel_locations(db, novel_id, force_refresh=False)
+        # 尚未分析时会触发全书分析，与分析接口合并并按小说互斥执行
+        locations = await analysis_flight.do_with_session(
+            ("locations.analyze", novel_id, False),
+            lambda db: analyze_novel_locations(db, novel_id, force_refresh=False),
+            exclusive=("locations", novel_id)
+        )
         return {
             "novel_id": novel_id,
             "locations": locations
@@ -89,12 +99,12 @@ async def get_novel_locations(
         raise HTTPException(status_code=500, detail=f"获取地点列表失败: {str(e)}")
 
 @router.get("/locations/{location_id}/timeline", response_model=TimelineResponse)
-async def get_location_timeline(
+def get_location_timeline(
     location_id: int = Path(..., title="地点ID"),
     novel_id: int = Query(..., title="小说ID"),
     start_chapter: int = Query(None, title="开始章节"),
     end_chapter: int = Query(None, title="结束章节"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     获取地点的时间线
@@ -121,8 +131,7 @@ async def get_location_timeline(
 @router.post("/novels/{novel_id}/locations/events/analyze", response_model=Dict[str, Any])
 async def analyze_all_location_events_endpoint(
     novel_id: int = Path(..., title="小说ID"),
-    force_refresh: bool = Query(False, title="强制刷新"),
-    db: Session = Depends(get_db)
+    force_refresh: bool = Query(False, title="强制刷新")
 ):
     """
     分析小说中所有地点的相关事件
@@ -131,11 +140,16 @@ async def analyze_all_location_events_endpoint(
     - **force_refresh**: 是否强制刷新分析结果
     """
     try:
-        result = await analyze_all_location_events(
-            db=db, 
-            novel_id=novel_id, 
-            force_refresh=force_refresh
-        )
+        with llm_priority(PRIORITY_BULK):
+            result = await analysis_flight.do_with_session(
+                ("locations.analyze_events", novel_id, force_refresh),
+                lambda db: analyze_all_location_events(
+                    db=db, 
+                    novel_id=novel_id, 
+                    force_refresh=force_refresh
+                ),
+                exclusive=("events", novel_id)
+            )
         return result
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -145,8 +159,7 @@ async def analyze_all_location_events_endpoint(
 @router.get("/novels/{novel_id}/chapters/{chapter_id}/analyze", response_model=List[LocationAnalysisResponse])
 async def analyze_chapter_locations(
     novel_id: int = Path(..., title="小说ID"),
-    chapter_id: int = Path(..., title="章节ID"),
-    db: Session = Depends(get_db)
+    chapter_id: int = Path(..., title="章节ID")
 ):
     """
     分析单个章节的地点
@@ -158,7 +171,12 @@ async def analyze_chapter_locations(
     - 章节中的地点列表
     """
     try:
-        result = await analyze_single_chapter(db, novel_id, chapter_id)
+        with llm_priority(PRIORITY_BULK):
+            result = await analysis_flight.do_with_session(
+                ("locations.analyze_chapter", novel_id, chapter_id),
+                lambda db: analyze_single_chapter(db, novel_id, chapter_id),
+                exclusive=("locations", novel_id)
+            )
         return result
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -166,10 +184,10 @@ async def analyze_chapter_locations(
         raise HTTPException(status_code=500, detail=f"章节地点分析失败: {str(e)}")
 
 @router.get("/novels/{novel_id}/chapters/{chapter_id}/locations", response_model=List[LocationAnalysisResponse])
-async def get_chapter_locations(
+def get_chapter_locations(
     novel_id: int = Path(..., title="小说ID"),
     chapter_id: int = Path(..., title="章节ID"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     获取特定章节的已有地点数据(不触发分析)
@@ -215,8 +233,7 @@ async def get_chapter_locations(
 async def analyze_locations_by_chapter_range(
     novel_id: int = Path(..., title="小说ID"),
     start_chapter: int = Query(..., title="起始章节ID"),
-    end_chapter: int = Query(..., title="结束章节ID"),
-    db: Session = Depends(get_db)
+    end_chapter: int = Query(..., title="结束章节ID")
 ):
     """
     分析指定章节范围内的地点
@@ -229,7 +246,12 @@ async def analyze_locations_by_chapter_range(
     - 地点列表，包含每个地点的章节信息
     """
     try:
-        result = await analyze_locations_by_chapter(db, novel_id, start_chapter, end_chapter)
+        with llm_priority(PRIORITY_BULK):
+            result = await analysis_flight.do_with_session(
+                ("locations.analyze_by_chapter", novel_id, start_chapter, end_chapter),
+                lambda db: analyze_locations_by_chapter(db, novel_id, start_chapter, end_chapter),
+                exclusive=("locations", novel_id)
+            )
         return result
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -1,42 +1,56 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 import logging
 
-from app.core.database import get_db
-from app.models import schemas, novel
-from app.services import novel_service
+from app.core.database import get_db, get_read_db, run_serialized_write, run_write
+from app.core.pagination import decode_cursor, list_response, next_cursor, parse_fields
+from app.models import schemas
+from app.services import novel_service, statistics_service
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 @router.post("/", response_model=schemas.NovelResponse)
-async def create_novel(
+def create_novel(
     novel_data: schemas.NovelCreate,
     db: Session = Depends(get_db)
 ):
     """创建新小说"""
-    return novel_service.create_novel(db=db, novel_data=novel_data)
+    return run_write(novel_service.create_novel, db=db, novel_data=novel_data)
 
 @router.get("/", response_model=List[schemas.NovelResponse])
-async def get_novels(
+def get_novels(
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = Query(None, title="分页游标", description="上一页响应头X-Next-Cursor的值，指定时忽略skip"),
+    fields: Optional[str] = Query(None, title="返回字段", description="逗号分隔，如 id,title,author"),
+    db: Session = Depends(get_read_db)
 ):
-    """获取所有小说"""
-    return novel_service.get_novels(db=db, skip=skip, limit=limit)
+    """获取所有小说，按ID排序"""
+    try:
+        columns = parse_fields(fields, list(schemas.NovelResponse.__fields__))
+        after = decode_cursor(cursor, len(novel_service.NOVEL_CURSOR_FIELDS)) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    novels = novel_service.get_novels(db=db, skip=skip, limit=limit, after=after, fields=columns)
+    return list_response(response, novels, columns, next_cursor(novels, limit, novel_service.NOVEL_CURSOR_FIELDS))
 
 @router.get("/{novel_id}", response_model=schemas.NovelDetail)
-async def get_novel(
+def get_novel(
     novel_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """获取小说详情"""
     db_novel = novel_service.get_novel(db=db, novel_id=novel_id)
     if db_novel is None:
         raise HTTPException(status_code=404, detail="小说不存在")
     
+    # 计数在数据库端聚合，避免加载全部章节和角色
+    counts = statistics_service.get_novel_counts(db=db, novel_id=novel_id)
+    
     # 创建NovelDetail对象，包含所需的计数字段
     novel_detail = schemas.NovelDetail(
         id=db_novel.id,
@@ -46,13 +60,13 @@ async def get_novel(
         cover_url=db_novel.cover_url,
         created_at=db_novel.created_at,
         updated_at=db_novel.updated_at,
-        chapters_count=len(db_novel.chapters) if hasattr(db_novel, "chapters") else 0,
-        characters_count=len(db_novel.characters) if hasattr(db_novel, "characters") else 0
+        chapters_count=counts["total_chapters"],
+        characters_count=counts["character_count"]
     )
     return novel_detail
 
 @router.put("/{novel_id}", response_model=schemas.NovelResponse)
-async def update_novel(
+def update_novel(
     novel_id: int,
     novel_data: schemas.NovelCreate,
     db: Session = Depends(get_db)
@@ -61,10 +75,10 @@ async def update_novel(
     db_novel = novel_service.get_novel(db=db, novel_id=novel_id)
     if db_novel is None:
         raise HTTPException(status_code=404, detail="小说不存在")
-    return novel_service.update_novel(db=db, novel_id=novel_id, novel_data=novel_data)
+    return run_write(novel_service.update_novel, db=db, novel_id=novel_id, novel_data=novel_data)
 
 @router.delete("/{novel_id}")
-async def delete_novel(
+def delete_novel(
     novel_id: int,
     db: Session = Depends(get_db)
 ):
@@ -72,7 +86,7 @@ async def delete_novel(
     db_novel = novel_service.get_novel(db=db, novel_id=novel_id)
     if db_novel is None:
         raise HTTPException(status_code=404, detail="小说不存在")
-    novel_service.delete_novel(db=db, novel_id=novel_id)
+    run_write(novel_service.delete_novel, db=db, novel_id=novel_id)
     return {"message": "小说删除成功"}
 
 @router.post("/upload-file", response_model=schemas.UploadNovelResponse)
@@ -92,7 +106,7 @@ async def upload_novel_file(
             author=author,
             description=description
         )
-        db_novel = novel_service.create_novel(db=db, novel_data=novel_data)
+        db_novel = await run_serialized_write(novel_service.create_novel, db=db, novel_data=novel_data)
         
         # 读取文件内容
         content = await file.read()
@@ -141,7 +155,7 @@ async def upload_novel_content(
         raise HTTPException(status_code=500, detail=f"小说内容上传失败: {str(e)}")
 
 @router.post("/{novel_id}/chapters", response_model=schemas.ChapterResponse)
-async def create_chapter(
+def create_chapter(
     novel_id: int,
     chapter_data: schemas.ChapterCreate,
     db: Session = Depends(get_db)
@@ -154,18 +168,14 @@ async def create_chapter(
             raise HTTPException(status_code=404, detail="小说不存在")
             
         # 创建章节
-        chapter = novel.Chapter(
-            novel_id=novel_id,
-            title=chapter_data.title,
-            content=chapter_data.content,
-            number=chapter_data.number,
-            word_count=len(chapter_data.content)
+        return run_write(
+            novel_service.create_chapter,
+            db,
+            novel_id,
+            chapter_data.title,
+            chapter_data.content,
+            chapter_data.number
         )
-        db.add(chapter)
-        db.commit()
-        db.refresh(chapter)
-        
-        return chapter
     except HTTPException:
         raise
     except Exception as e:
@@ -174,19 +184,23 @@ async def create_chapter(
         raise HTTPException(status_code=500, detail=f"创建章节失败: {str(e)}")
 
 @router.get("/{novel_id}/statistics", response_model=Dict[str, Any])
-async def get_novel_statistics(
+def get_novel_statistics(
     novel_id: int,
-    db: Session = Depends(get_db)
+    include_chapters: bool = Query(False, title="包含章节实体密度"),
+    db: Session = Depends(get_read_db)
 ):
-    """获取小说统计信息"""
+    """获取小说统计信息
+    
+    - **include_chapters**: 是否返回每个章节的实体密度（每千字实体数）
+    """
     db_novel = novel_service.get_novel(db=db, novel_id=novel_id)
     if db_novel is None:
         raise HTTPException(status_code=404, detail="小说不存在")
     
-    return novel_service.get_novel_statistics(db=db, novel_id=novel_id)
+    return novel_service.get_novel_statistics(db=db, novel_id=novel_id, include_chapters=include_chapters)
 
 @router.post("/{novel_id}/extract-entities", response_model=schemas.EntityExtractionResponse)
-async def extract_novel_entities(
+def extract_novel_entities(
     novel_id: int,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
@@ -229,27 +243,8 @@ async def upload_chapter(
         filename = file.filename
         title = filename.rsplit('.', 1)[0] if '.' in filename else filename
         
-        # 如果没有提供章节号，使用当前最大章节号+1
-        if number is None:
-            # 获取当前最大章节号
-            chapters = db.query(novel.Chapter).filter(
-                novel.Chapter.novel_id == novel_id
-            ).all()
-            number = max([c.number for c in chapters], default=0) + 1
-        
-        # 创建章节
-        chapter = novel.Chapter(
-            novel_id=novel_id,
-            title=title,
-            content=text,
-            number=number,
-            word_count=len(text)
-        )
-        db.add(chapter)
-        db.commit()
-        db.refresh(chapter)
-        
-        return chapter
+        # 创建章节，没有提供章节号时在写队列中取当前最大章节号+1
+        return await run_serialized_write(novel_service.create_chapter, db, novel_id, title, text, number)
     except HTTPException:
         raise
     except Exception as e:
@@ -1,7 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+import asyncio
+import json
 import logging
+from typing import Dict, Any
 
+from app.core.llm_scheduler import llm_priority, PRIORITY_INTERACTIVE, PRIORITY_BULK
 from app.core.database import get_db
 from app.models import schemas
 from app.services import qa_service, novel_service
@@ -16,23 +22,114 @@ async def ask_question(
 ):
     """向小说提问"""
     # 检查小说是否存在
-    novel = novel_service.get_novel(db=db, novel_id=question_data.novel_id)
+    novel = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=question_data.novel_id)
     if not novel:
         raise HTTPException(status_code=404, detail="小说不存在")
     
     try:
         # 调用问答服务
-        result = await qa_service.answer_question(
-            db=db, 
-            novel_id=question_data.novel_id,
-            question=question_data.question,
-            use_rag=question_data.use_rag
-        )
+        with llm_priority(PRIORITY_INTERACTIVE):
+            result = await qa_service.answer_question(
+                db=db, 
+                novel_id=question_data.novel_id,
+                question=question_data.question,
+                use_rag=question_data.use_rag
+            )
         return result
     except Exception as e:
         logger.error(f"问答失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"问答处理失败: {str(e)}")
 
+@router.post("/ask-stream")
+async def ask_question_stream(
+    question_data: schemas.QuestionRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    向小说提问（Server-Sent Events流式返回）
+    
+    事件依次为：
+    - **sources**: 检索到的来源引用，检索完成后立即发送
+    - **token**: 回答片段，随模型生成逐段发送
+    - **done**: 回答结束，附带置信度
+    - **error**: 处理失败
+    
+    客户端断开连接时会中止上游的模型请求。
+    """
+    # 检查小说是否存在
+    novel = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=question_data.novel_id)
+    if not novel:
+        raise HTTPException(status_code=404, detail="小说不存在")
+    
+    async def event_stream():
+        try:
+            async for item in qa_service.stream_answer(
+                db=db,
+                novel_id=question_data.novel_id,
+                question=question_data.question,
+                use_rag=question_data.use_rag
+            ):
+                yield format_sse(item["event"], item["data"])
+        except asyncio.CancelledError:
+            logger.info(f"客户端断开，已中止流式问答: novel_id={question_data.novel_id}")
+            raise
+        except Exception as e:
+            logger.error(f"流式问答失败: {str(e)}")
+            yield format_sse("error", {"detail": f"问答处理失败: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 关闭反向代理缓冲
+        }
+    )
+
+@router.post("/ask-batch")
+async def ask_questions_batch(
+    batch_data: schemas.BatchQuestionRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    批量向小说提问（NDJSON流式返回）
+    
+    每个问题回答完成后立即返回一行JSON，顺序为完成顺序，用index对应请求中的问题位置。
+    成功的行包含answer、sources、confidence和cached，失败的行包含error。
+    批量问答以批处理优先级排队，不会挤占交互式提问的配额。
+    """
+    # 检查小说是否存在
+    novel = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=batch_data.novel_id)
+    if not novel:
+        raise HTTPException(status_code=404, detail="小说不存在")
+    
+    async def result_stream():
+        try:
+            with llm_priority(PRIORITY_BULK):
+                async for item in qa_service.answer_questions_batch(
+                    db=db,
+                    novel_id=batch_data.novel_id,
+                    questions=batch_data.questions,
+                    use_rag=batch_data.use_rag
+                ):
+                    yield json.dumps(item, ensure_ascii=False) + "\n"
+        except asyncio.CancelledError:
+            logger.info(f"客户端断开，已取消批量问答: novel_id={batch_data.novel_id}")
+            raise
+        except Exception as e:
+            logger.error(f"批量问答失败: {str(e)}")
+            yield json.dumps({"error": f"批量问答处理失败: {str(e)}"}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"}
+    )
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @router.post("/extract-entities", response_model=schemas.EntityExtractionResponse)
 async def extract_entities(
     data: schemas.EntityExtractionRequest,
@@ -42,12 +139,13 @@ async def extract_entities(
     try:
         # 如果提供了小说ID，先检查小说是否存在
         if data.novel_id:
-            novel = novel_service.get_novel(db=db, novel_id=data.novel_id)
+            novel = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=data.novel_id)
             if not novel:
                 raise HTTPException(status_code=404, detail="小说不存在")
         
         # 调用实体提取服务
-        result = await qa_service.extract_entities(text=data.text)
+        with llm_priority(PRIORITY_INTERACTIVE):
+            result = await qa_service.extract_entities(text=data.text)
         return result
     except Exception as e:
         logger.error(f"实体提取失败: {str(e)}")
@@ -62,12 +160,13 @@ async def analyze_text(
     try:
         # 如果提供了小说ID，先检查小说是否存在
         if data.novel_id:
-            novel = novel_service.get_novel(db=db, novel_id=data.novel_id)
+            novel = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=data.novel_id)
             if not novel:
                 raise HTTPException(status_code=404, detail="小说不存在")
         
         # 调用文本分析服务
-        result = await qa_service.analyze_text(text=data.text)
+        with llm_priority(PRIORITY_INTERACTIVE):
+            result = await qa_service.analyze_text(text=data.text)
         return result
     except Exception as e:
         logger.error(f"文本分析失败: {str(e)}")
@@ -0,0 +1,149 @@
+"""
+问答语义缓存
+
+按小说缓存已回答过的问题。新问题先按规范化后的文本精确匹配，未命中时
+与已缓存问题的向量计算余弦相似度，超过阈值即复用答案和来源引用。
+
+每本小说的缓存记录创建时的内容版本，章节内容变化后版本递增，旧答案整体作废。
+向量预先归一化并按行存放在一个矩阵中，一次矩阵乘法即可完成全部比较。
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import copy
+import logging
+import re
+import threading
+import time
+
+import numpy as np
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def normalize_question(question: str) -> str:
+    """去掉空白和句末标点，使只有标点差异的问题能精确命中"""
+    return re.sub(r"[\s？?！!。.，,]+", "", question).lower()
+
+class _NovelAnswers:
+    """单本小说（同一问答模式下）的缓存条目"""
+
+    def __init__(self, content_version: int, dimension: int):
+        self.content_version = content_version
+        self.vectors = np.empty((0, dimension), dtype=np.float32)
+        self.entries: List[Dict[str, Any]] = []
+        self.exact: Dict[str, int] = {}
+
+    def remove_oldest(self, count: int) -> None:
+        self.vectors = self.vectors[count:]
+        self.entries = self.entries[count:]
+        self.exact = {entry["key"]: index for index, entry in enumerate(self.entries)}
+
+class SemanticAnswerCache:
+    """按小说分组的问答语义缓存，可在多个线程中使用"""
+
+    def __init__(self, threshold: float, max_entries: int, ttl: float):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._novels: Dict[Tuple[int, bool], _NovelAnswers] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, novel_id: int, use_rag: bool, content_version: int) -> Optional[_NovelAnswers]:
+        bucket = self._novels.get((novel_id, use_rag))
+        if bucket is not None and bucket.content_version != content_version:
+            # 小说内容已变化，旧答案全部作废
+            del self._novels[(novel_id, use_rag)]
+            logger.info(f"小说内容版本变化，清空问答缓存: novel_id={novel_id}")
+            return None
+        return bucket
+
+    def _fresh(self, entry: Dict[str, Any]) -> bool:
+        return not self.ttl or time.time() - entry["created_at"] <= self.ttl
+
+    def lookup_exact(self, novel_id: int, use_rag: bool, content_version: int, question: str) -> Optional[Dict[str, Any]]:
+        """按规范化后的问题文本查找，不需要向量"""
+        with self._lock:
+            bucket = self._bucket(novel_id, use_rag, content_version)
+            if bucket is None:
+                return None
+            index = bucket.exact.get(normalize_question(question))
+            if index is None or not self._fresh(bucket.entries[index]):
+                return None
+            metrics.CACHE_REQUESTS.inc(cache="answer", result="exact_hit")
+            return copy.deepcopy(bucket.entries[index]["answer"])
+
+    def lookup(
+        self,
+        novel_id: int,
+        use_rag: bool,
+        content_version: int,
+        embedding: Sequence[float]
+    ) -> Optional[Dict[str, Any]]:
+        """查找与问题向量最相似且超过阈值的已缓存答案"""
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return None
+        query /= norm
+
+        with self._lock:
+            bucket = self._bucket(novel_id, use_rag, content_version)
+            if bucket is None or not bucket.entries or bucket.vectors.shape[1] != query.shape[0]:
+                metrics.CACHE_REQUESTS.inc(cache="answer", result="miss")
+                return None
+            scores = bucket.vectors @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold or not self._fresh(bucket.entries[best]):
+                metrics.CACHE_REQUESTS.inc(cache="answer", result="miss")
+                return None
+            metrics.CACHE_REQUESTS.inc(cache="answer", result="semantic_hit")
+            logger.info(f"问答缓存命中: novel_id={novel_id}, 相似度={scores[best]:.3f}, 原问题={bucket.entries[best]['question']}")
+            return copy.deepcopy(bucket.entries[best]["answer"])
+
+    def store(
+        self,
+        novel_id: int,
+        use_rag: bool,
+        content_version: int,
+        question: str,
+        embedding: Optional[Sequence[float]],
+        answer: Dict[str, Any]
+    ) -> None:
+        """缓存一条答案，超过条数上限时淘汰最早的条目"""
+        if embedding is None:
+            return
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return
+        vector /= norm
+
+        with self._lock:
+            bucket = self._bucket(novel_id, use_rag, content_version)
+            if bucket is None or bucket.vectors.shape[1] != vector.shape[0]:
+                bucket = self._novels[(novel_id, use_rag)] = _NovelAnswers(content_version, vector.shape[0])
+            if len(bucket.entries) >= self.max_entries:
+                bucket.remove_oldest(len(bucket.entries) - self.max_entries + 1)
+
+            key = normalize_question(question)
+            bucket.exact[key] = len(bucket.entries)
+            bucket.entries.append({
+                "key": key,
+                "question": question,
+                "answer": copy.deepcopy(answer),
+                "created_at": time.time()
+            })
+            bucket.vectors = np.vstack([bucket.vectors, vector[np.newaxis, :]])
+
+    def invalidate(self, novel_id: int) -> None:
+        """清空指定小说的缓存"""
+        with self._lock:
+            for key in [key for key in self._novels if key[0] == novel_id]:
+                del self._novels[key]
+
+answer_cache = SemanticAnswerCache(
+    threshold=settings.ANSWER_CACHE_SIMILARITY,
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl=settings.ANSWER_CACHE_TTL
+)
@@ -0,0 +1,259 @@
+"""
+章节切分
+
+对整部小说文本做一次线性扫描，识别卷、章（回）、节以及序章、楔子、番外等标题行，
+返回各章节在原文中的偏移区间（ChapterSpan），不复制正文；需要时再按偏移切片。
+
+标题格式由一组可插拔的标题文法（HeadingGrammar）描述，所有文法合并为一个正则，
+每个位置只尝试一次。标题中的序号支持阿拉伯数字、全角数字和中文数字（含大写数字），
+例如 "第一百零五章"、"第贰拾回"、"第 12 章"。卷、章、节标记之后必须是空白、标点或行尾，
+"第三回合结束" 这类以序号开头的正文不会被当成标题。
+
+层级规则：
+- 卷（level 0）不单独成章，卷序号记录在其后章节的volume上；卷标题和卷首语（卷标题与该卷
+  第一章之间的文本）并入该卷第一章正文的开头。卷之后没有章节、但有卷首语时，卷单独作为一个章节
+- 章（level 1）和节（level 2）同时出现时，节视为章内小标题，不切分；
+  只有节时以节为章节单位
+- 第一个标题之前的文本（书名、简介等）作为前言返回，由调用方决定是否保留
+
+只依赖标准库。
+"""
+from typing import Iterable, List, NamedTuple, Optional, Pattern, Sequence, Tuple
+import re
+
+# 中文数字
+_DIGITS = {
+    "零": 0, "〇": 0, "○": 0,
+    "一": 1, "壹": 1, "二": 2, "贰": 2, "两": 2, "三": 3, "叁": 3,
+    "四": 4, "肆": 4, "五": 5, "伍": 5, "六": 6, "陆": 6,
+    "七": 7, "柒": 7, "八": 8, "捌": 8, "九": 9, "玖": 9,
+}
+_UNITS = {"十": 10, "拾": 10, "百": 100, "佰": 100, "千": 1000, "仟": 1000}
+_BIG_UNITS = {"万": 10 ** 4, "亿": 10 ** 8}
+_FULLWIDTH = str.maketrans("０１２３４５６７８９", "0123456789")
+
+# 标题序号可以使用的字符
+NUMERAL = "[0-9０-９" + "".join(_DIGITS) + "".join(_UNITS) + "".join(_BIG_UNITS) + "]+"
+
+# 标题行中序号之后的标题文字不超过该长度，且不含句末标点，避免把正文句子当成标题
+MAX_TITLE_CHARS = 40
+_SENTENCE_PUNCTUATION = re.compile(r"[。！？；!?;…]")
+_NON_SPACE = re.compile(r"\S")
+
+def parse_chinese_number(text: str) -> Optional[int]:
+    """把阿拉伯数字、全角数字或中文数字转换为整数，无法解析时返回None
+
+    >>> parse_chinese_number("一百零五"), parse_chinese_number("十二"), parse_chinese_number("二〇二三")
+    (105, 12, 2023)
+    """
+    text = text.strip().translate(_FULLWIDTH)
+    if not text:
+        return None
+    if text.isdigit():
+        return int(text)
+
+    if all(ch in _DIGITS for ch in text):
+        # 没有单位时按位读，如 "二〇二三"
+        value = 0
+        for ch in text:
+            value = value * 10 + _DIGITS[ch]
+        return value
+
+    total, section, digit = 0, 0, None
+    for ch in text:
+        if ch in _DIGITS:
+            digit = _DIGITS[ch]
+        elif ch in _UNITS:
+            # "十二" 省略了前面的 "一"
+            section += (1 if digit is None else digit) * _UNITS[ch]
+            digit = None
+        elif ch in _BIG_UNITS:
+            section += digit or 0
+            digit = None
+            if _BIG_UNITS[ch] > total:
+                total = (total + section) * _BIG_UNITS[ch]
+            else:
+                total += section * _BIG_UNITS[ch]
+            section = 0
+        else:
+            return None
+    return total + section + (digit or 0)
+
+class HeadingGrammar(NamedTuple):
+    """标题文法
+
+    pattern为匹配标题行开头的正则片段，可用 {num} 表示序号的位置；
+    level为层级：0卷，1章/回，2节。
+    """
+    name: str
+    pattern: str
+    level: int
+
+# 标题标记之后允许的字符：空白、标点或行尾，避免把 "第三回合"、"第二部分" 这类正文当成标题
+_HEADING_END = r"(?=[ \t\r　:：·、,，.．\-—_(（\[【「『]|$)"
+
+DEFAULT_GRAMMARS: Tuple[HeadingGrammar, ...] = (
+    HeadingGrammar("volume", r"第[ \t　]*{num}[ \t　]*[卷部集]" + _HEADING_END, 0),
+    HeadingGrammar("chapter", r"第[ \t　]*{num}[ \t　]*[章回]" + _HEADING_END, 1),
+    # 特殊标题后还可以直接跟序号，如 "番外1"
+    HeadingGrammar("special", r"(?:序章|序言|序幕|楔子|引子|终章|尾声|后记|番外篇?)(?=[ \t　:：·、.\-—]|[0-9０-９一二三四五六七八九十]|$)", 1),
+    HeadingGrammar("english", r"(?i:chapter)[ \t]+{num}", 1),
+    HeadingGrammar("section", r"第[ \t　]*{num}[ \t　]*节" + _HEADING_END, 2),
+)
+
+class ChapterSpan(NamedTuple):
+    """章节在原文中的区间
+
+    start为标题行起始偏移，title_end为标题行结束偏移（不含换行），
+    end为章节结束偏移（下一个章节标题的起始或文本末尾）。前言没有标题，start == title_end。
+    每卷第一章的lead_start、lead_end为并入正文开头的卷标题和卷首语的区间。
+    """
+    start: int
+    title_end: int
+    end: int
+    grammar: str
+    ordinal: Optional[int]
+    volume: Optional[int] = None
+    lead_start: Optional[int] = None
+    lead_end: Optional[int] = None
+
+    @property
+    def body_start(self) -> int:
+        return self.title_end
+
+    def title(self, text: str) -> str:
+        return text[self.start:self.title_end].strip()
+
+    def body(self, text: str) -> str:
+        body = text[self.body_start:self.end].strip()
+        if self.lead_start is None:
+            return body
+        lead = text[self.lead_start:self.lead_end].strip()
+        return f"{lead}\n\n{body}" if body else lead
+
+    def is_blank(self, text: str) -> bool:
+        """正文是否只有空白，不复制正文"""
+        return _NON_SPACE.search(text, self.body_start, self.end) is None
+
+class _Heading(NamedTuple):
+    start: int
+    end: int
+    level: int
+    grammar: str
+    ordinal: Optional[int]
+
+class ChapterSplitter:
+    """按标题文法切分章节，编译后的正则可重复使用"""
+
+    def __init__(self, grammars: Sequence[HeadingGrammar] = DEFAULT_GRAMMARS, max_title_chars: int = MAX_TITLE_CHARS):
+        self.grammars = tuple(grammars)
+        self.max_title_chars = max_title_chars
+        self.pattern = self._compile(self.grammars)
+
+    @staticmethod
+    def _compile(grammars: Sequence[HeadingGrammar]) -> Pattern:
+        alternatives = []
+        for i, grammar in enumerate(grammars):
+            body = grammar.pattern.replace("{num}", f"(?P<n{i}>{NUMERAL})")
+            alternatives.append(f"(?P<g{i}>{body})")
+        return re.compile(r"^[ \t　]*(?:" + "|".join(alternatives) + r")(?P<rest>[^\n]*)", re.MULTILINE)
+
+    def headings(self, text: str) -> Iterable[_Heading]:
+        """扫描全文，依次产出通过校验的标题行"""
+        grammars = self.grammars
+        for match in self.pattern.finditer(text):
+            rest = match.group("rest").rstrip()
+            if len(rest) > self.max_title_chars or _SENTENCE_PUNCTUATION.search(rest):
+                continue
+            for i, grammar in enumerate(grammars):
+                if match.start(f"g{i}") < 0:
+                    continue
+                numeral = match.group(f"n{i}") if f"n{i}" in self.pattern.groupindex else None
+                yield _Heading(
+                    start=match.start(),
+                    end=match.start("rest") + len(rest),
+                    level=grammar.level,
+                    grammar=grammar.name,
+                    ordinal=parse_chinese_number(numeral) if numeral else None,
+                )
+                break
+
+    def split(self, text: str, include_preamble: bool = True, skip_blank: bool = True) -> List[ChapterSpan]:
+        """切分章节
+
+        Args:
+            text: 小说全文
+            include_preamble: 第一个章节标题之前有非空白文本时，是否作为前言返回
+            skip_blank: 跳过正文为空的章节（如文首的目录）
+
+        Returns:
+            按原文顺序排列的章节区间；没有识别到任何章节标题时返回覆盖全文的单个区间
+        """
+        headings = list(self.headings(text))
+        chapter_levels = [h.level for h in headings if h.level > 0]
+        if not chapter_levels:
+            if _NON_SPACE.search(text) is None:
+                return []
+            return [ChapterSpan(0, 0, len(text), "preamble", None)]
+        chapter_level = min(chapter_levels)
+
+        # 只保留卷和章节级标题，更低层级的小标题留在正文中
+        boundaries = [h for h in headings if h.level == 0 or h.level == chapter_level]
+        spans: List[ChapterSpan] = []
+        volume = None
+        # 尚未并入章节的卷标题区间
+        lead: Optional[ChapterSpan] = None
+
+        def flush_lead() -> None:
+            # 卷之后没有章节时，有卷首语的卷单独成章；只有标题的卷（如目录中的卷）丢弃
+            if lead is not None and not (skip_blank and lead.is_blank(text)):
+                spans.append(lead)
+
+        for i, heading in enumerate(boundaries):
+            end = boundaries[i + 1].start if i + 1 < len(boundaries) else len(text)
+            if heading.level == 0:
+                flush_lead()
+                volume = heading.ordinal
+                lead = ChapterSpan(heading.start, heading.end, end, heading.grammar, heading.ordinal, volume)
+                continue
+            span = ChapterSpan(heading.start, heading.end, end, heading.grammar, heading.ordinal, volume)
+            if skip_blank and span.is_blank(text):
+                continue
+            if lead is not None:
+                span = span._replace(lead_start=lead.start, lead_end=lead.end)
+                lead = None
+            spans.append(span)
+        flush_lead()
+
+        if include_preamble:
+            preamble = ChapterSpan(0, 0, boundaries[0].start, "preamble", None)
+            if not preamble.is_blank(text):
+                spans.insert(0, preamble)
+        return spans
+
+_default_splitter = ChapterSplitter()
+
+def split_chapters(text: str, include_preamble: bool = True, skip_blank: bool = True) -> List[ChapterSpan]:
+    """使用默认标题文法切分章节，参数见ChapterSplitter.split"""
+    return _default_splitter.split(text, include_preamble=include_preamble, skip_blank=skip_blank)
+
+def chapter_records(text: str, title_override: Optional[str] = None) -> List[Tuple[str, str]]:
+    """切分章节并确定每章的标题，返回 (标题, 正文) 列表
+
+    Args:
+        text: 小说全文
+        title_override: 只有一个章节时使用的标题（可选）
+    """
+    spans = split_chapters(text)
+    records = []
+    for span in spans:
+        if len(spans) == 1 and title_override:
+            # 如果只有一个章节且有自定义标题，则使用自定义标题
+            title = title_override
+        elif span.grammar == "preamble":
+            # 没有章节标题时整部作为第1章，否则为首个标题之前的前言
+            title = "第1章" if len(spans) == 1 else "前言"
+        else:
+            title = span.title(text)
+        records.append((title, span.body(text)))
+    return records
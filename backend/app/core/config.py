@@ -16,6 +16,19 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "postgres")
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "novel_ai")
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
+    # 连接池大小（SQLite不使用），需覆盖线程池中并发执行的同步数据库操作（anyio默认40个工作线程）
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 20))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 20))
+    
+    # 嵌入式SQLite配置，USE_SQLITE为真时非DEBUG环境也使用SQLite（单机部署）
+    USE_SQLITE: bool = os.getenv("USE_SQLITE", "false").lower() in ("true", "1", "t")
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "./novel_ai.db")
+    SQLITE_WAL: bool = os.getenv("SQLITE_WAL", "true").lower() in ("true", "1", "t")  # WAL模式下读写互不阻塞
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))  # 内存映射大小（字节）
+    SQLITE_CACHE_SIZE_KB: int = int(os.getenv("SQLITE_CACHE_SIZE_KB", 64 * 1024))  # 每个连接的页缓存（KB）
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 10000))  # 等待写锁的超时时间
+    SQLITE_READ_POOL_SIZE: int = int(os.getenv("SQLITE_READ_POOL_SIZE", 20))  # 只读连接池大小
     
     # Redis配置
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
@@ -31,12 +44,76 @@ class Settings(BaseSettings):
     OPENAI_API_MODEL: str = os.getenv("OPENAI_API_MODEL", "gpt-3.5-turbo")
     USE_MOCK_DATA: bool = os.getenv("USE_MOCK_DATA", "false").lower() in ("true", "1", "t")
     
+    # 模型调用调度配置
+    LLM_REQUESTS_PER_MINUTE: int = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 500))
+    LLM_TOKENS_PER_MINUTE: int = int(os.getenv("LLM_TOKENS_PER_MINUTE", 200000))
+    LLM_MODEL_LIMITS: Dict[str, Dict[str, int]] = {}  # 按模型覆盖限额，如 {"gpt-4": {"rpm": 100, "tpm": 40000}}
+    LLM_INITIAL_CONCURRENCY: int = int(os.getenv("LLM_INITIAL_CONCURRENCY", 4))
+    LLM_MIN_CONCURRENCY: int = 1
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", 32))
+    LLM_TARGET_LATENCY: float = float(os.getenv("LLM_TARGET_LATENCY", 60.0))  # 超过该延迟（秒）时收缩并发
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", 4))
+    LLM_RETRY_BASE_DELAY: float = float(os.getenv("LLM_RETRY_BASE_DELAY", 2.0))
+    LLM_RETRY_MAX_DELAY: float = float(os.getenv("LLM_RETRY_MAX_DELAY", 60.0))
+    LLM_REQUEST_TIMEOUT: float = float(os.getenv("LLM_REQUEST_TIMEOUT", 120.0))
+    LLM_DEFAULT_COMPLETION_TOKENS: int = 1000  # 未指定max_tokens时按此估算输出长度
+    
     # 小说处理配置
     CHUNK_SIZE: int = 1000  # 文本分块大小
     CHUNK_OVERLAP: int = 200  # 分块重叠大小
+    ANALYSIS_WINDOW_TOKENS: int = int(os.getenv("ANALYSIS_WINDOW_TOKENS", 12000))  # 单次分析请求的正文token上限
+    ANALYSIS_PACK_TOKENS: int = int(os.getenv("ANALYSIS_PACK_TOKENS", 10000))  # 打包分析时每个请求的章节正文token上限
+    ANALYSIS_PACK_MAX_CHAPTERS: int = int(os.getenv("ANALYSIS_PACK_MAX_CHAPTERS", 6))  # 打包分析时每个请求最多包含的章节数
+    
+    # 实体预扫描配置
+    ENTITY_PREPASS_MODE: str = os.getenv("ENTITY_PREPASS_MODE", "delta")  # 没有新实体候选的章节：off照常分析，skip不调用模型，delta使用精简提示词
+    ENTITY_PREPASS_MIN_MENTIONS: int = int(os.getenv("ENTITY_PREPASS_MIN_MENTIONS", 2))  # 新实体候选在一段文本中至少出现的次数
+    
+    # 角色共现配置
+    COOCCURRENCE_CACHE_SIZE: int = int(os.getenv("COOCCURRENCE_CACHE_SIZE", 8))  # 进程内缓存的出场矩阵数量
+    COOCCURRENCE_CHUNK_CHARS: int = int(os.getenv("COOCCURRENCE_CHUNK_CHARS", 1000))  # 按文本块统计共现时每块的字数上限
+    
+    # 分层摘要配置
+    SUMMARY_ARC_SIZE: int = int(os.getenv("SUMMARY_ARC_SIZE", 20))  # 每个情节段包含的章节数
+    SUMMARY_CONCURRENCY: int = int(os.getenv("SUMMARY_CONCURRENCY", 8))  # 同时进行的摘要请求数
+    SUMMARY_INPUT_TOKENS: int = int(os.getenv("SUMMARY_INPUT_TOKENS", 8000))  # 单次摘要请求的输入token上限，超长章节分段摘要
+    SUMMARY_CHAPTER_TOKENS: int = int(os.getenv("SUMMARY_CHAPTER_TOKENS", 300))  # 章节摘要的输出token上限
+    SUMMARY_ARC_TOKENS: int = int(os.getenv("SUMMARY_ARC_TOKENS", 600))  # 情节段摘要的输出token上限
+    SUMMARY_NOVEL_TOKENS: int = int(os.getenv("SUMMARY_NOVEL_TOKENS", 1200))  # 全书梗概的输出token上限
+    COMPACT_CONTEXT_TOKENS: int = int(os.getenv("COMPACT_CONTEXT_TOKENS", 8000))  # 全书级提示词使用的摘要上下文token上限
     
     # 向量配置
     VECTOR_DIMENSION: int = 1536  # OpenAI embedding维度
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", 256))  # 单次请求的文本条数上限，接口上限为2048
+    EMBEDDING_BATCH_MAX_TOKENS: int = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", 100000))  # 单次请求的token总数上限
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("true", "1", "t")
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")  # 向量缓存文件，float16存储
+    EMBEDDING_CACHE_MEMORY_ITEMS: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", 20000))  # 内存热点缓存条数
+
+    # 问答语义缓存配置
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("true", "1", "t")
+    ANSWER_CACHE_SIMILARITY: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))  # 问题向量余弦相似度达到该值时复用答案
+    ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 2000))  # 每本小说缓存的问题数上限
+    ANSWER_CACHE_TTL: float = float(os.getenv("ANSWER_CACHE_TTL", 7 * 24 * 3600))  # 答案有效期（秒），0表示不过期
+    
+    # 运行指标配置
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() in ("true", "1", "t")  # 是否采集并导出 /metrics
+    SQL_ECHO: bool = os.getenv("SQL_ECHO", "false").lower() in ("true", "1", "t")  # 是否逐条输出SQL日志（开销较大，仅用于调试）
+    
+    # 响应序列化和压缩配置
+    TRUST_SERVICE_OUTPUT: bool = os.getenv("TRUST_SERVICE_OUTPUT", "true").lower() in ("true", "1", "t")  # 大结果接口跳过response_model重复校验
+    RESPONSE_COMPRESSION_ENABLED: bool = os.getenv("RESPONSE_COMPRESSION_ENABLED", "true").lower() in ("true", "1", "t")
+    RESPONSE_COMPRESSION_MIN_SIZE: int = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", 1024))  # 小于该字节数的响应不压缩
+    GZIP_LEVEL: int = int(os.getenv("GZIP_LEVEL", 5))
+    BROTLI_QUALITY: int = int(os.getenv("BROTLI_QUALITY", 4))  # 0-11，4以上压缩率提升有限而耗时明显增加
+
+    # 只读分析接口的HTTP缓存配置（ETag + 进程内响应缓存）
+    HTTP_CACHE_ENABLED: bool = os.getenv("HTTP_CACHE_ENABLED", "true").lower() in ("true", "1", "t")
+    HTTP_CACHE_MAX_ENTRIES: int = int(os.getenv("HTTP_CACHE_MAX_ENTRIES", 1000))  # 进程内缓存的响应条数上限
+    HTTP_CACHE_MAX_BYTES: int = int(os.getenv("HTTP_CACHE_MAX_BYTES", 64 * 1024 * 1024))  # 进程内缓存的响应体总字节数上限
+    HTTP_CACHE_CONTROL: str = os.getenv("HTTP_CACHE_CONTROL", "no-cache")  # 默认要求客户端和CDN每次携带ETag重新验证
+    ETAG_SALT: str = os.getenv("ETAG_SALT", "")  # 接口输出格式变化而数据未变时，修改该值使旧ETag全部失效
     
     # 开发模式配置
     DEBUG: bool = True
@@ -47,9 +124,9 @@ class Settings(BaseSettings):
 
     def __init__(self, **data: Any):
         super().__init__(**data)
-        # 在开发环境中使用SQLite
-        if self.DEBUG:
-            self.SQLALCHEMY_DATABASE_URI = "sqlite:///./novel_ai.db"
+        # 在开发环境或单机部署中使用SQLite
+        if self.DEBUG or self.USE_SQLITE:
+            self.SQLALCHEMY_DATABASE_URI = f"sqlite:///{self.SQLITE_PATH}"
         else:
             self.SQLALCHEMY_DATABASE_URI = f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
 
@@ -0,0 +1,148 @@
+"""
+角色共现矩阵
+
+出场矩阵P为 角色×单元 的稀疏0/1矩阵，单元是章节或章节内的文本块（按原文顺序）。
+共现计数 C = W·Wᵀ，其中W是按窗口展开后的出场矩阵：角色在第u个单元前后window个单元内出场，
+即视为在u中"在场"。window为0时 W = P，C[i, j]为两个角色同时出场的单元数，
+对角线C[i, i]为角色出场（在场）的单元数。
+
+全部运算都是稀疏矩阵乘法和对非零元素的向量化计算，不逐对循环；
+时间切片只是按单元的章节序号截取P的列区间。
+
+权重：
+- count：共现单元数
+- pmi：log(C_ij·N / (C_ii·C_jj))，N为单元数
+- ppmi：负的pmi截为0
+- npmi：pmi / -log(C_ij / N)，范围[-1, 1]
+- dice：2·C_ij / (C_ii + C_jj)，范围[0, 1]，作为关系强度使用
+
+只依赖numpy和scipy。
+"""
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+WEIGHTINGS = ("count", "pmi", "ppmi", "npmi", "dice")
+
+class PresenceMatrix:
+    """角色×单元出场矩阵
+
+    Args:
+        matrix: 稀疏出场矩阵，行对应角色，列对应单元
+        unit_chapters: 每个单元所在的章节序号（非递减），用于按章节范围切片
+    """
+
+    def __init__(self, matrix: sparse.spmatrix, unit_chapters: np.ndarray):
+        self.matrix = sparse.csc_matrix(matrix, dtype=np.float32)
+        self.unit_chapters = np.asarray(unit_chapters)
+
+    @classmethod
+    def from_pairs(cls, entity_index: np.ndarray, unit_index: np.ndarray, n_entities: int, unit_chapters: np.ndarray) -> "PresenceMatrix":
+        """由 (角色行号, 单元列号) 对构建，重复的对只计一次"""
+        data = np.ones(len(entity_index), dtype=np.float32)
+        matrix = sparse.coo_matrix(
+            (data, (np.asarray(entity_index), np.asarray(unit_index))),
+            shape=(n_entities, len(unit_chapters))
+        ).tocsc()
+        # 重复的对在转换时被累加，统一截为1
+        matrix.data[:] = 1
+        return cls(matrix, unit_chapters)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.matrix.shape
+
+    def slice(self, start_chapter: Optional[int] = None, end_chapter: Optional[int] = None) -> "PresenceMatrix":
+        """截取章节序号在 [start_chapter, end_chapter] 内的单元"""
+        lo = 0 if start_chapter is None else int(np.searchsorted(self.unit_chapters, start_chapter, side="left"))
+        hi = len(self.unit_chapters) if end_chapter is None else int(np.searchsorted(self.unit_chapters, end_chapter, side="right"))
+        return PresenceMatrix(self.matrix[:, lo:hi], self.unit_chapters[lo:hi])
+
+    def slices(self, size: int) -> List[Tuple[int, int, "PresenceMatrix"]]:
+        """按每size章切成连续的时间片，返回 (起始章节, 结束章节, 出场矩阵) 列表"""
+        if not len(self.unit_chapters):
+            return []
+        first, last = int(self.unit_chapters[0]), int(self.unit_chapters[-1])
+        return [
+            (start, min(start + size - 1, last), self.slice(start, start + size - 1))
+            for start in range(first, last + 1, size)
+        ]
+
+    def windowed(self, window: int) -> sparse.csr_matrix:
+        """按窗口展开出场矩阵：角色在前后window个单元内出场即视为在场
+
+        窗口超过单元数时截为单元数-1（即所有单元互相可见），没有单元时返回空矩阵
+        """
+        n_units = self.matrix.shape[1]
+        window = min(window, max(n_units - 1, 0))
+        if window <= 0:
+            return self.matrix.tocsr()
+        offsets = list(range(-window, window + 1))
+        band = sparse.diags([np.ones(n_units - abs(k), dtype=np.float32) for k in offsets], offsets, shape=(n_units, n_units), format="csc")
+        expanded = (self.matrix @ band).tocsr()
+        expanded.data[:] = 1
+        return expanded
+
+    def cooccurrence(self, window: int = 0) -> sparse.csr_matrix:
+        """共现计数矩阵（对称，对角线为在场单元数）"""
+        present = self.windowed(window)
+        return (present @ present.T).tocsr()
+
+def weight(counts: sparse.csr_matrix, n_units: int, weighting: str = "count") -> sparse.csr_matrix:
+    """对共现计数加权，结果去掉对角线，保留所有共现过的角色对（包括权重为0的）
+
+    Args:
+        counts: cooccurrence()得到的共现计数矩阵
+        n_units: 单元总数
+        weighting: WEIGHTINGS之一
+    """
+    if weighting not in WEIGHTINGS:
+        raise ValueError(f"不支持的权重: {weighting}，可选 {', '.join(WEIGHTINGS)}")
+    totals = counts.diagonal().astype(np.float64)
+    coo = sparse.triu(counts, k=1).tocoo()
+    rows, cols, values = coo.row, coo.col, coo.data.astype(np.float64)
+
+    if weighting == "count":
+        weighted = values
+    elif weighting == "dice":
+        weighted = 2 * values / (totals[rows] + totals[cols])
+    else:
+        n = float(max(n_units, 1))
+        pmi = np.log(values * n / (totals[rows] * totals[cols]))
+        if weighting == "pmi":
+            weighted = pmi
+        elif weighting == "ppmi":
+            weighted = np.maximum(pmi, 0)
+        else:
+            # 两个角色在所有单元都共现时 -log(1) 为0，此时npmi取1
+            denominator = -np.log(values / n)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                weighted = np.where(denominator > 0, pmi / denominator, 1.0)
+
+    # 直接按上三角及其转置的位置构建对称矩阵；稀疏矩阵相加会丢掉结果为0的元素，
+    # 而pmi为0（或ppmi截为0）的角色对仍然共现过，需要保留
+    data = weighted.astype(np.float32)
+    return sparse.coo_matrix(
+        (np.concatenate([data, data]), (np.concatenate([rows, cols]), np.concatenate([cols, rows]))),
+        shape=counts.shape
+    ).tocsr()
+
+def top_partners(weighted: sparse.csr_matrix, row: int, limit: int) -> List[Tuple[int, float]]:
+    """某个角色权重最高的共现角色，返回 (行号, 权重) 列表"""
+    start, end = weighted.indptr[row], weighted.indptr[row + 1]
+    cols, values = weighted.indices[start:end], weighted.data[start:end]
+    order = np.argsort(-values, kind="stable")[:limit]
+    return [(int(cols[i]), float(values[i])) for i in order]
+
+def top_entities(presence: PresenceMatrix, limit: int) -> np.ndarray:
+    """出场单元数最多的角色行号"""
+    totals = np.asarray(presence.matrix.sum(axis=1)).ravel()
+    order = np.argsort(-totals, kind="stable")
+    return order[:limit][totals[order[:limit]] > 0]
+
+def dense_block(matrix: sparse.spmatrix, rows: Sequence[int]) -> List[List[float]]:
+    """取出若干行列组成的稠密子矩阵，用于热力图"""
+    index = np.asarray(rows, dtype=np.int64)
+    block = matrix.tocsr()[index][:, index].toarray()
+    return np.round(block, 4).tolist()
@@ -0,0 +1,175 @@
+"""
+小说数据版本
+
+任何写入小说相关数据（章节、角色、事件、关系图等）的事务都会递增 novels.data_version，
+HTTP缓存以 (小说ID, 数据版本) 生成ETag，版本变化即视为所有派生响应失效。
+
+通过Session事件自动维护，业务代码无需手动调用：
+- 普通flush：在before_flush中收集新增、修改、删除对象所属的小说ID，after_flush中递增版本
+- 批量UPDATE/DELETE：从WHERE条件中提取 novel_id（或novels.id）的取值后立即递增，
+  无法确定范围时保守地递增全部小说的版本
+版本更新与业务写入处于同一事务，回滚时一并撤销。
+
+和 novels.content_version 的区别：content_version 只在章节正文变化时递增，
+问答缓存和分层摘要依赖它判断结果是否仍然有效，角色、关系等分析结果的写入不应使它们失效；
+data_version 覆盖所有写入（包括分析结果），只用于HTTP响应的ETag。两者的失效范围不同，不能合并。
+"""
+from typing import Any, Dict, Optional, Set
+import logging
+
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.interfaces import MANYTOONE
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+from sqlalchemy.sql.schema import Column
+
+logger = logging.getLogger(__name__)
+
+# session.info 中记录本次flush涉及的小说ID
+_PENDING_KEY = "novel_data_version_pending"
+
+def _novel_model():
+    from app.models import novel
+    return novel.Novel
+
+def _bump(session: Session, novel_ids: Optional[Set[int]]) -> None:
+    """递增指定小说的数据版本，novel_ids为None时递增全部小说"""
+    Novel = _novel_model()
+    novels = Novel.__table__
+    # 显式保留updated_at，避免onupdate把派生数据的写入记为小说本身的修改
+    stmt = update(novels).values(
+        data_version=novels.c.data_version + 1,
+        updated_at=novels.c.updated_at
+    )
+    if novel_ids is not None:
+        if not novel_ids:
+            return
+        stmt = stmt.where(novels.c.id.in_(sorted(novel_ids)))
+    # 直接使用Core连接执行，不经过ORM事件，避免递归触发
+    session.connection().execute(stmt)
+
+def _resolve_novel_id(session: Session, obj: Any, cache: Dict[Any, Optional[int]], depth: int = 0) -> Optional[int]:
+    """确定对象所属的小说ID
+
+    优先使用对象自身的novel_id；没有该字段的对象（事件参与者、关系边、文本块等）
+    沿多对一关系向上查找。父对象已加载时直接使用，否则按外键从会话中获取。
+    """
+    Novel = _novel_model()
+    if isinstance(obj, Novel):
+        return obj.id
+    if hasattr(type(obj), "novel_id"):
+        novel_id = obj.novel_id
+        if novel_id is None:
+            # 通过relationship赋值、外键尚未同步的新对象
+            parent = inspect(obj).dict.get("novel")
+            novel_id = parent.id if parent is not None else None
+        return novel_id
+    if depth > 3:
+        return None
+
+    state = inspect(obj)
+    for rel in state.mapper.relationships:
+        if rel.direction is not MANYTOONE:
+            continue
+        parent = state.dict.get(rel.key)
+        if parent is None:
+            column = next(iter(rel.local_columns))
+            fk_value = state.dict.get(state.mapper.get_property_by_column(column).key)
+            if fk_value is None:
+                continue
+            cache_key = (rel.mapper.class_, fk_value)
+            if cache_key in cache:
+                if cache[cache_key] is not None:
+                    return cache[cache_key]
+                continue
+            parent = session.get(rel.mapper.class_, fk_value)
+            cache[cache_key] = _resolve_novel_id(session, parent, cache, depth + 1) if parent is not None else None
+            if cache[cache_key] is not None:
+                return cache[cache_key]
+            continue
+        resolved = _resolve_novel_id(session, parent, cache, depth + 1)
+        if resolved is not None:
+            return resolved
+    return None
+
+def _collect_changed_novels(session: Session, flush_context, instances) -> None:
+    Novel = _novel_model()
+    pending: Set[int] = session.info.setdefault(_PENDING_KEY, set())
+    cache: Dict[Any, Optional[int]] = {}
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Novel) and obj in session.new:
+            # 新建的小说从版本1开始，不存在需要失效的缓存
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        try:
+            novel_id = _resolve_novel_id(session, obj, cache)
+        except Exception as e:
+            logger.warning(f"无法确定{type(obj).__name__}所属的小说，递增全部小说的数据版本: {str(e)}")
+            _bump(session, None)
+            continue
+        if novel_id is None:
+            logger.debug(f"{type(obj).__name__}未关联小说，跳过数据版本更新")
+            continue
+        pending.add(novel_id)
+
+def _bump_changed_novels(session: Session, flush_context) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        _bump(session, pending)
+
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+def _novel_ids_from_clause(clause: Any) -> Optional[Set[int]]:
+    """从WHERE条件中提取 novel_id = x / novel_id IN (...) 以及 novels.id 的取值"""
+    if clause is None:
+        return None
+    found: Set[int] = set()
+    for element in visitors.iterate(clause):
+        if not isinstance(element, BinaryExpression):
+            continue
+        left, right = element.left, element.right
+        if not isinstance(left, Column) or not isinstance(right, BindParameter):
+            continue
+        if left.key != "novel_id" and not (left.key == "id" and left.table.name == "novels"):
+            continue
+        value = right.effective_value
+        if element.operator is operators.eq and value is not None:
+            found.add(value)
+        elif element.operator is operators.in_op and value:
+            found.update(v for v in value if v is not None)
+    return found or None
+
+def _bump_for_bulk_statement(orm_execute_state) -> None:
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    statement = orm_execute_state.statement
+    table = getattr(statement, "table", None)
+    if table is not None and table.name == "novels" and orm_execute_state.is_insert:
+        return
+
+    if orm_execute_state.is_insert:
+        params = orm_execute_state.parameters
+        rows = params if isinstance(params, list) else [params or {}]
+        novel_ids = {row["novel_id"] for row in rows if row.get("novel_id") is not None} or None
+    else:
+        novel_ids = _novel_ids_from_clause(statement.whereclause)
+
+    if novel_ids is None:
+        logger.info(f"批量语句未限定小说范围，递增全部小说的数据版本: {table.name if table is not None else statement}")
+    _bump(orm_execute_state.session, novel_ids)
+
+_LISTENERS = (
+    ("before_flush", _collect_changed_novels),
+    ("after_flush", _bump_changed_novels),
+    ("after_rollback", _discard_pending),
+    ("do_orm_execute", _bump_for_bulk_statement),
+)
+
+def register() -> None:
+    """在Session类上注册数据版本跟踪的事件，重复调用只注册一次"""
+    for name, listener in _LISTENERS:
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
@@ -1,27 +1,101 @@
 from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+import functools
+import threading
 import logging
 
 from app.core.config import settings
+from app.core import metrics
 
 # 设置logger
 logger = logging.getLogger(__name__)
 
+is_sqlite = settings.SQLALCHEMY_DATABASE_URI.startswith("sqlite")
+# 内存数据库每个连接各自独立，只能使用写引擎的单一连接池
+is_sqlite_memory = is_sqlite and (
+    ":memory:" in settings.SQLALCHEMY_DATABASE_URI
+    or settings.SQLALCHEMY_DATABASE_URI.rstrip("/") == "sqlite:"
+)
+
+# 同步会话会在线程池中执行，同一个会话可能跨线程使用，SQLite需关闭同线程检查
+connect_args = {}
+if is_sqlite:
+    connect_args["check_same_thread"] = False
+
+# 连接池大小只对其他数据库生效；SQLite使用方言默认的连接池（内存数据库为单连接池），
+# 写入已经由单个写线程串行执行
+pool_args = {}
+if not is_sqlite:
+    pool_args = {"pool_size": settings.DB_POOL_SIZE, "max_overflow": settings.DB_MAX_OVERFLOW}
+
 # 创建数据库引擎
 engine = create_engine(
     settings.SQLALCHEMY_DATABASE_URI,
-    echo=True  # 启用SQL查询日志
+    connect_args=connect_args,
+    echo=settings.SQL_ECHO,  # 逐条SQL日志开销较大，仅在调试时开启
+    **pool_args
 )
 
-# 添加SQL执行事件监听，记录执行的SQL语句
+def _apply_sqlite_pragmas(dbapi_connection, read_only: bool = False) -> None:
+    """为SQLite连接设置性能相关的PRAGMA"""
+    cursor = dbapi_connection.cursor()
+    try:
+        if settings.SQLITE_WAL and not read_only:
+            # WAL模式写入数据库文件，读连接无需重复设置
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        # 负数表示以KB为单位
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=1")
+    finally:
+        cursor.close()
+
+# 只读连接池：SQLite数据库文件使用独立的连接池并禁止写入，WAL模式下读取不会等待写事务
+if is_sqlite:
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        _apply_sqlite_pragmas(dbapi_connection)
+
+if is_sqlite and not is_sqlite_memory:
+    read_engine = create_engine(
+        settings.SQLALCHEMY_DATABASE_URI,
+        connect_args=connect_args,
+        poolclass=QueuePool,
+        pool_size=settings.SQLITE_READ_POOL_SIZE,
+        max_overflow=0,
+        echo=settings.SQL_ECHO
+    )
+
+    @event.listens_for(read_engine, "connect")
+    def set_sqlite_read_pragmas(dbapi_connection, connection_record):
+        _apply_sqlite_pragmas(dbapi_connection, read_only=True)
+else:
+    read_engine = engine
+
+# 添加SQL执行事件监听，调试级别下记录执行的SQL语句
 @event.listens_for(engine, "before_cursor_execute")
 def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-    logger.info(f"执行SQL: {statement}")
-    logger.info(f"参数: {parameters}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"执行SQL: {statement}")
+        logger.debug(f"参数: {parameters}")
+
+# SQL执行次数和耗时指标
+metrics.instrument_engine(engine, "write")
+if read_engine is not engine:
+    metrics.instrument_engine(read_engine, "read")
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 # 创建基类
 Base = declarative_base()
@@ -32,4 +106,69 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+# 获取只读数据库会话，只用于不写入的查询接口
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# SQLite同一时刻只允许一个写事务，短写操作统一排队到单个写线程执行，
+# 避免并发写入互相等待直到busy_timeout后报"database is locked"
+_writer_thread = threading.local()
+
+def _mark_writer_thread():
+    _writer_thread.active = True
+
+_write_executor = ThreadPoolExecutor(
+    max_workers=1,
+    thread_name_prefix="db-writer",
+    initializer=_mark_writer_thread
+)
+
+# 已提交到写队列、尚未执行完成的写操作数
+_pending_writes = 0
+_pending_lock = threading.Lock()
+
+def _count_pending(delta: int) -> None:
+    global _pending_writes
+    with _pending_lock:
+        _pending_writes += delta
+
+def _submit_write(func, *args, **kwargs):
+    """提交写操作到写线程，执行完成（包括抛出异常）后从计数中移除"""
+    _count_pending(1)
+    try:
+        future = _write_executor.submit(func, *args, **kwargs)
+    except BaseException:
+        _count_pending(-1)
+        raise
+    future.add_done_callback(lambda _: _count_pending(-1))
+    return future
+
+metrics.gauge(
+    "db_write_queue_depth", "SQLite写队列中等待或正在执行的写操作数", (),
+    lambda: [((), _pending_writes)]
+)
+
+def run_write(func, *args, **kwargs):
+    """在写队列中同步执行写操作
+
+    非SQLite数据库或已经处于写线程中时直接执行。
+
+    Args:
+        func: 写操作函数，通常以会话作为第一个参数并在内部提交
+    """
+    if not is_sqlite or getattr(_writer_thread, "active", False):
+        return func(*args, **kwargs)
+    return _submit_write(func, *args, **kwargs).result()
+
+async def run_serialized_write(func, *args, **kwargs):
+    """在写队列中执行写操作，供异步代码使用，等待期间不阻塞事件循环"""
+    if not is_sqlite:
+        return await run_in_threadpool(func, *args, **kwargs)
+    future = _submit_write(functools.partial(func, *args, **kwargs))
+    return await asyncio.wrap_future(future)
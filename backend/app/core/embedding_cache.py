@@ -0,0 +1,145 @@
+"""
+文本向量缓存
+
+以 (模型, 文本内容) 的哈希为键缓存向量，分两级：
+- 内存LRU热点缓存，命中时不访问磁盘
+- 独立的SQLite文件持久化，向量按float16存储，体积约为float32的一半，
+  余弦相似度检索的精度损失可以忽略
+
+缓存与业务数据库分开存放，业务库使用PostgreSQL时同样可用，删除缓存文件不影响业务数据。
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+import hashlib
+import logging
+import sqlite3
+import struct
+import threading
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def content_key(model: str, text: str) -> str:
+    """计算缓存键：模型不同时向量不可混用"""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+def encode_vector(vector: Sequence[float]) -> bytes:
+    """按小端float16编码向量"""
+    return struct.pack(f"<{len(vector)}e", *vector)
+
+def decode_vector(blob: bytes) -> List[float]:
+    return list(struct.unpack(f"<{len(blob) // 2}e", blob))
+
+class EmbeddingCache:
+    """两级向量缓存，可在多个线程中使用"""
+
+    def __init__(self, path: str, memory_items: int):
+        self.path = path
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """批量查询向量，未命中的位置为None"""
+        keys = [content_key(model, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+        memory_hits = disk_hits = 0
+
+        with self._lock:
+            for index, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[index] = vector
+                    memory_hits += 1
+                else:
+                    missing.setdefault(key, []).append(index)
+
+            if missing:
+                try:
+                    conn = self._connection()
+                    key_list = list(missing)
+                    # SQLite单条语句的参数个数有上限，分批查询
+                    for start in range(0, len(key_list), 500):
+                        batch = key_list[start:start + 500]
+                        placeholders = ",".join("?" * len(batch))
+                        rows = conn.execute(
+                            f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                            batch
+                        ).fetchall()
+                        for key, blob in rows:
+                            vector = decode_vector(blob)
+                            self._remember(key, vector)
+                            for index in missing.pop(key):
+                                results[index] = vector
+                                disk_hits += 1
+                except sqlite3.Error as e:
+                    logger.warning(f"读取向量缓存失败: {str(e)}")
+
+            misses = sum(len(indexes) for indexes in missing.values())
+            self.hits += memory_hits
+            self.disk_hits += disk_hits
+            self.misses += misses
+
+        metrics.CACHE_REQUESTS.inc(memory_hits, cache="embedding", result="memory_hit")
+        metrics.CACHE_REQUESTS.inc(disk_hits, cache="embedding", result="disk_hit")
+        metrics.CACHE_REQUESTS.inc(misses, cache="embedding", result="miss")
+        return results
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """写入向量，缓存写入失败不影响调用方"""
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = content_key(model, text)
+                blob = encode_vector(vector)
+                # 内存中保存与磁盘一致的精度，命中哪一级结果都相同
+                self._remember(key, decode_vector(blob))
+                rows.append((key, model, len(vector), blob))
+            try:
+                conn = self._connection()
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)",
+                        rows
+                    )
+            except sqlite3.Error as e:
+                logger.warning(f"写入向量缓存失败: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        """缓存命中统计"""
+        return {
+            "memory_items": len(self._memory),
+            "memory_hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses
+        }
+
+embedding_cache = EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MEMORY_ITEMS)
+
+metrics.gauge("embedding_cache_memory_items", "向量缓存内存层中的条目数", (), lambda: [((), len(embedding_cache._memory))])
@@ -0,0 +1,186 @@
+"""
+实体预扫描
+
+在把章节交给模型抽取角色、地点之前，先在本地用 jieba.posseg 标注人名（nr）和地名（ns），
+再用已知名称索引（角色名、别名、已有地点名）过滤掉已知实体。没有新实体候选的章节
+不需要模型重新发现实体：
+
+- skip：不调用模型，角色按已知名称的出现情况直接记录出场，地点窗口直接跳过
+- delta：角色改用只列出本章已知角色的精简提示词，模型不必再识别新角色；地点窗口同skip
+- off：关闭预扫描，所有章节按原方式分析
+
+判断偏保守：分词出来的候选只要出现次数达到下限、且没有被已知名称覆盖就视为新实体，
+宁可多调用一次模型也不漏掉新角色。未安装jieba时预扫描自动关闭。
+"""
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Pattern
+import logging
+import re
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import jieba
+    import jieba.posseg as posseg
+    jieba.setLogLevel(logging.WARNING)
+except ImportError:
+    jieba = None
+    posseg = None
+    logger.info("未安装jieba，实体预扫描不可用")
+
+MODE_OFF = "off"
+MODE_SKIP = "skip"
+MODE_DELTA = "delta"
+
+PERSON = "person"
+PLACE = "place"
+_KIND_LABELS = {PERSON: "角色", PLACE: "地点"}
+
+# jieba词性：nr人名，nrfg/nrt为人名的细分；ns地名
+_PERSON_FLAGS = ("nr", "nrfg", "nrt")
+_PLACE_FLAGS = ("ns",)
+# 自造地名（门派、山峰等）常被标成普通名词，按常见后缀补充为地名候选
+_PLACE_SUFFIXES = tuple("山峰岭崖谷洞城镇村州府国岛湖河江海门宗派阁楼殿宫寺庙观院堂林关原街巷")
+_NOUN_FLAGS = ("n", "nz", "ns", "nt", "nr")
+
+ENTITY_PREPASS_DECISIONS = metrics.counter(
+    "entity_prepass_decisions_total", "实体预扫描对章节或分析窗口的处理方式", ("kind", "decision")
+)
+
+def available() -> bool:
+    """当前配置下预扫描是否生效"""
+    return jieba is not None and settings.ENTITY_PREPASS_MODE in (MODE_SKIP, MODE_DELTA)
+
+def warm_up() -> None:
+    """预先加载jieba词典，首次加载需要一两秒，在应用启动时执行而不是在第一次分析时"""
+    if available():
+        jieba.initialize()
+
+class KnownNameIndex:
+    """已知实体名称索引
+
+    每个规范名称可以有多个写法（别名），查找时返回规范名称。
+    新增名称后正则在下次查找时重新编译。
+    """
+
+    def __init__(self, names: Optional[Dict[str, Iterable[str]]] = None):
+        self._canonical: Dict[str, str] = {}
+        self._pattern: Optional[Pattern] = None
+        for name, aliases in (names or {}).items():
+            self.add(name, aliases)
+
+    def __len__(self) -> int:
+        return len(set(self._canonical.values()))
+
+    def add(self, name: str, aliases: Iterable[str] = ()) -> None:
+        """添加规范名称及其别名，单字写法容易误匹配，不加入索引"""
+        name = (name or "").strip()
+        if not name:
+            return
+        for surface in (name, *(aliases or ())):
+            surface = (surface or "").strip()
+            if len(surface) >= 2 and surface not in self._canonical:
+                self._canonical[surface] = name
+                self._pattern = None
+
+    def _compiled(self) -> Optional[Pattern]:
+        if self._pattern is None and self._canonical:
+            # 长名称优先，避免 "张三丰" 被 "张三" 截断
+            surfaces = sorted(self._canonical, key=len, reverse=True)
+            self._pattern = re.compile("|".join(map(re.escape, surfaces)))
+        return self._pattern
+
+    def find(self, text: str) -> Dict[str, List[tuple]]:
+        """查找文本中出现的已知名称
+
+        Returns:
+            规范名称 -> 出现位置 [(起始, 结束)] 列表
+        """
+        pattern = self._compiled()
+        found: Dict[str, List[tuple]] = {}
+        if pattern is None:
+            return found
+        for match in pattern.finditer(text):
+            found.setdefault(self._canonical[match.group()], []).append(match.span())
+        return found
+
+class PrepassResult(NamedTuple):
+    """一段文本的预扫描结果"""
+    known: List[str]  # 出现的已知实体（规范名称，按首次出现排序）
+    candidates: List[str]  # 未被已知名称覆盖的新实体候选
+
+    @property
+    def has_new(self) -> bool:
+        return bool(self.candidates)
+
+def _is_candidate(word: str, flag: str, kind: str) -> bool:
+    if len(word) < 2:
+        return False
+    if kind == PERSON:
+        return flag in _PERSON_FLAGS
+    return flag in _PLACE_FLAGS or (flag in _NOUN_FLAGS and word.endswith(_PLACE_SUFFIXES))
+
+def scan(text: str, index: KnownNameIndex, kind: str, min_mentions: Optional[int] = None) -> PrepassResult:
+    """扫描文本中的已知实体和新实体候选
+
+    Args:
+        text: 章节正文或分析窗口文本
+        index: 已知名称索引
+        kind: PERSON 或 PLACE
+        min_mentions: 候选至少出现的次数，默认使用配置的ENTITY_PREPASS_MIN_MENTIONS
+
+    需要jieba，调用前先用available()判断。分词是CPU密集的同步操作，在异步代码中应放到线程池执行
+    """
+    if min_mentions is None:
+        min_mentions = settings.ENTITY_PREPASS_MIN_MENTIONS
+    found = index.find(text)
+    known = sorted(found, key=lambda name: found[name][0][0])
+
+    # 被已知名称覆盖的字符位置，分词切开的已知名称（如 "张" + "无忌"）也算已知
+    covered = bytearray(len(text))
+    for spans in found.values():
+        for start, end in spans:
+            covered[start:end] = b"\x01" * (end - start)
+
+    mentions: Counter = Counter()
+    offset = 0
+    for word, flag in posseg.cut(text):
+        start, offset = offset, offset + len(word)
+        if _is_candidate(word, flag, kind) and not any(covered[start:offset]):
+            mentions[word] += 1
+    candidates = [word for word, count in mentions.most_common() if count >= min_mentions]
+    return PrepassResult(known, candidates)
+
+class PrepassStats:
+    """一次分析过程中预扫描的统计，同时计入运行指标"""
+
+    def __init__(self, kind: str, novel_id: Optional[int] = None):
+        self.kind = kind
+        self.novel_id = novel_id
+        self.counts: Counter = Counter()
+
+    def record(self, decision: str, count: int = 1) -> None:
+        """记录处理方式：full完整分析，delta精简提示词，skip不调用模型"""
+        self.counts[decision] += count
+        ENTITY_PREPASS_DECISIONS.inc(count, kind=self.kind, decision=decision)
+
+    def report(self) -> Dict[str, int]:
+        return {
+            "total": sum(self.counts.values()),
+            "full": self.counts["full"],
+            "delta": self.counts["delta"],
+            "skipped": self.counts["skip"],
+        }
+
+    def log(self) -> None:
+        report = self.report()
+        if not report["total"]:
+            return
+        scope = f"小说 {self.novel_id} " if self.novel_id is not None else ""
+        logger.info(
+            f"{scope}{_KIND_LABELS.get(self.kind, self.kind)}预扫描: 共{report['total']}段，完整分析{report['full']}段，"
+            f"精简提示{report['delta']}段，跳过模型调用{report['skipped']}段"
+        )
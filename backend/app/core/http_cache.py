@@ -0,0 +1,149 @@
+"""
+只读分析接口的HTTP缓存
+
+角色旅程、地点事件、角色列表等接口每次访问都要从数据库重新组装结果。
+这些结果只取决于小说的数据（novels.data_version）和请求地址，因此：
+- ETag：由小说ID、数据版本和请求地址生成的强ETag，数据未变化时保持不变
+- 条件请求：If-None-Match与当前ETag一致时直接返回304，不执行查询和序列化
+- 进程内LRU：缓存已序列化的响应体，客户端没有缓存时也省去重新计算
+
+数据版本由app.core.data_version在写入时自动递增，旧版本的缓存条目因ETag不匹配而失效，
+最终被LRU淘汰。压缩中间件会在ETag后追加编码后缀（如 "...-gzip"），比较时忽略该后缀。
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+import hashlib
+import logging
+import threading
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# 压缩中间件追加到ETag上的编码后缀
+ENCODING_SUFFIXES = ("-gzip", "-br")
+
+class RenderedResponseCache:
+    """按请求地址缓存序列化后的响应体，按条数和总字节数做LRU淘汰"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, etag: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != etag:
+                # 数据版本已变化，旧响应不再有效
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, etag: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (etag, body)
+            self._bytes += len(body)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str) -> None:
+        _, body = self._entries.pop(key)
+        self._bytes -= len(body)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+response_cache = RenderedResponseCache(settings.HTTP_CACHE_MAX_ENTRIES, settings.HTTP_CACHE_MAX_BYTES)
+
+metrics.gauge("http_cache_entries", "进程内HTTP响应缓存的条数", (), lambda: [((), len(response_cache))])
+metrics.gauge("http_cache_bytes", "进程内HTTP响应缓存的字节数", (), lambda: [((), response_cache.size_bytes)])
+
+def _cache_key(request: Request) -> str:
+    query = request.url.query
+    return f"{request.url.path}?{query}" if query else request.url.path
+
+def make_etag(novel_id: int, data_version: int, request: Request) -> str:
+    """生成强ETag：小说ID、数据版本加请求地址的摘要"""
+    digest = hashlib.sha1(f"{_cache_key(request)}|{settings.ETAG_SALT}".encode("utf-8")).hexdigest()[:12]
+    return f'"{novel_id}-{data_version}-{digest}"'
+
+def _strip_encoding_suffix(tag: str) -> str:
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断If-None-Match是否包含当前ETag（弱比较，忽略压缩后缀）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(_strip_encoding_suffix(tag.strip()) == etag for tag in if_none_match.split(","))
+
+def cached_json_response(
+    request: Request,
+    novel_id: int,
+    data_version: int,
+    build: Callable[[], Any],
+    response_model: Any = None
+) -> Any:
+    """按数据版本缓存只读接口的JSON响应
+
+    Args:
+        request: 当前请求，用于读取If-None-Match和生成缓存键
+        novel_id: 响应所属的小说ID
+        data_version: 小说当前的数据版本
+        build: 无参函数，缓存未命中时计算响应数据
+        response_model: 可选的pydantic模型，序列化前按其校验和过滤字段
+
+    Returns:
+        304响应、命中缓存的响应或新计算的响应；HTTP_CACHE_ENABLED关闭时原样返回build()的结果
+    """
+    if not settings.HTTP_CACHE_ENABLED:
+        return build()
+
+    etag = make_etag(novel_id, data_version, request)
+    headers = {"ETag": etag, "Cache-Control": settings.HTTP_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        metrics.CACHE_REQUESTS.inc(cache="http", result="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    key = _cache_key(request)
+    body = response_cache.get(key, etag)
+    if body is not None:
+        metrics.CACHE_REQUESTS.inc(cache="http", result="hit")
+    else:
+        metrics.CACHE_REQUESTS.inc(cache="http", result="miss")
+        content = build()
+        if response_model is not None:
+            content = response_model.parse_obj(content)
+        body = dumps(jsonable_encoder(content))
+        response_cache.put(key, etag, body)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,6 +1,8 @@
 import logging
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from pymilvus import connections, utility, Collection, CollectionSchema, FieldSchema, DataType
+from fastapi.concurrency import run_in_threadpool
 
 from app.core.config import settings
 
@@ -9,12 +11,39 @@ logger = logging.getLogger(__name__)
 def init_app(app: FastAPI) -> None:
     """
     初始化应用
+
+    导入时只配置日志；建表和外部服务连接在lifespan中执行，
+    导入应用（测试收集、工作进程启动）不会访问数据库和向量库。
     """
     init_logger()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用启动和关闭流程"""
+    started = time.perf_counter()
+    await run_in_threadpool(init_database)
+    from app.core import entity_prepass
+    await run_in_threadpool(entity_prepass.warm_up)
     if not settings.DEBUG:
-        init_vector_db()
+        await run_in_threadpool(init_vector_db)
     else:
         logger.info("开发模式：跳过向量数据库初始化")
+    logger.info(f"应用启动完成，耗时{(time.perf_counter() - started) * 1000:.0f}ms")
+    yield
+
+def init_database():
+    """创建缺失的数据表，并为旧数据回填角色档案"""
+    from app.core.database import Base, engine, SessionLocal, run_write
+    from app.services import character_profile_service
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        count = run_write(character_profile_service.backfill_missing_profiles, db)
+        if count:
+            logger.info(f"已为{count}部小说回填角色档案")
+    finally:
+        db.close()
 
 def init_logger():
     """
@@ -74,6 +103,8 @@ def init_vector_db():
     初始化向量数据库连接和集合
     """
     try:
+        from pymilvus import connections
+
         # 连接到Milvus
         connections.connect("default", host=settings.MILVUS_HOST, port=settings.MILVUS_PORT)
         logger.info(f"成功连接到Milvus服务器: {settings.MILVUS_HOST}:{settings.MILVUS_PORT}")
@@ -89,6 +120,8 @@ def init_vector_db():
 
 def create_novel_collection():
     """创建小说文本向量集合"""
+    from pymilvus import utility, Collection, CollectionSchema, FieldSchema, DataType
+
     collection_name = "novel_chunks"
     
     # 如果集合已存在就跳过
@@ -0,0 +1,153 @@
+"""
+增量JSON数组元素解码器
+
+模型的结构化输出通常是一个数组，或者是包含若干数组字段的对象，例如
+{"nodes": [...], "edges": [...]}。解码器按片段接收流式输出，每当目标数组中的
+一个元素（对象或数组）闭合时立即解析并产出，不需要等待整个文档生成完毕。
+
+- 只扫描新到达的字符，已产出元素之前的内容会被丢弃，不会重复解析
+- 文档前后的说明文字、代码块标记会被忽略，顶层数组须以对象元素开始或为空数组
+- 单个元素解析失败或结尾被截断时跳过该元素，不影响其他元素
+"""
+from typing import Any, Iterable, List, Optional, Tuple
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+class JSONArrayStreamDecoder:
+    """从流式文本中逐个解码目标数组的元素
+
+    Args:
+        keys: 目标数组所在的字段名，如 ("nodes", "edges")；为空时只匹配顶层数组
+        include_top_level: 是否同时匹配顶层数组
+    """
+
+    def __init__(self, keys: Iterable[str] = (), include_top_level: bool = True):
+        self.keys = set(keys)
+        self.include_top_level = include_top_level
+        self._buf = ""
+        self._pos = 0
+        # 容器栈：(类型, 是否为目标数组, 所在字段名)
+        self._stack: List[Tuple[str, bool, Optional[str]]] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._element_start: Optional[int] = None
+        self._done = False
+        self.skipped = 0
+
+    def feed(self, chunk: str) -> List[Tuple[Optional[str], Any]]:
+        """接收一段文本，返回本段中闭合的元素列表
+
+        Returns:
+            (所在字段名, 元素) 列表，顶层数组的字段名为None
+        """
+        if self._done or not chunk:
+            return []
+        self._buf += chunk
+        results = []
+        buf = self._buf
+        i = self._pos
+
+        while i < len(buf):
+            c = buf[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    # 只有对象中的字符串可能是字段名，元素内部的字符串不需要保留
+                    if self._element_start is None and self._stack and self._stack[-1][0] == "{":
+                        self._last_string = buf[self._string_start + 1:i]
+                i += 1
+                continue
+
+            if not self._stack:
+                if c == "[":
+                    # 说明文字中的方括号（如“[重要]”）不是数组：数组开始后应紧跟对象或直接闭合
+                    j = i + 1
+                    while j < len(buf) and buf[j].isspace():
+                        j += 1
+                    if j == len(buf):
+                        # 后续字符尚未到达，等待下一段再判断
+                        break
+                    if buf[j] not in "{]":
+                        i += 1
+                        continue
+                elif c != "{":
+                    # 文档开始前的说明文字和代码块标记
+                    i += 1
+                    continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":":
+                if self._stack and self._stack[-1][0] == "{":
+                    self._pending_key = self._last_string
+            elif c == ",":
+                self._pending_key = None
+            elif c in "{[":
+                parent = self._stack[-1] if self._stack else None
+                if parent is not None and parent[1] and self._element_start is None:
+                    self._element_start = i
+                key = self._pending_key if parent is not None and parent[0] == "{" else None
+                is_target = c == "[" and self._element_start is None and (
+                    (parent is None and self.include_top_level) or (key is not None and key in self.keys)
+                )
+                self._stack.append((c, is_target, key))
+                self._pending_key = None
+            elif c in "}]":
+                if self._stack:
+                    self._stack.pop()
+                parent = self._stack[-1] if self._stack else None
+                if parent is not None and parent[1] and self._element_start is not None:
+                    element = self._decode(buf[self._element_start:i + 1])
+                    if element is not None:
+                        results.append((parent[2], element))
+                    self._element_start = None
+                if not self._stack:
+                    # 根容器闭合后忽略剩余文本
+                    self._done = True
+                    i += 1
+                    break
+            i += 1
+
+        self._pos = i
+        self._compact()
+        return results
+
+    def _decode(self, text: str) -> Any:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            self.skipped += 1
+            logger.warning(f"跳过无法解析的数组元素: {str(e)}")
+            return None
+
+    def _compact(self) -> None:
+        """丢弃已经处理完且不再需要的缓冲内容"""
+        keep_from = self._pos
+        if self._element_start is not None:
+            keep_from = min(keep_from, self._element_start)
+        if self._in_string:
+            keep_from = min(keep_from, self._string_start)
+        if keep_from <= 0:
+            return
+        self._buf = self._buf[keep_from:]
+        self._pos -= keep_from
+        if self._element_start is not None:
+            self._element_start -= keep_from
+        if self._in_string:
+            self._string_start -= keep_from
+
+    @property
+    def complete(self) -> bool:
+        """根容器是否已经闭合"""
+        return self._done
@@ -0,0 +1,335 @@
+"""
+大语言模型调用调度器
+
+所有对模型服务的请求都经过这里排队：
+- 每个模型一组令牌桶，分别限制每分钟请求数和每分钟token数
+- 并发上限按AIMD自适应：请求顺利且延迟正常时缓慢增加，遇到429或延迟过高时成倍收缩
+- 429、超时和5xx错误按带抖动的指数退避重试
+- 等待队列按优先级出队，交互式问答优先于批量分析
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core import metrics, text_window
+
+logger = logging.getLogger(__name__)
+
+# 优先级，数值越小越先出队
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BULK = 10
+
+_current_priority: ContextVar[int] = ContextVar("llm_priority", default=PRIORITY_NORMAL)
+
+@contextmanager
+def llm_priority(priority: int):
+    """在当前上下文中设置模型请求的默认优先级"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+def current_priority() -> int:
+    """获取当前上下文的模型请求优先级"""
+    return _current_priority.get()
+
+def estimate_request_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> int:
+    """估算一次请求消耗的token数：提示词加上最大输出长度"""
+    prompt_tokens = sum(text_window.estimate_tokens(str(message.get("content") or "")) for message in messages)
+    return prompt_tokens + (max_tokens or settings.LLM_DEFAULT_COMPLETION_TOKENS)
+
+class TokenBucket:
+    """令牌桶，容量为每分钟的配额，按秒匀速补充"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """返回取出指定数量令牌前需要等待的秒数，0表示可以立即取出"""
+        self._refill()
+        # 单次请求超过桶容量时按满桶处理，避免永远等待
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        """取出令牌，允许为负数用于事后按实际用量补扣"""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        """归还多扣的令牌"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class ModelLimiter:
+    """单个模型的限流器：令牌桶、自适应并发上限和优先级等待队列"""
+
+    def __init__(self, model: str, requests_per_minute: int, tokens_per_minute: int):
+        self.model = model
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.concurrency = float(settings.LLM_INITIAL_CONCURRENCY)
+        self.in_flight = 0
+        self._queue: List[Any] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def limit(self) -> int:
+        return max(settings.LLM_MIN_CONCURRENCY, int(self.concurrency))
+
+    async def acquire(self, tokens: int, priority: int) -> None:
+        """排队等待一个并发槽位和足够的配额"""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已经分配到槽位但调用方被取消时归还槽位
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """释放并发槽位并唤醒等待中的请求"""
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """按优先级放行请求，配额不足时在补足所需的时间后再次检查"""
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+        while self._queue and self.in_flight < self.limit:
+            priority, _, tokens, future = self._queue[0]
+            if future.done():
+                # 等待方已取消
+                heapq.heappop(self._queue)
+                continue
+
+            wait = max(self.request_bucket.wait_time(1), self.token_bucket.wait_time(tokens))
+            if wait > 0:
+                # 队首请求配额不足时不让低优先级请求插队
+                self._wakeup = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+
+            heapq.heappop(self._queue)
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def on_success(self, latency: float) -> None:
+        """请求成功：延迟正常时加性增加并发，延迟过高时轻度收缩"""
+        if latency > settings.LLM_TARGET_LATENCY:
+            self.concurrency = max(settings.LLM_MIN_CONCURRENCY, self.concurrency * 0.9)
+        else:
+            self.concurrency = min(settings.LLM_MAX_CONCURRENCY, self.concurrency + 1.0 / self.concurrency)
+
+    def on_rate_limited(self) -> None:
+        """收到429：并发上限减半，并清空本分钟剩余的请求配额"""
+        self.concurrency = max(settings.LLM_MIN_CONCURRENCY, self.concurrency / 2)
+        self.request_bucket.tokens = min(self.request_bucket.tokens, 0.0)
+        logger.warning(f"模型 {self.model} 触发限流，并发上限调整为 {self.limit}")
+
+    def reconcile_tokens(self, estimated: int, actual: Optional[int]) -> None:
+        """按实际token用量修正令牌桶"""
+        if actual is None:
+            return
+        if actual > estimated:
+            self.token_bucket.consume(actual - estimated)
+        else:
+            self.token_bucket.refund(estimated - actual)
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """读取服务端返回的Retry-After秒数"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def _is_transient(error: Exception) -> bool:
+    """超时、连接错误和5xx视为可重试错误"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in ("APITimeoutError", "APIConnectionError"):
+        return True
+    status = _status_code(error)
+    return status is not None and status >= 500
+
+def _usage_tokens(result: Any) -> Optional[int]:
+    usage = getattr(result, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+def _release_once(limiter: ModelLimiter) -> Callable[[], None]:
+    """返回只生效一次的槽位释放函数，需在事件循环线程中调用"""
+    released = False
+
+    def release() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            limiter.release()
+
+    return release
+
+def _record_usage(model: str, result: Any) -> None:
+    """记录接口返回的token用量，流式响应没有usage时由调用方估算"""
+    usage = getattr(result, "usage", None)
+    if usage is None:
+        return
+    operation = metrics.current_llm_operation()
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    completion_tokens = getattr(usage, "completion_tokens", None) or 0
+    if prompt_tokens:
+        metrics.LLM_TOKENS.inc(prompt_tokens, model=model, operation=operation, kind="prompt")
+    if completion_tokens:
+        metrics.LLM_TOKENS.inc(completion_tokens, model=model, operation=operation, kind="completion")
+
+class LLMScheduler:
+    """按模型分组调度所有模型请求"""
+
+    def __init__(self):
+        self._limiters: Dict[str, ModelLimiter] = {}
+
+    def limiter(self, model: str) -> ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limits = settings.LLM_MODEL_LIMITS.get(model, {})
+            limiter = self._limiters[model] = ModelLimiter(
+                model,
+                requests_per_minute=int(limits.get("rpm", settings.LLM_REQUESTS_PER_MINUTE)),
+                tokens_per_minute=int(limits.get("tpm", settings.LLM_TOKENS_PER_MINUTE))
+            )
+        return limiter
+
+    def backoff_delay(self, attempt: int, base_delay: float) -> float:
+        """带完全抖动的指数退避"""
+        ceiling = min(settings.LLM_RETRY_MAX_DELAY, base_delay * (2 ** attempt))
+        return random.uniform(base_delay / 2, ceiling)
+
+    async def run(
+        self,
+        model: str,
+        call: Callable[[], Any],
+        estimated_tokens: int,
+        priority: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        retry_delay: Optional[float] = None,
+        hold_slot: bool = False
+    ) -> Any:
+        """排队执行一次同步的模型请求
+
+        请求在线程池中执行，不阻塞事件循环。流式请求返回时响应还没有读完，
+        指定hold_slot后成功时不释放并发槽位，由调用方在读取结束后释放。
+
+        Args:
+            model: 模型名称，用于选择限流器
+            call: 实际发起请求的无参函数
+            estimated_tokens: 预估的token消耗
+            priority: 优先级，默认取当前上下文的优先级
+            max_retries: 最大重试次数
+            retry_delay: 退避基准时间（秒）
+            hold_slot: 成功后继续占用并发槽位
+
+        Returns:
+            请求结果；指定hold_slot时为(请求结果, 释放槽位的函数)
+        """
+        limiter = self.limiter(model)
+        priority = current_priority() if priority is None else priority
+        max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+        retry_delay = settings.LLM_RETRY_BASE_DELAY if retry_delay is None else retry_delay
+
+        attempt = 0
+        while True:
+            queued = time.monotonic()
+            await limiter.acquire(estimated_tokens, priority)
+            started = time.monotonic()
+            metrics.LLM_QUEUE_WAIT.observe(started - queued, model=model)
+            try:
+                result = await run_in_threadpool(call)
+            except asyncio.CancelledError:
+                limiter.release()
+                raise
+            except Exception as e:
+                limiter.release()
+                metrics.LLM_REQUEST_DURATION.observe(time.monotonic() - started, model=model, operation=metrics.current_llm_operation())
+                rate_limited = _status_code(e) == 429
+                if rate_limited:
+                    limiter.on_rate_limited()
+                    metrics.LLM_RATE_LIMITED.inc(model=model)
+                if attempt >= max_retries or not (rate_limited or _is_transient(e)):
+                    raise
+                delay = _retry_after(e) or self.backoff_delay(attempt, retry_delay)
+                metrics.LLM_RETRIES.inc(model=model, reason="rate_limit" if rate_limited else "transient")
+                attempt += 1
+                logger.warning(f"模型 {model} 请求失败({str(e)})，{delay:.1f}秒后第{attempt}次重试")
+                await asyncio.sleep(delay)
+                continue
+
+            if not hold_slot:
+                limiter.release()
+            latency = time.monotonic() - started
+            limiter.on_success(latency)
+            limiter.reconcile_tokens(estimated_tokens, _usage_tokens(result))
+            metrics.LLM_REQUEST_DURATION.observe(latency, model=model, operation=metrics.current_llm_operation())
+            _record_usage(model, result)
+            if hold_slot:
+                return result, _release_once(limiter)
+            return result
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各模型限流器的当前状态"""
+        return {
+            model: {
+                "concurrency_limit": limiter.limit,
+                "in_flight": limiter.in_flight,
+                "queued": len(limiter._queue),
+                "request_tokens": round(limiter.request_bucket.tokens, 1),
+                "token_tokens": round(limiter.token_bucket.tokens, 1)
+            }
+            for model, limiter in self._limiters.items()
+        }
+
+scheduler = LLMScheduler()
+
+def _limiter_samples(field: str):
+    return [((model,), state[field]) for model, state in scheduler.stats().items()]
+
+metrics.gauge("llm_queue_depth", "调度器中等待执行的模型请求数", ("model",), lambda: _limiter_samples("queued"))
+metrics.gauge("llm_in_flight", "正在执行的模型请求数", ("model",), lambda: _limiter_samples("in_flight"))
+metrics.gauge("llm_concurrency_limit", "当前的自适应并发上限", ("model",), lambda: _limiter_samples("concurrency_limit"))
@@ -0,0 +1,312 @@
+"""
+运行指标
+
+进程内的计数器、直方图和仪表，以Prometheus文本格式从 /metrics 导出。
+热点路径上的记录只是一次加锁的字典更新，不做格式化和I/O；队列长度等
+瞬时状态不在热点路径上维护，而是在抓取时由各模块注册的回调读取。
+
+主要指标：
+- http_request_duration_seconds：按接口路由统计的耗时
+- llm_method_duration_seconds：按OpenAIClient方法统计的耗时
+- llm_request_duration_seconds、llm_queue_wait_seconds：单次模型请求和排队等待的耗时
+- llm_tokens_total、llm_retries_total、llm_rate_limited_total：token用量、重试和429
+- db_queries_total、db_query_duration_seconds：SQL执行次数和耗时
+- cache_requests_total：各缓存的命中和未命中次数
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import functools
+import inspect
+import logging
+import threading
+import time
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 覆盖毫秒级SQL到分钟级模型请求
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items
+        ]
+
+class Histogram(_Metric):
+    """按固定分桶统计耗时分布"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：各分桶的计数（不累计）、总和、次数
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels: str) -> "_Timer":
+        """用作上下文管理器，记录代码块的耗时"""
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+class Gauge(_Metric):
+    """抓取时通过回调读取的瞬时值，回调返回 [(标签值元组, 数值), ...]"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], collect: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        try:
+            samples = list(self.collect())
+        except Exception as e:
+            logger.warning(f"读取指标 {self.name} 失败: {str(e)}")
+            samples = []
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in samples
+        ]
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str], collect: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames, collect))
+
+def render_metrics() -> str:
+    """以Prometheus文本格式导出全部指标"""
+    return registry.render()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_REQUEST_DURATION = histogram(
+    "http_request_duration_seconds", "接口耗时（流式接口包含推送完整响应体的时间）", ("method", "route", "status")
+)
+LLM_METHOD_DURATION = histogram("llm_method_duration_seconds", "OpenAIClient方法的耗时", ("method",))
+LLM_METHOD_ERRORS = counter("llm_method_errors_total", "OpenAIClient方法抛出异常的次数", ("method",))
+LLM_REQUEST_DURATION = histogram("llm_request_duration_seconds", "单次模型请求的耗时（不含排队）", ("model", "operation"))
+LLM_QUEUE_WAIT = histogram("llm_queue_wait_seconds", "模型请求在调度器中排队等待的耗时", ("model",))
+LLM_TOKENS = counter("llm_tokens_total", "模型接口返回的token用量", ("model", "operation", "kind"))
+LLM_RETRIES = counter("llm_retries_total", "模型请求的重试次数", ("model", "reason"))
+LLM_RATE_LIMITED = counter("llm_rate_limited_total", "模型接口返回429的次数", ("model",))
+DB_QUERIES = counter("db_queries_total", "执行的SQL语句数", ("engine",))
+DB_QUERY_DURATION = histogram("db_query_duration_seconds", "SQL语句的执行耗时", ("engine",))
+CACHE_REQUESTS = counter("cache_requests_total", "缓存查询次数", ("cache", "result"))
+
+# 当前OpenAIClient方法名，用于把调度器中的token用量归到最外层的业务方法
+_llm_operation: ContextVar[Optional[str]] = ContextVar("llm_operation", default=None)
+
+def current_llm_operation() -> str:
+    return _llm_operation.get() or "other"
+
+def instrument_llm_method(func):
+    """记录OpenAIClient方法的耗时和异常次数，支持协程和异步生成器
+
+    嵌套调用时只有最外层方法设置token归属，内层方法仍单独记录耗时。
+    需放在 @staticmethod 之下。
+    """
+    name = func.__name__
+
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def generator_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            generator = func(*args, **kwargs)
+            try:
+                while True:
+                    # 只在驱动生成器的这一步设置上下文，yield给调用方期间不影响其上下文
+                    token = _llm_operation.set(name) if _llm_operation.get() is None else None
+                    try:
+                        item = await generator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        if token is not None:
+                            _llm_operation.reset(token)
+                    yield item
+            except Exception:
+                LLM_METHOD_ERRORS.inc(method=name)
+                raise
+            finally:
+                await generator.aclose()
+                LLM_METHOD_DURATION.observe(time.perf_counter() - started, method=name)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        token = _llm_operation.set(name) if _llm_operation.get() is None else None
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            LLM_METHOD_ERRORS.inc(method=name)
+            raise
+        finally:
+            if token is not None:
+                _llm_operation.reset(token)
+            LLM_METHOD_DURATION.observe(time.perf_counter() - started, method=name)
+    return wrapper
+
+def instrument_engine(engine, label: str) -> None:
+    """统计引擎上执行的SQL语句数和耗时"""
+    if not settings.METRICS_ENABLED:
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("metrics_started")
+        if stack:
+            DB_QUERY_DURATION.observe(time.perf_counter() - stack.pop(), engine=label)
+        DB_QUERIES.inc(engine=label)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        connection = context.connection
+        stack = connection.info.get("metrics_started") if connection is not None else None
+        if stack:
+            stack.pop()
+
+class RequestMetricsMiddleware:
+    """按路由模板记录接口耗时的ASGI中间件
+
+    路由模板（而不是实际路径）作为标签，避免路径参数导致标签数量无限增长。
+    直接包装send读取状态码，不经过BaseHTTPMiddleware，响应体不会被额外转发一次。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        # 应用在发送响应头前抛出异常时按500记录
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # 路由匹配后scope中才有route
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status)
+            )
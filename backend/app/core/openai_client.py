@@ -1,82 +1,209 @@
+import asyncio
+import hashlib
 import logging
 import time
 import os
 import json
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Iterable, Sequence, Tuple
 import re
 
-# 尝试使用新版本的导入方式
-try:
-    from openai import OpenAI
-    is_new_api = True
-    logger = logging.getLogger(__name__)
-    logger.info("使用新版本OpenAI API (>=1.0.0)")
-except ImportError:
-    # 如果失败，使用旧版本的导入方式
-    import openai
-    is_new_api = False
-    logger = logging.getLogger(__name__)
-    logger.info("使用旧版本OpenAI API (<1.0.0)")
+from fastapi.concurrency import run_in_threadpool
 
 from app.core.config import settings
+from app.core import llm_scheduler, metrics, request_packer, text_window
+from app.core.json_stream import JSONArrayStreamDecoder
+from app.core.embedding_cache import embedding_cache
 
-# 配置OpenAI客户端
-client = None
-try:
-    if settings.OPENAI_API_KEY:
-        if is_new_api:
-            client = OpenAI(
-                api_key=settings.OPENAI_API_KEY,
-                base_url=settings.OPENAI_API_BASE
-            )
+logger = logging.getLogger(__name__)
+
+# OpenAI SDK导入较慢（httpx及大量接口模型），首次调用模型时才加载
+_openai_sdk = None
+# 调度器使用的共享客户端，首次调用时创建
+_shared_client = None
+# 是否已提示未设置API密钥，只在首次调用模型时提示一次
+_missing_key_warned = False
+
+def _warn_missing_api_key() -> None:
+    """未设置API密钥时在首次调用模型前记录一次警告，导入模块时不输出"""
+    global _missing_key_warned
+    if not settings.OPENAI_API_KEY and not _missing_key_warned:
+        _missing_key_warned = True
+        logger.warning("未设置OpenAI API密钥，将使用模拟数据")
+
+def _openai():
+    """加载OpenAI SDK：>=1.0.0版本使用OpenAI客户端类，旧版本使用模块级接口"""
+    global _openai_sdk
+    if _openai_sdk is None:
+        import openai
+        if hasattr(openai, "OpenAI"):
+            logger.info("使用新版本OpenAI API (>=1.0.0)")
         else:
-            # 旧版本API初始化方式
+            logger.info("使用旧版本OpenAI API (<1.0.0)")
             openai.api_key = settings.OPENAI_API_KEY
             openai.api_base = settings.OPENAI_API_BASE
-            
-        logger.info(f"OpenAI客户端初始化成功，使用API基础URL: {settings.OPENAI_API_BASE}")
-    else:
-        logger.warning("未设置OpenAI API密钥，将使用模拟数据")
-        print("未设置OpenAI API密钥，将使用模拟数据")
-except Exception as e:
-    logger.error(f"OpenAI客户端初始化失败: {str(e)}")
-    # 不直接退出，可以通过USE_MOCK_DATA提供模拟数据
+        _openai_sdk = openai
+    return _openai_sdk
+
+def is_new_api() -> bool:
+    return hasattr(_openai(), "OpenAI")
+
+# 实体提取结果中的实体类型
+ENTITY_TYPES = ("persons", "locations", "items", "events", "times")
 
 class OpenAIClient:
     """OpenAI API客户端封装"""
     
+    @staticmethod
+    def _get_client():
+        """获取共享的OpenAI客户端
+
+        重试由LLM调度器统一处理，客户端自身不再重试。
+        """
+        global _shared_client
+        if _shared_client is None:
+            _shared_client = _openai().OpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_API_BASE,
+                max_retries=0
+            )
+            logger.info(f"OpenAI客户端初始化成功，使用API基础URL: {settings.OPENAI_API_BASE}")
+        return _shared_client
+    
+    @staticmethod
+    async def _create_completion(
+        priority: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        retry_delay: Optional[float] = None,
+        timeout: Optional[float] = None,
+        hold_slot: bool = False,
+        **kwargs
+    ):
+        """通过LLM调度器调用chat completion接口
+
+        Args:
+            priority: 调度优先级，默认取当前上下文的优先级
+            max_retries: 最大重试次数
+            retry_delay: 退避基准时间（秒）
+            timeout: 单次请求超时时间（秒）
+            hold_slot: 流式请求在读取结束前继续占用调度器的并发槽位
+            **kwargs: 传给chat.completions.create的参数
+
+        Returns:
+            接口原始响应对象；指定hold_slot时为(响应对象, 释放槽位的函数)
+        """
+        _warn_missing_api_key()
+        model = kwargs.setdefault("model", settings.OPENAI_API_MODEL)
+        kwargs["timeout"] = timeout or settings.LLM_REQUEST_TIMEOUT
+        estimated_tokens = llm_scheduler.estimate_request_tokens(kwargs.get("messages", []), kwargs.get("max_tokens"))
+        client = OpenAIClient._get_client()
+        return await llm_scheduler.scheduler.run(
+            model,
+            lambda: client.chat.completions.create(**kwargs),
+            estimated_tokens=estimated_tokens,
+            priority=priority,
+            max_retries=max_retries,
+            retry_delay=retry_delay,
+            hold_slot=hold_slot
+        )
+    
     @staticmethod
     async def get_embedding(text: str) -> List[float]:
         """获取文本嵌入向量"""
+        return (await OpenAIClient.get_embeddings([text]))[0]
+
+    @staticmethod
+    def _embedding_batches(texts: List[str]) -> List[List[str]]:
+        """按条数和token总数上限把文本分成多次请求"""
+        batches: List[List[str]] = []
+        batch: List[str] = []
+        batch_tokens = 0
+        for text in texts:
+            tokens = text_window.estimate_tokens(text)
+            if batch and (
+                len(batch) >= settings.EMBEDDING_BATCH_SIZE
+                or batch_tokens + tokens > settings.EMBEDDING_BATCH_MAX_TOKENS
+            ):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    @staticmethod
+    async def _request_embeddings(texts: List[str]) -> List[List[float]]:
+        """一次请求获取多条文本的向量，结果与输入顺序一致"""
+        model = settings.EMBEDDING_MODEL
+        if is_new_api():
+            client = OpenAIClient._get_client()
+            response = await llm_scheduler.scheduler.run(
+                model,
+                lambda: client.embeddings.create(input=texts, model=model),
+                estimated_tokens=sum(text_window.estimate_tokens(text) for text in texts)
+            )
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        # 旧版本API调用方式
+        response = await run_in_threadpool(_openai().Embedding.create, input=texts, model=model)
+        return [item["embedding"] for item in sorted(response["data"], key=lambda item: item["index"])]
+
+    @staticmethod
+    @metrics.instrument_llm_method
+    async def get_embeddings(texts: List[str]) -> List[List[float]]:
+        """批量获取文本嵌入向量
+
+        相同内容的文本只请求一次；先查内存和磁盘缓存，未命中的文本按接口上限分批请求，
+        结果写回缓存。内容未变化的文本重新索引时不再产生请求。
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            与输入顺序一致的向量列表
+        """
+        if not texts:
+            return []
+
+        _warn_missing_api_key()
         if settings.USE_MOCK_DATA:
-            # 返回模拟的嵌入向量
+            # 返回模拟的嵌入向量，按文本哈希生成，相同文本得到相同向量（问答缓存等依赖这一点）
             import numpy as np
-            return list(np.random.randn(settings.VECTOR_DIMENSION))
-            
+            return [
+                np.random.default_rng(
+                    int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+                ).standard_normal(settings.VECTOR_DIMENSION).tolist()
+                for text in texts
+            ]
+
         try:
-            if not client and not is_new_api:
+            if not settings.OPENAI_API_KEY:
                 raise ValueError("OpenAI客户端未初始化")
-                
-            if is_new_api:
-                if not client:
-                    raise ValueError("OpenAI客户端未初始化")
-                response = client.embeddings.create(
-                    input=text,
-                    model="text-embedding-ada-002"
-                )
-                return response.data[0].embedding
+
+            model = settings.EMBEDDING_MODEL
+            unique_texts = list(dict.fromkeys(texts))
+            if settings.EMBEDDING_CACHE_ENABLED:
+                cached = await run_in_threadpool(embedding_cache.get_many, model, unique_texts)
             else:
-                # 旧版本API调用方式
-                response = openai.Embedding.create(
-                    input=text,
-                    model="text-embedding-ada-002"
-                )
-                return response["data"][0]["embedding"]
+                cached = [None] * len(unique_texts)
+            vectors = dict(zip(unique_texts, cached))
+
+            missing = [text for text, vector in vectors.items() if vector is None]
+            if missing:
+                logger.info(f"请求{len(missing)}条文本的嵌入向量，缓存命中{len(unique_texts) - len(missing)}条")
+                batches = OpenAIClient._embedding_batches(missing)
+                results = await asyncio.gather(*(OpenAIClient._request_embeddings(batch) for batch in batches))
+                for batch, batch_vectors in zip(batches, results):
+                    vectors.update(zip(batch, batch_vectors))
+                    if settings.EMBEDDING_CACHE_ENABLED:
+                        await run_in_threadpool(embedding_cache.put_many, model, batch, batch_vectors)
+
+            return [vectors[text] for text in texts]
         except Exception as e:
             logger.error(f"获取嵌入向量失败: {str(e)}")
             raise
     
     @staticmethod
+    @metrics.instrument_llm_method
     async def chat_completion(
         messages: List[Dict[str, str]],
         temperature: float = 0.7,
@@ -85,26 +212,33 @@ class OpenAIClient:
         function_call: Optional[str] = None,
         max_retries: int = 3,
         retry_delay: float = 2.0,
-        timeout: float = 60.0
+        timeout: float = 60.0,
+        priority: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         调用OpenAI Chat API
+
+        请求经过LLM调度器限流，限流、超时和服务端错误按指数退避重试max_retries次。
         """
         try:
             logger.info(f"使用模型 {settings.OPENAI_API_MODEL} 调用OpenAI API")
             
-            client = OpenAI(
-                api_key=settings.OPENAI_API_KEY,
-                base_url=settings.OPENAI_API_BASE
-            )
+            options = {}
+            if functions is not None:
+                options["functions"] = functions
+            if function_call is not None:
+                options["function_call"] = function_call
             
-            response = client.chat.completions.create(
+            response = await OpenAIClient._create_completion(
                 model=settings.OPENAI_API_MODEL,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens,
-                functions=functions,
-                function_call=function_call
+                priority=priority,
+                max_retries=max_retries,
+                retry_delay=retry_delay,
+                timeout=timeout,
+                **options
             )
             
             # 将响应对象转换为字典格式
@@ -123,22 +257,147 @@ class OpenAIClient:
             raise
     
     @staticmethod
-    async def extract_character_relationships(text: str) -> Dict[str, Any]:
-        """从文本中提取人物关系图。
+    @metrics.instrument_llm_method
+    async def stream_chat_completion(
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = 2000,
+        priority: Optional[int] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        流式调用OpenAI Chat API，逐段产出生成的文本
+
+        建立连接的过程经过LLM调度器限流和重试，并发槽位一直占用到读取线程结束。
+        SDK的流式迭代是阻塞的，在后台线程中读取并通过队列转交给事件循环；调用方停止迭代时关闭
+        上游连接，读取线程随之退出。其他参数（如response_format）原样传给接口。
+        """
+        if settings.USE_MOCK_DATA:
+            for piece in ["这是", "模拟的", "流式", "回答。"]:
+                yield piece
+            return
+
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        stream, release_slot = await OpenAIClient._create_completion(
+            model=settings.OPENAI_API_MODEL,
+            messages=messages,
+            temperature=temperature,
+            priority=priority,
+            hold_slot=True,
+            stream=True,
+            **kwargs
+        )
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        # 流式响应不返回usage，按输出文本估算token用量
+        operation = metrics.current_llm_operation()
+        completion_tokens = 0
+
+        def pump():
+            try:
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        loop.call_soon_threadsafe(queue.put_nowait, delta)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                # 上游响应读完或连接被关闭后才释放并发槽位
+                loop.call_soon_threadsafe(release_slot)
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+        loop.run_in_executor(None, pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    logger.error(f"OpenAI流式响应中断: {str(item)}")
+                    raise item
+                completion_tokens += text_window.estimate_tokens(item)
+                yield item
+        finally:
+            # 正常结束时关闭无副作用；提前退出时中止上游请求
+            stream.close()
+            prompt_tokens = sum(text_window.estimate_tokens(str(message.get("content") or "")) for message in messages)
+            metrics.LLM_TOKENS.inc(prompt_tokens, model=settings.OPENAI_API_MODEL, operation=operation, kind="prompt")
+            metrics.LLM_TOKENS.inc(completion_tokens, model=settings.OPENAI_API_MODEL, operation=operation, kind="completion")
+
+    @staticmethod
+    async def stream_json_elements(
+        messages: List[Dict[str, str]],
+        keys: Iterable[str] = (),
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = 2000,
+        priority: Optional[int] = None,
+        **kwargs
+    ) -> AsyncIterator[Tuple[Optional[str], Any]]:
+        """
+        流式调用OpenAI Chat API，目标数组中的每个元素生成完毕即产出
+
+        适用于返回数组或 {"字段": [...]} 结构的提取任务，调用方可以边生成边处理，
+        不必等待整个响应后再整体解析。格式错误或被截断的元素会被跳过。
+
+        Args:
+            messages: 消息列表
+            keys: 目标数组所在的字段名，顶层数组总是会被匹配
+            其余参数同 stream_chat_completion
+
+        Yields:
+            (所在字段名, 元素)，顶层数组的字段名为None
+
+        Raises:
+            ValueError: 响应中没有任何可解析的JSON内容
+        """
+        decoder = JSONArrayStreamDecoder(keys)
+        produced = 0
+        async for delta in OpenAIClient.stream_chat_completion(
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            priority=priority,
+            **kwargs
+        ):
+            for item in decoder.feed(delta):
+                produced += 1
+                yield item
+            if decoder.complete:
+                # 根容器已闭合，后面只剩说明文字
+                break
+
+        if decoder.skipped:
+            logger.warning(f"流式解析跳过了{decoder.skipped}个格式错误的元素")
+        if not decoder.complete:
+            if not produced:
+                raise ValueError("API返回了无效的JSON格式")
+            logger.warning(f"响应不完整，保留已解析的{produced}个元素")
+    
+    @staticmethod
+    @metrics.instrument_llm_method
+    async def extract_character_relationships_stream(text: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """流式提取人物关系图，每个角色节点或关系生成完毕即产出
 
         Args:
             text: 输入文本
 
-        Returns:
-            包含节点和边的字典
+        Yields:
+            ("nodes", 节点) 或 ("edges", 关系)
         """
-        try:
-            # 如果配置为使用模拟数据，直接返回
-            if settings.USE_MOCK_DATA:
-                logger.info("已配置使用模拟数据，跳过API调用")
-                return OpenAIClient.generate_mock_relationship_data()
+        if settings.USE_MOCK_DATA:
+            logger.info("已配置使用模拟数据，跳过API调用")
+            mock_data = OpenAIClient.generate_mock_relationship_data()
+            for key in ("nodes", "edges"):
+                for element in mock_data[key]:
+                    yield key, element
+            return
 
-            system_prompt = """你是一个专业的文学分析师，专注于提取小说中的人物关系网络。分析文本中所有角色及其关系，并以JSON格式输出：
+        system_prompt = """你是一个专业的文学分析师，专注于提取小说中的人物关系网络。分析文本中所有角色及其关系，并以JSON格式输出：
 {
     "nodes": [
         {
@@ -177,82 +436,41 @@ class OpenAIClient:
 7. 角色重要性1-5分，关系重要性0.1-1.0
 8. 返回纯JSON，不含额外解释
 """
-            
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text}
-            ]
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text}
+        ]
 
-            # 初始化客户端
-            client = OpenAI(
-                api_key=settings.OPENAI_API_KEY,
-                base_url=settings.OPENAI_API_BASE
-            )
-            
-            # 直接调用API
-            response = client.chat.completions.create(
-                model=settings.OPENAI_API_MODEL,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=3000
-            )
-            
-            # 获取响应内容
-            content = response.choices[0].message.content
-            logger.info("\n===原始响应===\n%s", content)
-            
-            # 尝试解析JSON
-            try:
-                # 清理内容，移除可能的前缀说明
-                cleaned_content = content
-                prefixes = [
-                    "好的，", "这是", "以下是", "根据文本，", 
-                    "分析结果：", "人物关系图：", "JSON格式如下：",
-                    "```json", "```"
-                ]
-                for prefix in prefixes:
-                    if cleaned_content.startswith(prefix):
-                        cleaned_content = cleaned_content[len(prefix):].strip()
-                
-                # 尝试直接解析
-                try:
-                    data = json.loads(cleaned_content)
-                    if "nodes" in data and "edges" in data:
-                        logger.info(f"方法1成功：直接解析，找到{len(data['nodes'])}个角色，{len(data['edges'])}个关系")
-                        return data
-                except json.JSONDecodeError:
-                    pass
-                
-                # 尝试提取大括号内容
-                try:
-                    pattern = r'\{[\s\S]*\}'  # 匹配包括换行符在内的所有字符
-                    match = re.search(pattern, cleaned_content)
-                    if match:
-                        data = json.loads(match.group())
-                        if "nodes" in data and "edges" in data:
-                            logger.info(f"方法2成功：提取大括号内容，找到{len(data['nodes'])}个角色，{len(data['edges'])}个关系")
-                            return data
-                except (json.JSONDecodeError, AttributeError):
-                    pass
-                
-                # 尝试从代码块中提取
-                try:
-                    pattern = r'```(?:json)?\s*([\s\S]*?)\s*```'  # 匹配包括换行符的代码块
-                    match = re.search(pattern, content)
-                    if match:
-                        data = json.loads(match.group(1))
-                        if "nodes" in data and "edges" in data:
-                            logger.info(f"方法3成功：从代码块提取，找到{len(data['nodes'])}个角色，{len(data['edges'])}个关系")
-                            return data
-                except (json.JSONDecodeError, AttributeError):
-                    pass
-                
+        async for key, element in OpenAIClient.stream_json_elements(
+            messages,
+            keys=("nodes", "edges"),
+            temperature=0.7,
+            max_tokens=3000
+        ):
+            if key in ("nodes", "edges") and isinstance(element, dict):
+                yield key, element
+
+    @staticmethod
+    @metrics.instrument_llm_method
+    async def extract_character_relationships(text: str) -> Dict[str, Any]:
+        """从文本中提取人物关系图。
+
+        Args:
+            text: 输入文本
+
+        Returns:
+            包含节点和边的字典
+        """
+        try:
+            data = {"nodes": [], "edges": []}
+            async for key, element in OpenAIClient.extract_character_relationships_stream(text):
+                data[key].append(element)
+
+            if not data["nodes"]:
                 raise ValueError("无法从响应中提取有效的JSON数据")
-                
-            except Exception as e:
-                logger.error("JSON解析失败: %s", str(e))
-                logger.error("原始内容: %s", content)
-                raise
+            logger.info(f"解析人物关系成功，找到{len(data['nodes'])}个角色，{len(data['edges'])}个关系")
+            return data
             
         except Exception as e:
             logger.error("提取人物关系时出错: %s", str(e))
@@ -291,22 +509,24 @@ class OpenAIClient:
         }
     
     @staticmethod
-    async def extract_entities(text: str) -> Dict[str, Any]:
-        """从文本中提取实体。
+    @metrics.instrument_llm_method
+    async def extract_entities_stream(text: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """流式提取实体，每个实体生成完毕即产出
 
         Args:
             text: 输入文本
 
-        Returns:
-            包含不同类型实体的字典
+        Yields:
+            (实体类型, 实体)，实体类型为persons/locations/items/events/times之一
         """
-        try:
-            # 如果配置为使用模拟数据，直接返回
-            if settings.USE_MOCK_DATA:
-                logger.info("已配置使用模拟数据，跳过API调用")
-                return OpenAIClient.generate_mock_entities_data()
+        if settings.USE_MOCK_DATA:
+            logger.info("已配置使用模拟数据，跳过API调用")
+            for key, elements in OpenAIClient.generate_mock_entities_data().items():
+                for element in elements:
+                    yield key, element
+            return
 
-            system_prompt = """你是一个专业的小说分析助手。请分析输入的文本，提取出所有实体，并按以下JSON格式输出：
+        system_prompt = """你是一个专业的小说分析助手。请分析输入的文本，提取出所有实体，并按以下JSON格式输出：
 {
     "persons": [
         {
@@ -364,90 +584,45 @@ class OpenAIClient:
 3. 请确保输出是合法的JSON格式
 4. 不要输出任何额外的解释或分析，只返回JSON数据
 """
-            
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"请从以下文本中提取实体：\n\n{text}"}
-            ]
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"请从以下文本中提取实体：\n\n{text}"}
+        ]
 
-            # 初始化客户端
-            client = OpenAI(
-                api_key=settings.OPENAI_API_KEY,
-                base_url=settings.OPENAI_API_BASE
-            )
-            
-            # 直接调用API
-            response = client.chat.completions.create(
-                model=settings.OPENAI_API_MODEL,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=2000
-            )
-            
-            # 获取响应内容
-            content = response.choices[0].message.content
-            logger.info("\n===原始响应===\n%s", content)
-            
-            # 尝试解析JSON
-            def extract_json(text):
-                # 清理内容，移除可能的前缀说明
-                cleaned_content = text
-                prefixes = [
-                    "好的，", "这是", "以下是", "根据文本，", 
-                    "分析结果：", "实体提取结果：", "JSON格式如下：",
-                    "```json", "```"
-                ]
-                for prefix in prefixes:
-                    if cleaned_content.startswith(prefix):
-                        cleaned_content = cleaned_content[len(prefix):].strip()
-                
-                # 方法1：直接尝试解析整个内容
-                try:
-                    data = json.loads(cleaned_content)
-                    if all(key in data for key in ["persons", "locations", "items", "events", "times"]):
-                        logger.info("方法1成功：直接解析整个内容")
-                        return data
-                except json.JSONDecodeError:
-                    pass
-                
-                # 方法2：查找第一个{和最后一个}之间的内容
-                try:
-                    start = cleaned_content.find('{')
-                    end = cleaned_content.rfind('}') + 1
-                    if start >= 0 and end > start:
-                        json_str = cleaned_content[start:end]
-                        data = json.loads(json_str)
-                        if all(key in data for key in ["persons", "locations", "items", "events", "times"]):
-                            logger.info("方法2成功：提取大括号内容")
-                            return data
-                except json.JSONDecodeError:
-                    pass
-                
-                # 方法3：查找代码块
-                try:
-                    matches = re.finditer(r'```(?:json)?\s*(.*?)\s*```', text, re.DOTALL)
-                    for match in matches:
-                        try:
-                            data = json.loads(match.group(1))
-                            if all(key in data for key in ["persons", "locations", "items", "events", "times"]):
-                                logger.info("方法3成功：从代码块提取")
-                                return data
-                        except json.JSONDecodeError:
-                            continue
-                except Exception:
-                    pass
-                
-                return None
-            
-            # 尝试解析JSON
-            parsed_data = extract_json(content)
-            
-            if parsed_data:
-                logger.info("成功解析实体数据")
-                return parsed_data
-            else:
+        async for key, element in OpenAIClient.stream_json_elements(
+            messages,
+            keys=ENTITY_TYPES,
+            temperature=0.7,
+            max_tokens=2000
+        ):
+            if key in ENTITY_TYPES and isinstance(element, dict):
+                yield key, element
+
+    @staticmethod
+    @metrics.instrument_llm_method
+    async def extract_entities(text: str) -> Dict[str, Any]:
+        """从文本中提取实体。
+
+        Args:
+            text: 输入文本
+
+        Returns:
+            包含不同类型实体的字典
+        """
+        try:
+            data = {key: [] for key in ENTITY_TYPES}
+            produced = 0
+            async for key, element in OpenAIClient.extract_entities_stream(text):
+                data[key].append(element)
+                produced += 1
+
+            if not produced:
                 logger.error("无法从响应中提取有效的JSON数据")
                 return OpenAIClient.generate_mock_entities_data()
+
+            logger.info(f"成功解析实体数据，共{produced}个实体")
+            return data
             
         except Exception as e:
             logger.error(f"提取实体时出错: {str(e)}")
@@ -483,6 +658,34 @@ class OpenAIClient:
             ]
         }
     
+    @staticmethod
+    @metrics.instrument_llm_method
+    async def summarize_text(content: str, instruction: str, max_tokens: int = 500) -> str:
+        """按指定要求概括文本，用于构建分层摘要
+        
+        Args:
+            content: 待概括的文本（章节正文或下级摘要）
+            instruction: 概括要求，说明输入是什么以及输出的侧重点
+            max_tokens: 输出token上限
+            
+        Returns:
+            概括文本
+        """
+        if settings.USE_MOCK_DATA:
+            logger.info("已配置使用模拟数据，跳过API调用")
+            return content[:200]
+        
+        response = await OpenAIClient._create_completion(
+            model=settings.OPENAI_API_MODEL,
+            messages=[
+                {"role": "system", "content": "你是一位专业的文学编辑，擅长用简洁准确的中文概括小说情节。只输出概括内容，不要添加评论。"},
+                {"role": "user", "content": f"{instruction}\n\n{content}"}
+            ],
+            temperature=0.3,
+            max_tokens=max_tokens
+        )
+        return (response.choices[0].message.content or "").strip()
+    
     @staticmethod
     def check_api_connectivity() -> Dict[str, Any]:
         """检查与OpenAI API的连接状态"""
@@ -525,18 +728,14 @@ class OpenAIClient:
         # 如果能连接，测试API密钥
         if results["can_connect"]:
             try:
-                if is_new_api and client:
+                if is_new_api():
                     # 新版本API测试
-                    response = client.models.list()
-                    results["api_key_valid"] = True
-                    results["details"].append("API密钥有效")
-                elif not is_new_api:
-                    # 旧版本API测试
-                    response = openai.Model.list()
-                    results["api_key_valid"] = True
-                    results["details"].append("API密钥有效")
+                    response = OpenAIClient._get_client().models.list()
                 else:
-                    results["details"].append("API客户端未初始化")
+                    # 旧版本API测试
+                    response = _openai().Model.list()
+                results["api_key_valid"] = True
+                results["details"].append("API密钥有效")
             except Exception as e:
                 error_str = str(e)
                 results["details"].append(f"API密钥验证失败: {error_str}")
@@ -552,19 +751,22 @@ class OpenAIClient:
         return results 
 
     @staticmethod
-    async def analyze_characters(content: str, is_chapter_specific: bool = False) -> List[Dict[str, Any]]:
-        """分析文本中的人物角色
-        
+    def build_character_messages(
+        content: str,
+        is_chapter_specific: bool = False,
+        packed: bool = False,
+        known_cast: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, str]]:
+        """构建角色分析的提示词
+
         Args:
             content: 文本内容
             is_chapter_specific: 是否为单章节特定分析
-            
-        Returns:
-            角色信息列表
+            packed: 文本是否为带章节标记的多章节打包内容
+            known_cast: 预扫描确认文本中没有新角色时，文本中出现的已知角色名单
         """
-        try:
-            # 构建系统提示
-            system_prompt = """你是一个优秀的文学分析专家，擅长分析小说中的人物角色。
+        # 构建系统提示
+        system_prompt = """你是一个优秀的文学分析专家，擅长分析小说中的人物角色。
 请仔细分析以下文本，提取出所有出现的角色，并提供以下信息：
 1. 角色名称
 2. 角色别名（如有）
@@ -572,12 +774,40 @@ class OpenAIClient:
 4. 角色重要性（1-5，5为最重要）
 
 """
-            if is_chapter_specific:
-                system_prompt += """注意，这是小说的单个章节，请只分析该章节中出现的角色及其在本章中的表现。
+        if is_chapter_specific:
+            system_prompt += """注意，这是小说的单个章节，请只分析该章节中出现的角色及其在本章中的表现。
 不要猜测或推断角色在其他章节中的信息。"""
-            
-            # 构建用户提示
-            user_prompt = f"""请分析以下文本中的角色，并以JSON格式返回结果。每个角色包括name(角色名)、alias(别名数组)、description(描述)、importance(重要性1-5)等字段。
+        if known_cast:
+            system_prompt += f"""
+本段文本中出现的角色都已在前文分析过：{"、".join(known_cast)}。
+只需输出名单中实际出场的角色，描述用一两句话概括其在本段中的表现，不要输出名单之外的角色。"""
+        if packed:
+            system_prompt += """注意，文本包含多个连续章节，每个章节以【章节ID:数字】标记开头。
+请分别分析每个章节中出现的角色及其在该章节中的表现，同一角色出现在多个章节时每个章节各输出一条，
+并在chapter_id字段中填写该章节的章节ID。"""
+            return [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"""请分析以下文本中各章节的角色，并以JSON格式返回结果。每个角色包括chapter_id(章节ID)、name(角色名)、alias(别名数组)、description(描述)、importance(重要性1-5)等字段。
+
+文本内容:
+{content}
+
+请以JSON对象格式返回，例如：
+{{
+  "characters": [
+    {{
+      "chapter_id": 12,
+      "name": "角色A",
+      "alias": ["别名1"],
+      "description": "角色A在该章节中的表现...",
+      "importance": 5
+    }}
+  ]
+}}"""}
+            ]
+
+        # 构建用户提示
+        user_prompt = f"""请分析以下文本中的角色，并以JSON格式返回结果。每个角色包括name(角色名)、alias(别名数组)、description(描述)、importance(重要性1-5)等字段。
             
 文本内容:
 {content}
@@ -598,67 +828,118 @@ class OpenAIClient:
   }}
 ]"""
 
-            # 如果配置为使用模拟数据，返回模拟数据
-            if settings.USE_MOCK_DATA:
-                logger.info("使用模拟数据进行角色分析")
-                return OpenAIClient.generate_mock_characters_data()
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
 
-            # 初始化客户端
-            logger.info(f"初始化OpenAI客户端，使用API基础URL: {settings.OPENAI_API_BASE}")
-            client = OpenAI(
-                api_key=settings.OPENAI_API_KEY,
-                base_url=settings.OPENAI_API_BASE
-            )
-            
-            # 调用OpenAI API
-            logger.info(f"调用OpenAI API进行角色分析，使用模型: {settings.OPENAI_API_MODEL}")
-            response = client.chat.completions.create(
-                model=settings.OPENAI_API_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.2,
-                response_format={"type": "json_object"}
-            )
-            
-            result_text = response.choices[0].message.content
-            logger.info(f"OpenAI API返回结果: {result_text[:200]}...")
-            
-            # 尝试清理和解析JSON响应
-            try:
-                # 清理可能的前缀和后缀
-                json_pattern = r'(\{|\[).*(\}|\])'
-                json_matches = re.search(json_pattern, result_text, re.DOTALL)
-                if json_matches:
-                    cleaned_text = json_matches.group(0)
-                    logger.info(f"提取到JSON内容: {cleaned_text[:100]}...")
-                else:
-                    cleaned_text = result_text
-                
-                # 尝试解析JSON
-                result_json = json.loads(cleaned_text)
-            except json.JSONDecodeError as je:
-                logger.error(f"无法解析JSON响应: {str(je)}")
-                logger.error(f"原始响应: {result_text}")
-                raise ValueError(f"API返回了无效的JSON格式: {str(je)}")
-            
-            # 确保返回的是数组，如果是包含characters字段的对象，则取出characters
-            if isinstance(result_json, dict):
-                if "characters" in result_json:
-                    result = result_json["characters"]
-                else:
-                    result = result_json.get("characters", result_json)
-            else:
-                # 如果已经是列表，直接使用
-                result = result_json
-            
-            # 确保结果是列表类型
-            if not isinstance(result, list):
-                error_msg = f"分析结果不是列表格式: {type(result)}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
+    @staticmethod
+    @metrics.instrument_llm_method
+    async def analyze_characters_stream(
+        content: str,
+        is_chapter_specific: bool = False,
+        known_cast: Optional[Sequence[str]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式分析文本中的人物角色，每个角色生成完毕即产出
+
+        调用方可以在模型继续生成后续角色的同时写入已完成的角色。
+
+        Args:
+            content: 文本内容
+            is_chapter_specific: 是否为单章节特定分析
+            known_cast: 已知角色名单，指定时使用只分析这些角色的精简提示词
+
+        Yields:
+            角色信息
+        """
+        # 如果配置为使用模拟数据，返回模拟数据
+        if settings.USE_MOCK_DATA:
+            logger.info("使用模拟数据进行角色分析")
+            for character in OpenAIClient.generate_mock_characters_data():
+                yield character
+            return
+
+        logger.info(f"调用OpenAI API进行角色分析，使用模型: {settings.OPENAI_API_MODEL}")
+        # 兼容直接返回数组和返回 {"characters": [...]} 两种格式
+        async for _, character in OpenAIClient.stream_json_elements(
+            OpenAIClient.build_character_messages(content, is_chapter_specific, known_cast=known_cast),
+            keys=("characters",),
+            temperature=0.2,
+            max_tokens=None,
+            response_format={"type": "json_object"}
+        ):
+            if isinstance(character, dict) and character.get("name"):
+                yield character
+
+    @staticmethod
+    @metrics.instrument_llm_method
+    async def analyze_characters_packed_stream(
+        pack: Sequence[Tuple[int, str]],
+        known_cast: Optional[Sequence[str]] = None
+    ) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """在一次请求中分析多个章节的角色，结果按章节ID拆回
+
+        Args:
+            pack: (章节ID, 章节正文) 列表，通常由request_packer.pack_chapters生成
+            known_cast: 已知角色名单，指定时使用只分析这些角色的精简提示词
+
+        Yields:
+            (章节ID, 角色信息)，无法归属到本组章节的角色会被丢弃
+        """
+        chapter_ids = [chapter_id for chapter_id, _ in pack]
+        if len(pack) == 1:
+            async for character in OpenAIClient.analyze_characters_stream(pack[0][1], is_chapter_specific=True, known_cast=known_cast):
+                yield chapter_ids[0], character
+            return
+
+        if settings.USE_MOCK_DATA:
+            logger.info("使用模拟数据进行角色分析")
+            for chapter_id in chapter_ids:
+                for character in OpenAIClient.generate_mock_characters_data():
+                    yield chapter_id, character
+            return
+
+        logger.info(f"调用OpenAI API打包分析{len(pack)}个章节的角色: chapter_ids={chapter_ids}")
+        dropped = 0
+        async for _, character in OpenAIClient.stream_json_elements(
+            OpenAIClient.build_character_messages(request_packer.build_packed_content(pack), packed=True, known_cast=known_cast),
+            keys=("characters",),
+            temperature=0.2,
+            max_tokens=None,
+            response_format={"type": "json_object"}
+        ):
+            if not isinstance(character, dict) or not character.get("name"):
+                continue
+            chapter_id = request_packer.resolve_chapter_id(character, chapter_ids)
+            if chapter_id is None:
+                dropped += 1
+                continue
+            yield chapter_id, character
+        if dropped:
+            logger.warning(f"{dropped}个角色缺少有效的章节ID，已丢弃")
+
+    @staticmethod
+    @metrics.instrument_llm_method
+    async def analyze_characters(
+        content: str,
+        is_chapter_specific: bool = False,
+        known_cast: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """分析文本中的人物角色
+        
+        Args:
+            content: 文本内容
+            is_chapter_specific: 是否为单章节特定分析
+            known_cast: 已知角色名单，指定时使用只分析这些角色的精简提示词
             
+        Returns:
+            角色信息列表
+        """
+        try:
+            result = [
+                character
+                async for character in OpenAIClient.analyze_characters_stream(content, is_chapter_specific, known_cast)
+            ]
             logger.info(f"成功解析角色分析结果，共{len(result)}个角色")
             return result
         
@@ -669,6 +950,7 @@ class OpenAIClient:
             raise
     
     @staticmethod
+    @metrics.instrument_llm_method
     async def analyze_character_personality(text: str, character_name: str) -> Dict[str, Any]:
         """分析指定角色的性格和特点
         
@@ -716,14 +998,8 @@ class OpenAIClient:
                 {"role": "user", "content": text}
             ]
 
-            # 初始化客户端
-            client = OpenAI(
-                api_key=settings.OPENAI_API_KEY,
-                base_url=settings.OPENAI_API_BASE
-            )
-            
             # 调用API
-            response = client.chat.completions.create(
+            response = await OpenAIClient._create_completion(
                 model=settings.OPENAI_API_MODEL,
                 messages=messages,
                 temperature=0.7,
@@ -732,7 +1008,7 @@ class OpenAIClient:
             
             # 获取响应内容
             content = response.choices[0].message.content
-            logger.info("\n===角色性格分析原始响应===\n%s", content)
+            logger.debug("\n===角色性格分析原始响应===\n%s", content)
             
             # 提取JSON内容
             json_match = re.search(r'\{\s*"name".*\}', content, re.DOTALL)
@@ -854,6 +1130,7 @@ class OpenAIClient:
         }
 
     @staticmethod
+    @metrics.instrument_llm_method
     async def extract_character_relationships_from_list(content: str, character_list: str) -> Dict[str, Any]:
         """从已知角色列表中提取角色之间的关系
         
@@ -905,14 +1182,8 @@ class OpenAIClient:
 以下是小说内容:
 {content[:70000]}"""  # 限制内容长度
             
-            # 初始化客户端
-            client = OpenAI(
-                api_key=settings.OPENAI_API_KEY,
-                base_url=settings.OPENAI_API_BASE
-            )
-            
             # 调用API
-            response = client.chat.completions.create(
+            response = await OpenAIClient._create_completion(
                 model=settings.OPENAI_API_MODEL,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -924,7 +1195,7 @@ class OpenAIClient:
             
             # 获取响应内容
             content = response.choices[0].message.content
-            logger.info("\n===原始关系分析响应===\n%s", content)
+            logger.debug("\n===原始关系分析响应===\n%s", content)
             
             # 健壮的JSON解析
             try:
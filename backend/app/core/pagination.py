@@ -0,0 +1,91 @@
+"""
+列表接口的游标分页和字段投影
+
+OFFSET分页需要扫描并丢弃前面的所有行，长篇小说翻到后面的页会线性变慢。
+游标（keyset）分页记录上一页最后一行的排序键，下一页直接从索引定位：
+    WHERE novel_id = ? AND (number, id) > (上一页最后的number, id) ORDER BY number, id LIMIT ?
+游标对客户端不透明（排序键的base64编码），下一页的游标通过响应头 X-Next-Cursor 返回，
+响应体保持原有的列表结构。
+
+fields= 指定只返回部分字段，查询时只读取这些列，列表页无需拉取章节正文等大字段。
+"""
+from typing import Any, Dict, List, Optional, Sequence
+import base64
+import json
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, or_
+
+from app.core.responses import FastJSONResponse
+
+# 下一页游标的响应头
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """把排序键编码为游标"""
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """解析游标，格式不正确时抛出ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except Exception:
+        raise ValueError("无效的分页游标")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("无效的分页游标")
+    return values
+
+def keyset_after(columns: Sequence[Any], values: Sequence[Any]) -> Any:
+    """排序键严格大于给定值的条件
+
+    展开为 a >= x AND (a > x OR (b > y ...))，比行值比较更容易被各数据库用上复合索引。
+    """
+    if len(columns) == 1:
+        return columns[0] > values[0]
+    return and_(
+        columns[0] >= values[0],
+        or_(columns[0] > values[0], keyset_after(columns[1:], values[1:]))
+    )
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> Optional[List[str]]:
+    """解析逗号分隔的字段列表，未指定时返回None，包含未知字段时抛出ValueError"""
+    if not fields:
+        return None
+    requested = []
+    for name in fields.split(","):
+        name = name.strip()
+        if name and name not in requested:
+            requested.append(name)
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise ValueError(f"不支持的字段: {', '.join(unknown)}，可选字段: {', '.join(allowed)}")
+    return requested or None
+
+def query_columns(model: Any, fields: Sequence[str], key_fields: Sequence[str]) -> List[Any]:
+    """投影查询需要读取的列：请求的字段加上生成游标所需的排序键"""
+    names = list(fields) + [name for name in key_fields if name not in fields]
+    return [getattr(model, name) for name in names]
+
+def next_cursor(rows: Sequence[Any], limit: int, key_fields: Sequence[str]) -> Optional[str]:
+    """本页已满时根据最后一行生成下一页游标，否则返回None"""
+    if not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor([getattr(last, name) for name in key_fields])
+
+def list_response(response: Response, rows: List[Any], fields: Optional[List[str]], cursor: Optional[str]) -> Any:
+    """组装列表响应
+
+    未指定字段时返回ORM对象，由response_model校验；指定字段时只输出这些字段，
+    绕过要求完整字段的response_model直接返回JSON。
+    """
+    if fields is None:
+        if cursor:
+            response.headers[NEXT_CURSOR_HEADER] = cursor
+        return rows
+    content: List[Dict[str, Any]] = [{name: getattr(row, name) for name in fields} for row in rows]
+    headers = {NEXT_CURSOR_HEADER: cursor} if cursor else None
+    return FastJSONResponse(content=jsonable_encoder(content), headers=headers)
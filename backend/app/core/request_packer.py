@@ -0,0 +1,112 @@
+"""
+章节请求打包
+
+逐章请求时，每个请求都要重复发送较长的系统提示词。打包器把连续的短章节
+合并进同一个请求：正文中每章以章节标记开头，模型输出的每条结果带上章节ID，
+再按章节ID拆回各章节。
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import logging
+
+from app.core import text_window
+
+logger = logging.getLogger(__name__)
+
+CHAPTER_TAG = "【章节ID:{chapter_id}】"
+
+def format_chapter(chapter_id: int, text: str) -> str:
+    """为章节正文加上章节标记"""
+    return f"{CHAPTER_TAG.format(chapter_id=chapter_id)}\n{text.strip()}\n\n"
+
+def pack_chapters(
+    chapters: Iterable[Tuple[int, str]],
+    max_tokens: int,
+    max_chapters: Optional[int] = None
+) -> Iterator[List[Tuple[int, str]]]:
+    """把连续的章节分组，每组的正文token数不超过上限
+
+    单章超过上限时单独成组，由调用方按原有方式处理。
+
+    Args:
+        chapters: (章节ID, 章节正文) 迭代器，按章节顺序
+        max_tokens: 每组正文（含章节标记）的token上限
+        max_chapters: 每组最多包含的章节数，避免单次输出过长
+
+    Yields:
+        (章节ID, 章节正文) 列表
+    """
+    pack: List[Tuple[int, str]] = []
+    pack_tokens = 0
+
+    for chapter_id, text in chapters:
+        tokens = text_window.estimate_tokens(format_chapter(chapter_id, text))
+        full = max_chapters is not None and len(pack) >= max_chapters
+        if pack and (full or pack_tokens + tokens > max_tokens):
+            yield pack
+            pack, pack_tokens = [], 0
+        pack.append((chapter_id, text))
+        pack_tokens += tokens
+
+    if pack:
+        yield pack
+
+def build_packed_content(pack: Sequence[Tuple[int, str]]) -> str:
+    """拼接一组章节的正文，每章以章节标记开头"""
+    return "".join(format_chapter(chapter_id, text) for chapter_id, text in pack)
+
+def resolve_chapter_id(item: Dict[str, Any], chapter_ids: Sequence[int]) -> Optional[int]:
+    """读取模型结果中的章节ID
+
+    只有一个章节时结果一定属于该章节；章节ID无法识别或不在本组中时返回None。
+    """
+    if len(chapter_ids) == 1:
+        return chapter_ids[0]
+    value = item.get("chapter_id")
+    try:
+        chapter_id = int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+    return chapter_id if chapter_id in chapter_ids else None
+
+def packing_report(
+    chapters: Sequence[Tuple[int, str]],
+    max_tokens: int,
+    prompt_tokens: int,
+    max_chapters: Optional[int] = None,
+    packed_prompt_tokens: Optional[int] = None
+) -> Dict[str, Any]:
+    """对比逐章请求和打包请求的请求数与提示词token数
+
+    Args:
+        chapters: (章节ID, 章节正文) 列表
+        max_tokens: 每组正文的token上限
+        prompt_tokens: 每个请求固定的提示词开销（系统提示和指令）
+        max_chapters: 每组最多包含的章节数
+        packed_prompt_tokens: 打包请求的提示词开销，默认与逐章请求相同
+
+    Returns:
+        统计结果
+    """
+    per_chapter_tokens = sum(prompt_tokens + text_window.estimate_tokens(text) for _, text in chapters)
+    packs = list(pack_chapters(chapters, max_tokens, max_chapters))
+    if packed_prompt_tokens is None:
+        packed_prompt_tokens = prompt_tokens
+    packed_tokens = 0
+    for pack in packs:
+        # 只有一章的组按逐章方式发送，不加章节标记
+        if len(pack) == 1:
+            packed_tokens += prompt_tokens + text_window.estimate_tokens(pack[0][1])
+        else:
+            packed_tokens += packed_prompt_tokens + text_window.estimate_tokens(build_packed_content(pack))
+
+    def reduction(before: int, after: int) -> float:
+        return round((1 - after / before) * 100, 1) if before else 0.0
+
+    return {
+        "chapters": len(chapters),
+        "per_chapter": {"requests": len(chapters), "prompt_tokens": per_chapter_tokens},
+        "packed": {"requests": len(packs), "prompt_tokens": packed_tokens},
+        "request_reduction_percent": reduction(len(chapters), len(packs)),
+        "prompt_token_reduction_percent": reduction(per_chapter_tokens, packed_tokens),
+        "chapters_per_request": round(len(chapters) / len(packs), 2) if packs else 0.0
+    }
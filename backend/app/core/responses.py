@@ -0,0 +1,51 @@
+"""
+快速JSON响应
+
+关系图、时间线等大体量分析结果可达数MB，标准库json编码是主要耗时之一。
+安装了orjson时使用orjson序列化（速度约为标准库的数倍，原生支持datetime），
+未安装时退回标准库，输出格式一致（UTF-8、无多余空白）。
+"""
+from typing import Any
+import json
+import logging
+
+from fastapi.responses import JSONResponse
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logger.info("未安装orjson，使用标准库json序列化响应")
+
+def dumps(content: Any) -> bytes:
+    """序列化为紧凑的UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=str
+    ).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """使用orjson序列化的JSON响应，作为应用的默认响应类"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def trusted_response(content: Any) -> Any:
+    """返回服务层已按响应模型组装好的数据
+
+    接口直接返回Response对象时FastAPI不再按response_model逐字段校验和转换，
+    大结果集可省去一次完整的遍历和复制。仅用于结构已由服务层保证的结果；
+    TRUST_SERVICE_OUTPUT关闭时原样返回，仍走response_model校验。
+    """
+    if not settings.TRUST_SERVICE_OUTPUT:
+        return content
+    return FastJSONResponse(content=content)
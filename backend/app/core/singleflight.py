@@ -0,0 +1,101 @@
+"""
+相同请求合并（singleflight）
+
+同一个键的操作在执行期间只运行一次，并发的调用方等待同一个任务并共享结果。
+用于合并相同的分析请求，避免重复调用大模型。
+
+参数不同的操作（全书分析、按章节分析、强制刷新）不能合并，但会删除和重写同一部小说的
+同一批数据，通过互斥键按小说依次执行。
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+import asyncio
+import logging
+import weakref
+
+from app.core import metrics
+from app.core.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """按键合并进行中的异步操作"""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        # 互斥键对应的锁，没有任务持有时自动回收
+        self._locks: "weakref.WeakValueDictionary[Hashable, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def _lock(self, exclusive: Hashable) -> asyncio.Lock:
+        lock = self._locks.get(exclusive)
+        if lock is None:
+            lock = self._locks[exclusive] = asyncio.Lock()
+        return lock
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]], exclusive: Optional[Hashable] = None) -> Any:
+        """执行操作，若相同键的操作正在执行则等待其结果
+
+        任务与发起请求的调用方解耦：某个调用方断开连接时，任务会继续执行，
+        其他等待者仍能拿到结果。
+
+        Args:
+            key: 合并键，通常为 (操作名, 小说ID, 参数...)
+            func: 返回协程的无参函数
+            exclusive: 互斥键，通常为 (数据类型, 小说ID)，互斥键相同的不同操作依次执行
+
+        Returns:
+            操作结果，异常同样会传递给所有等待者
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run_exclusive(func, exclusive))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            logger.info(f"合并进行中的相同请求: {key}")
+        return await asyncio.shield(task)
+
+    async def _run_exclusive(self, func: Callable[[], Awaitable[Any]], exclusive: Optional[Hashable]) -> Any:
+        if exclusive is None:
+            return await func()
+        lock = self._lock(exclusive)
+        if lock.locked():
+            logger.info(f"等待同一小说的其他分析完成: {exclusive}")
+        async with lock:
+            return await func()
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # 所有等待者都已离开时读取异常，避免未取回异常的警告
+        if not task.cancelled():
+            task.exception()
+
+    async def do_with_session(
+        self,
+        key: Hashable,
+        func: Callable[[Any], Awaitable[Any]],
+        exclusive: Optional[Hashable] = None
+    ) -> Any:
+        """执行需要数据库会话的操作
+
+        合并后的任务可能比发起它的请求活得更久，因此使用独立的会话，
+        而不是请求依赖注入的会话。会话在取得互斥锁后才创建。
+
+        Args:
+            key: 合并键
+            func: 接收数据库会话并返回协程的函数
+            exclusive: 互斥键，见do()
+        """
+        async def run():
+            db = SessionLocal()
+            try:
+                return await func(db)
+            finally:
+                db.close()
+
+        return await self.do(key, run, exclusive)
+
+# 分析操作共用的合并器
+analysis_flight = SingleFlight()
+
+metrics.gauge("analysis_jobs_in_flight", "正在执行的分析任务数（合并后）", (), lambda: [((), len(analysis_flight._in_flight))])
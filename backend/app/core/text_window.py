@@ -0,0 +1,122 @@
+from typing import Iterable, Iterator, List, Optional, Tuple, Dict, Any
+import logging
+
+logger = logging.getLogger(__name__)
+
+# tiktoken编码器按需加载，加载失败时退回字符估算
+_encoder = None
+_encoder_loaded = False
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"加载tiktoken编码器失败，使用字符数估算token: {str(e)}")
+            _encoder = None
+    return _encoder
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数量
+
+    优先使用tiktoken精确计数；不可用时按中文约每字1个token估算，偏保守。
+    """
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return len(text)
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """把超过token上限的文本按段落切分，单个段落过长时按字符硬切
+
+    Args:
+        text: 输入文本
+        max_tokens: 每段的token上限
+
+    Returns:
+        切分后的文本片段列表
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    pieces = []
+    current: List[str] = []
+    current_tokens = 0
+    for paragraph in text.split("\n"):
+        paragraph_tokens = estimate_tokens(paragraph) + 1
+        if paragraph_tokens > max_tokens:
+            if current:
+                pieces.append("\n".join(current))
+                current, current_tokens = [], 0
+            # 按token比例估算字符步长，保证每片不超过上限
+            step = max(1, int(len(paragraph) * max_tokens / paragraph_tokens))
+            for start in range(0, len(paragraph), step):
+                pieces.append(paragraph[start:start + step])
+            continue
+        if current and current_tokens + paragraph_tokens > max_tokens:
+            pieces.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += paragraph_tokens
+
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+def iter_token_windows(
+    chapters: Iterable[Tuple[Dict[str, Any], str]],
+    max_tokens: int
+) -> Iterator[Tuple[List[Dict[str, Any]], str]]:
+    """把章节流合并为不超过token上限的文本窗口
+
+    章节按顺序尽量合并进同一个窗口，单章超过上限时拆成多个窗口。
+    输入是惰性的，窗口攒满即产出，调用方可以在整本书读完之前开始处理。
+
+    Args:
+        chapters: (章节元数据, 章节文本) 迭代器
+        max_tokens: 每个窗口的token上限
+
+    Yields:
+        (窗口包含的章节元数据列表, 窗口文本)
+    """
+    metas: List[Dict[str, Any]] = []
+    parts: List[str] = []
+    window_tokens = 0
+
+    for meta, text in chapters:
+        text_tokens = estimate_tokens(text)
+        if text_tokens > max_tokens:
+            if parts:
+                yield metas, "".join(parts)
+                metas, parts, window_tokens = [], [], 0
+            for piece in split_text(text, max_tokens):
+                yield [meta], piece
+            continue
+
+        if parts and window_tokens + text_tokens > max_tokens:
+            yield metas, "".join(parts)
+            metas, parts, window_tokens = [], [], 0
+
+        metas.append(meta)
+        parts.append(text)
+        window_tokens += text_tokens
+
+    if parts:
+        yield metas, "".join(parts)
+
+def join_limited(texts: Iterable[str], max_chars: Optional[int] = None) -> str:
+    """拼接文本流，达到字符上限后停止读取后续内容"""
+    parts: List[str] = []
+    total = 0
+    for text in texts:
+        if max_chars is not None and total + len(text) >= max_chars:
+            parts.append(text[:max_chars - total])
+            break
+        parts.append(text)
+        total += len(text)
+    return "".join(parts)
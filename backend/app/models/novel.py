@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Table, Float, JSON, Boolean
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Table, Float, JSON, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -13,21 +13,28 @@ class Novel(Base):
     author = Column(String(100), nullable=False, index=True)
     description = Column(Text, nullable=True)
     cover_url = Column(String(255), nullable=True)
+    content_version = Column(Integer, nullable=False, default=1, server_default="1")  # 章节内容每次变化时递增，用于失效派生缓存
+    data_version = Column(Integer, nullable=False, default=1, server_default="1")  # 小说相关的任何数据变化时递增，用于HTTP缓存的ETag
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # 关系
     chapters = relationship("Chapter", back_populates="novel", cascade="all, delete-orphan")
     characters = relationship("Character", back_populates="novel", cascade="all, delete-orphan")
+    character_profiles = relationship("CharacterProfile", back_populates="novel", cascade="all, delete-orphan")
     locations = relationship("Location", back_populates="novel", cascade="all, delete-orphan")
     items = relationship("Item", back_populates="novel", cascade="all, delete-orphan")
     events = relationship("Event", back_populates="novel", cascade="all, delete-orphan")
     relationships = relationship("Relationship", back_populates="novel", cascade="all, delete-orphan")
     relationship_graphs = relationship("RelationshipGraph", back_populates="novel", cascade="all, delete-orphan")
+    summary_nodes = relationship("SummaryNode", back_populates="novel", cascade="all, delete-orphan")
 
 class Chapter(Base):
     """章节模型"""
     __tablename__ = "chapters"
+    __table_args__ = (
+        Index("ix_chapters_novel_number", "novel_id", "number"),  # 章节列表按序号的游标分页
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     novel_id = Column(Integer, ForeignKey("novels.id", ondelete="CASCADE"), nullable=False)
@@ -60,6 +67,9 @@ class TextChunk(Base):
 class Character(Base):
     """角色模型"""
     __tablename__ = "characters"
+    __table_args__ = (
+        Index("ix_characters_novel_id", "novel_id", "id"),  # 角色列表按ID的游标分页
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     novel_id = Column(Integer, ForeignKey("novels.id"), nullable=False)
@@ -83,6 +93,52 @@ class Character(Base):
     participations = relationship("EventParticipation", back_populates="character")
     relationship_graphs = relationship("RelationshipGraph", back_populates="character", cascade="all, delete-orphan")
 
+class CharacterProfile(Base):
+    """角色档案模型（按名称去重后的规范角色，聚合字段在写入时维护）"""
+    __tablename__ = "character_profiles"
+    __table_args__ = (
+        UniqueConstraint("novel_id", "name", name="uq_character_profiles_novel_name"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    novel_id = Column(Integer, ForeignKey("novels.id", ondelete="CASCADE"), nullable=False, index=True)
+    character_id = Column(Integer, ForeignKey("characters.id", ondelete="SET NULL"), nullable=True)  # 代表记录，对外暴露的角色ID
+    name = Column(String(100), nullable=False)
+    alias = Column(JSON, nullable=True)  # 合并后的别名列表
+    description = Column(Text, nullable=True)  # 最详细的一条描述
+    importance = Column(Integer, default=1)  # 各章节中的最高重要性
+    first_chapter_id = Column(Integer, ForeignKey("chapters.id", ondelete="SET NULL"), nullable=True)  # 首次出场章节
+    first_chapter_number = Column(Integer, nullable=True)  # 首次出场章节序号
+    appearance_count = Column(Integer, default=0)  # 出场章节数
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    # 关系
+    novel = relationship("Novel", back_populates="character_profiles")
+    character = relationship("Character", foreign_keys=[character_id])
+    appearances = relationship("CharacterAppearance", back_populates="profile", cascade="all, delete-orphan")
+
+class CharacterAppearance(Base):
+    """角色出场记录（每个角色在每个章节一行）"""
+    __tablename__ = "character_appearances"
+    __table_args__ = (
+        UniqueConstraint("profile_id", "chapter_id", name="uq_character_appearances_profile_chapter"),
+        Index("ix_character_appearances_novel_chapter", "novel_id", "chapter_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    profile_id = Column(Integer, ForeignKey("character_profiles.id", ondelete="CASCADE"), nullable=False)
+    novel_id = Column(Integer, ForeignKey("novels.id", ondelete="CASCADE"), nullable=False)
+    chapter_id = Column(Integer, ForeignKey("chapters.id", ondelete="CASCADE"), nullable=False)
+    character_id = Column(Integer, ForeignKey("characters.id", ondelete="SET NULL"), nullable=True)  # 对应的章节角色记录
+    importance = Column(Integer, default=1)  # 本章节中的重要性
+    description = Column(Text, nullable=True)  # 本章节中的角色描述
+    
+    # 关系
+    profile = relationship("CharacterProfile", back_populates="appearances")
+    chapter = relationship("Chapter")
+    character = relationship("Character", foreign_keys=[character_id])
+
 class Location(Base):
     """地点模型"""
     __tablename__ = "locations"
@@ -243,4 +299,31 @@ class RelationshipEdge(Base):
     importance = Column(Float, default=1.0)
     
     # 关联到图表
-    graph = relationship("RelationshipGraph", back_populates="edges") 
\ No newline at end of file
+    graph = relationship("RelationshipGraph", back_populates="edges")
+
+class SummaryNode(Base):
+    """分层摘要节点：章节摘要、每N章的情节段摘要和全书梗概"""
+    __tablename__ = "summary_nodes"
+    __table_args__ = (
+        UniqueConstraint("novel_id", "level", "position", name="uq_summary_nodes_novel_level_position"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    novel_id = Column(Integer, ForeignKey("novels.id", ondelete="CASCADE"), nullable=False)
+    level = Column(Integer, nullable=False)  # 0章节 1情节段，更高为逐层合并的摘要，全书梗概在最高层
+    position = Column(Integer, nullable=False)  # 章节为章节序号，情节段为段序号（从1开始），全书梗概为-1
+    chapter_id = Column(Integer, ForeignKey("chapters.id", ondelete="CASCADE"), nullable=True)  # 仅章节摘要
+    start_number = Column(Integer, nullable=False)  # 覆盖的起始章节序号
+    end_number = Column(Integer, nullable=False)  # 覆盖的结束章节序号
+    content_hash = Column(String(64), nullable=False)  # 输入内容（章节正文或下级摘要）的哈希，未变化时复用摘要
+    content_version = Column(Integer, nullable=True)  # 生成时小说的内容版本
+    summary = Column(Text, nullable=False)
+    token_count = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    novel = relationship("Novel", back_populates="summary_nodes")
+
+# 注册数据版本跟踪（Session事件），需在模型定义之后执行
+from app.core import data_version
+data_version.register()
@@ -148,6 +148,11 @@ class AnswerResponse(BaseModel):
     sources: List[Dict[str, Any]] = []  # 来源引用
     confidence: float
 
+class BatchQuestionRequest(BaseModel):
+    novel_id: int
+    questions: List[str] = Field(..., min_items=1, max_items=500)  # 同一部小说的问题列表
+    use_rag: bool = True  # 是否使用检索增强生成
+
 # 分析相关模型
 class RelationshipGraphRequest(BaseModel):
     novel_id: int
@@ -1,14 +1,35 @@
 from sqlalchemy.orm import Session
-from typing import Dict, List, Any, Optional
+from fastapi.concurrency import run_in_threadpool
+from typing import Callable, Dict, List, Any, Optional
 import logging
-import networkx as nx
 
 from app.models import novel, schemas
-from app.services import novel_service
+from app.services import novel_service, character_profile_service, cooccurrence_service, summary_service
+from app.core.database import run_serialized_write
 from app.core.openai_client import OpenAIClient
 
 logger = logging.getLogger(__name__)
 
+def relationship_strength(db: Session, novel_id: int) -> Callable[[novel.Character, novel.Character], float]:
+    """返回计算两个角色关系强度（0~1）的函数
+
+    关系强度为两个角色按章节共现的Dice系数（一起出场的章节数 / 各自出场章节数的平均值）。
+    出场矩阵无法构建或角色没有出场记录时，退回按两个角色重要性的估计。
+    """
+    try:
+        lookup = cooccurrence_service.strength_lookup(db, novel_id)
+    except Exception as e:
+        logger.warning(f"构建出场矩阵失败，关系强度按角色重要性估计: {str(e)}")
+        lookup = None
+
+    def strength(a: novel.Character, b: novel.Character) -> float:
+        value = lookup(a.name, b.name) if lookup else None
+        if value is None:
+            return min(1.0, 0.5 + (a.importance or 1) * 0.1 + (b.importance or 1) * 0.1)
+        return value
+
+    return strength
+
 async def get_relationship_graph(
     db: Session,
     novel_id: int,
@@ -31,8 +52,8 @@ async def get_relationship_graph(
     # 记录请求参数
     logger.info(f"请求关系图: novel_id={novel_id}, character_id={character_id}, depth={depth}, force_refresh={force_refresh}")
     
-    # 获取小说
-    novel_obj = novel_service.get_novel(db=db, novel_id=novel_id)
+    # 获取小说，同步查询放到线程池执行，避免阻塞事件循环
+    novel_obj = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=novel_id)
     if not novel_obj:
         raise ValueError("小说不存在")
     
@@ -41,7 +62,7 @@ async def get_relationship_graph(
         logger.info("强制刷新模式，将调用大语言模型进行关系重新分析")
         
         # 获取小说内容
-        content = novel_service.get_novel_chapters_content(db=db, novel_id=novel_id)
+        content = await run_in_threadpool(novel_service.get_novel_chapters_content, db=db, novel_id=novel_id)
         if not content:
             raise ValueError("小说内容为空")
         
@@ -62,179 +83,18 @@ async def get_relationship_graph(
             # 直接调用OpenAI API提取角色关系
             relationship_data = await OpenAIClient.extract_character_relationships(content + f"\n\n[分析提示: {analysis_hint}]")
             
-            # 在数据库中删除现有关系（仅在强制刷新时）
-            existing_relationships = db.query(novel.Relationship).filter(
-                novel.Relationship.novel_id == novel_id
-            ).all()
-            
-            if existing_relationships:
-                for rel in existing_relationships:
-                    db.delete(rel)
-                db.flush()
-                logger.info(f"删除了 {len(existing_relationships)} 条现有关系")
-            
-            # 处理提取的关系
-            nodes = relationship_data.get("nodes", [])
-            edges = relationship_data.get("edges", [])
-            
-            logger.info(f"AI分析结果: 节点数={len(nodes)}, 边数={len(edges)}")
-            
-            # 保存角色数据
-            character_map = {}
-            for node in nodes:
-                # 检查角色是否已存在
-                existing_character = db.query(novel.Character).filter(
-                    novel.Character.novel_id == novel_id,
-                    # 使用更精确的名称匹配，处理可能有空格或标点符号差异的情况
-                    novel.Character.name.ilike(node["name"].strip())
-                ).first()
-                
-                if existing_character:
-                    # 更新现有角色
-                    existing_character.description = node.get("description", existing_character.description)
-                    # 仅当新重要性高于现有重要性时更新
-                    if node.get("importance", 0) > (existing_character.importance or 0):
-                        existing_character.importance = node.get("importance")
-                    # 记录角色ID映射
-                    character_map[node["name"]] = existing_character.id
-                    logger.info(f"更新已存在角色: {node['name']} (ID: {existing_character.id})")
-                else:
-                    # 再次检查名称相似但不完全匹配的角色
-                    similar_characters = db.query(novel.Character).filter(
-                        novel.Character.novel_id == novel_id,
-                        novel.Character.name.ilike(f"%{node['name'].split()[0]}%") if ' ' in node['name'] else novel.Character.name.ilike(f"%{node['name']}%")
-                    ).all()
-                    
-                    if similar_characters:
-                        # 找到最相似的角色
-                        logger.info(f"发现相似角色，名称: {node['name']}")
-                        similar_character = similar_characters[0]
-                        # 用户可以后续手动合并
-                        # 这里仍然使用现有角色
-                        character_map[node["name"]] = similar_character.id
-                        logger.info(f"使用相似角色: {similar_character.name} (ID: {similar_character.id})")
-                    else:
-                        # 创建新角色
-                        new_character = novel.Character(
-                            name=node["name"],
-                            novel_id=novel_id,
-                            description=node.get("description", ""),
-                            importance=node.get("importance", 3)
-                        )
-                        db.add(new_character)
-                        db.flush()
-                        character_map[node["name"]] = new_character.id
-                        logger.info(f"创建新角色: {node['name']} (ID: {new_character.id})")
-            
-            # 保存关系数据
-            for edge in edges:
-                source_name = edge["source_name"]
-                target_name = edge["target_name"]
-                
-                source_id = character_map.get(source_name)
-                target_id = character_map.get(target_name)
-                
-                if source_id and target_id:
-                    # 创建新的关系记录
-                    new_relationship = novel.Relationship(
-                        novel_id=novel_id,
-                        from_character_id=source_id,
-                        to_character_id=target_id,
-                        relation_type=edge.get("relation", "关系未知"),
-                        description=edge.get("description", "")
-                    )
-                    db.add(new_relationship)
-            
-            # 提交更改
-            db.commit()
-            
-            # 检查特定角色关系是否存在（用于调试）
-            expected_relationships = [
-                ("刘羡阳", "姚老头"),
-                ("锦衣少年", "陈平安"),
-                ("锦衣少年", "宋集薪")
-            ]
-            
-            # 当前已分析的关系
-            current_edges = [(edge["source_name"], edge["target_name"]) for edge in edges]
-            for source, target in expected_relationships:
-                if (source, target) not in current_edges and (target, source) not in current_edges:
-                    logger.warning(f"警告：未能分析出 '{source}' 和 '{target}' 之间的关系")
-            
-            # 重新获取所有角色用于构建响应
-            characters = db.query(novel.Character).filter(
-                novel.Character.novel_id == novel_id
-            ).all()
-            
-            # 重新获取所有关系用于构建响应
-            relationships = db.query(novel.Relationship).filter(
-                novel.Relationship.novel_id == novel_id
-            ).all()
-            
-            # 构建节点和边的响应格式
-            response_nodes = []
-            response_edges = []
-            
-            # 构建节点映射
-            node_map = {}
-            for i, character in enumerate(characters):
-                node_id = i + 1
-                node_map[character.id] = node_id
-                
-                response_nodes.append({
-                    "id": node_id,
-                    "name": character.name,
-                    "value": 10 + (character.importance or 1) * 5,
-                    "character_id": character.id,
-                    "importance": character.importance or 1
-                })
-            
-            # 构建边
-            edge_id = 1
-            for relationship in relationships:
-                if relationship.from_character_id in node_map and relationship.to_character_id in node_map:
-                    source_id = node_map[relationship.from_character_id]
-                    target_id = node_map[relationship.to_character_id]
-                    
-                    from_char = next((c for c in characters if c.id == relationship.from_character_id), None)
-                    to_char = next((c for c in characters if c.id == relationship.to_character_id), None)
-                    
-                    if from_char and to_char:
-                        response_edges.append({
-                            "id": edge_id,
-                            "source_id": source_id,
-                            "target_id": target_id,
-                            "source_name": from_char.name,
-                            "target_name": to_char.name,
-                            "relation": relationship.relation_type,
-                            "description": relationship.description,
-                            "importance": 0.5 + (from_char.importance or 1) * 0.1 + (to_char.importance or 1) * 0.1
-                        })
-                        edge_id += 1
-            
-            # 构建并返回响应
-            result = {
-                "nodes": response_nodes,
-                "edges": response_edges
-            }
-            
-            # 如果指定了中心角色，过滤关系图
-            if character_id:
-                character = novel_service.get_character(db=db, character_id=character_id)
-                if character:
-                    result = filter_relationship_graph(
-                        graph_data=result,
-                        center_name=character.name,
-                        depth=depth
-                    )
+            # 替换现有关系并构建关系图，数据库操作在写队列中执行
+            result = await run_serialized_write(
+                save_extracted_relationships, db, novel_id, character_id, depth, relationship_data
+            )
             
             # 保存到数据库
-            save_relationship_graph(db, novel_id, character_id, depth, result)
+            await run_serialized_write(save_relationship_graph, db, novel_id, character_id, depth, result)
             
             return result
             
         except Exception as e:
-            db.rollback()
+            await run_in_threadpool(db.rollback)
             logger.error(f"强制重新分析关系失败: {str(e)}")
             # 如果重新分析失败，回退到使用现有关系
             logger.info("回退到使用现有关系数据")
@@ -243,13 +103,277 @@ async def get_relationship_graph(
     # 如果不是强制刷新，尝试从数据库获取缓存的关系图
     if not force_refresh:
         logger.info(f"尝试获取缓存数据 (force_refresh={force_refresh})")
-        cached_graph = get_cached_relationship_graph(db, novel_id, character_id, depth)
+        cached_graph = await run_in_threadpool(get_cached_relationship_graph, db, novel_id, character_id, depth)
         if cached_graph:
             logger.info(f"从数据库缓存获取关系图数据: novel_id={novel_id}, character_id={character_id}, depth={depth}")
             return cached_graph
     else:
         logger.info(f"强制刷新模式，跳过缓存检查 (force_refresh={force_refresh})")
     
+    # 用已分析的角色和关系构建关系图，同步查询在线程池中执行
+    graph = await run_in_threadpool(build_existing_relationship_graph, db, novel_id)
+    if graph is None:
+        logger.warning("小说中没有已分析的角色，无法生成关系网络")
+        return {"nodes": [], "edges": []}
+    nodes, edges = graph["nodes"], graph["edges"]
+    
+    # 如果关系数据不足，使用OpenAI补充分析
+    if len(edges) < len(nodes) * 0.5:  # 如果关系数少于角色数的一半，则需要额外分析
+        logger.info("现有关系数据不足，使用OpenAI补充分析")
+        
+        # 优先使用分层摘要覆盖全书，尚未构建时退回截取正文开头
+        content = await run_in_threadpool(summary_service.build_compact_context, db=db, novel_id=novel_id)
+        if not content:
+            content = await run_in_threadpool(novel_service.get_novel_chapters_content, db=db, novel_id=novel_id, max_chars=70000)
+        if not content:
+            raise ValueError("小说内容为空")
+        
+        try:
+            # 构建角色列表作为提示，限制角色数量以避免提示太长
+            character_list = ", ".join(graph["prompt_names"][:20])
+            
+            # 调用OpenAI API提取已知角色之间的关系
+            extracted_relationships = await OpenAIClient.extract_character_relationships_from_list(
+                content, character_list
+            )
+            
+            # 合并提取的关系并写入数据库
+            await run_serialized_write(merge_extracted_relationships, db, novel_id, graph, extracted_relationships)
+                
+        except Exception as e:
+            logger.error(f"使用OpenAI提取角色关系失败: {str(e)}")
+            # 即使OpenAI分析失败，我们仍然返回已有的关系数据
+    
+    # 汇总关系图数据
+    relationship_data = {
+        "nodes": nodes,
+        "edges": edges
+    }
+    
+    # 如果指定了中心角色，过滤关系图
+    if character_id:
+        character = await run_in_threadpool(novel_service.get_character, db=db, character_id=character_id)
+        if not character:
+            raise ValueError("指定的角色不存在")
+            
+        # 过滤出与中心角色相关的节点和边
+        filtered_data = filter_relationship_graph(
+            graph_data=relationship_data,
+            center_name=character.name,
+            depth=depth
+        )
+        
+        # 保存到数据库
+        await run_serialized_write(save_relationship_graph, db, novel_id, character_id, depth, filtered_data)
+        
+        return filtered_data
+    
+    # 保存到数据库
+    await run_serialized_write(save_relationship_graph, db, novel_id, None, depth, relationship_data)
+    
+    return relationship_data
+
+def save_extracted_relationships(
+    db: Session,
+    novel_id: int,
+    character_id: Optional[int],
+    depth: int,
+    relationship_data: Dict[str, Any]
+) -> Dict[str, Any]:
+    """用模型重新提取的角色关系替换现有关系，返回构建好的关系图
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        character_id: 可选的中心角色ID
+        depth: 关系网络深度
+        relationship_data: 模型返回的节点和边
+        
+    Returns:
+        包含节点和边的字典
+    """
+    # 在数据库中删除现有关系（仅在强制刷新时）
+    existing_relationships = db.query(novel.Relationship).filter(
+        novel.Relationship.novel_id == novel_id
+    ).all()
+    
+    if existing_relationships:
+        for rel in existing_relationships:
+            db.delete(rel)
+        db.flush()
+        logger.info(f"删除了 {len(existing_relationships)} 条现有关系")
+    
+    # 处理提取的关系
+    nodes = relationship_data.get("nodes", [])
+    edges = relationship_data.get("edges", [])
+    
+    logger.info(f"AI分析结果: 节点数={len(nodes)}, 边数={len(edges)}")
+    
+    # 保存角色数据
+    character_map = {}
+    profile_index = character_profile_service.CharacterProfileIndex(db, novel_id)
+    for node in nodes:
+        # 检查角色是否已存在
+        existing_character = db.query(novel.Character).filter(
+            novel.Character.novel_id == novel_id,
+            # 使用更精确的名称匹配，处理可能有空格或标点符号差异的情况
+            novel.Character.name.ilike(node["name"].strip())
+        ).first()
+        
+        if existing_character:
+            # 更新现有角色
+            existing_character.description = node.get("description", existing_character.description)
+            # 仅当新重要性高于现有重要性时更新
+            if node.get("importance", 0) > (existing_character.importance or 0):
+                existing_character.importance = node.get("importance")
+            # 记录角色ID映射
+            character_map[node["name"]] = existing_character.id
+            logger.info(f"更新已存在角色: {node['name']} (ID: {existing_character.id})")
+        else:
+            # 再次检查名称相似但不完全匹配的角色
+            similar_characters = db.query(novel.Character).filter(
+                novel.Character.novel_id == novel_id,
+                novel.Character.name.ilike(f"%{node['name'].split()[0]}%") if ' ' in node['name'] else novel.Character.name.ilike(f"%{node['name']}%")
+            ).all()
+            
+            if similar_characters:
+                # 找到最相似的角色
+                logger.info(f"发现相似角色，名称: {node['name']}")
+                similar_character = similar_characters[0]
+                # 用户可以后续手动合并
+                # 这里仍然使用现有角色
+                character_map[node["name"]] = similar_character.id
+                logger.info(f"使用相似角色: {similar_character.name} (ID: {similar_character.id})")
+            else:
+                # 创建新角色
+                new_character = novel.Character(
+                    name=node["name"],
+                    novel_id=novel_id,
+                    description=node.get("description", ""),
+                    importance=node.get("importance", 3)
+                )
+                db.add(new_character)
+                profile_index.record(new_character)
+                db.flush()
+                character_map[node["name"]] = new_character.id
+                logger.info(f"创建新角色: {node['name']} (ID: {new_character.id})")
+    
+    # 保存关系数据
+    for edge in edges:
+        source_name = edge["source_name"]
+        target_name = edge["target_name"]
+        
+        source_id = character_map.get(source_name)
+        target_id = character_map.get(target_name)
+        
+        if source_id and target_id:
+            # 创建新的关系记录
+            new_relationship = novel.Relationship(
+                novel_id=novel_id,
+                from_character_id=source_id,
+                to_character_id=target_id,
+                relation_type=edge.get("relation", "关系未知"),
+                description=edge.get("description", "")
+            )
+            db.add(new_relationship)
+    
+    # 提交更改
+    db.commit()
+    
+    # 检查特定角色关系是否存在（用于调试）
+    expected_relationships = [
+        ("刘羡阳", "姚老头"),
+        ("锦衣少年", "陈平安"),
+        ("锦衣少年", "宋集薪")
+    ]
+    
+    # 当前已分析的关系
+    current_edges = [(edge["source_name"], edge["target_name"]) for edge in edges]
+    for source, target in expected_relationships:
+        if (source, target) not in current_edges and (target, source) not in current_edges:
+            logger.warning(f"警告：未能分析出 '{source}' 和 '{target}' 之间的关系")
+    
+    # 重新获取所有角色用于构建响应
+    characters = db.query(novel.Character).filter(
+        novel.Character.novel_id == novel_id
+    ).all()
+    
+    # 重新获取所有关系用于构建响应
+    relationships = db.query(novel.Relationship).filter(
+        novel.Relationship.novel_id == novel_id
+    ).all()
+    
+    # 构建节点和边的响应格式
+    response_nodes = []
+    response_edges = []
+    
+    # 构建节点映射
+    node_map = {}
+    for i, character in enumerate(characters):
+        node_id = i + 1
+        node_map[character.id] = node_id
+        
+        response_nodes.append({
+            "id": node_id,
+            "name": character.name,
+            "value": 10 + (character.importance or 1) * 5,
+            "character_id": character.id,
+            "importance": character.importance or 1
+        })
+    
+    # 构建边，关系强度按角色共现计算
+    edge_id = 1
+    strength = relationship_strength(db, novel_id)
+    for relationship in relationships:
+        if relationship.from_character_id in node_map and relationship.to_character_id in node_map:
+            source_id = node_map[relationship.from_character_id]
+            target_id = node_map[relationship.to_character_id]
+            
+            from_char = next((c for c in characters if c.id == relationship.from_character_id), None)
+            to_char = next((c for c in characters if c.id == relationship.to_character_id), None)
+            
+            if from_char and to_char:
+                response_edges.append({
+                    "id": edge_id,
+                    "source_id": source_id,
+                    "target_id": target_id,
+                    "source_name": from_char.name,
+                    "target_name": to_char.name,
+                    "relation": relationship.relation_type,
+                    "description": relationship.description,
+                    "importance": strength(from_char, to_char)
+                })
+                edge_id += 1
+    
+    # 构建并返回响应
+    result = {
+        "nodes": response_nodes,
+        "edges": response_edges
+    }
+    
+    # 如果指定了中心角色，过滤关系图
+    if character_id:
+        character = novel_service.get_character(db=db, character_id=character_id)
+        if character:
+            result = filter_relationship_graph(
+                graph_data=result,
+                center_name=character.name,
+                depth=depth
+            )
+    
+    return result
+
+def build_existing_relationship_graph(db: Session, novel_id: int) -> Optional[Dict[str, Any]]:
+    """用已分析的角色和关系构建关系图
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        
+    Returns:
+        包含nodes、edges、character_map（角色名到节点的映射）、prompt_names（补充分析时提示的角色名）
+        和existing_count（已有关系数）的字典，小说没有角色时返回None
+    """
     # 获取小说中已分析的角色列表
     characters = db.query(novel.Character).filter(
         novel.Character.novel_id == novel_id
@@ -258,8 +382,7 @@ async def get_relationship_graph(
     logger.info(f"找到小说中已分析的角色: {len(characters)}个")
     
     if not characters:
-        logger.warning("小说中没有已分析的角色，无法生成关系网络")
-        return {"nodes": [], "edges": []}
+        return None
     
     # 构建角色节点映射
     nodes = []
@@ -292,6 +415,7 @@ async def get_relationship_graph(
     edges = []
     edge_id = 1
     processed_pairs = set()  # 用于跟踪已处理的角色对
+    strength = relationship_strength(db, novel_id)
     
     for rel in existing_relationships:
         from_char = db.query(novel.Character).filter(
@@ -313,8 +437,8 @@ async def get_relationship_graph(
             source_id = character_map[from_char.name]["id"]
             target_id = character_map[to_char.name]["id"]
             
-            # 根据角色重要性计算关系重要性
-            importance = 0.5 + (from_char.importance or 1) * 0.1 + (to_char.importance or 1) * 0.1
+            # 关系重要性取两个角色的共现强度
+            importance = strength(from_char, to_char)
             
             edges.append({
                 "id": edge_id,
@@ -328,176 +452,149 @@ async def get_relationship_graph(
             })
             edge_id += 1
     
-    # 如果关系数据不足，使用OpenAI补充分析
-    if len(edges) < len(characters) * 0.5:  # 如果关系数少于角色数的一半，则需要额外分析
-        logger.info("现有关系数据不足，使用OpenAI补充分析")
-        
-        # 获取小说内容
-        content = novel_service.get_novel_chapters_content(db=db, novel_id=novel_id)
-        if not content:
-            raise ValueError("小说内容为空")
+    return {
+        "nodes": nodes,
+        "edges": edges,
+        "character_map": character_map,
+        "prompt_names": [char.name for char in characters if char.importance and char.importance >= 2],
+        "existing_count": len(existing_relationships)
+    }
+
+def merge_extracted_relationships(
+    db: Session,
+    novel_id: int,
+    graph: Dict[str, Any],
+    extracted_relationships: Dict[str, Any]
+) -> None:
+    """把补充分析提取的关系合并到关系图（原地修改graph）并写入数据库
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        graph: build_existing_relationship_graph返回的关系图
+        extracted_relationships: 模型返回的关系
+    """
+    edges = graph["edges"]
+    character_map = graph["character_map"]
+    edge_id = len(edges) + 1
+    profile_index = character_profile_service.CharacterProfileIndex(db, novel_id)
+    
+    # 合并提取的关系
+    for rel in extracted_relationships.get("edges", []):
+        source_name = rel.get("source_name")
+        target_name = rel.get("target_name")
         
-        try:
-            # 构建角色列表作为提示
-            character_names = [char.name for char in characters if char.importance and char.importance >= 2]
-            # 限制角色数量以避免提示太长
-            if len(character_names) > 20:
-                character_names = character_names[:20]
+        # 首先检查源角色和目标角色是否在已知角色映射中
+        # 如果不在，则检查数据库中是否已存在相同名称的角色
+        if source_name not in character_map:
+            # 检查是否已有相同名称的角色
+            existing_source = db.query(novel.Character).filter(
+                novel.Character.novel_id == novel_id,
+                novel.Character.name == source_name
+            ).first()
             
-            character_list = ", ".join(character_names)
+            if existing_source:
+                # 使用已存在的角色
+                character_map[source_name] = {"id": existing_source.id, "character_id": existing_source.id}
+            else:
+                # 创建新角色
+                new_source = novel.Character(
+                    name=source_name,
+                    novel_id=novel_id,
+                    description="",  # 可以后续更新
+                    importance=2  # 默认重要性
+                )
+                db.add(new_source)
+                profile_index.record(new_source)
+                db.flush()
+                character_map[source_name] = {"id": new_source.id, "character_id": new_source.id}
+        
+        if target_name not in character_map:
+            # 检查是否已有相同名称的角色
+            existing_target = db.query(novel.Character).filter(
+                novel.Character.novel_id == novel_id,
+                novel.Character.name == target_name
+            ).first()
             
-            # 调用OpenAI API提取已知角色之间的关系
-            extracted_relationships = await OpenAIClient.extract_character_relationships_from_list(
-                content, character_list
-            )
+            if existing_target:
+                # 使用已存在的角色
+                character_map[target_name] = {"id": existing_target.id, "character_id": existing_target.id}
+            else:
+                # 创建新角色
+                new_target = novel.Character(
+                    name=target_name,
+                    novel_id=novel_id,
+                    description="",  # 可以后续更新
+                    importance=2  # 默认重要性
+                )
+                db.add(new_target)
+                profile_index.record(new_target)
+                db.flush()
+                character_map[target_name] = {"id": new_target.id, "character_id": new_target.id}
+        
+        if source_name in character_map and target_name in character_map:
+            # 检查是否已存在这对角色的关系
+            pair_exists = False
+            for existing_edge in edges:
+                if (existing_edge["source_name"] == source_name and existing_edge["target_name"] == target_name) or \
+                   (existing_edge["source_name"] == target_name and existing_edge["target_name"] == source_name):
+                    pair_exists = True
+                    break
             
-            # 合并提取的关系
-            for rel in extracted_relationships.get("edges", []):
-                source_name = rel.get("source_name")
-                target_name = rel.get("target_name")
-                
-                # 首先检查源角色和目标角色是否在已知角色映射中
-                # 如果不在，则检查数据库中是否已存在相同名称的角色
-                if source_name not in character_map:
-                    # 检查是否已有相同名称的角色
-                    existing_source = db.query(novel.Character).filter(
-                        novel.Character.novel_id == novel_id,
-                        novel.Character.name == source_name
-                    ).first()
-                    
-                    if existing_source:
-                        # 使用已存在的角色
-                        character_map[source_name] = {"id": existing_source.id, "character_id": existing_source.id}
-                    else:
-                        # 创建新角色
-                        new_source = novel.Character(
-                            name=source_name,
-                            novel_id=novel_id,
-                            description="",  # 可以后续更新
-                            importance=2  # 默认重要性
-                        )
-                        db.add(new_source)
-                        db.flush()
-                        character_map[source_name] = {"id": new_source.id, "character_id": new_source.id}
+            if not pair_exists:
+                source_id = character_map[source_name]["id"]
+                target_id = character_map[target_name]["id"]
                 
-                if target_name not in character_map:
-                    # 检查是否已有相同名称的角色
-                    existing_target = db.query(novel.Character).filter(
-                        novel.Character.novel_id == novel_id,
-                        novel.Character.name == target_name
-                    ).first()
-                    
-                    if existing_target:
-                        # 使用已存在的角色
-                        character_map[target_name] = {"id": existing_target.id, "character_id": existing_target.id}
-                    else:
-                        # 创建新角色
-                        new_target = novel.Character(
-                            name=target_name,
-                            novel_id=novel_id,
-                            description="",  # 可以后续更新
-                            importance=2  # 默认重要性
-                        )
-                        db.add(new_target)
-                        db.flush()
-                        character_map[target_name] = {"id": new_target.id, "character_id": new_target.id}
-                
-                if source_name in character_map and target_name in character_map:
-                    # 检查是否已存在这对角色的关系
-                    pair_exists = False
-                    for existing_edge in edges:
-                        if (existing_edge["source_name"] == source_name and existing_edge["target_name"] == target_name) or \
-                           (existing_edge["source_name"] == target_name and existing_edge["target_name"] == source_name):
-                            pair_exists = True
-                            break
-                    
-                    if not pair_exists:
-                        source_id = character_map[source_name]["id"]
-                        target_id = character_map[target_name]["id"]
-                        
-                        edges.append({
-                            "id": edge_id,
-                            "source_id": source_id,
-                            "target_id": target_id,
-                            "source_name": source_name,
-                            "target_name": target_name,
-                            "relation": rel.get("relation", "关系未知"),
-                            "description": rel.get("description", ""),
-                            "importance": rel.get("importance", 0.5)
-                        })
-                        edge_id += 1
+                edges.append({
+                    "id": edge_id,
+                    "source_id": source_id,
+                    "target_id": target_id,
+                    "source_name": source_name,
+                    "target_name": target_name,
+                    "relation": rel.get("relation", "关系未知"),
+                    "description": rel.get("description", ""),
+                    "importance": rel.get("importance", 0.5)
+                })
+                edge_id += 1
+    
+    # 添加关系到数据库
+    added_relation_count = 0
+    existing_relation_count = 0
+    for edge in edges:
+        if edge.get("id") > graph["existing_count"]:  # 只添加新的关系
+            source_char_id = character_map[edge["source_name"]]["character_id"]
+            target_char_id = character_map[edge["target_name"]]["character_id"]
             
-            # 添加关系到数据库
-            added_relation_count = 0
-            existing_relation_count = 0
-            for edge in edges:
-                if edge.get("id") > len(existing_relationships):  # 只添加新的关系
-                    source_char_id = character_map[edge["source_name"]]["character_id"]
-                    target_char_id = character_map[edge["target_name"]]["character_id"]
-                    
-                    # 检查正向关系是否已存在
-                    existing_forward = db.query(novel.Relationship).filter(
-                        novel.Relationship.novel_id == novel_id,
-                        novel.Relationship.from_character_id == source_char_id,
-                        novel.Relationship.to_character_id == target_char_id
-                    ).first()
-                    
-                    # 检查反向关系是否已存在
-                    existing_backward = db.query(novel.Relationship).filter(
-                        novel.Relationship.novel_id == novel_id,
-                        novel.Relationship.from_character_id == target_char_id,
-                        novel.Relationship.to_character_id == source_char_id
-                    ).first()
-                    
-                    if not existing_forward and not existing_backward:
-                        # 只有当正反两个方向都没有关系时才添加
-                        new_relationship = novel.Relationship(
-                            novel_id=novel_id,
-                            from_character_id=source_char_id,
-                            to_character_id=target_char_id,
-                            relation_type=edge["relation"],
-                            description=edge["description"]
-                        )
-                        db.add(new_relationship)
-                        added_relation_count += 1
-                    else:
-                        existing_relation_count += 1
+            # 检查正向关系是否已存在
+            existing_forward = db.query(novel.Relationship).filter(
+                novel.Relationship.novel_id == novel_id,
+                novel.Relationship.from_character_id == source_char_id,
+                novel.Relationship.to_character_id == target_char_id
+            ).first()
             
-            db.commit()
-            logger.info(f"添加了{added_relation_count}个新的角色关系到数据库，跳过了{existing_relation_count}个已存在的关系")
-                
-        except Exception as e:
-            logger.error(f"使用OpenAI提取角色关系失败: {str(e)}")
-            # 即使OpenAI分析失败，我们仍然返回已有的关系数据
-    
-    # 汇总关系图数据
-    relationship_data = {
-        "nodes": nodes,
-        "edges": edges
-    }
-    
-    # 如果指定了中心角色，过滤关系图
-    if character_id:
-        character = novel_service.get_character(db=db, character_id=character_id)
-        if not character:
-            raise ValueError("指定的角色不存在")
+            # 检查反向关系是否已存在
+            existing_backward = db.query(novel.Relationship).filter(
+                novel.Relationship.novel_id == novel_id,
+                novel.Relationship.from_character_id == target_char_id,
+                novel.Relationship.to_character_id == source_char_id
+            ).first()
             
-        # 过滤出与中心角色相关的节点和边
-        filtered_data = filter_relationship_graph(
-            graph_data=relationship_data,
-            center_name=character.name,
-            depth=depth
-        )
-        
-        # 保存到数据库
-        save_relationship_graph(db, novel_id, character_id, depth, filtered_data)
-        
-        return filtered_data
-    
-    # 保存到数据库
-    save_relationship_graph(db, novel_id, None, depth, relationship_data)
+            if not existing_forward and not existing_backward:
+                # 只有当正反两个方向都没有关系时才添加
+                new_relationship = novel.Relationship(
+                    novel_id=novel_id,
+                    from_character_id=source_char_id,
+                    to_character_id=target_char_id,
+                    relation_type=edge["relation"],
+                    description=edge["description"]
+                )
+                db.add(new_relationship)
+                added_relation_count += 1
+            else:
+                existing_relation_count += 1
     
-    return relationship_data
+    db.commit()
+    logger.info(f"添加了{added_relation_count}个新的角色关系到数据库，跳过了{existing_relation_count}个已存在的关系")
 
 def get_cached_relationship_graph(
     db: Session,
@@ -734,7 +831,8 @@ def get_character_journey(db: Session, novel_id: int, character_id: int) -> Dict
         novel.Relationship.novel_id == novel_id
     ).all()
     
-    # 处理角色的关系
+    # 处理角色的关系，关系强度按共现计算，以百分比返回
+    strength = relationship_strength(db, novel_id)
     for rel in from_relationships:
         other_character = db.query(novel.Character).filter(
             novel.Character.id == rel.to_character_id
@@ -749,7 +847,7 @@ def get_character_journey(db: Session, novel_id: int, character_id: int) -> Dict
                 "direction": "outgoing",
                 "importance": other_character.importance or 1,
                 "first_chapter": rel.first_chapter_id,
-                "strength": 0.5 + (other_character.importance or 1) * 0.1  # 根据角色重要性计算关系强度
+                "strength": round(strength(character, other_character) * 100, 1)
             })
     
     for rel in to_relationships:
@@ -766,7 +864,7 @@ def get_character_journey(db: Session, novel_id: int, character_id: int) -> Dict
                 "direction": "incoming",
                 "importance": other_character.importance or 1,
                 "first_chapter": rel.first_chapter_id,
-                "strength": 0.5 + (other_character.importance or 1) * 0.1  # 根据角色重要性计算关系强度
+                "strength": round(strength(character, other_character) * 100, 1)
             })
     
     # 分析角色旅程的阶段
@@ -1,18 +1,52 @@
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Sequence, Union
 from sqlalchemy.orm import Session
 
+from app.core.pagination import keyset_after, query_columns
 from app.models.novel import Chapter
 from app.schemas.chapter import ChapterCreate, ChapterUpdate
+from app.services.novel_service import bump_content_version
+
+# 修改后会影响分析和问答结果的章节字段
+CONTENT_FIELDS = {"title", "content", "number"}
+
+# 章节列表游标分页的排序键
+CHAPTER_CURSOR_FIELDS = ("number", "id")
 
 def get_chapter(db: Session, chapter_id: int) -> Optional[Chapter]:
     """根据ID获取章节"""
     return db.query(Chapter).filter(Chapter.id == chapter_id).first()
 
-def get_chapters_by_novel_id(db: Session, novel_id: int, skip: int = 0, limit: int = 100) -> List[Chapter]:
-    """获取指定小说的所有章节"""
-    return db.query(Chapter).filter(
-        Chapter.novel_id == novel_id
-    ).order_by(Chapter.number).offset(skip).limit(limit).all()
+def get_chapters_by_novel_id(
+    db: Session,
+    novel_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[Sequence[Any]] = None,
+    fields: Optional[List[str]] = None
+) -> List[Any]:
+    """获取指定小说的章节，按 (number, id) 排序
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        skip: 偏移量，仅在未使用游标时生效
+        limit: 返回数量
+        after: 上一页最后一章的 (number, id)，指定时使用游标分页
+        fields: 只读取的字段，未指定时返回完整的章节对象
+        
+    Returns:
+        章节对象列表，指定fields时为只包含这些字段（及排序键）的行
+    """
+    if fields:
+        query = db.query(*query_columns(Chapter, fields, CHAPTER_CURSOR_FIELDS))
+    else:
+        query = db.query(Chapter)
+    query = query.filter(Chapter.novel_id == novel_id)
+    if after is not None:
+        query = query.filter(keyset_after((Chapter.number, Chapter.id), after))
+    else:
+        query = query.offset(skip)
+    return query.order_by(Chapter.number, Chapter.id).limit(limit).all()
 
 def create_chapter(db: Session, obj_in: ChapterCreate) -> Chapter:
     """创建新章节"""
@@ -27,6 +61,7 @@ def create_chapter(db: Session, obj_in: ChapterCreate) -> Chapter:
         word_count=word_count
     )
     db.add(db_obj)
+    bump_content_version(db, obj_in.novel_id)
     db.commit()
     db.refresh(db_obj)
     return db_obj
@@ -42,6 +77,8 @@ def update_chapter(db: Session, db_obj: Chapter, obj_in: Union[ChapterUpdate, Di
         setattr(db_obj, field, update_data[field])
     
     db.add(db_obj)
+    if CONTENT_FIELDS & set(update_data):
+        bump_content_version(db, db_obj.novel_id)
     db.commit()
     db.refresh(db_obj)
     return db_obj
@@ -51,4 +88,5 @@ def delete_chapter(db: Session, chapter_id: int) -> None:
     chapter = get_chapter(db, chapter_id)
     if chapter:
         db.delete(chapter)
+        bump_content_version(db, chapter.novel_id)
         db.commit() 
\ No newline at end of file
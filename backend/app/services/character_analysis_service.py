@@ -1,13 +1,262 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import exists
+from sqlalchemy.orm import Session, load_only
+from fastapi.concurrency import run_in_threadpool
+from contextlib import closing
 from typing import List, Dict, Any, Optional
 import logging
 
 from app.models import novel
-from app.services import novel_service
+from app.services import novel_service, character_profile_service
+from app.core.config import settings
+from app.core.database import run_serialized_write
 from app.core.openai_client import OpenAIClient
+from app.core import entity_prepass, request_packer
 
 logger = logging.getLogger(__name__)
 
+def load_known_profiles(
+    db: Session,
+    novel_id: int,
+    exclude_chapter_ids: Optional[List[int]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """读取小说已有角色档案的快照（名称、别名、描述、重要性），供分析阶段在内存中使用
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        exclude_chapter_ids: 即将重新分析的章节，只在这些章节出场的档案写入时会被清除，不计入已知角色
+    """
+    query = db.query(
+        novel.CharacterProfile.name,
+        novel.CharacterProfile.alias,
+        novel.CharacterProfile.description,
+        novel.CharacterProfile.importance
+    ).filter(novel.CharacterProfile.novel_id == novel_id)
+    if exclude_chapter_ids:
+        query = query.filter(exists().where(
+            novel.CharacterAppearance.profile_id == novel.CharacterProfile.id,
+            novel.CharacterAppearance.chapter_id.not_in(exclude_chapter_ids)
+        ))
+    rows = query.all()
+    return {
+        row.name: {
+            "name": row.name,
+            "alias": list(row.alias or []),
+            "description": row.description or "",
+            "importance": row.importance or 1
+        }
+        for row in rows
+    }
+
+def _known_name_index(known_profiles: Dict[str, Dict[str, Any]]) -> entity_prepass.KnownNameIndex:
+    """用已有角色档案的名称和别名构建已知名称索引"""
+    return entity_prepass.KnownNameIndex({
+        name: profile["alias"] for name, profile in known_profiles.items()
+    })
+
+def _known_characters_data(names: List[str], known_profiles: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """不调用模型，按预扫描找到的已知角色生成章节角色数据，沿用角色档案中的信息"""
+    return [dict(known_profiles[name]) for name in names if name in known_profiles]
+
+async def _analyze_chapter_characters(
+    db: Session,
+    novel_id: int,
+    chapters: List[novel.Chapter],
+    known_profiles: Dict[str, Dict[str, Any]]
+) -> Dict[int, List[Dict[str, Any]]]:
+    """分析一组章节中的角色，结果只保存在内存中，不写数据库
+    
+    连续的短章节打包进同一个请求，避免每章重复发送系统提示词，
+    模型结果按章节ID拆回各章节。分析全部完成后由调用方在写队列中一次性写入，
+    模型调用期间不持有数据库写锁。
+    
+    启用实体预扫描时，没有新角色候选的章节不进入完整分析：skip模式直接按已知角色记录出场，
+    delta模式在完整分析之后再打包，使用只列出已知角色的精简提示词。
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        chapters: 按顺序排列的章节（只需要ID和序号）
+        known_profiles: 已有角色档案快照，见load_known_profiles
+        
+    Returns:
+        章节ID -> 该章节的角色数据列表
+    """
+    if not chapters:
+        return {}
+    chapter_ids = {chapter.id for chapter in chapters}
+    start_number, end_number = chapters[0].number, chapters[-1].number
+    prepass = entity_prepass.available()
+    name_index = _known_name_index(known_profiles) if prepass else None
+    stats = entity_prepass.PrepassStats(entity_prepass.PERSON, novel_id)
+    # delta模式下等待精简分析的章节: 章节ID -> 本章出现的已知角色
+    known_only: Dict[int, List[str]] = {}
+    results: Dict[int, List[Dict[str, Any]]] = {}
+    
+    def chapter_texts(selected):
+        # 按章节序号范围分批流式读取正文，只保留本次分析的章节
+        with closing(novel_service.iter_novel_chapters(db, novel_id, start_number=start_number, end_number=end_number)) as rows:
+            for meta, text in rows:
+                if meta["id"] in selected:
+                    yield meta["id"], text
+    
+    def chapter_contents():
+        for chapter_id, chapter_content in chapter_texts(chapter_ids):
+            if prepass:
+                result = entity_prepass.scan(chapter_content, name_index, entity_prepass.PERSON)
+                if not result.has_new and result.known:
+                    if settings.ENTITY_PREPASS_MODE == entity_prepass.MODE_SKIP:
+                        results.setdefault(chapter_id, []).extend(_known_characters_data(result.known, known_profiles))
+                        stats.record("skip")
+                    else:
+                        known_only[chapter_id] = result.known
+                        stats.record("delta")
+                    continue
+                stats.record("full")
+            yield chapter_id, chapter_content
+    
+    async def analyze_packs(packs, known_cast=None):
+        packs = iter(packs)
+        try:
+            while True:
+                # 打包时读取章节正文并做预扫描（jieba分词较慢），在线程池中取下一个请求包，不阻塞事件循环；
+                # 生成器在各包之间依次推进，会话和名称索引不会被并发使用
+                pack = await run_in_threadpool(next, packs, None)
+                if pack is None:
+                    break
+                pack_ids = [chapter_id for chapter_id, _ in pack]
+                cast = None
+                if known_cast is not None:
+                    cast = list(dict.fromkeys(name for chapter_id in pack_ids for name in known_cast[chapter_id]))
+                try:
+                    logger.info(f"调用OpenAI API分析章节角色: chapter_ids={pack_ids}")
+                    pack_count = 0
+                    async for chapter_id, character_data in OpenAIClient.analyze_characters_packed_stream(pack, known_cast=cast):
+                        results.setdefault(chapter_id, []).append(character_data)
+                        if name_index is not None:
+                            name_index.add(character_data["name"], character_data.get("alias") or [])
+                        pack_count += 1
+                    logger.info(f"成功获取章节角色分析结果: chapter_ids={pack_ids}, 共{pack_count}个角色")
+                except Exception as e:
+                    logger.error(f"分析章节角色失败: chapter_ids={pack_ids}, error={str(e)}")
+                    # 继续处理下一组章节，不中断整个流程
+                    continue
+        finally:
+            # 提前退出时关闭章节查询
+            await run_in_threadpool(packs.close)
+    
+    await analyze_packs(request_packer.pack_chapters(
+        chapter_contents(),
+        max_tokens=settings.ANALYSIS_PACK_TOKENS,
+        max_chapters=settings.ANALYSIS_PACK_MAX_CHAPTERS
+    ))
+    
+    if known_only:
+        await analyze_packs(request_packer.pack_chapters(
+            chapter_texts(set(known_only)),
+            max_tokens=settings.ANALYSIS_PACK_TOKENS,
+            max_chapters=settings.ANALYSIS_PACK_MAX_CHAPTERS
+        ), known_cast=known_only)
+    
+    stats.log()
+    return results
+
+def _new_character(novel_id: int, chapter_id: int, character_data: Dict[str, Any]) -> novel.Character:
+    """按分析得到的角色数据创建章节角色记录"""
+    return novel.Character(
+        novel_id=novel_id,
+        chapter_id=chapter_id,
+        name=character_data["name"],
+        alias=character_data.get("alias", []),
+        description=character_data.get("description", ""),
+        importance=character_data.get("importance", 1),
+        first_appearance=character_data.get("first_appearance")
+    )
+
+def clear_characters(db: Session, novel_id: int, chapter_ids: Optional[List[int]] = None) -> int:
+    """删除小说（或指定章节）的角色记录，同时重算受影响的角色档案
+    
+    只flush不提交，和随后写入的新角色记录在同一个事务中提交。
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        chapter_ids: 需要清除的章节ID列表，为None时清除整部小说的角色
+        
+    Returns:
+        删除的角色记录数
+    """
+    character_profile_service.remove_appearances(db, novel_id, chapter_ids)
+    query = db.query(novel.Character).filter(novel.Character.novel_id == novel_id)
+    if chapter_ids is None:
+        deleted = query.delete()
+    else:
+        deleted = query.filter(
+            novel.Character.chapter_id.in_(chapter_ids)
+        ).delete(synchronize_session=False)
+    db.flush()
+    return deleted
+
+def save_characters(
+    db: Session,
+    novel_id: int,
+    chapters: List[novel.Chapter],
+    characters_by_chapter: Dict[int, List[Dict[str, Any]]],
+    clear: bool = True,
+    chapter_ids: Optional[List[int]] = None
+) -> int:
+    """在一个事务中清除旧的角色记录、写入分析结果并提交
+    
+    在写队列中执行，模型分析已在此之前完成，写锁只在删除和插入期间持有。
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        chapters: 按顺序排列的章节，按此顺序写入以维护首次出场
+        characters_by_chapter: 章节ID -> 该章节的角色数据列表
+        clear: 写入前是否清除旧的角色记录
+        chapter_ids: 需要清除的章节ID列表，为None时清除整部小说的角色
+        
+    Returns:
+        创建的角色记录数
+    """
+    if clear:
+        deleted = clear_characters(db, novel_id, chapter_ids)
+        logger.info(f"已删除{deleted}条现有角色数据")
+    
+    # 清除之后再建立档案索引，索引只包含仍然有效的档案
+    profile_index = character_profile_service.CharacterProfileIndex(db, novel_id)
+    created_count = 0
+    for chapter in chapters:
+        for character_data in characters_by_chapter.get(chapter.id, []):
+            new_character = _new_character(novel_id, chapter.id, character_data)
+            db.add(new_character)
+            # 同步写入角色档案和出场记录
+            profile_index.record(new_character, chapter)
+            created_count += 1
+    
+    db.commit()
+    return created_count
+
+def list_chapters(
+    db: Session,
+    novel_id: int,
+    start_chapter_id: Optional[int] = None,
+    end_chapter_id: Optional[int] = None
+) -> List[novel.Chapter]:
+    """按章节序号读取小说的章节元数据，可按章节ID范围过滤
+    
+    只加载ID、序号和标题，正文在分析时通过novel_service.iter_novel_chapters分批读取。
+    """
+    query = db.query(novel.Chapter).options(
+        load_only(novel.Chapter.id, novel.Chapter.number, novel.Chapter.title)
+    ).filter(novel.Chapter.novel_id == novel_id)
+    if start_chapter_id is not None:
+        query = query.filter(novel.Chapter.id >= start_chapter_id)
+    if end_chapter_id is not None:
+        query = query.filter(novel.Chapter.id <= end_chapter_id)
+    return query.order_by(novel.Chapter.number).all()
+
 async def analyze_novel_characters(db: Session, novel_id: int, force_refresh: bool = False) -> List[Dict[str, Any]]:
     """分析小说中的人物角色
     
@@ -21,153 +270,32 @@ async def analyze_novel_characters(db: Session, novel_id: int, force_refresh: bo
     """
     logger.info(f"开始分析小说人物: novel_id={novel_id}, force_refresh={force_refresh}")
     
-    # 获取小说
-    db_novel = novel_service.get_novel(db=db, novel_id=novel_id)
+    # 获取小说，同步查询放到线程池执行，避免阻塞事件循环
+    db_novel = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=novel_id)
     if not db_novel:
         raise ValueError("小说不存在")
     
-    # 获取章节信息，用于返回结果
-    chapter_info = {}
-    all_chapters = db.query(novel.Chapter).filter(
-        novel.Chapter.novel_id == novel_id
-    ).all()
-    for chapter in all_chapters:
-        chapter_info[chapter.id] = {
-            "title": chapter.title,
-            "number": chapter.number
-        }
-    
     # 如果不是强制刷新，检查是否已有角色分析结果
-    if not force_refresh and db_novel.characters:
+    if not force_refresh and await run_in_threadpool(character_profile_service.has_characters, db, novel_id):
         logger.info(f"使用现有角色数据，novel_id={novel_id}")
-        
-        # 按角色名聚合数据，获取所有章节中该角色的综合信息
-        character_aggregated = {}
-        for character in db_novel.characters:
-            if character.name not in character_aggregated:
-                character_aggregated[character.name] = {
-                    "id": character.id,
-                    "name": character.name,
-                    "alias": character.alias or [],
-                    "description": character.description or "",
-                    "first_appearance": character.first_appearance,
-                    "importance": character.importance or 1,
-                    "chapters": [],
-                    "chapter_info": []
-                }
-            
-            # 如果角色有关联章节，添加到章节列表
-            if character.chapter_id:
-                character_aggregated[character.name]["chapters"].append(character.chapter_id)
-                character_aggregated[character.name]["chapter_info"].append({
-                    "chapter_id": character.chapter_id,
-                    "chapter_title": chapter_info.get(character.chapter_id, {}).get("title", f"第{chapter_info.get(character.chapter_id, {}).get('number', '?')}章"),
-                    "chapter_number": chapter_info.get(character.chapter_id, {}).get("number", 0),
-                    "description": character.description
-                })
-        
-        return list(character_aggregated.values())
+        # 角色档案在写入时已完成聚合，这里只需一次连接查询
+        return await run_in_threadpool(character_profile_service.list_profiles, db, novel_id)
     
-    # 如果是强制刷新，先删除现有角色数据
-    if force_refresh:
-        deleted = db.query(novel.Character).filter(
-            novel.Character.novel_id == novel_id
-        ).delete()
-        logger.info(f"已删除{deleted}条现有角色数据")
+    all_chapters = await run_in_threadpool(list_chapters, db, novel_id)
     
-    # 计数和聚合数据容器
-    created_count = 0
-    character_aggregated = {}
-    
-    # 对每个章节单独进行分析
-    for chapter in all_chapters:
-        # 获取单个章节内容
-        chapter_content = novel_service.get_chapter_content(db=db, chapter_id=chapter.id)
-        if not chapter_content:
-            logger.warning(f"章节内容为空: chapter_id={chapter.id}")
-            continue
-        
-        # 使用AI分析当前章节的角色
-        try:
-            logger.info(f"调用OpenAI API分析章节角色: chapter_id={chapter.id}")
-            # 传递is_chapter_specific=True，告诉模型只分析这个章节中的角色表现
-            characters_data = await OpenAIClient.analyze_characters(chapter_content, is_chapter_specific=True)
-            logger.info(f"成功获取章节角色分析结果: chapter_id={chapter.id}, 共{len(characters_data)}个角色")
-            
-            # 为该章节创建角色记录
-            for character_data in characters_data:
-                # 创建该章节的角色记录
-                new_character = novel.Character(
-                    novel_id=novel_id,
-                    chapter_id=chapter.id,
-                    name=character_data["name"],
-                    alias=character_data.get("alias", []),
-                    description=character_data.get("description", ""),
-                    importance=character_data.get("importance", 1),
-                    first_appearance=character_data.get("first_appearance")
-                )
-                db.add(new_character)
-                created_count += 1
-                
-                # 聚合数据用于返回
-                if character_data["name"] not in character_aggregated:
-                    character_aggregated[character_data["name"]] = {
-                        "name": character_data["name"],
-                        "alias": character_data.get("alias", []),
-                        "description": character_data.get("description", ""),
-                        "importance": character_data.get("importance", 1),
-                        "first_appearance": character_data.get("first_appearance"),
-                        "chapters": [chapter.id],
-                        "chapter_info": [{
-                            "chapter_id": chapter.id,
-                            "chapter_title": chapter.title,
-                            "chapter_number": chapter.number,
-                            "description": character_data.get("description", "")
-                        }]
-                    }
-                else:
-                    # 如果角色已存在，更新重要性和描述（如果新信息更详细）
-                    if character_data.get("importance", 0) > character_aggregated[character_data["name"]]["importance"]:
-                        character_aggregated[character_data["name"]]["importance"] = character_data.get("importance", 1)
-                    
-                    # 合并描述，如果新描述更详细
-                    if len(character_data.get("description", "")) > len(character_aggregated[character_data["name"]]["description"]):
-                        character_aggregated[character_data["name"]]["description"] = character_data.get("description", "")
-                    
-                    # 合并别名
-                    existing_aliases = set(character_aggregated[character_data["name"]]["alias"])
-                    new_aliases = set(character_data.get("alias", []))
-                    merged_aliases = list(existing_aliases.union(new_aliases))
-                    character_aggregated[character_data["name"]]["alias"] = merged_aliases
-                    
-                    # 添加章节信息
-                    character_aggregated[character_data["name"]]["chapters"].append(chapter.id)
-                    character_aggregated[character_data["name"]]["chapter_info"].append({
-                        "chapter_id": chapter.id,
-                        "chapter_title": chapter.title,
-                        "chapter_number": chapter.number,
-                        "description": character_data.get("description", "")
-                    })
-        except Exception as e:
-            logger.error(f"分析章节角色失败: chapter_id={chapter.id}, error={str(e)}")
-            # 继续处理下一个章节，不中断整个流程
-            continue
+    # 整部小说重新分析，已有档案都会被清除，预扫描不沿用旧档案
+    known_profiles = {} if force_refresh else await run_in_threadpool(load_known_profiles, db, novel_id)
     
-    db.commit()
+    # 先完成模型分析（连续的短章节打包），再在写队列中一次性清除旧数据并写入，写锁不跨越模型调用
+    characters_by_chapter = await _analyze_chapter_characters(db, novel_id, all_chapters, known_profiles)
+    created_count = await run_serialized_write(
+        save_characters, db, novel_id, all_chapters, characters_by_chapter, clear=force_refresh
+    )
     logger.info(f"角色分析处理完成: 创建了{created_count}个角色记录")
     
-    # 获取新创建的角色ID
-    for character_name, data in character_aggregated.items():
-        character = db.query(novel.Character).filter(
-            novel.Character.novel_id == novel_id,
-            novel.Character.name == character_name
-        ).first()
-        if character:
-            data["id"] = character.id
-    
-    return list(character_aggregated.values())
+    return await run_in_threadpool(character_profile_service.list_profiles, db, novel_id)
 
-async def get_character_details(db: Session, character_id: int) -> Dict[str, Any]:
+def get_character_details(db: Session, character_id: int) -> Dict[str, Any]:
     """获取角色详细信息
     
     Args:
@@ -333,8 +461,8 @@ async def analyze_characters_by_chapter(db: Session, novel_id: int, start_chapte
     """
     logger.info(f"开始分析章节范围内角色: novel_id={novel_id}, start_chapter={start_chapter_id}, end_chapter={end_chapter_id}")
     
-    # 验证小说存在
-    db_novel = novel_service.get_novel(db=db, novel_id=novel_id)
+    # 验证小说存在，同步查询放到线程池执行
+    db_novel = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=novel_id)
     if not db_novel:
         raise ValueError("小说不存在")
     
@@ -343,11 +471,7 @@ async def analyze_characters_by_chapter(db: Session, novel_id: int, start_chapte
         raise ValueError("起始章节ID不能大于结束章节ID")
     
     # 获取指定章节范围
-    chapters = db.query(novel.Chapter).filter(
-        novel.Chapter.novel_id == novel_id,
-        novel.Chapter.id >= start_chapter_id,
-        novel.Chapter.id <= end_chapter_id
-    ).order_by(novel.Chapter.number).all()
+    chapters = await run_in_threadpool(list_chapters, db, novel_id, start_chapter_id, end_chapter_id)
     
     if not chapters:
         raise ValueError("找不到指定的章节范围")
@@ -355,170 +479,16 @@ async def analyze_characters_by_chapter(db: Session, novel_id: int, start_chapte
     # 记录本次分析涉及的章节
     analyzed_chapter_ids = [chapter.id for chapter in chapters]
     
-    # 删除这些章节的现有角色数据
-    deleted = db.query(novel.Character).filter(
-        novel.Character.novel_id == novel_id,
-        novel.Character.chapter_id.in_(analyzed_chapter_ids)
-    ).delete(synchronize_session=False)
-    logger.info(f"已删除指定章节范围内的{deleted}条现有角色数据")
-    
-    # 创建记录所有创建角色的字典
-    created_count = 0
-    character_aggregated = {}
-    
-    # 每个章节单独分析角色，而不是一次性分析所有章节
-    for chapter in chapters:
-        # 获取单个章节的内容
-        chapter_content = novel_service.get_chapter_content(db=db, chapter_id=chapter.id)
-        if not chapter_content:
-            logger.warning(f"章节内容为空: chapter_id={chapter.id}")
-            continue
-        
-        # 使用AI分析单个章节的角色
-        try:
-            logger.info(f"调用OpenAI API分析章节角色: chapter_id={chapter.id}")
-            # 传递is_chapter_specific=True，告诉模型只分析这个章节中的角色表现
-            characters_data = await OpenAIClient.analyze_characters(chapter_content, is_chapter_specific=True)
-            logger.info(f"成功获取章节角色分析结果，chapter_id={chapter.id}，共{len(characters_data)}个角色")
-            
-            # 为该章节创建角色记录
-            for character_data in characters_data:
-                new_character = novel.Character(
-                    novel_id=novel_id,
-                    chapter_id=chapter.id,
-                    name=character_data["name"],
-                    alias=character_data.get("alias", []),
-                    description=character_data.get("description", ""),
-                    importance=character_data.get("importance", 1),
-                    first_appearance=character_data.get("first_appearance")
-                )
-                db.add(new_character)
-                created_count += 1
-                
-                # 聚合数据用于返回
-                if character_data["name"] not in character_aggregated:
-                    character_aggregated[character_data["name"]] = {
-                        "name": character_data["name"],
-                        "alias": character_data.get("alias", []),
-                        "description": character_data.get("description", ""),
-                        "importance": character_data.get("importance", 1),
-                        "first_appearance": character_data.get("first_appearance"),
-                        "chapters": [chapter.id],
-                        "chapter_info": [{
-                            "chapter_id": chapter.id,
-                            "chapter_title": chapter.title,
-                            "chapter_number": chapter.number,
-                            "description": character_data.get("description", "")
-                        }]
-                    }
-                else:
-                    # 如果角色已存在，更新重要性和章节信息
-                    if character_data.get("importance", 0) > character_aggregated[character_data["name"]]["importance"]:
-                        character_aggregated[character_data["name"]]["importance"] = character_data.get("importance", 1)
-                    
-                    # 合并描述，如果新描述更详细
-                    if len(character_data.get("description", "")) > len(character_aggregated[character_data["name"]]["description"]):
-                        character_aggregated[character_data["name"]]["description"] = character_data.get("description", "")
-                    
-                    # 合并别名
-                    existing_aliases = set(character_aggregated[character_data["name"]]["alias"])
-                    new_aliases = set(character_data.get("alias", []))
-                    merged_aliases = list(existing_aliases.union(new_aliases))
-                    character_aggregated[character_data["name"]]["alias"] = merged_aliases
-                    
-                    # 添加章节信息
-                    character_aggregated[character_data["name"]]["chapters"].append(chapter.id)
-                    character_aggregated[character_data["name"]]["chapter_info"].append({
-                        "chapter_id": chapter.id,
-                        "chapter_title": chapter.title,
-                        "chapter_number": chapter.number,
-                        "description": character_data.get("description", "")
-                    })
-        
-        except Exception as e:
-            logger.error(f"分析章节角色失败: chapter_id={chapter.id}, error={str(e)}")
-            # 继续处理下一个章节，不中断整个流程
-            continue
-    
-    db.commit()
+    # 先完成模型分析，再在写队列中一次性删除这些章节的现有角色数据（同时重算受影响的角色档案）并写入
+    known_profiles = await run_in_threadpool(load_known_profiles, db, novel_id, analyzed_chapter_ids)
+    characters_by_chapter = await _analyze_chapter_characters(db, novel_id, chapters, known_profiles)
+    created_count = await run_serialized_write(
+        save_characters, db, novel_id, chapters, characters_by_chapter, chapter_ids=analyzed_chapter_ids
+    )
     logger.info(f"章节角色分析处理完成: 创建了{created_count}个角色记录")
     
-    # 获取所有角色的综合信息
-    all_characters = {}
-    
-    # 获取分析的章节中的角色
-    for character_name, data in character_aggregated.items():
-        character = db.query(novel.Character).filter(
-            novel.Character.novel_id == novel_id,
-            novel.Character.name == character_name,
-            novel.Character.chapter_id.in_(analyzed_chapter_ids)
-        ).first()
-        
-        if character:
-            all_characters[character_name] = {
-                "id": character.id,
-                "name": character_name,
-                "alias": data["alias"],
-                "description": data["description"],
-                "importance": data["importance"],
-                "first_appearance": data["first_appearance"],
-                "chapters": data["chapters"],
-                "chapter_info": data["chapter_info"]
-            }
-    
-    # 再获取其他章节的角色信息
-    other_characters = db.query(novel.Character).filter(
-        novel.Character.novel_id == novel_id,
-        novel.Character.chapter_id.notin_(analyzed_chapter_ids)
-    ).all()
-    
-    # 获取所有章节信息，用于标题显示
-    chapter_info = {}
-    all_chapters = db.query(novel.Chapter).filter(
-        novel.Chapter.novel_id == novel_id
-    ).all()
-    for chapter in all_chapters:
-        chapter_info[chapter.id] = {
-            "title": chapter.title,
-            "number": chapter.number
-        }
-    
-    # 合并其他章节中的角色信息
-    for character in other_characters:
-        if character.name in all_characters:
-            # 合并已有角色的章节信息
-            if character.chapter_id and character.chapter_id not in all_characters[character.name]["chapters"]:
-                all_characters[character.name]["chapters"].append(character.chapter_id)
-                all_characters[character.name]["chapter_info"].append({
-                    "chapter_id": character.chapter_id,
-                    "chapter_title": chapter_info.get(character.chapter_id, {}).get("title", ""),
-                    "chapter_number": chapter_info.get(character.chapter_id, {}).get("number", 0),
-                    "description": character.description
-                })
-        else:
-            # 添加不在分析章节中的角色
-            chapters = [character.chapter_id] if character.chapter_id else []
-            chapter_info_list = []
-            if character.chapter_id:
-                chapter_info_list.append({
-                    "chapter_id": character.chapter_id,
-                    "chapter_title": chapter_info.get(character.chapter_id, {}).get("title", ""),
-                    "chapter_number": chapter_info.get(character.chapter_id, {}).get("number", 0),
-                    "description": character.description
-                })
-            
-            all_characters[character.name] = {
-                "id": character.id,
-                "name": character.name,
-                "alias": character.alias or [],
-                "description": character.description or "",
-                "importance": character.importance or 1,
-                "first_appearance": character.first_appearance,
-                "chapters": chapters,
-                "chapter_info": chapter_info_list
-            }
-    
-    return list(all_characters.values())
+    # 返回整部小说的角色列表，其他章节的出场记录已在档案中
+    return await run_in_threadpool(character_profile_service.list_profiles, db, novel_id)
 
 def get_novel_characters_without_analysis(db: Session, novel_id: int) -> List[Dict[str, Any]]:
     """获取小说中的所有角色，不触发分析
@@ -537,54 +507,14 @@ def get_novel_characters_without_analysis(db: Session, novel_id: int) -> List[Di
     if not db_novel:
         raise ValueError("小说不存在")
     
-    # 查询所有属于该小说的角色
-    characters = db.query(novel.Character).filter(
-        novel.Character.novel_id == novel_id
-    ).all()
+    # 角色档案按名称去重，出场章节通过一次连接查询读出
+    characters = character_profile_service.list_profiles(db, novel_id)
     
     # 如果没有角色，直接返回空列表
     if not characters:
         logger.info(f"小说没有角色数据: novel_id={novel_id}")
-        return []
-    
-    # 获取章节信息，用于返回结果
-    chapter_info = {}
-    all_chapters = db.query(novel.Chapter).filter(
-        novel.Chapter.novel_id == novel_id
-    ).all()
-    for chapter in all_chapters:
-        chapter_info[chapter.id] = {
-            "title": chapter.title,
-            "number": chapter.number
-        }
-    
-    # 按角色名聚合数据
-    character_aggregated = {}
-    for character in characters:
-        if character.name not in character_aggregated:
-            character_aggregated[character.name] = {
-                "id": character.id,
-                "name": character.name,
-                "alias": character.alias or [],
-                "description": character.description or "",
-                "first_appearance": character.first_appearance,
-                "importance": character.importance or 1,
-                "chapters": [],
-                "chapter_info": []
-            }
-        
-        # 如果角色有关联章节，添加到章节列表
-        if character.chapter_id and character.chapter_id not in character_aggregated[character.name]["chapters"]:
-            character_aggregated[character.name]["chapters"].append(character.chapter_id)
-            character_aggregated[character.name]["chapter_info"].append({
-                "chapter_id": character.chapter_id,
-                "chapter_title": chapter_info.get(character.chapter_id, {}).get("title", ""),
-                "chapter_number": chapter_info.get(character.chapter_id, {}).get("number", 0),
-                "description": character.description
-            })
     
-    # 返回聚合后的角色数据
-    return list(character_aggregated.values())
+    return characters
 
 async def analyze_single_chapter(db: Session, novel_id: int, chapter_id: int) -> List[Dict[str, Any]]:
     """分析单个章节的角色
@@ -599,84 +529,114 @@ async def analyze_single_chapter(db: Session, novel_id: int, chapter_id: int) ->
     """
     logger.info(f"开始分析单个章节的角色: novel_id={novel_id}, chapter_id={chapter_id}")
     
-    # 获取小说
-    db_novel = novel_service.get_novel(db=db, novel_id=novel_id)
+    # 获取小说，同步查询放到线程池执行
+    db_novel = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=novel_id)
     if not db_novel:
         raise ValueError("小说不存在")
     
     # 获取章节
-    chapter = db.query(novel.Chapter).filter(
-        novel.Chapter.id == chapter_id,
-        novel.Chapter.novel_id == novel_id
-    ).first()
-    if not chapter:
+    chapters = await run_in_threadpool(list_chapters, db, novel_id, chapter_id, chapter_id)
+    if not chapters:
         raise ValueError("章节不存在或不属于该小说")
-    
-    # 删除该章节现有的角色记录
-    deleted = db.query(novel.Character).filter(
-        novel.Character.novel_id == novel_id,
-        novel.Character.chapter_id == chapter_id
-    ).delete()
-    logger.info(f"已删除章节现有角色数据: {deleted}条")
+    chapter = chapters[0]
     
     # 获取章节内容
-    chapter_content = novel_service.get_chapter_content(db=db, chapter_id=chapter_id)
+    chapter_content = await run_in_threadpool(novel_service.get_chapter_content, db=db, chapter_id=chapter_id)
     if not chapter_content:
         raise ValueError("章节内容为空")
     
-    # 创建章节信息字典
-    chapter_info = {
-        "title": chapter.title,
-        "number": chapter.number
-    }
-    
-    # 使用AI分析当前章节的角色
+    # 使用AI分析当前章节的角色，旧的角色记录在分析完成后与新记录一起替换
     try:
-        logger.info(f"调用OpenAI API分析章节角色: chapter_id={chapter_id}")
-        characters_data = await OpenAIClient.analyze_characters(chapter_content, is_chapter_specific=True)
-        logger.info(f"成功获取章节角色分析结果: chapter_id={chapter_id}, 共{len(characters_data)}个角色")
+        known_profiles = await run_in_threadpool(load_known_profiles, db, novel_id, [chapter_id])
         
-        # 结果容器
-        result_characters = []
+        # 实体预扫描：本章没有新角色候选时跳过模型或只让模型分析已知角色
+        prepass = None
+        if entity_prepass.available():
+            stats = entity_prepass.PrepassStats(entity_prepass.PERSON, novel_id)
+            prepass = await run_in_threadpool(
+                entity_prepass.scan, chapter_content, _known_name_index(known_profiles), entity_prepass.PERSON
+            )
+            if prepass.has_new or not prepass.known:
+                stats.record("full")
+                prepass = None
+            elif settings.ENTITY_PREPASS_MODE == entity_prepass.MODE_SKIP:
+                stats.record("skip")
+            else:
+                stats.record("delta")
         
-        # 为该章节创建角色记录
-        for character_data in characters_data:
-            # 创建该章节的角色记录
-            new_character = novel.Character(
-                novel_id=novel_id,
-                chapter_id=chapter_id,
-                name=character_data["name"],
-                alias=character_data.get("alias", []),
-                description=character_data.get("description", ""),
-                importance=character_data.get("importance", 1),
-                first_appearance=character_data.get("first_appearance")
+        if prepass is not None and settings.ENTITY_PREPASS_MODE == entity_prepass.MODE_SKIP:
+            logger.info(f"章节没有新角色，按已知角色记录出场: chapter_id={chapter_id}, 角色={prepass.known}")
+            characters_data = _known_characters_data(prepass.known, known_profiles)
+        else:
+            logger.info(f"调用OpenAI API分析章节角色: chapter_id={chapter_id}")
+            characters_data = await OpenAIClient.analyze_characters(
+                chapter_content,
+                is_chapter_specific=True,
+                known_cast=prepass.known if prepass is not None else None
             )
-            db.add(new_character)
-            db.flush()  # 获取新生成的ID
-            
-            # 准备返回数据
-            result = {
-                "id": new_character.id,
-                "name": character_data["name"],
-                "alias": character_data.get("alias", []),
-                "description": character_data.get("description", ""),
-                "importance": character_data.get("importance", 1),
-                "first_appearance": character_data.get("first_appearance"),
-                "chapters": [chapter_id],
-                "chapter_info": [{
-                    "chapter_id": chapter_id,
-                    "chapter_title": chapter.title,
-                    "chapter_number": chapter.number,
-                    "description": character_data.get("description", "")
-                }]
-            }
-            result_characters.append(result)
+            logger.info(f"成功获取章节角色分析结果: chapter_id={chapter_id}, 共{len(characters_data)}个角色")
         
-        db.commit()
+        # 在写队列中替换该章节的角色记录
+        result_characters = await run_serialized_write(
+            save_chapter_characters, db, novel_id, chapter, characters_data
+        )
         logger.info(f"单章节角色分析完成: chapter_id={chapter_id}, 共{len(result_characters)}个角色")
         return result_characters
         
     except Exception as e:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         logger.error(f"单章节角色分析失败: chapter_id={chapter_id}, error={str(e)}")
-        raise 
\ No newline at end of file
+        raise 
+
+def save_chapter_characters(
+    db: Session,
+    novel_id: int,
+    chapter: novel.Chapter,
+    characters_data: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """替换单个章节的角色记录并提交，返回角色数据列表
+    
+    删除旧记录和写入新记录在同一个短事务中完成。
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        chapter: 章节
+        characters_data: 分析得到的角色数据
+        
+    Returns:
+        角色数据列表
+    """
+    deleted = clear_characters(db, novel_id, [chapter.id])
+    logger.info(f"已删除章节现有角色数据: {deleted}条")
+    
+    profile_index = character_profile_service.CharacterProfileIndex(db, novel_id)
+    result_characters = []
+    
+    for character_data in characters_data:
+        # 创建该章节的角色记录
+        new_character = _new_character(novel_id, chapter.id, character_data)
+        db.add(new_character)
+        profile_index.record(new_character, chapter)
+        db.flush()  # 获取新生成的ID
+        
+        # 准备返回数据
+        result = {
+            "id": new_character.id,
+            "name": character_data["name"],
+            "alias": character_data.get("alias", []),
+            "description": character_data.get("description", ""),
+            "importance": character_data.get("importance", 1),
+            "first_appearance": character_data.get("first_appearance"),
+            "chapters": [chapter.id],
+            "chapter_info": [{
+                "chapter_id": chapter.id,
+                "chapter_title": chapter.title,
+                "chapter_number": chapter.number,
+                "description": character_data.get("description", "")
+            }]
+        }
+        result_characters.append(result)
+    
+    db.commit()
+    return result_characters
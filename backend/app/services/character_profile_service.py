@@ -0,0 +1,335 @@
+from sqlalchemy import select, delete, exists
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Dict, Any, Optional, Iterable, Set, Tuple
+import logging
+
+from app.models import novel
+
+logger = logging.getLogger(__name__)
+
+class CharacterProfileIndex:
+    """小说角色档案的写入索引
+
+    在一次分析过程中缓存该小说的全部角色档案，新增的章节角色记录通过
+    record() 写入出场表，并同步更新档案上的首次出场、最高重要性等聚合字段。
+    会话未flush时新建的档案也能被后续记录命中，避免重复创建。
+    """
+
+    def __init__(self, db: Session, novel_id: int):
+        self.db = db
+        self.novel_id = novel_id
+        # record()会读取档案的代表记录，一次预加载，避免逐个档案懒加载
+        self.profiles: Dict[str, novel.CharacterProfile] = {
+            profile.name: profile
+            for profile in db.query(novel.CharacterProfile).options(
+                selectinload(novel.CharacterProfile.character)
+            ).filter(
+                novel.CharacterProfile.novel_id == novel_id
+            ).all()
+        }
+        # 本次写入过的(角色名, 章节ID)，同一章节重复返回的角色只记一次出场
+        self._recorded: Set[Tuple[str, int]] = set()
+
+    def record(self, character: novel.Character, chapter: Optional[novel.Chapter] = None) -> novel.CharacterProfile:
+        """记录一条章节角色数据并更新角色档案
+
+        Args:
+            character: 新建或已有的章节角色记录
+            chapter: 角色出场的章节，没有章节时只维护档案本身
+
+        Returns:
+            对应的角色档案
+        """
+        name = character.name.strip()
+        profile = self.profiles.get(name)
+        if profile is None:
+            profile = novel.CharacterProfile(
+                novel_id=self.novel_id,
+                name=name,
+                alias=list(character.alias or []),
+                description=character.description or "",
+                importance=character.importance or 1,
+                appearance_count=0
+            )
+            profile.character = character
+            self.db.add(profile)
+            self.profiles[name] = profile
+        else:
+            merge_profile_fields(profile, character.alias, character.description, character.importance)
+            if profile.character is None:
+                profile.character = character
+
+        if chapter is None or (name, chapter.id) in self._recorded:
+            return profile
+        self._recorded.add((name, chapter.id))
+
+        appearance = novel.CharacterAppearance(
+            novel_id=self.novel_id,
+            chapter_id=chapter.id,
+            importance=character.importance or 1,
+            description=character.description or ""
+        )
+        appearance.character = character
+        # 通过多对一端建立关联，不会触发加载档案已有的出场集合
+        appearance.profile = profile
+        self.db.add(appearance)
+        profile.appearance_count = (profile.appearance_count or 0) + 1
+
+        # 按章节序号维护首次出场，代表记录跟随首次出场章节
+        if profile.first_chapter_number is None or chapter.number < profile.first_chapter_number:
+            profile.first_chapter_id = chapter.id
+            profile.first_chapter_number = chapter.number
+            profile.character = character
+
+        return profile
+
+def merge_profile_fields(
+    profile: novel.CharacterProfile,
+    alias: Optional[Iterable[str]],
+    description: Optional[str],
+    importance: Optional[int]
+) -> None:
+    """合并别名、描述和重要性到角色档案"""
+    if alias:
+        merged = list(profile.alias or [])
+        for name in alias:
+            if name not in merged:
+                merged.append(name)
+        profile.alias = merged
+
+    # 保留更详细的描述
+    if description and len(description) > len(profile.description or ""):
+        profile.description = description
+
+    if importance and importance > (profile.importance or 0):
+        profile.importance = importance
+
+def remove_appearances(db: Session, novel_id: int, chapter_ids: Optional[List[int]] = None) -> None:
+    """删除角色出场记录并重算受影响档案的聚合字段
+
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        chapter_ids: 需要清除的章节ID列表，为None时清除整部小说的角色档案
+    """
+    if chapter_ids is None:
+        db.execute(delete(novel.CharacterAppearance).where(novel.CharacterAppearance.novel_id == novel_id))
+        db.execute(delete(novel.CharacterProfile).where(novel.CharacterProfile.novel_id == novel_id))
+        return
+
+    if not chapter_ids:
+        return
+
+    affected_ids = db.execute(
+        select(novel.CharacterAppearance.profile_id).where(
+            novel.CharacterAppearance.novel_id == novel_id,
+            novel.CharacterAppearance.chapter_id.in_(chapter_ids)
+        ).distinct()
+    ).scalars().all()
+
+    db.execute(
+        delete(novel.CharacterAppearance).where(
+            novel.CharacterAppearance.novel_id == novel_id,
+            novel.CharacterAppearance.chapter_id.in_(chapter_ids)
+        ).execution_options(synchronize_session=False)
+    )
+
+    _recompute_profiles(db, affected_ids)
+
+def _recompute_profiles(db: Session, profile_ids: Iterable[int]) -> None:
+    """按剩余的出场记录重算档案的聚合字段，没有剩余出场的档案直接删除"""
+    profile_ids = list(profile_ids)
+    if not profile_ids:
+        return
+
+    # 只读取受影响档案剩余的出场记录，按章节序号排序；别名来自对应的章节角色记录
+    remaining = db.execute(
+        select(
+            novel.CharacterAppearance.profile_id,
+            novel.CharacterAppearance.chapter_id,
+            novel.CharacterAppearance.character_id,
+            novel.CharacterAppearance.importance,
+            novel.CharacterAppearance.description,
+            novel.Chapter.number,
+            novel.Character.alias
+        )
+        .join(novel.Chapter, novel.Chapter.id == novel.CharacterAppearance.chapter_id)
+        .outerjoin(novel.Character, novel.Character.id == novel.CharacterAppearance.character_id)
+        .where(novel.CharacterAppearance.profile_id.in_(profile_ids))
+        .order_by(novel.CharacterAppearance.profile_id, novel.Chapter.number)
+    ).all()
+
+    rows_by_profile: Dict[int, List[Any]] = {}
+    for row in remaining:
+        rows_by_profile.setdefault(row.profile_id, []).append(row)
+
+    profiles = db.query(novel.CharacterProfile).filter(
+        novel.CharacterProfile.id.in_(profile_ids)
+    ).all()
+    for profile in profiles:
+        rows = rows_by_profile.get(profile.id)
+        if not rows:
+            db.delete(profile)
+            continue
+
+        first = rows[0]
+        profile.first_chapter_id = first.chapter_id
+        profile.first_chapter_number = first.number
+        profile.character_id = first.character_id
+        profile.appearance_count = len(rows)
+        profile.importance = max(row.importance or 1 for row in rows)
+        profile.description = max((row.description or "" for row in rows), key=len)
+        aliases: List[str] = []
+        for row in rows:
+            for alias in row.alias or []:
+                if alias not in aliases:
+                    aliases.append(alias)
+        profile.alias = aliases
+
+    db.flush()
+
+def remove_character(db: Session, character_id: int) -> None:
+    """删除一条章节角色记录的出场，并重算受影响的档案
+
+    在修改或删除角色记录前调用。以该记录为代表记录、但没有出场记录的档案也会被重算（即删除）。
+    """
+    affected_ids = set(db.execute(
+        select(novel.CharacterAppearance.profile_id).where(
+            novel.CharacterAppearance.character_id == character_id
+        ).distinct()
+    ).scalars().all())
+    affected_ids.update(db.execute(
+        select(novel.CharacterProfile.id).where(novel.CharacterProfile.character_id == character_id)
+    ).scalars().all())
+
+    db.execute(
+        delete(novel.CharacterAppearance).where(
+            novel.CharacterAppearance.character_id == character_id
+        ).execution_options(synchronize_session=False)
+    )
+    _recompute_profiles(db, affected_ids)
+
+def sync_character(db: Session, character: novel.Character) -> novel.CharacterProfile:
+    """角色记录的名称、别名等修改后重新归入角色档案
+
+    先从原档案中移除该记录的出场并重算，再按修改后的名称记录，改名后会并入同名档案或新建档案。
+    """
+    db.flush()
+    remove_character(db, character.id)
+    return CharacterProfileIndex(db, character.novel_id).record(character, character.chapter)
+
+def has_characters(db: Session, novel_id: int) -> bool:
+    """判断小说是否已有角色记录，不加载角色数据"""
+    return db.query(
+        exists().where(novel.Character.novel_id == novel_id)
+    ).scalar()
+
+def rebuild_profiles(db: Session, novel_id: int) -> int:
+    """根据现有的章节角色记录重建角色档案
+
+    用于迁移旧数据，或在档案表为空但已有角色记录时回填。
+
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+
+    Returns:
+        重建后的档案数量
+    """
+    remove_appearances(db, novel_id)
+    db.flush()
+
+    index = CharacterProfileIndex(db, novel_id)
+    rows = db.query(novel.Character, novel.Chapter).outerjoin(
+        novel.Chapter, novel.Chapter.id == novel.Character.chapter_id
+    ).filter(
+        novel.Character.novel_id == novel_id
+    ).order_by(novel.Chapter.number, novel.Character.id).yield_per(500)
+
+    for character, chapter in rows:
+        index.record(character, chapter)
+
+    db.flush()
+    logger.info(f"重建角色档案完成: novel_id={novel_id}, 共{len(index.profiles)}个角色")
+    return len(index.profiles)
+
+def backfill_missing_profiles(db: Session) -> int:
+    """为已有角色记录但没有角色档案的小说回填档案
+
+    在应用启动时通过写队列执行，读取角色列表的接口不再写入。
+
+    Returns:
+        回填的小说数量
+    """
+    novel_ids = db.execute(
+        select(novel.Character.novel_id).where(
+            ~exists().where(novel.CharacterProfile.novel_id == novel.Character.novel_id)
+        ).distinct()
+    ).scalars().all()
+    for novel_id in novel_ids:
+        rebuild_profiles(db, novel_id)
+        db.commit()
+    return len(novel_ids)
+
+def list_profiles(db: Session, novel_id: int) -> List[Dict[str, Any]]:
+    """读取小说的角色列表
+
+    档案和出场记录通过一次带索引的连接查询读出，返回结构与原先按名称
+    聚合的结果一致。只读取不写入，旧数据的档案在启动时回填（见backfill_missing_profiles）。
+
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+
+    Returns:
+        角色数据列表
+    """
+    rows = db.execute(
+        select(
+            novel.CharacterProfile.id,
+            novel.CharacterProfile.character_id,
+            novel.CharacterProfile.name,
+            novel.CharacterProfile.alias,
+            novel.CharacterProfile.description,
+            novel.CharacterProfile.importance,
+            novel.CharacterProfile.first_chapter_id,
+            novel.CharacterAppearance.chapter_id,
+            novel.CharacterAppearance.description.label("chapter_description"),
+            novel.Chapter.title,
+            novel.Chapter.number
+        )
+        .outerjoin(novel.CharacterAppearance, novel.CharacterAppearance.profile_id == novel.CharacterProfile.id)
+        .outerjoin(novel.Chapter, novel.Chapter.id == novel.CharacterAppearance.chapter_id)
+        .where(novel.CharacterProfile.novel_id == novel_id)
+        .order_by(
+            novel.CharacterProfile.first_chapter_number,
+            novel.CharacterProfile.id,
+            novel.Chapter.number
+        )
+    ).all()
+
+    characters: Dict[int, Dict[str, Any]] = {}
+    for row in rows:
+        data = characters.get(row.id)
+        if data is None:
+            data = characters[row.id] = {
+                "id": row.character_id or row.id,
+                "name": row.name,
+                "alias": row.alias or [],
+                "description": row.description or "",
+                "first_appearance": row.first_chapter_id,
+                "importance": row.importance or 1,
+                "chapters": [],
+                "chapter_info": []
+            }
+
+        if row.chapter_id:
+            data["chapters"].append(row.chapter_id)
+            data["chapter_info"].append({
+                "chapter_id": row.chapter_id,
+                "chapter_title": row.title or f"第{row.number}章",
+                "chapter_number": row.number or 0,
+                "description": row.chapter_description
+            })
+
+    return list(characters.values())
@@ -1,16 +1,53 @@
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Sequence, Union
 from sqlalchemy.orm import Session
 
+from app.core.pagination import keyset_after, query_columns
 from app.models.novel import Character
+from app.services import character_profile_service
+from app.services.character_profile_service import CharacterProfileIndex
 from app.schemas.character import CharacterCreate, CharacterUpdate
 
+# 角色列表游标分页的排序键
+CHARACTER_CURSOR_FIELDS = ("id",)
+
+# 修改后需要重新归入角色档案的字段
+PROFILE_FIELDS = {"name", "alias", "description", "importance"}
+
 def get_character(db: Session, character_id: int) -> Optional[Character]:
     """根据ID获取角色"""
     return db.query(Character).filter(Character.id == character_id).first()
 
-def get_characters_by_novel_id(db: Session, novel_id: int, skip: int = 0, limit: int = 100) -> List[Character]:
-    """获取指定小说的所有角色"""
-    return db.query(Character).filter(Character.novel_id == novel_id).offset(skip).limit(limit).all()
+def get_characters_by_novel_id(
+    db: Session,
+    novel_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[Sequence[Any]] = None,
+    fields: Optional[List[str]] = None
+) -> List[Any]:
+    """获取指定小说的角色，按ID排序
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        skip: 偏移量，仅在未使用游标时生效
+        limit: 返回数量
+        after: 上一页最后一个角色的 (id,)，指定时使用游标分页
+        fields: 只读取的字段，未指定时返回完整的角色对象
+        
+    Returns:
+        角色对象列表，指定fields时为只包含这些字段（及排序键）的行
+    """
+    if fields:
+        query = db.query(*query_columns(Character, fields, CHARACTER_CURSOR_FIELDS))
+    else:
+        query = db.query(Character)
+    query = query.filter(Character.novel_id == novel_id)
+    if after is not None:
+        query = query.filter(keyset_after((Character.id,), after))
+    else:
+        query = query.offset(skip)
+    return query.order_by(Character.id).limit(limit).all()
 
 def create_character(db: Session, obj_in: CharacterCreate) -> Character:
     """创建新角色"""
@@ -22,6 +59,7 @@ def create_character(db: Session, obj_in: CharacterCreate) -> Character:
         image_url=obj_in.image_url
     )
     db.add(db_obj)
+    CharacterProfileIndex(db, obj_in.novel_id).record(db_obj)
     db.commit()
     db.refresh(db_obj)
     return db_obj
@@ -37,6 +75,9 @@ def update_character(db: Session, db_obj: Character, obj_in: Union[CharacterUpda
         setattr(db_obj, field, update_data[field])
     
     db.add(db_obj)
+    # 改名后出场记录归入新名称的档案，原档案重算或删除
+    if PROFILE_FIELDS & update_data.keys():
+        character_profile_service.sync_character(db, db_obj)
     db.commit()
     db.refresh(db_obj)
     return db_obj
@@ -44,5 +85,7 @@ def update_character(db: Session, db_obj: Character, obj_in: Union[CharacterUpda
 def delete_character(db: Session, character_id: int) -> None:
     """删除角色"""
     character = db.query(Character).filter(Character.id == character_id).first()
+    # 档案外键为SET NULL，先移除出场并重算档案，避免留下孤立的档案
+    character_profile_service.remove_character(db, character_id)
     db.delete(character)
     db.commit() 
\ No newline at end of file
@@ -0,0 +1,247 @@
+"""
+角色共现服务
+
+从角色出场记录（按章节）或章节正文中的角色名（按文本块）构建出场矩阵，
+计算"谁和谁一起出现"、共现热力图和关系强度。矩阵运算见app.core.cooccurrence。
+
+构建好的出场矩阵按 (小说ID, 单元类型, 数据版本) 缓存在进程内，
+小说数据变化后数据版本递增，旧条目自然失效。
+"""
+from collections import OrderedDict
+from sqlalchemy.orm import Session
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+import threading
+
+import numpy as np
+
+from app.core import cooccurrence, metrics
+from app.core.config import settings
+from app.core.entity_prepass import KnownNameIndex
+from app.models import novel
+from app.services import novel_service
+
+logger = logging.getLogger(__name__)
+
+UNIT_CHAPTER = "chapter"
+UNIT_CHUNK = "chunk"
+UNITS = (UNIT_CHAPTER, UNIT_CHUNK)
+
+class CooccurrenceModel:
+    """一部小说的出场矩阵及行号与角色的对应关系"""
+
+    def __init__(self, presence: cooccurrence.PresenceMatrix, profiles: Sequence[Tuple[int, str, Optional[int]]]):
+        self.presence = presence
+        self.names = [name for _, name, _ in profiles]
+        self.character_ids = [character_id for _, _, character_id in profiles]
+        self.row_by_name = {name: row for row, name in enumerate(self.names)}
+
+    def character(self, row: int) -> Dict[str, Any]:
+        return {"character_id": self.character_ids[row], "name": self.names[row]}
+
+_cache: "OrderedDict[Tuple[int, str, int], CooccurrenceModel]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _split_chunks(text: str, max_chars: int) -> List[str]:
+    """按段落把章节切成不超过max_chars字的文本块"""
+    chunks, current = [], ""
+    for paragraph in text.split("\n"):
+        if current and len(current) + len(paragraph) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += paragraph + "\n"
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+def _build_model(db: Session, novel_id: int, unit: str) -> CooccurrenceModel:
+    profiles = db.query(
+        novel.CharacterProfile.id,
+        novel.CharacterProfile.name,
+        novel.CharacterProfile.character_id,
+        novel.CharacterProfile.alias
+    ).filter(novel.CharacterProfile.novel_id == novel_id).order_by(novel.CharacterProfile.id).all()
+    profile_ids = np.array([row.id for row in profiles], dtype=np.int64)
+
+    if unit == UNIT_CHAPTER:
+        unit_chapters = np.array([
+            number for number, in db.query(novel.Chapter.number).filter(
+                novel.Chapter.novel_id == novel_id
+            ).order_by(novel.Chapter.number)
+        ], dtype=np.int64)
+        rows = db.query(novel.CharacterAppearance.profile_id, novel.Chapter.number).join(
+            novel.Chapter, novel.Chapter.id == novel.CharacterAppearance.chapter_id
+        ).filter(novel.CharacterAppearance.novel_id == novel_id).all()
+        pairs = np.array([(profile_id, number) for profile_id, number in rows], dtype=np.int64).reshape(-1, 2)
+        entity_index = np.searchsorted(profile_ids, pairs[:, 0])
+        unit_index = np.searchsorted(unit_chapters, pairs[:, 1])
+    else:
+        # 按文本块扫描正文中的角色名和别名
+        index = KnownNameIndex({row.name: row.alias or [] for row in profiles})
+        row_by_name = {row.name: i for i, row in enumerate(profiles)}
+        chapters, entities, units = [], [], []
+        for meta, text in novel_service.iter_novel_chapters(db, novel_id):
+            for chunk in _split_chunks(text, settings.COOCCURRENCE_CHUNK_CHARS):
+                for name in index.find(chunk):
+                    entities.append(row_by_name[name])
+                    units.append(len(chapters))
+                chapters.append(meta["number"])
+        unit_chapters = np.array(chapters, dtype=np.int64)
+        entity_index = np.array(entities, dtype=np.int64)
+        unit_index = np.array(units, dtype=np.int64)
+
+    presence = cooccurrence.PresenceMatrix.from_pairs(entity_index, unit_index, len(profiles), unit_chapters)
+    logger.info(f"小说 {novel_id} 出场矩阵({unit}): {presence.shape[0]}个角色 × {presence.shape[1]}个单元，{presence.matrix.nnz}条出场")
+    return CooccurrenceModel(presence, [(row.id, row.name, row.character_id) for row in profiles])
+
+def get_model(db: Session, novel_id: int, unit: str = UNIT_CHAPTER) -> CooccurrenceModel:
+    """获取小说的出场矩阵，数据未变化时使用进程内缓存"""
+    if unit not in UNITS:
+        raise ValueError(f"不支持的共现单元: {unit}，可选 {', '.join(UNITS)}")
+    data_version = novel_service.get_data_version(db, novel_id)
+    if data_version is None:
+        raise ValueError("小说不存在")
+
+    key = (novel_id, unit, data_version)
+    with _cache_lock:
+        model = _cache.get(key)
+        if model is not None:
+            _cache.move_to_end(key)
+    metrics.CACHE_REQUESTS.inc(cache="cooccurrence", result="hit" if model is not None else "miss")
+    if model is not None:
+        return model
+
+    model = _build_model(db, novel_id, unit)
+    with _cache_lock:
+        # 同一小说的旧版本不会再被访问，直接移除
+        for stale in [k for k in _cache if k[:2] == key[:2]]:
+            del _cache[stale]
+        _cache[key] = model
+        while len(_cache) > settings.COOCCURRENCE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return model
+
+def _character_row(db: Session, model: CooccurrenceModel, novel_id: int, character_id: int) -> int:
+    character = novel_service.get_character(db=db, character_id=character_id)
+    if character is None or character.novel_id != novel_id:
+        raise ValueError("角色不存在或不属于该小说")
+    row = model.row_by_name.get(character.name.strip())
+    if row is None:
+        raise ValueError("角色没有出场记录")
+    return row
+
+def get_partners(
+    db: Session,
+    novel_id: int,
+    character_id: int,
+    weighting: str = "dice",
+    window: int = 0,
+    start_chapter: Optional[int] = None,
+    end_chapter: Optional[int] = None,
+    unit: str = UNIT_CHAPTER,
+    limit: int = 20
+) -> Dict[str, Any]:
+    """获取与指定角色共现最多的角色
+
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        character_id: 角色ID
+        weighting: 权重方式，见cooccurrence.WEIGHTINGS
+        window: 共现窗口（单元数），0表示必须在同一单元出场
+        start_chapter: 起始章节序号（包含）
+        end_chapter: 结束章节序号（包含）
+        unit: 共现单元，chapter按章节，chunk按章节内的文本块
+        limit: 返回的角色数
+
+    Returns:
+        角色信息和按权重降序排列的共现角色
+    """
+    model = get_model(db, novel_id, unit)
+    row = _character_row(db, model, novel_id, character_id)
+    presence = model.presence.slice(start_chapter, end_chapter)
+    counts = presence.cooccurrence(window)
+    weighted = cooccurrence.weight(counts, presence.shape[1], weighting)
+
+    partners = []
+    for col, value in cooccurrence.top_partners(weighted, row, limit):
+        partners.append({
+            **model.character(col),
+            "count": int(counts[row, col]),
+            "weight": round(value, 4)
+        })
+    return {
+        **model.character(row),
+        "occurrences": int(counts[row, row]),
+        "unit": unit,
+        "units": presence.shape[1],
+        "weighting": weighting,
+        "window": window,
+        "partners": partners
+    }
+
+def get_heatmap(
+    db: Session,
+    novel_id: int,
+    top: int = 30,
+    weighting: str = "count",
+    window: int = 0,
+    start_chapter: Optional[int] = None,
+    end_chapter: Optional[int] = None,
+    unit: str = UNIT_CHAPTER,
+    slice_size: Optional[int] = None,
+    character_ids: Optional[Sequence[int]] = None
+) -> Dict[str, Any]:
+    """获取角色共现热力图
+
+    角色默认取章节范围内出场最多的top个，也可以用character_ids指定。
+    指定slice_size时按每slice_size章切片，各切片使用同一组角色，便于对比关系随剧情的变化。
+
+    Returns:
+        角色列表，以及共现矩阵（matrix）或各时间片的共现矩阵（slices）
+    """
+    model = get_model(db, novel_id, unit)
+    presence = model.presence.slice(start_chapter, end_chapter)
+    if character_ids:
+        rows = [_character_row(db, model, novel_id, character_id) for character_id in character_ids]
+    else:
+        rows = cooccurrence.top_entities(presence, top).tolist()
+
+    occurrences = np.asarray(presence.matrix.sum(axis=1)).ravel()
+    result: Dict[str, Any] = {
+        "characters": [{**model.character(row), "occurrences": int(occurrences[row])} for row in rows],
+        "unit": unit,
+        "weighting": weighting,
+        "window": window
+    }
+
+    def block(part: cooccurrence.PresenceMatrix) -> List[List[float]]:
+        weighted = cooccurrence.weight(part.cooccurrence(window), part.shape[1], weighting)
+        return cooccurrence.dense_block(weighted, rows)
+
+    if slice_size:
+        result["slices"] = [
+            {"start_chapter": start, "end_chapter": end, "matrix": block(part)}
+            for start, end, part in presence.slices(slice_size)
+        ]
+    else:
+        result["matrix"] = block(presence)
+    return result
+
+def strength_lookup(db: Session, novel_id: int) -> Callable[[str, str], Optional[float]]:
+    """按角色名查询关系强度（按章节共现的Dice系数，0~1）
+
+    没有出场记录的角色返回None，由调用方决定退回方式。
+    """
+    model = get_model(db, novel_id, UNIT_CHAPTER)
+    counts = model.presence.cooccurrence()
+    weighted = cooccurrence.weight(counts, model.presence.shape[1], "dice")
+
+    def lookup(name: str, other: str) -> Optional[float]:
+        row = model.row_by_name.get((name or "").strip())
+        col = model.row_by_name.get((other or "").strip())
+        if row is None or col is None:
+            return None
+        return round(float(weighted[row, col]), 4)
+
+    return lookup
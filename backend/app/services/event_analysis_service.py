@@ -1,11 +1,13 @@
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
 
 from app.models import novel
 from app.models.novel import Novel, Character, Location, Event, EventParticipation
-from app.services import novel_service
+from app.services import novel_service, summary_service
 from app.core.config import settings
+from app.core.database import run_serialized_write
 from app.core.openai_client import OpenAIClient
 
 # 设置日志
@@ -25,19 +27,21 @@ async def analyze_novel_events(db: Session, novel_id: int) -> List[Dict[str, Any
     logger.info(f"开始分析小说ID {novel_id} 的事件")
     
     # 1. 检查小说是否存在
-    novel_obj = db.query(novel.Novel).filter(novel.Novel.id == novel_id).first()
+    novel_obj = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=novel_id)
     if not novel_obj:
         logger.error(f"小说ID {novel_id} 不存在")
         raise ValueError(f"小说ID {novel_id} 不存在")
     
-    # 2. 获取小说内容
-    content = novel_service.get_novel_chapters_content(db=db, novel_id=novel_id)
+    # 2. 获取小说内容：优先使用覆盖全书的分层摘要，尚未构建时退回截取正文开头
+    content = await run_in_threadpool(summary_service.build_compact_context, db=db, novel_id=novel_id)
+    if not content:
+        content = await run_in_threadpool(novel_service.get_novel_chapters_content, db=db, novel_id=novel_id, max_chars=15000)
     if not content:
         logger.warning(f"小说ID {novel_id} 没有内容，无法分析事件")
         return []
     
-    # 3. 获取小说角色
-    characters = db.query(novel.Character).filter(novel.Character.novel_id == novel_id).all()
+    # 3. 获取小说角色和地点
+    characters, locations = await run_in_threadpool(load_characters_and_locations, db, novel_id)
     if not characters:
         logger.warning(f"小说ID {novel_id} 没有角色数据，无法关联事件与角色")
         return []
@@ -52,8 +56,6 @@ async def analyze_novel_events(db: Session, novel_id: int) -> List[Dict[str, Any
         for char in characters
     ]
     
-    # 4. 获取小说地点
-    locations = db.query(novel.Location).filter(novel.Location.novel_id == novel_id).all()
     if not locations:
         logger.warning(f"小说ID {novel_id} 没有地点数据，无法关联事件与地点")
         return []
@@ -68,22 +70,12 @@ async def analyze_novel_events(db: Session, novel_id: int) -> List[Dict[str, Any
         for loc in locations
     ]
     
-    # 5. 使用OpenAI分析小说内容，提取事件
+    # 4. 使用OpenAI分析小说内容，提取事件
     try:
-        # 清除现有事件数据
-        db.query(novel.EventParticipation).filter(
-            novel.EventParticipation.event_id.in_(
-                db.query(novel.Event.id).filter(novel.Event.novel_id == novel_id)
-            )
-        ).delete(synchronize_session=False)
-        
-        db.query(novel.Event).filter(novel.Event.novel_id == novel_id).delete()
-        db.commit()
-        
         # 调用OpenAI API分析事件
         events = await extract_events_from_novel(
             novel_title=novel_obj.title,
-            content=content[:15000],  # 限制内容长度，避免超出token限制
+            content=content,  # 读取时已限制内容长度，避免超出token限制
             characters=character_info,
             locations=location_info
         )
@@ -93,67 +85,104 @@ async def analyze_novel_events(db: Session, novel_id: int) -> List[Dict[str, Any
             # 如果AI分析失败，使用示例事件
             events = generate_sample_events(characters, locations)
         
-        # 将事件保存到数据库
-        for event_data in events:
-            # 从事件数据中提取参与者信息
-            participants = event_data.pop("participants", [])
-            
-            # 获取事件关联的地点ID
-            location_id = None
-            location_name = event_data.pop("location_name", None)
-            if location_name:
-                # 尝试通过名称查找地点
-                location_obj = next((loc for loc in locations if loc.name == location_name), None)
-                if location_obj:
-                    location_id = location_obj.id
-                else:
-                    # 如果找不到匹配的地点，使用第一个地点
-                    location_id = locations[0].id if locations else None
-            else:
-                # 直接使用第一个地点
-                location_id = locations[0].id if locations else None
-            
-            # 创建事件
-            new_event = novel.Event(
-                novel_id=novel_id,
-                location_id=location_id,
-                **{k: v for k, v in event_data.items() if k in [
-                    "name", "description", "chapter_id", "time_description", "importance"
-                ] and v is not None}
-            )
-            db.add(new_event)
-            db.flush()  # 获取新创建事件的ID
-            
-            # 添加事件参与者
-            for participant in participants:
-                character_name = participant.get("name")
-                if not character_name:
-                    continue
-                    
-                # 尝试通过名称查找角色
-                character_obj = next((char for char in characters if char.name == character_name), None)
-                if not character_obj:
-                    # 如果找不到匹配的角色，跳过
-                    continue
-                    
-                event_participation = novel.EventParticipation(
-                    event_id=new_event.id,
-                    character_id=character_obj.id,
-                    role=participant.get("role", "参与者")
-                )
-                db.add(event_participation)
-        
-        db.commit()
+        # 5. 替换数据库中的事件，写操作在写队列中执行
+        await run_serialized_write(replace_novel_events, db, novel_id, events, characters, locations)
         logger.info(f"成功为小说ID {novel_id} 添加了 {len(events)} 个事件")
         
         # 返回新创建的事件列表
         return events
         
     except Exception as e:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         logger.error(f"分析小说事件失败: {str(e)}")
         raise ValueError(f"分析小说事件失败: {str(e)}")
 
+def load_characters_and_locations(db: Session, novel_id: int) -> Tuple[List[Character], List[Location]]:
+    """读取小说的角色和地点，供事件分析关联使用"""
+    characters = db.query(novel.Character).filter(novel.Character.novel_id == novel_id).all()
+    locations = db.query(novel.Location).filter(novel.Location.novel_id == novel_id).all()
+    return characters, locations
+
+def replace_novel_events(
+    db: Session,
+    novel_id: int,
+    events: List[Dict[str, Any]],
+    characters: List[Character],
+    locations: List[Location]
+) -> None:
+    """
+    清除小说现有的事件并保存新分析的事件
+    
+    在同一个事务中删除和写入，分析失败时保留原有事件。
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        events: 分析得到的事件列表，参与者和地点名称字段会被取出
+        characters: 小说角色，用于按名称关联参与者
+        locations: 小说地点，用于按名称关联事件地点
+    """
+    # 清除现有事件数据
+    db.query(novel.EventParticipation).filter(
+        novel.EventParticipation.event_id.in_(
+            db.query(novel.Event.id).filter(novel.Event.novel_id == novel_id)
+        )
+    ).delete(synchronize_session=False)
+    
+    db.query(novel.Event).filter(novel.Event.novel_id == novel_id).delete()
+    
+    # 将事件保存到数据库
+    for event_data in events:
+        # 从事件数据中提取参与者信息
+        participants = event_data.pop("participants", [])
+        
+        # 获取事件关联的地点ID
+        location_id = None
+        location_name = event_data.pop("location_name", None)
+        if location_name:
+            # 尝试通过名称查找地点
+            location_obj = next((loc for loc in locations if loc.name == location_name), None)
+            if location_obj:
+                location_id = location_obj.id
+            else:
+                # 如果找不到匹配的地点，使用第一个地点
+                location_id = locations[0].id if locations else None
+        else:
+            # 直接使用第一个地点
+            location_id = locations[0].id if locations else None
+        
+        # 创建事件
+        new_event = novel.Event(
+            novel_id=novel_id,
+            location_id=location_id,
+            **{k: v for k, v in event_data.items() if k in [
+                "name", "description", "chapter_id", "time_description", "importance"
+            ] and v is not None}
+        )
+        db.add(new_event)
+        db.flush()  # 获取新创建事件的ID
+        
+        # 添加事件参与者
+        for participant in participants:
+            character_name = participant.get("name")
+            if not character_name:
+                continue
+                
+            # 尝试通过名称查找角色
+            character_obj = next((char for char in characters if char.name == character_name), None)
+            if not character_obj:
+                # 如果找不到匹配的角色，跳过
+                continue
+                
+            event_participation = novel.EventParticipation(
+                event_id=new_event.id,
+                character_id=character_obj.id,
+                role=participant.get("role", "参与者")
+            )
+            db.add(event_participation)
+    
+    db.commit()
+
 async def extract_events_from_novel(
     novel_title: str,
     content: str,
@@ -364,20 +393,16 @@ def generate_sample_events(characters, locations) -> List[Dict[str, Any]]:
             }
         ]
 
-async def get_novel_events(db: Session, novel_id: int, force_refresh: bool = False) -> Dict[str, Any]:
-    """
-    获取小说中的所有事件
+def check_event_sources(db: Session, novel_id: int) -> Tuple[bool, bool]:
+    """检查小说是否存在，以及事件分析所需的角色和地点数据是否存在
     
     Args:
         db: 数据库会话
         novel_id: 小说ID
-        force_refresh: 是否强制刷新分析结果
         
     Returns:
-        Dict[str, Any]: 包含事件列表和元数据的字典
+        (角色数据是否存在, 地点数据是否存在)
     """
-    logger.info(f"获取小说ID为 {novel_id} 的事件列表，force_refresh={force_refresh}")
-    
     # 1. 检查小说是否存在
     novel_obj = db.query(novel.Novel).filter(novel.Novel.id == novel_id).first()
     if not novel_obj:
@@ -392,11 +417,45 @@ async def get_novel_events(db: Session, novel_id: int, force_refresh: bool = Fal
     locations_exist = db.query(novel.Location).filter(novel.Location.novel_id == novel_id).count() > 0
     logger.info(f"小说ID {novel_id} 的地点数据存在性: {locations_exist}")
     
+    return characters_exist, locations_exist
+
+async def get_novel_events(db: Session, novel_id: int, force_refresh: bool = False) -> Dict[str, Any]:
+    """
+    获取小说中的所有事件
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        force_refresh: 是否强制刷新分析结果
+        
+    Returns:
+        Dict[str, Any]: 包含事件列表和元数据的字典
+    """
+    logger.info(f"获取小说ID为 {novel_id} 的事件列表，force_refresh={force_refresh}")
+    
+    # 同步查询放到线程池执行，避免阻塞事件循环
+    characters_exist, locations_exist = await run_in_threadpool(check_event_sources, db, novel_id)
+    
     # 4. 如果force_refresh为True且角色和地点数据都存在，则重新分析事件
     if force_refresh and characters_exist and locations_exist:
         logger.info(f"开始强制刷新小说ID {novel_id} 的事件分析")
         await analyze_novel_events(db, novel_id)
     
+    return await run_in_threadpool(list_novel_events, db, novel_id, characters_exist, locations_exist)
+
+def list_novel_events(db: Session, novel_id: int, characters_exist: bool, locations_exist: bool) -> Dict[str, Any]:
+    """
+    从数据库读取小说的事件列表
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        characters_exist: 角色数据是否存在
+        locations_exist: 地点数据是否存在
+        
+    Returns:
+        Dict[str, Any]: 包含事件列表和元数据的字典
+    """
     # 5. 从数据库获取事件
     events = []
     db_events = db.query(novel.Event).filter(novel.Event.novel_id == novel_id).all()
@@ -453,7 +512,7 @@ async def get_novel_events(db: Session, novel_id: int, force_refresh: bool = Fal
     
     return response
 
-async def get_event_details(db: Session, event_id: int) -> Dict[str, Any]:
+def get_event_details(db: Session, event_id: int) -> Dict[str, Any]:
     """获取事件详细信息
     
     Args:
@@ -585,6 +644,12 @@ async def analyze_event_significance(db: Session, event_id: int) -> Dict[str, An
             if chapter:
                 context = chapter.content[:5000]  # 限制内容长度
         
+        # 全书梗概和情节段摘要，用于判断事件在整个故事中的位置；多次同步查询放到线程池执行
+        synopsis = await run_in_threadpool(
+            summary_service.build_compact_context,
+            db=db, novel_id=event.novel_id, max_tokens=settings.COMPACT_CONTEXT_TOKENS // 4
+        ) or "无"
+        
         # 处理所有字符串确保安全
         safe_title = novel_obj.title.replace("%", "%%") if novel_obj.title else ""
         safe_event_name = event.name.replace("%", "%%") if event.name else ""
@@ -592,6 +657,7 @@ async def analyze_event_significance(db: Session, event_id: int) -> Dict[str, An
         safe_time_desc = (event.time_description or "未知").replace("%", "%%")
         safe_location = (location or "未知").replace("%", "%%")
         safe_context = context.replace("%", "%%") if context else ""
+        safe_synopsis = synopsis.replace("%", "%%")
         
         # 构建参与者文本，确保安全处理
         try:
@@ -615,6 +681,11 @@ async def analyze_event_significance(db: Session, event_id: int) -> Dict[str, An
         发生地点: {location}
         参与角色: {participants}
 
+        故事梗概:
+        ```
+        {synopsis}
+        ```
+
         相关内容片段:
         ```
         {context}
@@ -659,7 +730,8 @@ async def analyze_event_significance(db: Session, event_id: int) -> Dict[str, An
             time_desc=safe_time_desc,
             location=safe_location,
             participants=participants_text,
-            context=safe_context
+            context=safe_context,
+            synopsis=safe_synopsis
         )
         
         # 检查是否需要使用模拟数据
@@ -689,7 +761,7 @@ async def analyze_event_significance(db: Session, event_id: int) -> Dict[str, An
         )
         
         # 记录API响应
-        logger.info("OpenAI API响应: %s...", str(response)[:200] if response else "无响应")
+        logger.debug("OpenAI API响应: %s...", str(response)[:200] if response else "无响应")
         
         # 解析响应
         if not response or "choices" not in response:
@@ -697,7 +769,7 @@ async def analyze_event_significance(db: Session, event_id: int) -> Dict[str, An
             return generate_sample_significance(event)
             
         content = response["choices"][0]["message"]["content"]
-        logger.info("API响应内容: %s...", content[:200] if content else "无内容")
+        logger.debug("API响应内容: %s...", content[:200] if content else "无内容")
         
         try:
             # 提取JSON部分
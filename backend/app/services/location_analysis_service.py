@@ -1,11 +1,15 @@
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 import re
 import json
+from contextlib import closing
 
 from app.models import novel
 from app.services import novel_service
+from app.core import entity_prepass
+from app.core.database import run_serialized_write
 from app.core.openai_client import OpenAIClient
 
 logger = logging.getLogger(__name__)
@@ -61,6 +65,177 @@ def filter_invalid_locations(locations_list: List[Dict[str, Any]]) -> List[Dict[
     logger.info(f"地点过滤: 原始数量 {len(locations_list)}，过滤后数量 {len(filtered_locations)}")
     return filtered_locations
 
+async def extract_locations_from_windows(windows, known_names: Optional[entity_prepass.KnownNameIndex] = None) -> List[Dict[str, Any]]:
+    """逐个分析文本窗口中的地点并按名称合并
+
+    窗口来自惰性的章节流，每个窗口读出后立即发起请求，不需要先把整本书
+    拼接成一个字符串。
+
+    传入已知地点索引且启用实体预扫描时，只出现已知地点、没有新地点候选的窗口
+    不再调用模型；本次分析发现的地点随即加入索引。
+
+    Args:
+        windows: (章节元数据列表, 窗口文本) 生成器，结束或出错时关闭
+        known_names: 已知地点名称索引（可选）
+
+    Returns:
+        合并后的地点列表，窗口为空时返回None
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    window_count = 0
+    prepass = known_names is not None and entity_prepass.available()
+    stats = entity_prepass.PrepassStats(entity_prepass.PLACE)
+    # 请求失败提前退出时也关闭窗口生成器，释放底层的章节查询
+    with closing(windows):
+        while True:
+            # 读取下一个窗口会查询章节，放到线程池执行
+            window = await run_in_threadpool(next, windows, None)
+            if window is None:
+                break
+            metas, text = window
+            window_count += 1
+            if prepass:
+                # 分词是CPU密集的同步操作，放到线程池执行
+                result = await run_in_threadpool(entity_prepass.scan, text, known_names, entity_prepass.PLACE)
+                if not result.has_new and result.known:
+                    logger.info(f"第{window_count}个文本窗口没有新地点，跳过模型调用，章节 {metas[0]['number']}-{metas[-1]['number']}")
+                    stats.record("skip")
+                    continue
+                stats.record("full")
+            logger.info(f"分析第{window_count}个文本窗口的地点，章节 {metas[0]['number']}-{metas[-1]['number']}")
+            locations_data = await OpenAIClient.extract_entities(text)
+            for location_data in locations_data.get("locations", []):
+                name = (location_data.get("name") or "").strip()
+                if not name:
+                    continue
+                if prepass:
+                    known_names.add(name)
+                existing = merged.get(name)
+                if existing is None:
+                    merged[name] = dict(location_data)
+                    continue
+                # 同名地点保留更详细的描述和更高的重要性
+                if len(location_data.get("description") or "") > len(existing.get("description") or ""):
+                    existing["description"] = location_data["description"]
+                if (location_data.get("importance") or 0) > (existing.get("importance") or 0):
+                    existing["importance"] = location_data["importance"]
+                if not existing.get("parent") and location_data.get("parent"):
+                    existing["parent"] = location_data["parent"]
+
+    stats.log()
+    if window_count == 0:
+        return None
+    return list(merged.values())
+
+def known_location_index(db: Session, novel_id: int) -> entity_prepass.KnownNameIndex:
+    """用小说已保存的地点名称构建已知名称索引"""
+    names = db.query(novel.Location.name).filter(novel.Location.novel_id == novel_id).all()
+    return entity_prepass.KnownNameIndex({name: () for name, in names})
+
+def get_saved_locations(db: Session, db_novel: novel.Novel) -> List[Dict[str, Any]]:
+    """读取小说已保存的地点数据"""
+    return [
+        {
+            "id": location.id,
+            "name": location.name,
+            "description": location.description,
+            "parent_id": location.parent_id,
+            "events_count": len(location.events) if hasattr(location, "events") else 0
+        }
+        for location in db_novel.locations
+    ]
+
+def save_locations(
+    db: Session,
+    novel_id: int,
+    locations_list: List[Dict[str, Any]],
+    chapter_id: Optional[int] = None
+) -> Tuple[int, int]:
+    """保存地点分析结果，按名称更新已有地点或创建新地点，并设置父子关系
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        locations_list: 地点分析结果
+        chapter_id: 按章节分析时地点所属的章节，已有地点只在未设置章节时更新
+        
+    Returns:
+        (创建数量, 更新数量)
+    """
+    # 记录所有操作，用于调试和记录
+    created_count = 0
+    updated_count = 0
+    
+    for location_data in locations_list:
+        # 检查地点是否已存在
+        existing = db.query(novel.Location).filter(
+            novel.Location.novel_id == novel_id,
+            novel.Location.name.ilike(location_data["name"].strip())
+        ).first()
+        
+        if existing:
+            # 如果已存在且没有chapter_id，则更新为分析的章节
+            if chapter_id is not None and existing.chapter_id is None:
+                existing.chapter_id = chapter_id
+            # 更新现有地点
+            logger.info(f"更新现有地点: {location_data['name']}")
+            existing.description = location_data.get("description", existing.description)
+            # 更新重要性（如果提供）
+            if "importance" in location_data and location_data["importance"]:
+                existing.importance = location_data["importance"]
+            updated_count += 1
+        else:
+            # 创建新地点
+            logger.info(f"创建新地点: {location_data['name']}")
+            new_location = novel.Location(
+                novel_id=novel_id,
+                name=location_data["name"],
+                description=location_data.get("description", ""),
+                importance=location_data.get("importance", 1),  # 默认值为1
+                chapter_id=chapter_id
+            )
+            db.add(new_location)
+            created_count += 1
+    
+    # 处理地点的父子关系
+    for location_data in locations_list:
+        if "parent" in location_data and location_data["parent"]:
+            child_location = db.query(novel.Location).filter(
+                novel.Location.novel_id == novel_id,
+                novel.Location.name.ilike(location_data["name"].strip())
+            ).first()
+            
+            parent_location = db.query(novel.Location).filter(
+                novel.Location.novel_id == novel_id,
+                novel.Location.name.ilike(location_data["parent"].strip())
+            ).first()
+            
+            if child_location and parent_location:
+                child_location.parent_id = parent_location.id
+    
+    db.commit()
+    return created_count, updated_count
+
+def list_chapter_locations(db: Session, novel_id: int, chapter_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """读取小说的地点，指定chapter_id时只返回该章节的地点"""
+    locations_query = db.query(novel.Location).filter(
+        novel.Location.novel_id == novel_id
+    )
+    if chapter_id is not None:
+        locations_query = locations_query.filter(novel.Location.chapter_id == chapter_id)
+    
+    return [
+        {
+            "id": location.id,
+            "name": location.name,
+            "description": location.description,
+            "parent_id": location.parent_id,
+            "chapter_id": location.chapter_id,
+            "events_count": len(location.events) if hasattr(location, "events") else 0
+        }
+        for location in locations_query.all()
+    ]
+
 async def analyze_novel_locations(db: Session, novel_id: int, force_refresh: bool = False) -> List[Dict[str, Any]]:
     """分析小说中的地点
     
@@ -74,114 +249,49 @@ async def analyze_novel_locations(db: Session, novel_id: int, force_refresh: boo
     """
     logger.info(f"开始分析小说地点: novel_id={novel_id}, force_refresh={force_refresh}")
     
-    # 获取小说
-    db_novel = novel_service.get_novel(db=db, novel_id=novel_id)
+    # 获取小说，同步查询放到线程池执行，避免阻塞事件循环
+    db_novel = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=novel_id)
     if not db_novel:
         raise ValueError("小说不存在")
     
     # 如果不是强制刷新，检查是否已有地点分析结果
-    if not force_refresh and db_novel.locations:
-        logger.info(f"使用现有地点数据，novel_id={novel_id}")
-        return [
-            {
-                "id": location.id,
-                "name": location.name,
-                "description": location.description,
-                "parent_id": location.parent_id,
-                "events_count": len(location.events) if hasattr(location, "events") else 0
-            }
-            for location in db_novel.locations
-        ]
+    if not force_refresh:
+        saved_locations = await run_in_threadpool(get_saved_locations, db, db_novel)
+        if saved_locations:
+            logger.info(f"使用现有地点数据，novel_id={novel_id}")
+            return saved_locations
     
-    # 获取小说内容
-    logger.info(f"需要分析地点，获取小说内容: novel_id={novel_id}")
-    content = novel_service.get_novel_chapters_content(db=db, novel_id=novel_id)
-    if not content:
-        raise ValueError("小说内容为空")
+    # 按token窗口流式读取小说内容并分析地点
+    logger.info(f"需要分析地点，流式读取小说内容: novel_id={novel_id}")
     
     # 使用AI分析地点
     try:
-        logger.info("调用OpenAI API分析地点...")
-        locations_data = await OpenAIClient.extract_entities(content)
-        locations_list = locations_data.get("locations", [])
+        locations_list = await extract_locations_from_windows(
+            novel_service.iter_novel_windows(db=db, novel_id=novel_id),
+            # 重新分析全书，索引从空开始，只收录本次发现的地点
+            known_names=entity_prepass.KnownNameIndex()
+        )
+        if locations_list is None:
+            raise ValueError("小说内容为空")
+        
         logger.info(f"成功获取地点分析结果，共{len(locations_list)}个地点")
         
         # 过滤不太可能是地点的条目
         locations_list = filter_invalid_locations(locations_list)
         
-        # 记录所有操作，用于调试和记录
-        created_count = 0
-        updated_count = 0
-        
-        # 保存分析结果到数据库
-        for location_data in locations_list:
-            # 检查地点是否已存在
-            existing = db.query(novel.Location).filter(
-                novel.Location.novel_id == novel_id,
-                novel.Location.name.ilike(location_data["name"].strip())
-            ).first()
-            
-            if existing:
-                # 更新现有地点
-                logger.info(f"更新现有地点: {location_data['name']}")
-                existing.description = location_data.get("description", existing.description)
-                # 更新重要性（如果提供）
-                if "importance" in location_data and location_data["importance"]:
-                    existing.importance = location_data["importance"]
-                updated_count += 1
-            else:
-                # 创建新地点
-                logger.info(f"创建新地点: {location_data['name']}")
-                new_location = novel.Location(
-                    novel_id=novel_id,
-                    name=location_data["name"],
-                    description=location_data.get("description", ""),
-                    importance=location_data.get("importance", 1)  # 默认值为1
-                )
-                db.add(new_location)
-                created_count += 1
-        
-        # 处理地点的父子关系
-        for location_data in locations_list:
-            if "parent" in location_data and location_data["parent"]:
-                child_location = db.query(novel.Location).filter(
-                    novel.Location.novel_id == novel_id,
-                    novel.Location.name.ilike(location_data["name"].strip())
-                ).first()
-                
-                parent_location = db.query(novel.Location).filter(
-                    novel.Location.novel_id == novel_id,
-                    novel.Location.name.ilike(location_data["parent"].strip())
-                ).first()
-                
-                if child_location and parent_location:
-                    child_location.parent_id = parent_location.id
-        
-        db.commit()
+        # 保存分析结果到数据库，写操作在写队列中执行
+        created_count, updated_count = await run_serialized_write(save_locations, db, novel_id, locations_list)
         logger.info(f"地点分析处理完成: 创建了{created_count}个新地点，更新了{updated_count}个现有地点")
         
         # 返回更新后的地点列表
-        updated_locations = db.query(novel.Location).filter(
-            novel.Location.novel_id == novel_id
-        ).all()
-        
-        return [
-            {
-                "id": location.id,
-                "name": location.name,
-                "description": location.description,
-                "parent_id": location.parent_id,
-                "events_count": len(location.events) if hasattr(location, "events") else 0
-            }
-            for location in updated_locations
-        ]
+        return await run_in_threadpool(get_saved_locations, db, db_novel)
         
     except Exception as e:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         logger.error(f"地点分析失败: {str(e)}")
         raise
 
-async def get_location_details(db: Session, location_id: int) -> Dict[str, Any]:
+def get_location_details(db: Session, location_id: int) -> Dict[str, Any]:
     """获取地点详细信息
     
     Args:
@@ -372,9 +482,10 @@ async def analyze_location_significance(db: Session, location_id: int) -> Dict[s
     if not novel_data:
         raise ValueError("小说不存在")
     
-    # 获取小说内容
-    content = novel_service.get_novel_chapters_content(db=db, novel_id=location.novel_id)
-    if not content:
+    # 检查小说是否有章节内容
+    with closing(novel_service.iter_novel_chapters(db=db, novel_id=location.novel_id, limit=1)) as chapters:
+        has_content = next(chapters, None)
+    if not has_content:
         return {
             "name": location.name,
             "significance": [],
@@ -452,7 +563,8 @@ async def analyze_all_location_events(db: Session, novel_id: int, force_refresh:
             }
     
     # 获取小说内容
-    content = novel_service.get_novel_chapters_content(db=db, novel_id=novel_id)
+    # 只使用前10000个字符作为上下文，读够即停止
+    content = novel_service.get_novel_chapters_content(db=db, novel_id=novel_id, max_chars=10000)
     if not content:
         raise ValueError("小说内容为空")
     
@@ -503,7 +615,7 @@ async def analyze_all_location_events(db: Session, novel_id: int, force_refresh:
             response = await OpenAIClient.chat_completion(
                 messages=[
                     {"role": "system", "content": "你是一个专业的文学分析工具，专注于分析小说中的地点与事件关系。"},
-                    {"role": "user", "content": prompt + f"\n\n小说内容:\n{content[:10000]}"}  # 使用前10000个字符作为上下文
+                    {"role": "user", "content": prompt + f"\n\n小说内容:\n{content}"}
                 ],
                 temperature=0.7,
                 max_tokens=2000
@@ -599,113 +711,58 @@ async def analyze_locations_by_chapter(db: Session, novel_id: int, start_chapter
     """
     logger.info(f"开始按章节范围分析地点: novel_id={novel_id}, 从章节{start_chapter_id}到{end_chapter_id}")
     
-    # 获取小说
-    db_novel = novel_service.get_novel(db=db, novel_id=novel_id)
+    # 获取小说，同步查询放到线程池执行
+    db_novel = await run_in_threadpool(novel_service.get_novel, db=db, novel_id=novel_id)
     if not db_novel:
         raise ValueError("小说不存在")
     
     # 获取指定范围的章节内容
     logger.info(f"获取章节范围内的内容: novel_id={novel_id}, start_chapter={start_chapter_id}, end_chapter={end_chapter_id}")
-    content = novel_service.get_chapters_content_by_range(
-        db=db, 
-        novel_id=novel_id, 
-        start_chapter_id=start_chapter_id, 
+    number_range = await run_in_threadpool(
+        novel_service.get_chapter_number_range,
+        db=db,
+        novel_id=novel_id,
+        start_chapter_id=start_chapter_id,
         end_chapter_id=end_chapter_id
     )
-    
-    if not content:
+    if not number_range:
         raise ValueError("章节内容为空")
     
+    logger.info("调用OpenAI API分析章节范围内的地点...")
+    
     # 使用AI分析地点
     try:
-        logger.info("调用OpenAI API分析章节范围内的地点...")
-        locations_data = await OpenAIClient.extract_entities(content)
-        locations_list = locations_data.get("locations", [])
+        locations_list = await extract_locations_from_windows(
+            novel_service.iter_novel_windows(
+                db=db,
+                novel_id=novel_id,
+                start_number=number_range[0],
+                end_number=number_range[1]
+            ),
+            known_names=await run_in_threadpool(known_location_index, db, novel_id)
+        )
+        if locations_list is None:
+            raise ValueError("章节内容为空")
+        
         logger.info(f"成功获取章节范围地点分析结果，共{len(locations_list)}个地点")
         
         # 过滤不太可能是地点的条目
         locations_list = filter_invalid_locations(locations_list)
         
-        # 记录所有操作，用于调试和记录
-        created_count = 0
-        updated_count = 0
-        
-        # 保存分析结果到数据库
-        for location_data in locations_list:
-            # 检查地点是否已存在
-            existing = db.query(novel.Location).filter(
-                novel.Location.novel_id == novel_id,
-                novel.Location.name.ilike(location_data["name"].strip())
-            ).first()
-            
-            if existing:
-                # 如果已存在且没有chapter_id，则更新chapter_id为分析范围的第一个章节
-                if existing.chapter_id is None:
-                    existing.chapter_id = start_chapter_id
-                # 更新现有地点
-                logger.info(f"更新现有地点: {location_data['name']}")
-                existing.description = location_data.get("description", existing.description)
-                # 更新重要性（如果提供）
-                if "importance" in location_data and location_data["importance"]:
-                    existing.importance = location_data["importance"]
-                updated_count += 1
-            else:
-                # 创建新地点，设置chapter_id为分析范围的第一个章节
-                logger.info(f"创建新地点: {location_data['name']}")
-                new_location = novel.Location(
-                    novel_id=novel_id,
-                    name=location_data["name"],
-                    description=location_data.get("description", ""),
-                    importance=location_data.get("importance", 1),  # 默认值为1
-                    chapter_id=start_chapter_id  # 设置章节ID
-                )
-                db.add(new_location)
-                created_count += 1
-        
-        # 处理地点的父子关系
-        for location_data in locations_list:
-            if "parent" in location_data and location_data["parent"]:
-                child_location = db.query(novel.Location).filter(
-                    novel.Location.novel_id == novel_id,
-                    novel.Location.name.ilike(location_data["name"].strip())
-                ).first()
-                
-                parent_location = db.query(novel.Location).filter(
-                    novel.Location.novel_id == novel_id,
-                    novel.Location.name.ilike(location_data["parent"].strip())
-                ).first()
-                
-                if child_location and parent_location:
-                    child_location.parent_id = parent_location.id
-        
-        db.commit()
+        # 保存分析结果到数据库，新地点记录为分析范围的第一个章节
+        created_count, updated_count = await run_serialized_write(
+            save_locations, db, novel_id, locations_list, start_chapter_id
+        )
         logger.info(f"章节范围地点分析处理完成: 创建了{created_count}个新地点，更新了{updated_count}个现有地点")
         
-        # 返回该小说在分析章节范围内的所有地点
-        locations_query = db.query(novel.Location).filter(
-            novel.Location.novel_id == novel_id
+        # 返回该小说的所有地点，单章节分析只返回该章节的地点
+        return await run_in_threadpool(
+            list_chapter_locations, db, novel_id,
+            start_chapter_id if start_chapter_id == end_chapter_id else None
         )
         
-        # 如果是单章节分析，只返回该章节的地点
-        if start_chapter_id == end_chapter_id:
-            locations_query = locations_query.filter(novel.Location.chapter_id == start_chapter_id)
-        
-        updated_locations = locations_query.all()
-        
-        return [
-            {
-                "id": location.id,
-                "name": location.name,
-                "description": location.description,
-                "parent_id": location.parent_id,
-                "chapter_id": location.chapter_id,
-                "events_count": len(location.events) if hasattr(location, "events") else 0
-            }
-            for location in updated_locations
-        ]
-        
     except Exception as e:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         logger.error(f"章节范围地点分析失败: {str(e)}")
         raise
 
@@ -1,21 +1,54 @@
+from contextlib import closing
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator, Sequence, Tuple
 import logging
 from fastapi import UploadFile
-import re
+from fastapi.concurrency import run_in_threadpool
 
 from app.models import novel, schemas
 from app.core.openai_client import OpenAIClient
+from app.core.answer_cache import answer_cache
+from app.core.config import settings
+from app.core.database import run_serialized_write
+from app.core import text_window
+from app.core.chapter_splitter import chapter_records
+from app.core.pagination import keyset_after, query_columns
+from app.services import character_profile_service, statistics_service
 
 logger = logging.getLogger(__name__)
 
+# 小说列表游标分页的排序键
+NOVEL_CURSOR_FIELDS = ("id",)
+
 def get_novel(db: Session, novel_id: int) -> Optional[novel.Novel]:
     """获取小说详情"""
     return db.query(novel.Novel).filter(novel.Novel.id == novel_id).first()
 
-def get_novels(db: Session, skip: int = 0, limit: int = 100) -> List[novel.Novel]:
-    """获取小说列表"""
-    return db.query(novel.Novel).offset(skip).limit(limit).all()
+def get_novels(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[Sequence[Any]] = None,
+    fields: Optional[List[str]] = None
+) -> List[Any]:
+    """获取小说列表，按ID排序
+    
+    Args:
+        db: 数据库会话
+        skip: 偏移量，仅在未使用游标时生效
+        limit: 返回数量
+        after: 上一页最后一本小说的 (id,)，指定时使用游标分页
+        fields: 只读取的字段，未指定时返回完整的小说对象
+    """
+    if fields:
+        query = db.query(*query_columns(novel.Novel, fields, NOVEL_CURSOR_FIELDS))
+    else:
+        query = db.query(novel.Novel)
+    if after is not None:
+        query = query.filter(keyset_after((novel.Novel.id,), after))
+    else:
+        query = query.offset(skip)
+    return query.order_by(novel.Novel.id).limit(limit).all()
 
 def create_novel(db: Session, novel_data: schemas.NovelCreate) -> novel.Novel:
     """创建新小说"""
@@ -41,11 +74,83 @@ def update_novel(db: Session, novel_id: int, novel_data: schemas.NovelCreate) ->
     db.refresh(db_novel)
     return db_novel
 
+def bump_content_version(db: Session, novel_id: int) -> None:
+    """章节内容变化后递增小说的内容版本，随调用方的事务一起提交"""
+    db.query(novel.Novel).filter(novel.Novel.id == novel_id).update(
+        {novel.Novel.content_version: novel.Novel.content_version + 1},
+        synchronize_session=False
+    )
+
+def get_content_version(db: Session, novel_id: int) -> Optional[int]:
+    """获取小说当前的内容版本，小说不存在时返回None"""
+    return db.query(novel.Novel.content_version).filter(novel.Novel.id == novel_id).scalar()
+
+def get_data_version(db: Session, novel_id: int) -> Optional[int]:
+    """获取小说当前的数据版本，小说不存在时返回None
+
+    数据版本由app.core.data_version在每次写入时自动递增
+    """
+    return db.query(novel.Novel.data_version).filter(novel.Novel.id == novel_id).scalar()
+
+def create_chapter(
+    db: Session,
+    novel_id: int,
+    title: str,
+    content: str,
+    number: Optional[int] = None
+) -> novel.Chapter:
+    """创建单个章节并递增内容版本
+
+    Args:
+        number: 章节序号，未指定时使用当前最大章节号+1
+    """
+    if number is None:
+        number = statistics_service.get_max_chapter_number(db=db, novel_id=novel_id) + 1
+    chapter = novel.Chapter(
+        novel_id=novel_id,
+        title=title,
+        content=content,
+        number=number,
+        word_count=len(content)
+    )
+    db.add(chapter)
+    bump_content_version(db, novel_id)
+    db.commit()
+    db.refresh(chapter)
+    return chapter
+
 def delete_novel(db: Session, novel_id: int) -> None:
     """删除小说"""
     db_novel = get_novel(db, novel_id)
     db.delete(db_novel)
     db.commit()
+    # 小说ID可能被新导入的小说复用，内容版本也从1开始，需要清掉旧答案
+    answer_cache.invalidate(novel_id)
+
+def build_chapters(novel_id: int, text: str, title_override: Optional[str] = None) -> List[novel.Chapter]:
+    """把小说全文切分为章节对象（未加入会话）
+    
+    章节序号按原文顺序从1递增；标题中的卷/章序号只用于识别，不作为排序依据，
+    分卷小说每卷从第一章重新编号时也不会冲突。
+    
+    Args:
+        novel_id: 小说ID
+        text: 小说全文
+        title_override: 只有一个章节时使用的标题（可选）
+        
+    Returns:
+        章节对象列表
+    """
+    return [
+        novel.Chapter(
+            novel_id=novel_id,
+            title=title,
+            content=chapter_content,
+            number=i,
+            word_count=len(chapter_content)
+        )
+        for i, (title, chapter_content) in enumerate(chapter_records(text, title_override), 1)
+    ]
 
 async def process_novel_file(db: Session, novel_id: int, file: UploadFile) -> None:
     """处理上传的小说文件"""
@@ -54,27 +159,10 @@ async def process_novel_file(db: Session, novel_id: int, file: UploadFile) -> No
         content = await file.read()
         text = content.decode('utf-8')
         
-        # 简单的章节分割（按"第X章"分割）
-        chapters = re.split(r'第[一二三四五六七八九十百千万\d]+章', text)
-        
-        if len(chapters) <= 1:
-            # 如果没有找到章节标记，将整个内容作为一个章节
-            chapters = [text]
-        
-        # 删除空白章节
-        chapters = [ch.strip() for ch in chapters if ch.strip()]
-        
-        # 保存章节
-        for i, chapter_content in enumerate(chapters, 1):
-            chapter = novel.Chapter(
-                novel_id=novel_id,
-                title=f"第{i}章",
-                content=chapter_content,
-                number=i,
-                word_count=len(chapter_content)
-            )
-            db.add(chapter)
+        # 按标题切分章节并保存
+        db.add_all(build_chapters(novel_id, text))
         
+        bump_content_version(db, novel_id)
         db.commit()
         
     except Exception as e:
@@ -82,32 +170,30 @@ async def process_novel_file(db: Session, novel_id: int, file: UploadFile) -> No
         db.rollback()
         raise
 
-def get_novel_statistics(db: Session, novel_id: int) -> Dict[str, Any]:
-    """获取小说统计信息"""
-    db_novel = get_novel(db, novel_id)
+def get_novel_statistics(db: Session, novel_id: int, include_chapters: bool = False) -> Dict[str, Any]:
+    """获取小说统计信息
     
-    # 计算总字数
-    total_words = 0
-    for chapter in db_novel.chapters:
-        total_words += chapter.word_count or 0
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        include_chapters: 是否附带每个章节的实体密度
+        
+    Returns:
+        统计信息字典
+    """
+    # 统计全部在数据库端聚合完成，不加载章节和实体对象
+    statistics = statistics_service.get_novel_counts(db, novel_id)
     
-    # 统计人物、地点、物品数量
-    character_count = len(db_novel.characters)
-    location_count = len(db_novel.locations)
-    item_count = len(db_novel.items)
+    if include_chapters:
+        statistics["chapter_densities"] = statistics_service.get_chapter_densities(db, novel_id)
     
-    return {
-        "total_chapters": len(db_novel.chapters),
-        "total_words": total_words,
-        "character_count": character_count,
-        "location_count": location_count,
-        "item_count": item_count
-    }
+    return statistics
 
 async def extract_novel_entities(db: Session, novel_id: int) -> None:
     """提取小说实体（示例实现）"""
     try:
         db_novel = get_novel(db, novel_id)
+        profile_index = character_profile_service.CharacterProfileIndex(db, novel_id)
         
         # 处理每个章节
         for chapter in db_novel.chapters:
@@ -149,6 +235,7 @@ async def extract_novel_entities(db: Session, novel_id: int) -> None:
                         )
                         db.add(character)
                         db.flush()
+                        profile_index.record(character, chapter)
                 
                 # 处理地点和物品等其他实体...
                 
@@ -172,45 +259,124 @@ def get_item(db: Session, item_id: int) -> Optional[novel.Item]:
     """获取物品详情"""
     return db.query(novel.Item).filter(novel.Item.id == item_id).first()
 
-def get_novel_chapters_content(db: Session, novel_id: int, limit: Optional[int] = None) -> str:
+def iter_novel_chapters(
+    db: Session,
+    novel_id: int,
+    start_number: Optional[int] = None,
+    end_number: Optional[int] = None,
+    limit: Optional[int] = None,
+    batch_size: int = 50
+) -> Iterator[Tuple[Dict[str, Any], str]]:
+    """按章节序号流式读取小说章节
+
+    查询使用yield_per分批从数据库取行，任意时刻只持有一批章节正文。
+    每章产出的文本已带上章节标题，格式与合并内容一致。
+
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        start_number: 起始章节序号（包含），为None时从第一章开始
+        end_number: 结束章节序号（包含），为None时读到最后一章
+        limit: 限制读取的章节数量
+        batch_size: 每批从数据库读取的章节数
+
+    Yields:
+        (章节元数据, 带标题的章节文本)
+    """
+    query = db.query(
+        novel.Chapter.id,
+        novel.Chapter.number,
+        novel.Chapter.title,
+        novel.Chapter.word_count,
+        novel.Chapter.content
+    ).filter(novel.Chapter.novel_id == novel_id)
+
+    if start_number is not None:
+        query = query.filter(novel.Chapter.number >= start_number)
+    if end_number is not None:
+        query = query.filter(novel.Chapter.number <= end_number)
+
+    query = query.order_by(novel.Chapter.number)
+    if limit:
+        query = query.limit(limit)
+
+    for row in query.yield_per(batch_size):
+        meta = {
+            "id": row.id,
+            "number": row.number,
+            "title": row.title,
+            "word_count": row.word_count
+        }
+        # 章节之间添加空行分隔
+        yield meta, f"第{row.number}章 {row.title}\n\n{row.content or ''}\n\n"
+
+def iter_novel_windows(
+    db: Session,
+    novel_id: int,
+    max_tokens: Optional[int] = None,
+    start_number: Optional[int] = None,
+    end_number: Optional[int] = None
+) -> Iterator[Tuple[List[Dict[str, Any]], str]]:
+    """把小说章节流切成不超过token上限的分析窗口
+
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        max_tokens: 每个窗口的token上限，默认使用配置的ANALYSIS_WINDOW_TOKENS
+        start_number: 起始章节序号（包含）
+        end_number: 结束章节序号（包含）
+
+    Yields:
+        (窗口包含的章节元数据列表, 窗口文本)
+    """
+    # 调用方提前停止迭代时一并关闭章节查询
+    with closing(iter_novel_chapters(db, novel_id, start_number=start_number, end_number=end_number)) as chapters:
+        yield from text_window.iter_token_windows(chapters, max_tokens or settings.ANALYSIS_WINDOW_TOKENS)
+
+def get_chapter_number_range(
+    db: Session,
+    novel_id: int,
+    start_chapter_id: int,
+    end_chapter_id: int
+) -> Optional[Tuple[int, int]]:
+    """把起止章节ID换算为章节序号范围，章节不存在时返回None"""
+    rows = dict(db.query(novel.Chapter.id, novel.Chapter.number).filter(
+        novel.Chapter.novel_id == novel_id,
+        novel.Chapter.id.in_([start_chapter_id, end_chapter_id])
+    ).all())
+
+    if start_chapter_id not in rows or end_chapter_id not in rows:
+        return None
+    return rows[start_chapter_id], rows[end_chapter_id]
+
+def get_novel_chapters_content(
+    db: Session,
+    novel_id: int,
+    limit: Optional[int] = None,
+    max_chars: Optional[int] = None
+) -> str:
     """获取小说章节内容
     
     Args:
         db: 数据库会话
         novel_id: 小说ID
         limit: 限制返回的章节数量，如果为None则返回所有章节
+        max_chars: 限制返回的字符数，达到上限后不再读取后续章节
         
     Returns:
         合并后的章节内容
     """
-    # 获取小说
-    db_novel = get_novel(db, novel_id)
-    if not db_novel:
-        return ""
-        
-    # 查询章节，按章节序号排序
-    chapters = db.query(novel.Chapter).filter(
-        novel.Chapter.novel_id == novel_id
-    ).order_by(novel.Chapter.number)
-    
-    if limit:
-        chapters = chapters.limit(limit)
-    
-    chapters = chapters.all()
-    
-    if not chapters:
-        return ""
-    
-    # 合并章节内容
-    content_parts = []
-    for chapter in chapters:
-        content_parts.append(f"第{chapter.number}章 {chapter.title}\n\n")
-        content_parts.append(chapter.content)
-        content_parts.append("\n\n")  # 章节之间添加空行分隔
-    
-    return "".join(content_parts)
+    # 达到字符上限后提前结束迭代，关闭章节查询，不再取后续批次
+    with closing(iter_novel_chapters(db, novel_id, limit=limit)) as chapters:
+        return text_window.join_limited((text for _, text in chapters), max_chars)
 
-def get_chapters_content_by_range(db: Session, novel_id: int, start_chapter_id: int, end_chapter_id: int) -> str:
+def get_chapters_content_by_range(
+    db: Session,
+    novel_id: int,
+    start_chapter_id: int,
+    end_chapter_id: int,
+    max_chars: Optional[int] = None
+) -> str:
     """获取指定章节范围的小说内容
     
     Args:
@@ -218,47 +384,23 @@ def get_chapters_content_by_range(db: Session, novel_id: int, start_chapter_id:
         novel_id: 小说ID
         start_chapter_id: 起始章节ID
         end_chapter_id: 结束章节ID
+        max_chars: 限制返回的字符数，达到上限后不再读取后续章节
         
     Returns:
         合并后的章节内容
     """
-    # 获取小说
-    db_novel = get_novel(db, novel_id)
-    if not db_novel:
-        return ""
-    
-    # 获取起始和结束章节的序号，用于后续查询
-    start_chapter = db.query(novel.Chapter).filter(
-        novel.Chapter.id == start_chapter_id,
-        novel.Chapter.novel_id == novel_id
-    ).first()
-    
-    end_chapter = db.query(novel.Chapter).filter(
-        novel.Chapter.id == end_chapter_id,
-        novel.Chapter.novel_id == novel_id
-    ).first()
-    
-    if not start_chapter or not end_chapter:
-        return ""
-    
-    # 查询章节范围
-    chapters = db.query(novel.Chapter).filter(
-        novel.Chapter.novel_id == novel_id,
-        novel.Chapter.number >= start_chapter.number,
-        novel.Chapter.number <= end_chapter.number
-    ).order_by(novel.Chapter.number).all()
-    
-    if not chapters:
+    number_range = get_chapter_number_range(db, novel_id, start_chapter_id, end_chapter_id)
+    if not number_range:
         return ""
-    
-    # 合并章节内容
-    content_parts = []
-    for chapter in chapters:
-        content_parts.append(f"第{chapter.number}章 {chapter.title}\n\n")
-        content_parts.append(chapter.content)
-        content_parts.append("\n\n")  # 章节之间添加空行分隔
-    
-    return "".join(content_parts)
+
+    with closing(iter_novel_chapters(db, novel_id, start_number=number_range[0], end_number=number_range[1])) as chapters:
+        return text_window.join_limited((text for _, text in chapters), max_chars)
+
+def save_chapters(db: Session, novel_id: int, chapters: List[novel.Chapter]) -> None:
+    """保存切分好的章节并递增内容版本"""
+    db.add_all(chapters)
+    bump_content_version(db, novel_id)
+    db.commit()
 
 async def process_novel_content(db: Session, novel_id: int, content: str, title_override: Optional[str] = None) -> None:
     """处理小说内容
@@ -270,35 +412,9 @@ async def process_novel_content(db: Session, novel_id: int, content: str, title_
         title_override: 覆盖自动检测的标题（可选）
     """
     try:
-        # 使用正则表达式找到所有章节标题和内容
-        chapter_pattern = r'(第[一二三四五六七八九十百千万\d]+章[^\n]*)\n(.*?)(?=\n第[一二三四五六七八九十百千万\d]+章|$)'
-        chapters = re.findall(chapter_pattern, content, re.DOTALL)
-        
-        if not chapters:
-            # 如果没有找到章节标记，将整个内容作为一个章节
-            if title_override:
-                # 使用传入的标题
-                chapter_title = title_override
-            else:
-                # 默认标题
-                chapter_title = "第1章"
-            chapters = [(chapter_title, content.strip())]
-        
-        # 保存章节
-        for i, (title, chapter_content) in enumerate(chapters, 1):
-            # 如果只有一个章节且有自定义标题，则使用自定义标题
-            actual_title = title_override if (len(chapters) == 1 and title_override) else title.strip()
-            
-            chapter = novel.Chapter(
-                novel_id=novel_id,
-                title=actual_title,
-                content=chapter_content.strip(),
-                number=i,
-                word_count=len(chapter_content.strip())
-            )
-            db.add(chapter)
-        
-        db.commit()
+        # 按标题切分章节，切分在线程池中进行，写入通过写队列执行
+        chapters = await run_in_threadpool(build_chapters, novel_id, content, title_override=title_override)
+        await run_serialized_write(save_chapters, db, novel_id, chapters)
         logger.info(f"成功处理小说内容，共导入{len(chapters)}章节")
         
     except Exception as e:
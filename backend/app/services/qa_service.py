@@ -1,12 +1,170 @@
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
 
+from app.core.config import settings
+from app.core.database import ReadSessionLocal
 from app.core.openai_client import OpenAIClient
+from app.core.llm_scheduler import llm_priority, PRIORITY_INTERACTIVE
+from app.core.answer_cache import answer_cache
 from app.models import schemas
+from app.services import novel_service, summary_service
 
 logger = logging.getLogger(__name__)
 
+async def build_answer_messages(
+    db: Session,
+    novel_id: int,
+    question: str,
+    use_rag: bool = True,
+    relevant_chunks: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+    """
+    构建问答请求的消息和来源引用
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        question: 用户问题
+        use_rag: 是否使用检索增强生成
+        relevant_chunks: 已经检索好的相关文本，为空时按问题检索
+        
+    Returns:
+        (消息列表, 来源引用列表)
+    """
+    sources = []
+    
+    if use_rag:
+        # 1. 检索相关文本
+        if relevant_chunks is None:
+            relevant_chunks = await retrieve_relevant_chunks(db, novel_id, question)
+        
+        # 2. 准备上下文
+        context = ""
+        for chunk in relevant_chunks:
+            context += f"内容片段 (章节 {chunk['chapter_title']}):\n{chunk['content']}\n\n"
+            sources.append({
+                "chapter_id": chunk["chapter_id"],
+                "chapter_title": chunk["chapter_title"],
+                "content": chunk["content"][:100] + "..." if len(chunk["content"]) > 100 else chunk["content"]
+            })
+            
+        # 3. 构建提示
+        system_prompt = """
+        你是一个专门回答关于小说内容的AI助手。请根据提供的小说内容片段回答用户问题。
+        如果无法从内容片段中找到答案，请明确说明。不要编造不在内容中的信息。
+        回答要详细、准确，并引用相关文本来支持你的回答。
+        """
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"根据以下小说内容片段回答问题:\n\n{context}\n\n问题: {question}"}
+        ]
+    else:
+        # 不使用RAG，直接问LLM
+        # 获取小说基本信息
+        # 同步查询放到线程池执行，避免阻塞事件循环
+        novel = await run_in_threadpool(novel_service.get_novel, db, novel_id)
+        
+        system_prompt = f"""
+        你是一个专门回答关于小说《{novel.title}》(作者: {novel.author})的AI助手。
+        请尽量根据你对这部小说的了解回答用户问题。如果不确定，请明确说明。
+        """
+        
+        # 已构建分层摘要时附上全书梗概，模型不必只凭记忆回答
+        synopsis = await run_in_threadpool(summary_service.build_compact_context, db, novel_id)
+        if synopsis:
+            system_prompt += f"\n以下是这部小说的情节概括，可作为回答的依据：\n\n{synopsis}\n"
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": question}
+        ]
+    
+    return messages, sources
+
+def answer_confidence(use_rag: bool, sources: List[Dict[str, Any]]) -> float:
+    """计算回答置信度"""
+    return 0.9 if use_rag and sources else 0.6
+
+async def lookup_cached_answer(
+    db: Session,
+    novel_id: int,
+    question: str,
+    use_rag: bool = True,
+    embedding: Optional[List[float]] = None
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """
+    在问答缓存中查找相同或语义相近问题的答案
+    
+    先按问题文本精确匹配，未命中时计算问题向量做相似度匹配。问题向量经过向量缓存，
+    之后检索相关文本时不会重复请求。
+    
+    Args:
+        embedding: 已经计算好的问题向量，为空时按需获取
+    
+    Returns:
+        (缓存的答案或None, 写回缓存所需的上下文)
+    """
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None, {"content_version": None, "embedding": embedding}
+    
+    content_version = await run_in_threadpool(novel_service.get_content_version, db, novel_id)
+    return await lookup_versioned_answer(novel_id, question, use_rag, content_version, embedding)
+
+async def lookup_versioned_answer(
+    novel_id: int,
+    question: str,
+    use_rag: bool,
+    content_version: Optional[int],
+    embedding: Optional[List[float]] = None,
+    fetch_embedding: bool = True
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """
+    按已经读取的内容版本查找缓存答案，批量问答时内容版本只需读取一次
+    
+    Args:
+        content_version: 小说的内容版本，为None时不使用缓存
+        embedding: 已经计算好的问题向量
+        fetch_embedding: 没有问题向量时是否单独获取向量做语义匹配，为False时只做精确匹配
+    
+    Returns:
+        (缓存的答案或None, 写回缓存所需的上下文)
+    """
+    context = {"content_version": content_version, "embedding": embedding}
+    if content_version is None:
+        return None, context
+    
+    cached = answer_cache.lookup_exact(novel_id, use_rag, content_version, question)
+    if cached is not None:
+        logger.info(f"问答缓存精确命中: novel_id={novel_id}")
+        return cached, context
+    
+    if context["embedding"] is None:
+        if not fetch_embedding:
+            return None, context
+        try:
+            context["embedding"] = await OpenAIClient.get_embedding(question)
+        except Exception as e:
+            logger.warning(f"获取问题向量失败，跳过问答缓存: {str(e)}")
+            return None, context
+    
+    return answer_cache.lookup(novel_id, use_rag, content_version, context["embedding"]), context
+
+def store_cached_answer(
+    novel_id: int,
+    question: str,
+    use_rag: bool,
+    context: Dict[str, Any],
+    answer: Dict[str, Any]
+) -> None:
+    """把新生成的答案写入问答缓存"""
+    if context["content_version"] is None:
+        return
+    answer_cache.store(novel_id, use_rag, context["content_version"], question, context["embedding"], answer)
+
 async def answer_question(
     db: Session, 
     novel_id: int,
@@ -26,48 +184,11 @@ async def answer_question(
         回答结果
     """
     try:
-        sources = []
+        cached, cache_context = await lookup_cached_answer(db, novel_id, question, use_rag)
+        if cached is not None:
+            return cached
         
-        if use_rag:
-            # 1. 检索相关文本
-            relevant_chunks = await retrieve_relevant_chunks(db, novel_id, question)
-            
-            # 2. 准备上下文
-            context = ""
-            for chunk in relevant_chunks:
-                context += f"内容片段 (章节 {chunk['chapter_title']}):\n{chunk['content']}\n\n"
-                sources.append({
-                    "chapter_id": chunk["chapter_id"],
-                    "chapter_title": chunk["chapter_title"],
-                    "content": chunk["content"][:100] + "..." if len(chunk["content"]) > 100 else chunk["content"]
-                })
-                
-            # 3. 构建提示
-            system_prompt = """
-            你是一个专门回答关于小说内容的AI助手。请根据提供的小说内容片段回答用户问题。
-            如果无法从内容片段中找到答案，请明确说明。不要编造不在内容中的信息。
-            回答要详细、准确，并引用相关文本来支持你的回答。
-            """
-            
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"根据以下小说内容片段回答问题:\n\n{context}\n\n问题: {question}"}
-            ]
-        else:
-            # 不使用RAG，直接问LLM
-            # 获取小说基本信息
-            from app.services.novel_service import get_novel
-            novel = get_novel(db, novel_id)
-            
-            system_prompt = f"""
-            你是一个专门回答关于小说《{novel.title}》(作者: {novel.author})的AI助手。
-            请尽量根据你对这部小说的了解回答用户问题。如果不确定，请明确说明。
-            """
-            
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": question}
-            ]
+        messages, sources = await build_answer_messages(db, novel_id, question, use_rag)
         
         # 4. 调用OpenAI API
         response = await OpenAIClient.chat_completion(messages=messages, temperature=0.3)
@@ -75,19 +196,155 @@ async def answer_question(
         # 5. 解析回答
         answer = response["choices"][0]["message"]["content"]
         
-        # 6. 计算置信度
-        confidence = 0.9 if use_rag and sources else 0.6
-        
-        return {
+        result = {
             "answer": answer,
             "sources": sources,
-            "confidence": confidence
+            "confidence": answer_confidence(use_rag, sources)
         }
+        store_cached_answer(novel_id, question, use_rag, cache_context, result)
+        return result
         
     except Exception as e:
         logger.error(f"回答问题失败: {str(e)}")
         raise
 
+async def stream_answer(
+    db: Session,
+    novel_id: int,
+    question: str,
+    use_rag: bool = True
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    流式回答关于小说的问题
+    
+    检索完成后立即产出来源引用，随后逐段产出模型生成的回答。
+    调用方停止迭代（例如客户端断开）时会关闭上游的流式请求。
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        question: 用户问题
+        use_rag: 是否使用检索增强生成
+        
+    Yields:
+        事件字典，event为sources、token或done
+    """
+    with llm_priority(PRIORITY_INTERACTIVE):
+        cached, cache_context = await lookup_cached_answer(db, novel_id, question, use_rag)
+        if cached is not None:
+            # 缓存命中时一次性产出完整答案
+            yield {"event": "sources", "data": {"sources": cached["sources"]}}
+            yield {"event": "token", "data": {"content": cached["answer"]}}
+            yield {"event": "done", "data": {"confidence": cached["confidence"], "cached": True}}
+            return
+        
+        messages, sources = await build_answer_messages(db, novel_id, question, use_rag)
+        yield {"event": "sources", "data": {"sources": sources}}
+        
+        parts = []
+        async for delta in OpenAIClient.stream_chat_completion(messages=messages, temperature=0.3):
+            parts.append(delta)
+            yield {"event": "token", "data": {"content": delta}}
+        
+        confidence = answer_confidence(use_rag, sources)
+        # 只缓存完整生成的答案，客户端中途断开时不会执行到这里
+        store_cached_answer(novel_id, question, use_rag, cache_context, {
+            "answer": "".join(parts),
+            "sources": sources,
+            "confidence": confidence
+        })
+        yield {"event": "done", "data": {"confidence": confidence}}
+
+async def answer_questions_batch(
+    db: Session,
+    novel_id: int,
+    questions: List[str],
+    use_rag: bool = True
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    批量回答关于同一部小说的问题，按完成顺序逐条产出结果
+    
+    全部问题的向量一次批量获取，缓存未命中的问题一次完成检索，
+    之后各问题的模型请求并发执行，并发度和配额由LLM调度器控制。
+    调用方停止迭代时取消尚未完成的请求。
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        questions: 问题列表
+        use_rag: 是否使用检索增强生成
+        
+    Yields:
+        结果字典，包含index(问题在列表中的位置)、question以及回答或error
+    """
+    embeddings: List[Optional[List[float]]] = [None] * len(questions)
+    try:
+        embeddings = await OpenAIClient.get_embeddings(questions)
+    except Exception as e:
+        logger.warning(f"批量获取问题向量失败，只做精确缓存匹配，检索逐个问题进行: {str(e)}")
+    
+    content_version = None
+    if settings.ANSWER_CACHE_ENABLED:
+        content_version = await run_in_threadpool(novel_service.get_content_version, db, novel_id)
+    
+    # 先返回缓存命中的问题；批量获取向量失败时不再逐个请求向量
+    pending = []
+    for index, question in enumerate(questions):
+        cached, cache_context = await lookup_versioned_answer(
+            novel_id, question, use_rag, content_version, embeddings[index], fetch_embedding=False
+        )
+        if cached is not None:
+            yield {"index": index, "question": question, **cached, "cached": True}
+        else:
+            pending.append((index, question, cache_context))
+    
+    if not pending:
+        return
+    
+    chunk_lists: List[Optional[List[Dict[str, Any]]]] = [None] * len(pending)
+    if use_rag and all(embeddings[index] is not None for index, _, _ in pending):
+        try:
+            chunk_lists = await retrieve_relevant_chunks_batch(
+                db,
+                novel_id,
+                [question for _, question, _ in pending],
+                embeddings=[embeddings[index] for index, _, _ in pending]
+            )
+        except Exception as e:
+            # 批量检索失败时各问题单独检索，失败的问题单独返回错误
+            logger.warning(f"批量检索失败，改为逐个问题检索: {str(e)}")
+    
+    async def answer_one(index: int, question: str, cache_context: Dict[str, Any], relevant_chunks):
+        # 需要单独检索的任务会并发在线程池中查询，各自使用独立的只读会话，不共用请求的会话
+        session = ReadSessionLocal() if use_rag and relevant_chunks is None else None
+        try:
+            messages, sources = await build_answer_messages(session or db, novel_id, question, use_rag, relevant_chunks)
+            response = await OpenAIClient.chat_completion(messages=messages, temperature=0.3)
+            result = {
+                "answer": response["choices"][0]["message"]["content"],
+                "sources": sources,
+                "confidence": answer_confidence(use_rag, sources)
+            }
+            store_cached_answer(novel_id, question, use_rag, cache_context, result)
+            return {"index": index, "question": question, **result, "cached": False}
+        except Exception as e:
+            logger.error(f"批量问答中的问题处理失败: index={index}, error={str(e)}")
+            return {"index": index, "question": question, "error": str(e)}
+        finally:
+            if session is not None:
+                session.close()
+    
+    tasks = [
+        asyncio.ensure_future(answer_one(index, question, cache_context, relevant_chunks))
+        for (index, question, cache_context), relevant_chunks in zip(pending, chunk_lists)
+    ]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
 async def retrieve_relevant_chunks(
     db: Session, 
     novel_id: int, 
@@ -106,22 +363,52 @@ async def retrieve_relevant_chunks(
     Returns:
         相关文本块列表
     """
+    return (await retrieve_relevant_chunks_batch(db, novel_id, [query], limit))[0]
+
+async def retrieve_relevant_chunks_batch(
+    db: Session,
+    novel_id: int,
+    queries: List[str],
+    limit: int = 5,
+    embeddings: Optional[List[List[float]]] = None
+) -> List[List[Dict[str, Any]]]:
+    """
+    批量检索与多个问题相关的文本块
+    
+    所有问题的向量一次批量获取，在向量数据库中一次检索全部问题的top-k，
+    文本内容也只用一次查询取回。
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        queries: 查询问题列表
+        limit: 每个问题返回结果数量限制
+        embeddings: 已经计算好的问题向量，与queries一一对应
+        
+    Returns:
+        与queries顺序一致的相关文本块列表
+    """
+    if not queries:
+        return []
+    
     try:
         # 1. 获取问题的向量表示
-        query_embedding = await OpenAIClient.get_embedding(query)
+        if embeddings is None:
+            embeddings = await OpenAIClient.get_embeddings(queries)
         
-        # 2. 从向量数据库检索相似文本
+        # 2. 从向量数据库检索相似文本，多个查询向量一次检索
         from pymilvus import Collection
         collection = Collection("novel_chunks")
-        collection.load()
+        await run_in_threadpool(collection.load)
         
         search_params = {
             "metric_type": "COSINE",
             "params": {"ef": 64}
         }
         
-        results = collection.search(
-            data=[query_embedding],
+        results = await run_in_threadpool(
+            collection.search,
+            data=embeddings,
             anns_field="embedding",
             param=search_params,
             limit=limit,
@@ -129,39 +416,42 @@ async def retrieve_relevant_chunks(
         )
         
         # 3. 获取检索结果
-        chunk_ids = [hit.id for hit in results[0]]
-        
-        # 4. 从数据库获取文本内容
-        from sqlalchemy import text
-        
-        result = []
-        for chunk_id in chunk_ids:
-            sql = text("""
-                SELECT 
-                    tc.id, tc.content, tc.start_char, tc.end_char, 
-                    c.id as chapter_id, c.title as chapter_title, c.number as chapter_number
-                FROM 
-                    text_chunks tc
-                JOIN 
-                    chapters c ON tc.chapter_id = c.id
-                WHERE 
-                    tc.vector_id = :vector_id
-            """)
-            
-            chunk_data = db.execute(sql, {"vector_id": str(chunk_id)}).fetchone()
-            
-            if chunk_data:
-                result.append({
-                    "id": chunk_data.id,
-                    "content": chunk_data.content,
-                    "start_char": chunk_data.start_char,
-                    "end_char": chunk_data.end_char,
-                    "chapter_id": chunk_data.chapter_id,
-                    "chapter_title": chunk_data.chapter_title,
-                    "chapter_number": chunk_data.chapter_number
-                })
+        hit_ids = [[str(hit.id) for hit in hits] for hits in results]
+        vector_ids = list({vector_id for ids in hit_ids for vector_id in ids})
+        if not vector_ids:
+            return [[] for _ in queries]
         
-        return result
+        # 4. 从数据库一次取回全部文本内容
+        from sqlalchemy import bindparam, text
+        
+        sql = text("""
+            SELECT 
+                tc.id, tc.content, tc.start_char, tc.end_char, tc.vector_id,
+                c.id as chapter_id, c.title as chapter_title, c.number as chapter_number
+            FROM 
+                text_chunks tc
+            JOIN 
+                chapters c ON tc.chapter_id = c.id
+            WHERE 
+                tc.vector_id IN :vector_ids
+        """).bindparams(bindparam("vector_ids", expanding=True))
+        
+        rows = await run_in_threadpool(lambda: db.execute(sql, {"vector_ids": vector_ids}).fetchall())
+        chunks = {
+            row.vector_id: {
+                "id": row.id,
+                "content": row.content,
+                "start_char": row.start_char,
+                "end_char": row.end_char,
+                "chapter_id": row.chapter_id,
+                "chapter_title": row.chapter_title,
+                "chapter_number": row.chapter_number
+            }
+            for row in rows
+        }
+        
+        # 按相似度顺序组装每个问题的结果
+        return [[chunks[vector_id] for vector_id in ids if vector_id in chunks] for ids in hit_ids]
         
     except Exception as e:
         logger.error(f"检索相关文本失败: {str(e)}")
@@ -0,0 +1,118 @@
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from typing import List, Dict, Any
+import logging
+
+from app.models import novel
+
+logger = logging.getLogger(__name__)
+
+def get_novel_counts(db: Session, novel_id: int) -> Dict[str, int]:
+    """在数据库端聚合小说的统计数据
+
+    所有计数均通过一条SQL语句中的聚合子查询完成，不会加载任何ORM对象。
+
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+
+    Returns:
+        各项统计计数
+    """
+    chapter_stats = select(
+        func.count(novel.Chapter.id).label("total_chapters"),
+        func.coalesce(func.sum(novel.Chapter.word_count), 0).label("total_words")
+    ).where(novel.Chapter.novel_id == novel_id).subquery()
+
+    def count_of(column, model) -> Any:
+        return select(func.count(column)).where(model.novel_id == novel_id).scalar_subquery()
+
+    stmt = select(
+        chapter_stats.c.total_chapters,
+        chapter_stats.c.total_words,
+        count_of(novel.Character.id, novel.Character).label("character_count"),
+        count_of(func.distinct(novel.Character.name), novel.Character).label("unique_character_count"),
+        count_of(novel.Location.id, novel.Location).label("location_count"),
+        count_of(novel.Item.id, novel.Item).label("item_count"),
+        count_of(novel.Event.id, novel.Event).label("event_count"),
+        count_of(novel.Relationship.id, novel.Relationship).label("relationship_count")
+    )
+
+    row = db.execute(stmt).one()
+    return {key: int(value or 0) for key, value in row._mapping.items()}
+
+def get_chapter_entity_counts(db: Session, model, novel_id: int) -> Dict[int, int]:
+    """按章节分组统计实体数量
+
+    Args:
+        db: 数据库会话
+        model: 带有novel_id和chapter_id字段的实体模型（角色、地点、事件）
+        novel_id: 小说ID
+
+    Returns:
+        章节ID到实体数量的映射
+    """
+    rows = db.execute(
+        select(model.chapter_id, func.count(model.id))
+        .where(model.novel_id == novel_id, model.chapter_id.isnot(None))
+        .group_by(model.chapter_id)
+    ).all()
+    return {chapter_id: count for chapter_id, count in rows}
+
+def get_chapter_densities(db: Session, novel_id: int) -> List[Dict[str, Any]]:
+    """计算每个章节的实体密度
+
+    密度定义为每千字出现的实体数量。章节只查询元数据列，不读取正文。
+
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+
+    Returns:
+        按章节序号排序的密度列表
+    """
+    chapters = db.execute(
+        select(
+            novel.Chapter.id,
+            novel.Chapter.number,
+            novel.Chapter.title,
+            novel.Chapter.word_count
+        )
+        .where(novel.Chapter.novel_id == novel_id)
+        .order_by(novel.Chapter.number)
+    ).all()
+
+    character_counts = get_chapter_entity_counts(db, novel.Character, novel_id)
+    location_counts = get_chapter_entity_counts(db, novel.Location, novel_id)
+    event_counts = get_chapter_entity_counts(db, novel.Event, novel_id)
+
+    densities = []
+    for chapter_id, number, title, word_count in chapters:
+        characters = character_counts.get(chapter_id, 0)
+        locations = location_counts.get(chapter_id, 0)
+        events = event_counts.get(chapter_id, 0)
+        # 每千字实体数，字数缺失时按0处理
+        per_thousand = 1000.0 / word_count if word_count else 0.0
+
+        densities.append({
+            "chapter_id": chapter_id,
+            "number": number,
+            "title": title,
+            "word_count": word_count or 0,
+            "character_count": characters,
+            "location_count": locations,
+            "event_count": events,
+            "character_density": round(characters * per_thousand, 3),
+            "location_density": round(locations * per_thousand, 3),
+            "event_density": round(events * per_thousand, 3),
+            "entity_density": round((characters + locations + events) * per_thousand, 3)
+        })
+
+    return densities
+
+def get_max_chapter_number(db: Session, novel_id: int) -> int:
+    """获取小说当前最大章节序号，没有章节时返回0"""
+    return db.execute(
+        select(func.coalesce(func.max(novel.Chapter.number), 0))
+        .where(novel.Chapter.novel_id == novel_id)
+    ).scalar_one()
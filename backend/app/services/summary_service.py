@@ -0,0 +1,352 @@
+"""
+分层摘要服务
+
+为全书级的分析提示词提供压缩后的上下文：
+- 第0层：每章一个摘要
+- 第1层：每 SUMMARY_ARC_SIZE 章一个情节段摘要
+- 更高层：情节段过多、合计超过单次请求的输入上限时继续逐层合并
+- 顶层：全书梗概（position为ROOT_POSITION）
+
+自底向上逐层构建，同一层的摘要请求并发执行（仍受LLM调度器限流）。
+每个节点记录输入内容的哈希：章节正文或下级摘要未变化时直接复用，
+修改一章只需重新生成该章、所在情节段以及上层节点。
+"""
+from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import hashlib
+import logging
+
+from app.core import text_window
+from app.core.config import settings
+from app.core.database import run_serialized_write
+from app.core.openai_client import OpenAIClient
+from app.models import novel
+from app.services import novel_service
+
+logger = logging.getLogger(__name__)
+
+# 摘要提示词变化时递增，使已有摘要全部失效
+SUMMARY_PROMPT_VERSION = 1
+
+CHAPTER_LEVEL = 0
+ARC_LEVEL = 1
+# 全书梗概的position；章节序号可能从0开始（序章），用不会与章节和情节段冲突的哨兵值
+ROOT_POSITION = -1
+
+CHAPTER_INSTRUCTION = "请概括以下小说章节的主要情节：出场人物、发生地点、关键事件及其结果。保留人名、地名原文，不超过200字。"
+ARC_INSTRUCTION = "以下是小说连续若干章的情节概括，请合并为一段不超过400字的概括，突出主线进展、人物关系变化和重要转折。"
+ROOT_INSTRUCTION = "以下是整部小说各部分的情节概括，请写出不超过800字的全书梗概，包括主要人物及其关系、故事主线、重要转折和结局。"
+
+def _hash(*parts: Any) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+def _load_nodes(db: Session, novel_id: int) -> Dict[Tuple[int, int], novel.SummaryNode]:
+    nodes = db.query(novel.SummaryNode).filter(novel.SummaryNode.novel_id == novel_id).all()
+    return {(node.level, node.position): node for node in nodes}
+
+def _node_data(node: novel.SummaryNode) -> Dict[str, Any]:
+    return {
+        "level": node.level,
+        "position": node.position,
+        "chapter_id": node.chapter_id,
+        "start_number": node.start_number,
+        "end_number": node.end_number,
+        "content_hash": node.content_hash,
+        "content_version": node.content_version,
+        "summary": node.summary,
+        "token_count": node.token_count,
+    }
+
+def _existing_nodes(db: Session, novel_id: int) -> Dict[Tuple[int, int], Dict[str, Any]]:
+    """已有节点的快照，构建期间的提交不会让它过期，事件循环中读取不触发数据库查询"""
+    return {key: _node_data(node) for key, node in _load_nodes(db, novel_id).items()}
+
+def _scan_chapters(db: Session, novel_id: int, stats: Dict[str, int]) -> List[Dict[str, Any]]:
+    """流式读取全部章节计算哈希，只保留元数据"""
+    chapters = []
+    for row in db.query(
+        novel.Chapter.id, novel.Chapter.number, novel.Chapter.title, novel.Chapter.content
+    ).filter(novel.Chapter.novel_id == novel_id).order_by(novel.Chapter.number).yield_per(200):
+        content = row.content or ""
+        stats["raw_chars"] += len(content)
+        chapters.append({
+            "level": CHAPTER_LEVEL,
+            "position": row.number,
+            "chapter_id": row.id,
+            "start_number": row.number,
+            "end_number": row.number,
+            "content_hash": _hash(SUMMARY_PROMPT_VERSION, row.title, content),
+        })
+    return chapters
+
+def _chapter_texts(db: Session, chapter_ids: Sequence[int]) -> Dict[int, str]:
+    """按ID取回一批章节的标题和正文"""
+    rows = db.query(novel.Chapter.id, novel.Chapter.title, novel.Chapter.content).filter(
+        novel.Chapter.id.in_(chapter_ids)
+    ).all()
+    return {row.id: f"{row.title}\n\n{row.content or ''}" for row in rows}
+
+def save_summary_nodes(db: Session, novel_id: int, nodes: Sequence[Dict[str, Any]]) -> None:
+    """写入或更新摘要节点"""
+    existing = _load_nodes(db, novel_id)
+    for data in nodes:
+        node = existing.get((data["level"], data["position"]))
+        if node is None:
+            node = novel.SummaryNode(novel_id=novel_id, level=data["level"], position=data["position"])
+            db.add(node)
+        for field in ("chapter_id", "start_number", "end_number", "content_hash", "content_version", "summary", "token_count"):
+            setattr(node, field, data.get(field))
+    db.commit()
+
+def delete_stale_nodes(db: Session, novel_id: int, keep: Sequence[Tuple[int, int]]) -> int:
+    """删除本次构建中不再存在的节点（章节被删除、情节段数量减少或层数变化）"""
+    keep_set = set(keep)
+    stale = [node for key, node in _load_nodes(db, novel_id).items() if key not in keep_set]
+    for node in stale:
+        db.delete(node)
+    db.commit()
+    return len(stale)
+
+async def _summarize(semaphore: asyncio.Semaphore, content: str, instruction: str, max_tokens: int) -> str:
+    """概括一段文本，超过输入上限时分段概括后拼接"""
+    pieces = text_window.split_text(content, settings.SUMMARY_INPUT_TOKENS)
+
+    async def one(piece: str) -> str:
+        async with semaphore:
+            return await OpenAIClient.summarize_text(piece, instruction, max_tokens=max_tokens)
+
+    summaries = await asyncio.gather(*(one(piece) for piece in pieces))
+    return "\n".join(summary for summary in summaries if summary)
+
+def _children_text(children: Sequence[Dict[str, Any]]) -> str:
+    return "\n\n".join(f"【第{child['start_number']}-{child['end_number']}章】\n{child['summary']}" for child in children)
+
+async def _build_chapter_level(
+    db: Session,
+    novel_id: int,
+    existing: Dict[Tuple[int, int], Dict[str, Any]],
+    content_version: int,
+    semaphore: asyncio.Semaphore,
+    force_refresh: bool,
+    stats: Dict[str, int]
+) -> List[Dict[str, Any]]:
+    # 第一遍流式读取全部章节计算哈希，同步查询放到线程池执行
+    chapters = await run_in_threadpool(_scan_chapters, db, novel_id, stats)
+
+    pending = []
+    for chapter in chapters:
+        node = existing.get((CHAPTER_LEVEL, chapter["position"]))
+        if node is not None and node["content_hash"] == chapter["content_hash"] and not force_refresh:
+            chapter.update(summary=node["summary"], token_count=node["token_count"], content_version=node["content_version"])
+            stats["reused"] += 1
+        else:
+            pending.append(chapter)
+
+    # 需要生成的章节按批取回正文，批内并发请求，每批完成后立即保存
+    batch_size = max(1, settings.SUMMARY_CONCURRENCY * 4)
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        texts = await run_in_threadpool(_chapter_texts, db, [chapter["chapter_id"] for chapter in batch])
+        summaries = await asyncio.gather(*(
+            _summarize(semaphore, texts.get(chapter["chapter_id"], ""), CHAPTER_INSTRUCTION, settings.SUMMARY_CHAPTER_TOKENS)
+            for chapter in batch
+        ))
+        for chapter, summary in zip(batch, summaries):
+            chapter.update(summary=summary, token_count=text_window.estimate_tokens(summary), content_version=content_version)
+        await run_serialized_write(save_summary_nodes, db, novel_id, batch)
+        stats["generated"] += len(batch)
+        logger.info(f"小说 {novel_id} 章节摘要进度: {min(start + batch_size, len(pending))}/{len(pending)}")
+    return chapters
+
+async def _build_group_level(
+    db: Session,
+    novel_id: int,
+    children: List[Dict[str, Any]],
+    level: int,
+    group_size: int,
+    existing: Dict[Tuple[int, int], Dict[str, Any]],
+    content_version: int,
+    semaphore: asyncio.Semaphore,
+    force_refresh: bool,
+    stats: Dict[str, int]
+) -> List[Dict[str, Any]]:
+    """把下一层节点按group_size分组，每组生成一个上层节点"""
+    nodes, pending = [], []
+    for index in range(0, len(children), group_size):
+        group = children[index:index + group_size]
+        node = {
+            "level": level,
+            "position": index // group_size + 1,
+            "chapter_id": None,
+            "start_number": group[0]["start_number"],
+            "end_number": group[-1]["end_number"],
+            "content_hash": _hash(SUMMARY_PROMPT_VERSION, level, *(child["content_hash"] for child in group)),
+        }
+        stored = existing.get((level, node["position"]))
+        if stored is not None and stored["content_hash"] == node["content_hash"] and not force_refresh:
+            node.update(summary=stored["summary"], token_count=stored["token_count"], content_version=stored["content_version"])
+            stats["reused"] += 1
+        else:
+            pending.append((node, group))
+        nodes.append(node)
+
+    summaries = await asyncio.gather(*(
+        _summarize(semaphore, _children_text(group), ARC_INSTRUCTION, settings.SUMMARY_ARC_TOKENS)
+        for _, group in pending
+    ))
+    for (node, _), summary in zip(pending, summaries):
+        node.update(summary=summary, token_count=text_window.estimate_tokens(summary), content_version=content_version)
+    if pending:
+        await run_serialized_write(save_summary_nodes, db, novel_id, [node for node, _ in pending])
+        stats["generated"] += len(pending)
+    return nodes
+
+async def build_summary_tree(db: Session, novel_id: int, force_refresh: bool = False) -> Dict[str, Any]:
+    """构建或增量更新小说的分层摘要
+
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        force_refresh: 忽略已有摘要，全部重新生成
+
+    Returns:
+        构建统计：章节数、层数、新生成和复用的节点数、压缩比
+    """
+    # 同步查询放到线程池执行，避免阻塞事件循环
+    content_version = await run_in_threadpool(novel_service.get_content_version, db, novel_id)
+    if content_version is None:
+        raise ValueError("小说不存在")
+
+    existing = await run_in_threadpool(_existing_nodes, db, novel_id)
+    semaphore = asyncio.Semaphore(max(1, settings.SUMMARY_CONCURRENCY))
+    stats = {"generated": 0, "reused": 0, "raw_chars": 0}
+
+    chapters = await _build_chapter_level(db, novel_id, existing, content_version, semaphore, force_refresh, stats)
+    if not chapters:
+        await run_serialized_write(delete_stale_nodes, db, novel_id, [])
+        return {"novel_id": novel_id, "chapters": 0, "levels": 0, **stats}
+
+    # 情节段；合计仍超过单次输入上限时继续逐层合并
+    level = ARC_LEVEL
+    keep = [(node["level"], node["position"]) for node in chapters]
+    current = await _build_group_level(db, novel_id, chapters, level, settings.SUMMARY_ARC_SIZE, existing, content_version, semaphore, force_refresh, stats)
+    keep += [(node["level"], node["position"]) for node in current]
+    while len(current) > 1 and sum(node["token_count"] or 0 for node in current) > settings.SUMMARY_INPUT_TOKENS:
+        level += 1
+        current = await _build_group_level(db, novel_id, current, level, settings.SUMMARY_ARC_SIZE, existing, content_version, semaphore, force_refresh, stats)
+        keep += [(node["level"], node["position"]) for node in current]
+
+    # 全书梗概
+    level += 1
+    root = {
+        "level": level,
+        "position": ROOT_POSITION,
+        "chapter_id": None,
+        "start_number": chapters[0]["start_number"],
+        "end_number": chapters[-1]["end_number"],
+        "content_hash": _hash(SUMMARY_PROMPT_VERSION, "root", *(node["content_hash"] for node in current)),
+        "content_version": content_version,
+    }
+    stored = existing.get((level, ROOT_POSITION))
+    if stored is not None and stored["content_hash"] == root["content_hash"] and not force_refresh:
+        root.update(summary=stored["summary"], token_count=stored["token_count"])
+        stats["reused"] += 1
+    else:
+        if len(current) == 1:
+            # 只有一个情节段时直接沿用其摘要
+            summary = current[0]["summary"]
+        else:
+            summary = await _summarize(semaphore, _children_text(current), ROOT_INSTRUCTION, settings.SUMMARY_NOVEL_TOKENS)
+        root.update(summary=summary, token_count=text_window.estimate_tokens(summary))
+        stats["generated"] += 1
+    # 内容版本记录在顶层节点上，用于判断摘要是否与当前章节一致
+    await run_serialized_write(save_summary_nodes, db, novel_id, [root])
+    keep.append((level, ROOT_POSITION))
+    removed = await run_serialized_write(delete_stale_nodes, db, novel_id, keep)
+
+    context = await run_in_threadpool(build_compact_context, db, novel_id) or ""
+    logger.info(f"小说 {novel_id} 分层摘要完成: 生成{stats['generated']}个，复用{stats['reused']}个，删除{removed}个")
+    return {
+        "novel_id": novel_id,
+        "chapters": len(chapters),
+        "levels": level + 1,
+        "generated": stats["generated"],
+        "reused": stats["reused"],
+        "removed": removed,
+        "raw_chars": stats["raw_chars"],
+        "context_chars": len(context),
+        "compression_ratio": round(stats["raw_chars"] / len(context), 1) if context else None,
+    }
+
+def get_root_node(db: Session, novel_id: int) -> Optional[novel.SummaryNode]:
+    """获取全书梗概节点"""
+    return db.query(novel.SummaryNode).filter(
+        novel.SummaryNode.novel_id == novel_id,
+        novel.SummaryNode.position == ROOT_POSITION
+    ).order_by(novel.SummaryNode.level.desc()).first()
+
+def get_summary_tree(db: Session, novel_id: int, level: Optional[int] = None) -> Dict[str, Any]:
+    """获取已保存的分层摘要
+
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        level: 只返回指定层级，为None时返回全部
+    """
+    query = db.query(novel.SummaryNode).filter(novel.SummaryNode.novel_id == novel_id)
+    if level is not None:
+        query = query.filter(novel.SummaryNode.level == level)
+    nodes = query.order_by(novel.SummaryNode.level, novel.SummaryNode.position).all()
+    root = next((node for node in nodes if node.position == ROOT_POSITION), None) if level is None else get_root_node(db, novel_id)
+    content_version = novel_service.get_content_version(db, novel_id)
+    return {
+        "novel_id": novel_id,
+        "up_to_date": root is not None and root.content_version == content_version,
+        "nodes": [_node_data(node) for node in nodes],
+    }
+
+def build_compact_context(db: Session, novel_id: int, max_tokens: Optional[int] = None) -> Optional[str]:
+    """用分层摘要组装全书级提示词的上下文
+
+    全书梗概之后，预算足够时附上全部章节摘要，否则附上情节段摘要（超出预算的部分截断）。
+    摘要尚未构建或章节内容已变化时返回None，调用方应退回原有的正文截取方式。
+
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        max_tokens: 上下文token上限，默认使用COMPACT_CONTEXT_TOKENS
+    """
+    max_tokens = max_tokens or settings.COMPACT_CONTEXT_TOKENS
+    root = get_root_node(db, novel_id)
+    if root is None or root.content_version != novel_service.get_content_version(db, novel_id):
+        return None
+
+    parts = [f"【全书梗概】\n{root.summary}"]
+    budget = max_tokens - (root.token_count or text_window.estimate_tokens(root.summary))
+    for level in (CHAPTER_LEVEL, ARC_LEVEL):
+        rows = db.query(
+            novel.SummaryNode.start_number,
+            novel.SummaryNode.end_number,
+            novel.SummaryNode.summary,
+            novel.SummaryNode.token_count
+        ).filter(
+            novel.SummaryNode.novel_id == novel_id,
+            novel.SummaryNode.level == level
+        ).order_by(novel.SummaryNode.position).all()
+        total = sum(row.token_count or 0 for row in rows)
+        if total <= budget or level == ARC_LEVEL:
+            for row in rows:
+                cost = row.token_count or text_window.estimate_tokens(row.summary)
+                if cost > budget:
+                    break
+                label = f"第{row.start_number}章" if level == CHAPTER_LEVEL else f"第{row.start_number}-{row.end_number}章"
+                parts.append(f"【{label}】\n{row.summary}")
+                budget -= cost
+            break
+    return "\n\n".join(parts)
@@ -0,0 +1,159 @@
+"""
+章节切分吞吐基准测试
+
+比较统一的单遍标题扫描（app.core.chapter_splitter）与此前两种切分方式的吞吐（MB/s，按UTF-8字节计）：
+- legacy_split：process_novel_file 原有的 re.split 按 "第X章" 切分（丢弃标题）
+- legacy_findall：process_novel_content 原有的 DOTALL findall + 前瞻
+- spans：只计算章节偏移区间
+- spans_materialized：计算区间后再切出每章标题和正文（与导入时的实际用法一致）
+
+默认用合成小说的正文拼出指定大小的语料，标题混合中文数字章/回、分卷、章内小节，
+并夹杂以 "第X回合" 开头的正文句子；也可以用 --file 指定真实语料。
+
+用法:
+    python benchmarks/chapter_split_benchmark.py --size-mb 50
+    python benchmarks/chapter_split_benchmark.py --file a.txt --file b.txt --output split.json
+    python benchmarks/chapter_split_benchmark.py --size-mb 20 --min-mbps 50   # 吞吐低于阈值时退出码为1
+
+只依赖标准库。
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.chapter_splitter import split_chapters
+from novel_generator import generate_novel
+
+LEGACY_SPLIT_PATTERN = r'第[一二三四五六七八九十百千万\d]+章'
+LEGACY_FINDALL_PATTERN = r'(第[一二三四五六七八九十百千万\d]+章[^\n]*)\n(.*?)(?=\n第[一二三四五六七八九十百千万\d]+章|$)'
+
+_CHINESE_DIGITS = "零一二三四五六七八九"
+
+def to_chinese_number(value: int) -> str:
+    """把整数写成中文数字（一万以内），如 105 -> 一百零五"""
+    if value < 10:
+        return _CHINESE_DIGITS[value]
+    if value < 20:
+        return "十" + (_CHINESE_DIGITS[value % 10] if value % 10 else "")
+    parts, zero = [], False
+    for unit_value, unit in ((1000, "千"), (100, "百"), (10, "十"), (1, "")):
+        digit = value // unit_value % 10
+        if digit == 0:
+            zero = bool(parts)
+            continue
+        if zero:
+            parts.append("零")
+            zero = False
+        parts.append(_CHINESE_DIGITS[digit] + unit)
+    return "".join(parts)
+
+def build_corpus(size_mb: float, seed: int) -> Tuple[str, int]:
+    """拼出至少size_mb大小的语料，返回 (文本, 章节数)"""
+    novel = generate_novel(chapters=60, chapter_chars=4000, seed=seed)
+    bodies = [chapter["content"] for chapter in novel.chapters]
+    target = int(size_mb * 1024 * 1024)
+    parts: List[str] = ["合成测试语料\n作者：基准测试\n\n"]
+    size, number = 0, 0
+    while size < target:
+        number += 1
+        if number % 200 == 1:
+            parts.append(f"第{to_chinese_number(number // 200 + 1)}卷 卷{number // 200 + 1}\n\n")
+        unit = "回" if number % 7 == 0 else "章"
+        body = bodies[number % len(bodies)]
+        if number % 5 == 0:
+            # 章内小节和以 "第X回合" 开头的正文句子都不应切分
+            half = len(body) // 2
+            body = f"{body[:half]}\n第一节 转折\n第三回合交手时，他终于看清了对方的剑路。\n{body[half:]}"
+        chunk = f"第{to_chinese_number(number % 10000)}{unit} 标题{number}\n{body}\n\n"
+        parts.append(chunk)
+        size += len(chunk.encode("utf-8"))
+    return "".join(parts), number
+
+def legacy_split(text: str) -> int:
+    chapters = re.split(LEGACY_SPLIT_PATTERN, text)
+    return len([ch for ch in (c.strip() for c in chapters) if ch])
+
+def legacy_findall(text: str) -> int:
+    return len(re.findall(LEGACY_FINDALL_PATTERN, text, re.DOTALL))
+
+def spans_only(text: str) -> int:
+    return len(split_chapters(text, include_preamble=False))
+
+def spans_materialized(text: str) -> int:
+    spans = split_chapters(text, include_preamble=False)
+    return len([(span.title(text), span.body(text)) for span in spans])
+
+METHODS: Dict[str, Callable[[str], int]] = {
+    "legacy_split": legacy_split,
+    "legacy_findall": legacy_findall,
+    "spans": spans_only,
+    "spans_materialized": spans_materialized,
+}
+
+def measure(text: str, repeat: int) -> List[Dict[str, Any]]:
+    megabytes = len(text.encode("utf-8")) / (1024 * 1024)
+    results = []
+    for name, func in METHODS.items():
+        best, count = float("inf"), 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            count = func(text)
+            best = min(best, time.perf_counter() - started)
+        results.append({
+            "method": name,
+            "chapters": count,
+            "best_seconds": round(best, 4),
+            "mb_per_second": round(megabytes / best, 1) if best else None,
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="章节切分吞吐基准测试")
+    parser.add_argument("--size-mb", type=float, default=20, help="合成语料的大小（MB）")
+    parser.add_argument("--file", action="append", help="真实语料文件，可指定多次，指定时不生成合成语料")
+    parser.add_argument("--repeat", type=int, default=3, help="每项取最好成绩的重复次数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--min-mbps", type=float, help="spans吞吐下限（MB/s），低于该值时退出码为1")
+    parser.add_argument("--output", help="结果JSON的输出路径，不指定时打印到标准输出")
+    args = parser.parse_args()
+
+    corpora: List[Tuple[str, str, Any]] = []
+    if args.file:
+        for path in args.file:
+            with open(path, "r", encoding="utf-8") as f:
+                corpora.append((os.path.basename(path), f.read(), None))
+    else:
+        text, expected = build_corpus(args.size_mb, args.seed)
+        corpora.append(("synthetic", text, expected))
+
+    report = []
+    for name, text, expected in corpora:
+        report.append({
+            "corpus": name,
+            "megabytes": round(len(text.encode("utf-8")) / (1024 * 1024), 2),
+            "expected_chapters": expected,
+            "results": measure(text, args.repeat),
+        })
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.min_mbps is not None:
+        slowest = min(r["mb_per_second"] for corpus in report for r in corpus["results"] if r["method"] == "spans")
+        if slowest < args.min_mbps:
+            print(f"章节切分吞吐 {slowest}MB/s 低于下限 {args.min_mbps}MB/s", file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
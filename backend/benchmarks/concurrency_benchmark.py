@@ -0,0 +1,129 @@
+"""
+并发压测脚本：测量热点读接口在不同并发客户端数量下的每秒请求数
+
+用法（先启动服务，例如 uvicorn main:app --port 8001 --workers 1）:
+    python benchmarks/concurrency_benchmark.py --novel-id 1
+    python benchmarks/concurrency_benchmark.py --novel-id 1 --concurrency 50 200 --duration 15 --output result.json
+
+每个并发客户端是一个线程，使用独立的keep-alive连接循环发送请求，
+只依赖标准库，可以在没有安装服务端依赖的机器上运行。
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from typing import Dict, List, Any
+from urllib.parse import urlparse
+
+DEFAULT_ENDPOINTS = [
+    "/api/v1/novels/",
+    "/api/v1/novels/{novel_id}",
+    "/api/v1/novels/{novel_id}/statistics",
+    "/api/v1/chapters/?novel_id={novel_id}",
+    "/api/v1/character-analysis/novels/{novel_id}/characters",
+]
+
+def percentile(values: List[float], ratio: float) -> float:
+    """计算已排序列表的分位数"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(len(values) * ratio))
+    return values[index]
+
+def run_client(host: str, port: int, paths: List[str], deadline: float, results: Dict[str, Any], lock: threading.Lock) -> None:
+    """单个客户端：在截止时间前轮流请求各接口"""
+    latencies = []
+    errors = 0
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors += 1
+        except Exception:
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=60)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+    with lock:
+        results["latencies"].extend(latencies)
+        results["errors"] += errors
+
+def run_level(base_url: str, paths: List[str], concurrency: int, duration: float) -> Dict[str, Any]:
+    """以指定并发数运行一轮压测"""
+    parsed = urlparse(base_url)
+    results = {"latencies": [], "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(parsed.hostname, parsed.port or 80, paths, deadline, results, lock),
+            daemon=True
+        )
+        for _ in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(results["latencies"])
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": results["errors"],
+        "elapsed_seconds": round(elapsed, 2),
+        "requests_per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99": round(percentile(latencies, 0.99) * 1000, 1),
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="热点读接口并发压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8001", help="服务地址")
+    parser.add_argument("--novel-id", type=int, default=1, help="用于请求的小说ID")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200], help="并发客户端数量")
+    parser.add_argument("--duration", type=float, default=10.0, help="每轮压测时长（秒）")
+    parser.add_argument("--warmup", type=float, default=2.0, help="正式压测前的预热时长（秒）")
+    parser.add_argument("--endpoint", action="append", help="自定义接口路径，可多次指定，支持{novel_id}占位符")
+    parser.add_argument("--output", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    paths = [path.format(novel_id=args.novel_id) for path in (args.endpoint or DEFAULT_ENDPOINTS)]
+
+    if args.warmup > 0:
+        run_level(args.base_url, paths, 4, args.warmup)
+
+    report = []
+    for concurrency in args.concurrency:
+        level = run_level(args.base_url, paths, concurrency, args.duration)
+        report.append(level)
+        print(
+            f"并发 {level['concurrency']:>4}: {level['requests_per_second']:>8} req/s, "
+            f"p50 {level['latency_ms']['p50']}ms, p95 {level['latency_ms']['p95']}ms, "
+            f"p99 {level['latency_ms']['p99']}ms, 错误 {level['errors']}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"base_url": args.base_url, "endpoints": paths, "results": report}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
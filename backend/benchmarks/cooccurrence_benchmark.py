@@ -0,0 +1,103 @@
+"""
+角色共现矩阵基准测试
+
+按给定规模构造合成的出场数据：角色出场频率服从Zipf分布（少数主角几乎每章出场，
+大量配角只出场几章），配角集中在连续的章节段内。统计以下各项的耗时：
+- build：由 (角色, 章节) 对构建稀疏出场矩阵
+- cooccurrence：共现计数（window为0和指定窗口）
+- 各权重：count、pmi、ppmi、npmi、dice
+- slices：按每N章切片并计算各时间片的共现
+
+用法（在backend目录下运行，需要numpy和scipy）:
+    python benchmarks/cooccurrence_benchmark.py --characters 2000 --chapters 3000
+    python benchmarks/cooccurrence_benchmark.py --window 3 --max-seconds 1 --output cooc.json   # 总耗时超过阈值时退出码为1
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import cooccurrence
+
+def synthetic_pairs(characters: int, chapters: int, cast_per_chapter: int, seed: int):
+    """生成 (角色行号, 章节列号) 对"""
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, characters + 1)
+    # 每个角色的出场章节数按Zipf分布，主角约出场于全部章节
+    appearances = np.maximum(1, (chapters / ranks ** 0.9).astype(np.int64))
+    scale = cast_per_chapter * chapters / appearances.sum()
+    appearances = np.clip((appearances * scale).astype(np.int64), 1, chapters)
+    rows, cols = [], []
+    for row, count in enumerate(appearances):
+        # 配角的出场集中在一段连续章节内
+        span = min(chapters, count * 3)
+        start = rng.integers(0, chapters - span + 1)
+        cols.append(start + rng.choice(span, size=count, replace=False))
+        rows.append(np.full(count, row, dtype=np.int64))
+    return np.concatenate(rows), np.concatenate(cols)
+
+def timed(results: List[Dict[str, Any]], name: str, func: Callable[[], Any]) -> Any:
+    started = time.perf_counter()
+    value = func()
+    results.append({"step": name, "seconds": round(time.perf_counter() - started, 4)})
+    return value
+
+def main():
+    parser = argparse.ArgumentParser(description="角色共现矩阵基准测试")
+    parser.add_argument("--characters", type=int, default=2000)
+    parser.add_argument("--chapters", type=int, default=3000)
+    parser.add_argument("--cast-per-chapter", type=int, default=25, help="每章平均出场角色数")
+    parser.add_argument("--window", type=int, default=2, help="窗口共现的窗口大小（章）")
+    parser.add_argument("--slice-size", type=int, default=100, help="时间切片的章节数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-seconds", type=float, help="总耗时上限，超过时退出码为1")
+    parser.add_argument("--output", help="结果JSON的输出路径")
+    args = parser.parse_args()
+
+    entity_index, unit_index = synthetic_pairs(args.characters, args.chapters, args.cast_per_chapter, args.seed)
+    unit_chapters = np.arange(1, args.chapters + 1)
+
+    results: List[Dict[str, Any]] = []
+    presence = timed(results, "build", lambda: cooccurrence.PresenceMatrix.from_pairs(
+        entity_index, unit_index, args.characters, unit_chapters
+    ))
+    counts = timed(results, "cooccurrence", lambda: presence.cooccurrence())
+    for weighting in cooccurrence.WEIGHTINGS:
+        timed(results, f"weight_{weighting}", lambda: cooccurrence.weight(counts, args.chapters, weighting))
+    windowed = timed(results, f"cooccurrence_window{args.window}", lambda: presence.cooccurrence(args.window))
+    timed(results, f"weight_npmi_window{args.window}", lambda: cooccurrence.weight(windowed, args.chapters, "npmi"))
+    timed(results, f"slices_{args.slice_size}", lambda: [
+        cooccurrence.weight(part.cooccurrence(), part.shape[1], "count")
+        for _, _, part in presence.slices(args.slice_size)
+    ])
+    top = cooccurrence.top_entities(presence, 30)
+    timed(results, "heatmap_top30", lambda: cooccurrence.dense_block(cooccurrence.weight(counts, args.chapters, "dice"), top))
+
+    total = round(sum(item["seconds"] for item in results), 4)
+    report = {
+        "characters": args.characters,
+        "chapters": args.chapters,
+        "appearances": int(presence.matrix.nnz),
+        "cooccurring_pairs": int((counts.nnz - args.characters) // 2),
+        "steps": results,
+        "total_seconds": total,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.max_seconds is not None and total > args.max_seconds:
+        print(f"共现计算总耗时 {total}s 超过上限 {args.max_seconds}s", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,506 @@
+"""
+本地模拟大模型服务：兼容OpenAI接口，用于离线压测完整的分析流程
+
+与 USE_MOCK_DATA 不同，服务端通过真实的HTTP请求调用它，网络、流式解析、JSON清理、
+限流和重试代码都会被执行。支持：
+- POST /v1/chat/completions：普通和流式（stream=true）输出，支持function_call
+- POST /v1/embeddings：批量输入，向量由文本哈希确定
+- GET  /v1/models、GET /stats（调用次数和token统计）、POST /stats/reset
+
+输出由请求内容的哈希确定：相同的提示词总是得到相同的回答，压测结果可复现。
+结构化提取类的提示词（角色、实体、关系、事件等）会返回对应结构的JSON，
+人名和地名从正文中提取，使后续的合并和入库逻辑按真实情况执行。
+
+用法:
+    python benchmarks/mock_llm_server.py --port 9000
+    python benchmarks/mock_llm_server.py --port 9000 --latency-dist lognormal --latency-mean 1.5 \\
+        --latency-std 0.8 --rate-limit-rate 0.05 --error-rate 0.02 --rpm 600
+
+然后以如下环境变量启动服务端：
+    OPENAI_API_BASE=http://127.0.0.1:9000/v1 OPENAI_API_KEY=mock USE_MOCK_DATA=false
+
+只依赖标准库。
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+COMMON_SURNAMES = "赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张孔曹严华金魏陶姜谢邹喻柏水章云苏潘葛范彭鲁韦马苗方俞任袁柳鲍史唐薛雷贺倪汤罗郝安常乐于傅齐康伍余顾孟黄穆萧尹姚邵汪毛狄米明臧计伏成戴宋庞熊纪舒屈项祝董梁杜阮蓝闵季贾路江童颜郭梅盛林钟徐邱骆高夏蔡田樊胡凌霍虞万柯管卢莫房解应宗丁宣邓单杭洪包左石崔龚程邢裴陆荣翁荀羊甄家封储靳焦牧山谷车侯宁仇甘武刘景龙叶司韶黎薄白怀蒲邰从鄂索咸籍赖卓屠蒙池乔阴胥苍闻党翟谭贡劳姬申扶堵冉宰郦雍桑桂濮牛寿通边扈燕冀尚农温庄晏柴瞿阎充慕连茹习艾鱼容向古易慎戈廖庾终居衡步都耿满弘匡国文寇广禄阙东欧利蔚越隆师巩聂晁勾敖融冷辛阚那简饶空曾沙养鞠须丰巢关蒯相查荆红游竺权盖后桓公"
+PLACE_SUFFIXES = "城山村镇府宫殿谷峰湖河寺阁楼街巷岛林关州县庄院堂"
+FALLBACK_NAMES = ["林远", "苏晴", "顾长风", "沈月", "陆青山", "叶知秋", "秦川", "白芷"]
+FALLBACK_PLACES = ["青云城", "落霞山", "临水镇", "天机阁", "白鹿书院"]
+RELATIONS = ["师徒", "朋友", "敌人", "同门", "亲人", "主仆", "恋人", "交易"]
+
+CHAPTER_TAG_PATTERN = re.compile(r"【章节ID:(\d+)】")
+
+def estimate_tokens(text: str) -> int:
+    """按字符数估算token，与服务端未安装tiktoken时的估算一致"""
+    return len(text)
+
+def prompt_seed(*parts: Any) -> int:
+    digest = hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    return int(digest[:16], 16)
+
+def is_han(term: str) -> bool:
+    return all("\u4e00" <= char <= "\u9fff" for char in term)
+
+def frequent_terms(text: str, anchors: str, lengths: range, anchor_at_start: bool) -> Counter:
+    """统计以姓氏开头（或以地名后缀结尾）的各长度汉字串，只保留出现两次以上、
+    且再多一个字出现次数就减少的词，避免把“林远走”“进青云城”这类片段当成名字"""
+    counts = Counter()
+    for position, char in enumerate(text):
+        if char not in anchors:
+            continue
+        for length in lengths:
+            term = text[position:position + length] if anchor_at_start else text[max(0, position - length + 1):position + 1]
+            if len(term) == length and is_han(term):
+                counts[term] += 1
+
+    longer = Counter()
+    for term, count in counts.items():
+        shorter = term[:-1] if anchor_at_start else term[1:]
+        if shorter in counts:
+            longer[shorter] = max(longer[shorter], count)
+    return Counter({term: count for term, count in counts.items() if count >= 2 and longer[term] < count})
+
+def ranked(counts: Counter, text: str, limit: int) -> List[str]:
+    return sorted(counts, key=lambda term: (-counts[term], text.find(term)))[:limit]
+
+def top_places(text: str, limit: int) -> List[str]:
+    return ranked(frequent_terms(text, PLACE_SUFFIXES, range(2, 5), False), text, limit)
+
+def top_names(text: str, limit: int) -> List[str]:
+    places = top_places(text, 50)
+    counts = frequent_terms(text, COMMON_SURNAMES, range(2, 4), True)
+    counts = Counter({term: count for term, count in counts.items() if not any(term in place for place in places)})
+    return ranked(counts, text, limit)
+
+class ContentGenerator:
+    """按提示词类型生成确定性的回答"""
+
+    def __init__(self, messages: List[Dict[str, Any]], model: str):
+        self.messages = messages
+        self.model = model
+        self.system = "\n".join(str(m.get("content") or "") for m in messages if m.get("role") == "system")
+        self.user = "\n".join(str(m.get("content") or "") for m in messages if m.get("role") != "system")
+        self.prompt = self.system + "\n" + self.user
+        self.rng = random.Random(prompt_seed(model, messages))
+
+    def names(self, limit: int = 6) -> List[str]:
+        return top_names(self.user, limit) or FALLBACK_NAMES[:limit]
+
+    def places(self, limit: int = 4) -> List[str]:
+        return top_places(self.user, limit) or FALLBACK_PLACES[:limit]
+
+    def importance(self) -> int:
+        return self.rng.randint(1, 5)
+
+    def characters(self, chapter_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        result = []
+        for index, name in enumerate(self.names()):
+            character = {
+                "name": name,
+                "alias": [],
+                "description": f"{name}在本段中多次出场，是推动情节的人物之一。",
+                "importance": max(1, 5 - index)
+            }
+            if chapter_id is not None:
+                character = {"chapter_id": chapter_id, **character}
+            result.append(character)
+        return result
+
+    def edges(self, names: List[str]) -> List[Dict[str, Any]]:
+        edges = []
+        for i in range(len(names) - 1):
+            j = self.rng.randrange(i + 1, len(names))
+            edges.append({
+                "source_id": i + 1,
+                "target_id": j + 1,
+                "source_name": names[i],
+                "target_name": names[j],
+                "relation": self.rng.choice(RELATIONS),
+                "description": f"{names[i]}与{names[j]}在文中有直接往来。",
+                "importance": round(self.rng.uniform(0.1, 1.0), 2)
+            })
+        return edges
+
+    def events(self, with_participants: bool) -> List[Dict[str, Any]]:
+        names, places = self.names(), self.places()
+        chapter_numbers = [int(n) for n in re.findall(r"第(\d+)章", self.user)] or [1]
+        events = []
+        for index in range(self.rng.randint(3, 6)):
+            place = places[index % len(places)]
+            event = {
+                "name": f"{names[index % len(names)]}在{place}的遭遇{index + 1}",
+                "description": f"{names[index % len(names)]}在{place}经历了一次重要的转折。",
+                "chapter_id": self.rng.choice(chapter_numbers),
+                "time_description": self.rng.choice(["清晨", "当天夜里", "三天后", "次年春天"]),
+                "importance": self.importance()
+            }
+            if with_participants:
+                event["location_name"] = place
+                event["participants"] = [
+                    {"name": name, "role": self.rng.choice(["主导者", "参与者", "旁观者"])}
+                    for name in self.rng.sample(names, min(2, len(names)))
+                ]
+            events.append(event)
+        return events
+
+    def from_schema(self, schema: Dict[str, Any], depth: int = 0) -> Any:
+        """按function的JSON Schema生成参数"""
+        kind = schema.get("type")
+        if kind == "object":
+            return {key: self.from_schema(value, depth + 1) for key, value in schema.get("properties", {}).items()}
+        if kind == "array":
+            return [self.from_schema(schema.get("items", {"type": "string"}), depth + 1) for _ in range(2)]
+        if kind in ("number", "integer"):
+            return round(self.rng.uniform(0, 1), 2) if kind == "number" else self.importance()
+        if kind == "boolean":
+            return self.rng.random() < 0.5
+        return self.rng.choice(self.names() + self.places())
+
+    def json_body(self) -> Optional[Any]:
+        """结构化提取类提示词返回的数据，非结构化提示词返回None"""
+        prompt = self.prompt
+        if '"nodes"' in prompt and '"edges"' in prompt:
+            names = self.names(8)
+            return {
+                "nodes": [
+                    {"id": i + 1, "name": name, "description": f"{name}是文中的人物", "importance": max(1, 5 - i)}
+                    for i, name in enumerate(names)
+                ],
+                "edges": self.edges(names)
+            }
+        if '"edges"' in prompt:
+            return {"edges": self.edges(self.names(8))}
+        if '"persons"' in prompt:
+            return {
+                "persons": [{"name": name, "alias": [], "description": f"{name}是文中的人物", "importance": self.importance()} for name in self.names()],
+                "locations": [{"name": place, "description": f"{place}是故事发生的地点", "parent": "", "importance": self.importance()} for place in self.places()],
+                "items": [],
+                "events": [{"name": event["name"], "description": event["description"], "importance": event["importance"]} for event in self.events(False)],
+                "times": [{"name": "当天夜里", "description": "故事中的时间点"}]
+            }
+        if '"traits"' in prompt and '"quotes"' in prompt:
+            name = self.names(1)[0]
+            return {
+                "name": name,
+                "traits": [{"trait": "坚韧", "description": "面对困境不轻言放弃", "evidence": "文本中的表现"}],
+                "description": f"{name}的性格鲜明。",
+                "analysis": f"{name}在故事中逐渐成长。",
+                "quotes": ["此事我自有分寸。"]
+            }
+        if '"participants"' in prompt:
+            return self.events(True)
+        if '"time_description"' in prompt:
+            return self.events(False)
+        if '"alias"' in prompt and "角色" in prompt:
+            chapter_ids = [int(n) for n in CHAPTER_TAG_PATTERN.findall(self.user)]
+            if chapter_ids:
+                sections = CHAPTER_TAG_PATTERN.split(self.user)[1:]
+                characters = []
+                for chapter_id, section in zip(sections[0::2], sections[1::2]):
+                    section_generator = ContentGenerator([{"role": "user", "content": section}], self.model)
+                    characters.extend(section_generator.characters(int(chapter_id)))
+                return {"characters": characters}
+            return {"characters": self.characters()}
+        return None
+
+    def answer(self) -> str:
+        """非结构化提示词（问答等）的回答"""
+        names = self.names(3)
+        sentences = [
+            f"根据提供的内容片段，{names[0]}是这一段情节的核心人物。",
+            f"文中多次提到{'、'.join(names)}之间的往来。",
+            "以上结论来自检索到的原文片段，片段之外的信息无法确定。"
+        ]
+        # 前两句的顺序随机，切片是副本，打乱后需要写回
+        head = sentences[:2]
+        self.rng.shuffle(head)
+        sentences[:2] = head
+        return "".join(sentences)
+
+    def completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """生成choices[0].message"""
+        functions = body.get("functions") or [
+            tool.get("function") for tool in body.get("tools") or [] if tool.get("type") == "function"
+        ]
+        if functions:
+            function = functions[0]
+            arguments = self.from_schema(function.get("parameters", {"type": "object"}))
+            return {
+                "role": "assistant",
+                "content": None,
+                "function_call": {"name": function["name"], "arguments": json.dumps(arguments, ensure_ascii=False)}
+            }
+
+        data = self.json_body()
+        if data is None:
+            return {"role": "assistant", "content": self.answer()}
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+        if (body.get("response_format") or {}).get("type") != "json_object" and isinstance(data, list):
+            # 不强制JSON输出时模拟模型常见的代码块包裹
+            text = f"```json\n{text}\n```"
+        return {"role": "assistant", "content": text}
+
+def embedding_vector(model: str, text: str, dimension: int) -> List[float]:
+    rng = random.Random(prompt_seed(model, text))
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimension)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [round(v / norm, 6) for v in vector]
+
+class MockState:
+    """服务的配置、故障注入随机源和调用统计"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.recent: deque = deque()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stats = Counter()
+
+    def count(self, **values: int) -> None:
+        with self.lock:
+            self.stats.update(values)
+
+    def latency(self) -> float:
+        args = self.args
+        with self.lock:
+            if args.latency_dist == "fixed":
+                value = args.latency_mean
+            elif args.latency_dist == "uniform":
+                value = self.rng.uniform(max(0.0, args.latency_mean - args.latency_std), args.latency_mean + args.latency_std)
+            elif args.latency_dist == "normal":
+                value = self.rng.gauss(args.latency_mean, args.latency_std)
+            else:
+                # 对数正态分布：按期望和标准差换算参数，长尾更接近真实服务
+                mean, std = max(args.latency_mean, 1e-6), args.latency_std
+                sigma2 = math.log(1 + (std * std) / (mean * mean))
+                value = self.rng.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2))
+        return max(0.0, value)
+
+    def inject_fault(self) -> Optional[str]:
+        """按配置的比例决定本次请求是否返回故障"""
+        args = self.args
+        now = time.monotonic()
+        with self.lock:
+            if args.rpm:
+                while self.recent and now - self.recent[0] > 60:
+                    self.recent.popleft()
+                if len(self.recent) >= args.rpm:
+                    return "rate_limit"
+                self.recent.append(now)
+            draw = self.rng.random()
+        if draw < args.rate_limit_rate:
+            return "rate_limit"
+        if draw < args.rate_limit_rate + args.error_rate:
+            return "error"
+        if draw < args.rate_limit_rate + args.error_rate + args.timeout_rate:
+            return "timeout"
+        return None
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: MockState = None
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.state.args.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status: int, message: str, kind: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_json(status, {"error": {"message": message, "type": kind, "code": status}}, headers)
+
+    def read_body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self) -> None:
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/models"):
+            models = [self.state.args.model, self.state.args.embedding_model]
+            self.send_json(200, {"object": "list", "data": [{"id": m, "object": "model", "owned_by": "mock"} for m in models]})
+        elif path == "/stats":
+            with self.state.lock:
+                self.send_json(200, dict(self.state.stats))
+        else:
+            self.send_error_json(404, f"未知路径: {self.path}", "not_found")
+
+    def do_POST(self) -> None:
+        path = self.path.split("?")[0].rstrip("/")
+        try:
+            body = self.read_body()
+        except ValueError:
+            self.send_error_json(400, "请求体不是合法的JSON", "invalid_request_error")
+            return
+
+        if path == "/stats/reset":
+            self.state.reset()
+            self.send_json(200, {"reset": True})
+            return
+        if not (path.endswith("/chat/completions") or path.endswith("/embeddings")):
+            self.send_error_json(404, f"未知路径: {self.path}", "not_found")
+            return
+
+        fault = self.state.inject_fault()
+        if fault == "rate_limit":
+            self.state.count(rate_limited=1)
+            self.send_error_json(429, "Rate limit reached (mock)", "rate_limit_error", {"Retry-After": str(self.state.args.retry_after)})
+            return
+        if fault == "error":
+            self.state.count(server_errors=1)
+            self.send_error_json(500, "Internal server error (mock)", "server_error")
+            return
+        if fault == "timeout":
+            self.state.count(timeouts=1)
+            time.sleep(self.state.args.timeout_seconds)
+            self.send_error_json(504, "Gateway timeout (mock)", "timeout")
+            return
+
+        time.sleep(self.state.latency())
+        if path.endswith("/embeddings"):
+            self.handle_embeddings(body)
+        else:
+            self.handle_chat(body)
+
+    def handle_embeddings(self, body: Dict[str, Any]) -> None:
+        inputs = body.get("input")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        model = body.get("model") or self.state.args.embedding_model
+        tokens = sum(estimate_tokens(str(text)) for text in inputs)
+        self.state.count(embedding_requests=1, embedding_inputs=len(inputs), embedding_tokens=tokens)
+        self.send_json(200, {
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": index, "embedding": embedding_vector(model, str(text), self.state.args.dimension)}
+                for index, text in enumerate(inputs)
+            ],
+            "model": model,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        })
+
+    def handle_chat(self, body: Dict[str, Any]) -> None:
+        messages = body.get("messages") or []
+        model = body.get("model") or self.state.args.model
+        message = ContentGenerator(messages, model).completion(body)
+        prompt_tokens = sum(estimate_tokens(str(m.get("content") or "")) for m in messages)
+        completion_text = message.get("content") or json.dumps(message.get("function_call"), ensure_ascii=False)
+        completion_tokens = estimate_tokens(completion_text)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        self.state.count(
+            chat_requests=1,
+            stream_requests=1 if body.get("stream") else 0,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
+        )
+
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        if not body.get("stream"):
+            self.send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "function_call" if message.get("function_call") else "stop"}],
+                "usage": usage
+            })
+            return
+        self.stream_chat(completion_id, created, model, message)
+
+    def write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def stream_chat(self, completion_id: str, created: int, model: str, message: Dict[str, Any]) -> None:
+        """按OpenAI的SSE格式分段输出"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> None:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            self.write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        try:
+            event({"role": "assistant", "content": ""})
+            content = message.get("content") or ""
+            size = max(1, self.state.args.stream_chunk_chars)
+            for start in range(0, len(content), size):
+                if self.state.args.token_delay:
+                    time.sleep(self.state.args.token_delay)
+                event({"content": content[start:start + size]})
+            event({}, "stop")
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开
+            self.state.count(stream_aborted=1)
+            self.close_connection = True
+
+def main():
+    parser = argparse.ArgumentParser(description="兼容OpenAI接口的本地模拟大模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--model", default="gpt-3.5-turbo", help="/v1/models返回的对话模型名")
+    parser.add_argument("--embedding-model", default="text-embedding-ada-002")
+    parser.add_argument("--dimension", type=int, default=1536, help="向量维度")
+    parser.add_argument("--seed", type=int, default=42, help="延迟和故障注入的随机种子")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "normal", "lognormal"], default="fixed")
+    parser.add_argument("--latency-mean", type=float, default=0.2, help="响应延迟期望（秒）")
+    parser.add_argument("--latency-std", type=float, default=0.1, help="响应延迟标准差（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="流式输出每段之间的间隔（秒）")
+    parser.add_argument("--stream-chunk-chars", type=int, default=4, help="流式输出每段的字符数")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="随机返回429的比例")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回500的比例")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="随机超时的比例")
+    parser.add_argument("--timeout-seconds", type=float, default=30.0, help="超时请求的挂起时长（秒）")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429响应的Retry-After（秒）")
+    parser.add_argument("--rpm", type=int, default=0, help="每分钟请求数上限，超出返回429，0表示不限制")
+    parser.add_argument("--verbose", action="store_true", help="打印每个请求的访问日志")
+    args = parser.parse_args()
+
+    MockHandler.state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    print(f"模拟大模型服务已启动: http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+章节打包效果报告：对比逐章请求和打包请求的请求数与提示词token数
+
+用法（在backend目录下运行）:
+    python benchmarks/packing_report.py --db novel_ai.db --novel-id 1
+    python benchmarks/packing_report.py --file sample.txt --pack-tokens 10000 --max-chapters 6 --output packing.json
+
+章节正文直接从SQLite数据库或按"第X章"切分的文本文件读取，不调用模型。
+能导入服务端依赖时，提示词开销按实际的角色分析提示词估算，否则使用 --prompt-tokens。
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import request_packer, text_window
+from app.core.chapter_splitter import split_chapters
+
+def load_chapters_from_db(path: str, novel_id: int) -> List[Tuple[int, str]]:
+    """从SQLite数据库读取小说章节"""
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT id, content FROM chapters WHERE novel_id = ? ORDER BY number",
+            (novel_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [(chapter_id, content or "") for chapter_id, content in rows if content]
+
+def load_chapters_from_file(path: str) -> List[Tuple[int, str]]:
+    """按章节标题切分文本文件"""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    spans = split_chapters(text, include_preamble=False)
+    return [(index, span.body(text)) for index, span in enumerate(spans, 1)]
+
+def measure_prompt_tokens() -> Optional[Tuple[int, int]]:
+    """按实际的角色分析提示词估算逐章和打包请求的固定开销"""
+    try:
+        from app.core.openai_client import OpenAIClient
+    except Exception:
+        return None
+
+    def overhead(messages) -> int:
+        return sum(text_window.estimate_tokens(message["content"]) for message in messages)
+
+    return (
+        overhead(OpenAIClient.build_character_messages("", is_chapter_specific=True)),
+        overhead(OpenAIClient.build_character_messages("", packed=True))
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="章节打包效果报告")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--db", help="SQLite数据库文件")
+    source.add_argument("--file", help="小说文本文件，按\"第X章\"切分")
+    parser.add_argument("--novel-id", type=int, default=1, help="使用数据库时的小说ID")
+    parser.add_argument("--pack-tokens", type=int, default=10000, help="每个请求的章节正文token上限")
+    parser.add_argument("--max-chapters", type=int, default=6, help="每个请求最多包含的章节数")
+    parser.add_argument("--prompt-tokens", type=int, default=450, help="无法导入提示词时使用的每请求提示词开销")
+    parser.add_argument("--output", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    if args.db:
+        chapters = load_chapters_from_db(args.db, args.novel_id)
+    else:
+        chapters = load_chapters_from_file(args.file)
+    if not chapters:
+        print("没有读取到章节")
+        return
+
+    measured = measure_prompt_tokens()
+    prompt_tokens, packed_prompt_tokens = measured or (args.prompt_tokens, args.prompt_tokens)
+
+    report = request_packer.packing_report(
+        chapters,
+        max_tokens=args.pack_tokens,
+        prompt_tokens=prompt_tokens,
+        max_chapters=args.max_chapters,
+        packed_prompt_tokens=packed_prompt_tokens
+    )
+    report["prompt_overhead_tokens"] = {
+        "per_chapter": prompt_tokens,
+        "packed": packed_prompt_tokens,
+        "measured": measured is not None
+    }
+
+    print(f"章节数: {report['chapters']}")
+    print(f"逐章请求: {report['per_chapter']['requests']} 次, 提示词 {report['per_chapter']['prompt_tokens']} tokens")
+    print(f"打包请求: {report['packed']['requests']} 次, 提示词 {report['packed']['prompt_tokens']} tokens")
+    print(
+        f"请求数减少 {report['request_reduction_percent']}%, "
+        f"提示词token减少 {report['prompt_token_reduction_percent']}%, "
+        f"平均每请求 {report['chapters_per_request']} 章"
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
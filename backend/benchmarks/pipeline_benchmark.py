@@ -0,0 +1,350 @@
+"""
+端到端分析流程基准测试：上传、角色/地点/事件/关系分析、时间线和问答
+
+在进程内通过TestClient调用完整的接口，大模型调用走真实的OpenAI客户端代码路径，
+请求发往本地模拟服务（benchmarks/mock_llm_server.py，默认自动启动），输入由合成小说
+生成器按种子确定，因此同一提交的多次运行结果可比。
+
+每个场景记录：
+- 接口耗时（总耗时和每个请求的耗时）
+- 大模型调用次数和token数（读取模拟服务的 /stats）
+- 数据库查询次数（SQLAlchemy游标执行事件）
+- 进程的峰值RSS
+- 与合成小说ground truth的人名、地名召回率（角色、地点分析场景）
+
+用法:
+    python benchmarks/pipeline_benchmark.py --chapters 30 --output result.json
+    python benchmarks/pipeline_benchmark.py --scenarios upload characters qa --questions 20
+    python benchmarks/pipeline_benchmark.py --output new.json --baseline result.json --tolerance 0.2
+
+指定 --baseline 时，任一场景的耗时、大模型调用数、token数或查询数超出基线的 (1 + tolerance) 倍
+即视为性能回退，脚本以退出码1结束，可直接用于CI。
+
+数据库和向量缓存使用临时目录中的独立文件，不影响本地数据，运行结束（包括出错退出）后删除。
+需要安装服务端依赖。
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from novel_generator import SyntheticNovel, generate_novel
+
+SCENARIOS = ["upload", "characters", "locations", "events", "relationships", "timeline", "qa"]
+COMPARED_METRICS = ["latency_seconds", "llm_calls", "total_tokens", "db_queries"]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def fetch_json(url: str, method: str = "GET") -> Dict[str, Any]:
+    request = urllib.request.Request(url, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+def start_mock_server(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    """以子进程启动模拟大模型服务，返回进程和服务地址"""
+    port = free_port()
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_llm_server.py"),
+        "--port", str(port),
+        "--seed", str(args.seed),
+        "--latency-dist", args.latency_dist,
+        "--latency-mean", str(args.latency_mean),
+        "--latency-std", str(args.latency_std),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            fetch_json(f"{base}/v1/models")
+            return process, base
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("模拟大模型服务启动超时")
+
+def peak_rss_mb() -> float:
+    """进程启动以来的峰值RSS（MB）"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux下单位为KB，macOS下为字节
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+class QueryCounter:
+    """统计业务库（读写两个引擎）上执行的SQL语句数"""
+
+    def __init__(self, engines: List[Any]):
+        from sqlalchemy import event
+        self.count = 0
+        self._lock = threading.Lock()
+        for engine in {id(engine): engine for engine in engines}.values():
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        with self._lock:
+            self.count += 1
+
+def name_recall(names: List[str], payload: Any) -> float:
+    """ground truth中的名字出现在接口返回内容中的比例"""
+    if not names:
+        return 0.0
+    text = json.dumps(payload, ensure_ascii=False)
+    return round(sum(1 for name in names if name in text) / len(names), 3)
+
+class PipelineBenchmark:
+    def __init__(self, client: Any, novel: SyntheticNovel, queries: QueryCounter, llm_base: Optional[str], args: argparse.Namespace):
+        self.client = client
+        self.novel = novel
+        self.queries = queries
+        self.llm_base = llm_base
+        self.args = args
+        self.novel_id: Optional[int] = None
+
+    def llm_stats(self) -> Dict[str, int]:
+        if not self.llm_base:
+            return {}
+        try:
+            return fetch_json(f"{self.llm_base}/stats")
+        except OSError:
+            return {}
+
+    def measure(self, name: str, requests: Callable[[], List[Any]], truth_names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """执行一个场景的全部请求并汇总指标"""
+        llm_before = self.llm_stats()
+        queries_before = self.queries.count
+        latencies, statuses, payloads = [], {}, []
+
+        started = time.perf_counter()
+        for send in requests():
+            request_started = time.perf_counter()
+            response = send()
+            latencies.append(time.perf_counter() - request_started)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            try:
+                payloads.append(response.json())
+            except ValueError:
+                payloads.append(response.text)
+        elapsed = time.perf_counter() - started
+
+        llm_after = self.llm_stats()
+        delta = {key: llm_after.get(key, 0) - llm_before.get(key, 0) for key in llm_after}
+        latencies.sort()
+        result = {
+            "scenario": name,
+            "requests": len(latencies),
+            "status_codes": statuses,
+            "errors": sum(count for code, count in statuses.items() if int(code) >= 400),
+            "latency_seconds": round(elapsed, 4),
+            "latency_p50": round(latencies[len(latencies) // 2], 4) if latencies else 0.0,
+            "latency_max": round(latencies[-1], 4) if latencies else 0.0,
+            "llm_calls": delta.get("chat_requests", 0) + delta.get("embedding_requests", 0),
+            "llm_chat_calls": delta.get("chat_requests", 0),
+            "llm_embedding_calls": delta.get("embedding_requests", 0),
+            "prompt_tokens": delta.get("prompt_tokens", 0) + delta.get("embedding_tokens", 0),
+            "completion_tokens": delta.get("completion_tokens", 0),
+            "llm_faults": delta.get("rate_limited", 0) + delta.get("server_errors", 0) + delta.get("timeouts", 0),
+            "db_queries": self.queries.count - queries_before,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        result["total_tokens"] = result["prompt_tokens"] + result["completion_tokens"]
+        if truth_names is not None:
+            result["truth_recall"] = name_recall(truth_names, payloads)
+        return result
+
+    def run(self, scenario: str) -> Dict[str, Any]:
+        client, api = self.client, "/api/v1"
+        cast = [character["name"] for character in self.novel.characters]
+        places = [location["name"] for location in self.novel.locations]
+
+        if scenario == "upload":
+            def upload():
+                response = client.post(
+                    f"{api}/novels/upload-file",
+                    data={"title": self.novel.title, "author": "基准测试"},
+                    files={"file": ("novel.txt", self.novel.text.encode("utf-8"), "text/plain")}
+                )
+                if response.status_code == 200:
+                    self.novel_id = response.json()["novel_id"]
+                return response
+            return self.measure(scenario, lambda: [upload])
+
+        if self.novel_id is None:
+            raise RuntimeError("需要先运行upload场景")
+        novel_id = self.novel_id
+
+        if scenario == "characters":
+            return self.measure(scenario, lambda: [
+                lambda: client.get(f"{api}/character-analysis/novels/{novel_id}/characters/analyze")
+            ], cast)
+        if scenario == "locations":
+            return self.measure(scenario, lambda: [
+                lambda: client.get(f"{api}/location-analysis/novels/{novel_id}/locations/analyze")
+            ], places)
+        if scenario == "events":
+            return self.measure(scenario, lambda: [
+                lambda: client.get(f"{api}/event-analysis/novels/{novel_id}/events", params={"force_refresh": True})
+            ])
+        if scenario == "relationships":
+            return self.measure(scenario, lambda: [
+                lambda: client.post(f"{api}/analysis/relationship-graph", json={"novel_id": novel_id, "force_refresh": True})
+            ], cast)
+        if scenario == "timeline":
+            return self.measure(scenario, lambda: [
+                lambda: client.post(f"{api}/analysis/timeline", json={"novel_id": novel_id})
+            ])
+        if scenario == "qa":
+            questions = [
+                f"{event['participants'][0]}和{event['participants'][1]}在哪里发生了什么？"
+                for event in self.novel.events[:self.args.questions]
+            ]
+            return self.measure(scenario, lambda: [
+                (lambda question=question: client.post(
+                    f"{api}/qa/ask",
+                    json={"novel_id": novel_id, "question": question, "use_rag": self.args.use_rag}
+                ))
+                for question in questions
+            ])
+        raise ValueError(f"未知场景: {scenario}")
+
+def compare_with_baseline(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """返回超出基线容差的指标说明"""
+    previous = {item["scenario"]: item for item in baseline.get("scenarios", [])}
+    regressions = []
+    for result in results:
+        base = previous.get(result["scenario"])
+        if not base:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = base.get(metric, 0), result.get(metric, 0)
+            # 耗时允许至少50ms的绝对抖动，避免极短场景误报
+            slack = 0.05 if metric == "latency_seconds" else 0
+            if new > old * (1 + tolerance) + slack:
+                regressions.append(f"{result['scenario']}.{metric}: {old} -> {new}")
+    return regressions
+
+def configure_environment(workdir: str, llm_base: str) -> None:
+    """在导入服务端代码之前设置环境变量，使用临时数据库和缓存文件"""
+    os.environ.update({
+        "USE_SQLITE": "true",
+        "SQLITE_PATH": os.path.join(workdir, "benchmark.db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.db"),
+        "OPENAI_API_BASE": f"{llm_base}/v1",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "mock",
+        "USE_MOCK_DATA": "false",
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端分析流程基准测试")
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--chapter-chars", type=int, default=3000)
+    parser.add_argument("--characters", type=int, default=8)
+    parser.add_argument("--locations", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=42, help="合成小说和模拟服务的随机种子")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--questions", type=int, default=10, help="问答场景的问题数")
+    parser.add_argument("--use-rag", action="store_true", help="问答使用向量检索（需要可用的Milvus）")
+    parser.add_argument("--llm-base", help="使用已启动的模拟服务（如 http://127.0.0.1:9000），不指定时自动启动")
+    parser.add_argument("--latency-dist", default="fixed", choices=["fixed", "uniform", "normal", "lognormal"])
+    parser.add_argument("--latency-mean", type=float, default=0.05, help="模拟服务的响应延迟期望（秒）")
+    parser.add_argument("--latency-std", type=float, default=0.02)
+    parser.add_argument("--output", help="结果JSON的输出路径，不指定时打印到标准输出")
+    parser.add_argument("--baseline", help="基线结果JSON，用于检测性能回退")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="相对基线允许的增幅")
+    parser.add_argument("--verbose", action="store_true", help="保留服务端日志输出")
+    args = parser.parse_args()
+
+    scenarios = [name for name in SCENARIOS if name in args.scenarios]
+    if scenarios[0] != "upload":
+        scenarios.insert(0, "upload")
+
+    mock_process = None
+    llm_base = args.llm_base
+    if not llm_base:
+        mock_process, llm_base = start_mock_server(args)
+
+    workdir = tempfile.mkdtemp(prefix="novel_ai_bench_")
+    configure_environment(workdir, llm_base)
+    try:
+        import_started = time.perf_counter()
+        from fastapi.testclient import TestClient
+        from main import app
+        from app.core.database import engine, read_engine
+        import_seconds = time.perf_counter() - import_started
+        if not args.verbose:
+            logging.disable(logging.WARNING)
+
+        try:
+            fetch_json(f"{llm_base}/stats/reset", method="POST")
+        except OSError:
+            logging.getLogger(__name__).warning("大模型服务不支持 /stats，结果中不包含调用统计")
+        novel = generate_novel(args.chapters, args.chapter_chars, args.characters, args.locations, args.seed)
+        results = []
+        # 进入上下文时执行应用的lifespan（建表等启动步骤）
+        with TestClient(app) as client:
+            benchmark = PipelineBenchmark(client, novel, QueryCounter([engine, read_engine]), llm_base, args)
+            for scenario in scenarios:
+                result = benchmark.run(scenario)
+                results.append(result)
+                print(
+                    f"{scenario:<14} {result['latency_seconds']:>8.3f}s  llm={result['llm_calls']:<5} "
+                    f"tokens={result['total_tokens']:<8} queries={result['db_queries']:<6} "
+                    f"rss={result['peak_rss_mb']}MB errors={result['errors']}",
+                    file=sys.stderr
+                )
+
+        report = {
+            "config": {
+                "chapters": args.chapters,
+                "chapter_chars": args.chapter_chars,
+                "novel_chars": len(novel.text),
+                "seed": args.seed,
+                "latency_dist": args.latency_dist,
+                "latency_mean": args.latency_mean,
+                "use_rag": args.use_rag,
+            },
+            "import_seconds": round(import_seconds, 3),
+            "scenarios": results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(output)
+        else:
+            print(output)
+
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+            for line in regressions:
+                print(f"性能回退: {line}", file=sys.stderr)
+            if regressions:
+                sys.exit(1)
+    finally:
+        if mock_process:
+            mock_process.terminate()
+            mock_process.wait(timeout=10)
+        # 关闭连接池后删除临时数据库和缓存文件
+        database = sys.modules.get("app.core.database")
+        if database is not None:
+            database.engine.dispose()
+            database.read_engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
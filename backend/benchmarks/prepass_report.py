@@ -0,0 +1,92 @@
+"""
+实体预扫描效果报告：统计角色分析中有多少章节可以跳过模型调用或改用精简提示词
+
+用法（在backend目录下运行，需要安装jieba）:
+    python benchmarks/prepass_report.py --db novel_ai.db --novel-id 1
+    python benchmarks/prepass_report.py --file sample.txt --min-mentions 2 --output prepass.json
+
+不调用模型。按章节顺序扫描，完整分析的章节中出现的人名候选视为模型会返回的新角色，
+加入已知名称索引；实际运行时索引来自模型结果（含别名），命中率通常更高。
+请求数按与角色分析相同的打包规则计算。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import entity_prepass, request_packer, text_window
+from packing_report import load_chapters_from_db, load_chapters_from_file
+
+def count_requests(chapters, pack_tokens: int, max_chapters: int) -> int:
+    return sum(1 for _ in request_packer.pack_chapters(chapters, max_tokens=pack_tokens, max_chapters=max_chapters))
+
+def main():
+    parser = argparse.ArgumentParser(description="实体预扫描效果报告")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--db", help="SQLite数据库文件")
+    source.add_argument("--file", help="小说文本文件，按章节标题切分")
+    parser.add_argument("--novel-id", type=int, default=1, help="使用数据库时的小说ID")
+    parser.add_argument("--min-mentions", type=int, default=2, help="新角色候选在一章中至少出现的次数")
+    parser.add_argument("--pack-tokens", type=int, default=10000, help="每个请求的章节正文token上限")
+    parser.add_argument("--max-chapters", type=int, default=6, help="每个请求最多包含的章节数")
+    parser.add_argument("--output", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    if entity_prepass.jieba is None:
+        print("未安装jieba，无法进行预扫描")
+        sys.exit(1)
+
+    if args.db:
+        chapters = load_chapters_from_db(args.db, args.novel_id)
+    else:
+        chapters = load_chapters_from_file(args.file)
+    if not chapters:
+        print("没有读取到章节")
+        return
+
+    index = entity_prepass.KnownNameIndex()
+    full, known_only = [], []
+    started = time.perf_counter()
+    for chapter_id, content in chapters:
+        result = entity_prepass.scan(content, index, entity_prepass.PERSON, min_mentions=args.min_mentions)
+        if not result.has_new and result.known:
+            known_only.append((chapter_id, content))
+            continue
+        full.append((chapter_id, content))
+        for name in result.candidates:
+            index.add(name)
+    elapsed = time.perf_counter() - started
+
+    total_chars = sum(len(content) for _, content in chapters)
+    baseline = count_requests(chapters, args.pack_tokens, args.max_chapters)
+    full_requests = count_requests(full, args.pack_tokens, args.max_chapters)
+    delta_requests = count_requests(known_only, args.pack_tokens, args.max_chapters)
+    skipped_tokens = sum(text_window.estimate_tokens(content) for _, content in known_only)
+    report = {
+        "chapters": len(chapters),
+        "full_chapters": len(full),
+        "known_only_chapters": len(known_only),
+        "known_names": len(index),
+        "requests": {
+            "baseline": baseline,
+            "skip": full_requests,
+            "delta": full_requests + delta_requests,
+        },
+        "skip_saved_input_tokens": skipped_tokens,
+        "scan_seconds": round(elapsed, 3),
+        "scan_chars_per_second": round(total_chars / elapsed) if elapsed else None,
+    }
+
+    print(f"章节数: {report['chapters']}，需要完整分析 {len(full)} 章，只出现已知角色 {len(known_only)} 章")
+    print(f"打包请求数: 原方式 {baseline} 次，skip模式 {full_requests} 次，delta模式 {full_requests + delta_requests} 次（其中精简提示 {delta_requests} 次）")
+    print(f"skip模式少发送正文约 {skipped_tokens} tokens；预扫描耗时 {report['scan_seconds']}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+响应序列化和压缩基准测试：关系图和时间线接口
+
+本地模式（默认）按给定规模构造与服务层结构一致的关系图和时间线数据，比较：
+- validated_stdlib：response_model校验 + jsonable_encoder + 标准库json（原有路径）
+- trusted_fast：跳过校验，直接使用orjson（未安装时为标准库）序列化
+并统计原始、gzip和brotli压缩后的字节数及压缩耗时。
+
+接口模式（指定 --base-url 和 --novel-id）请求运行中的服务，统计不同Accept-Encoding下
+/analysis/relationship-graph 和 /analysis/timeline 的传输字节数和耗时。
+
+用法:
+    python benchmarks/serialization_benchmark.py --characters 2000 --events 20000
+    python benchmarks/serialization_benchmark.py --base-url http://127.0.0.1:8001 --novel-id 1 --output wire.json
+
+本地模式需要安装服务端依赖，接口模式只依赖标准库。
+"""
+import argparse
+import gzip
+import http.client
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def build_graph(characters: int, edges_per_character: int, rng: random.Random) -> Dict[str, Any]:
+    """与analysis_service.get_relationship_graph结构一致的关系图"""
+    nodes = [
+        {"id": i + 1, "name": f"角色{i + 1}", "description": f"第{i + 1}个角色，" + "性格描写" * 8, "importance": rng.randint(1, 5)}
+        for i in range(characters)
+    ]
+    edges = []
+    for i in range(characters):
+        for _ in range(edges_per_character):
+            j = rng.randrange(characters)
+            if j == i:
+                continue
+            edges.append({
+                "id": len(edges) + 1,
+                "source_id": i + 1,
+                "target_id": j + 1,
+                "source_name": nodes[i]["name"],
+                "target_name": nodes[j]["name"],
+                "relation": rng.choice(["朋友", "师徒", "敌人", "亲人"]),
+                "description": "二人在多个章节中有直接往来，" + "关系描述" * 6,
+                "importance": round(rng.uniform(0.5, 1.5), 2)
+            })
+    return {"nodes": nodes, "edges": edges}
+
+def build_timeline(events: int, characters: int, rng: random.Random) -> Dict[str, Any]:
+    """与analysis_service.get_timeline结构一致的时间线"""
+    return {
+        "events": [
+            {
+                "id": i + 1,
+                "novel_id": 1,
+                "name": f"事件{i + 1}",
+                "description": "事件经过的详细描述，" * 5,
+                "chapter_id": i // 10 + 1,
+                "location_id": rng.randint(1, 50),
+                "time_description": rng.choice(["清晨", "当天夜里", "三日之后"]),
+                "importance": rng.randint(1, 5),
+                "participants": [
+                    {"character_id": c, "name": f"角色{c}", "role": "参与者"}
+                    for c in rng.sample(range(1, characters + 1), min(3, characters))
+                ],
+                "location": {"location_id": 1, "name": "青云城", "description": "故事的主要发生地"}
+            }
+            for i in range(events)
+        ]
+    }
+
+def best_of(func: Callable[[], Any], repeat: int) -> Tuple[float, Any]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def measure_local(name: str, payload: Dict[str, Any], model: Any, repeat: int) -> Dict[str, Any]:
+    from fastapi.encoders import jsonable_encoder
+    from app.core import compression, responses
+
+    def validated_stdlib() -> bytes:
+        # 与FastAPI处理response_model的步骤一致：校验、转换为基本类型、标准库编码
+        validated = model.parse_obj(payload)
+        return json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    validated_seconds, validated_body = best_of(validated_stdlib, repeat)
+    fast_seconds, fast_body = best_of(lambda: responses.dumps(payload), repeat)
+    result = {
+        "payload": name,
+        "serializer": "orjson" if responses.orjson is not None else "json",
+        "validated_stdlib_seconds": round(validated_seconds, 4),
+        "trusted_fast_seconds": round(fast_seconds, 4),
+        "speedup": round(validated_seconds / fast_seconds, 1) if fast_seconds else None,
+        "raw_bytes": len(fast_body),
+        "validated_raw_bytes": len(validated_body),
+    }
+    gzip_seconds, gzip_body = best_of(lambda: gzip.compress(fast_body, compresslevel=5), repeat)
+    result.update({"gzip_bytes": len(gzip_body), "gzip_seconds": round(gzip_seconds, 4)})
+    if compression.brotli is not None:
+        br_seconds, br_body = best_of(lambda: compression.brotli.compress(fast_body, quality=4), repeat)
+        result.update({"br_bytes": len(br_body), "br_seconds": round(br_seconds, 4)})
+    return result
+
+def measure_wire(base_url: str, novel_id: int, repeat: int) -> List[Dict[str, Any]]:
+    parsed = urlparse(base_url)
+    requests = [
+        ("relationship-graph", "/api/v1/analysis/relationship-graph", {"novel_id": novel_id}),
+        ("timeline", "/api/v1/analysis/timeline", {"novel_id": novel_id}),
+    ]
+    results = []
+    for name, path, body in requests:
+        for encoding in ("identity", "gzip", "br"):
+            timings, size, applied = [], 0, None
+            for _ in range(repeat):
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=300)
+                started = time.perf_counter()
+                conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json", "Accept-Encoding": encoding})
+                response = conn.getresponse()
+                data = response.read()
+                timings.append(time.perf_counter() - started)
+                size, applied = len(data), response.getheader("Content-Encoding")
+                conn.close()
+            results.append({
+                "payload": name,
+                "accept_encoding": encoding,
+                "content_encoding": applied,
+                "wire_bytes": size,
+                "best_seconds": round(min(timings), 4),
+            })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="关系图和时间线响应的序列化与压缩基准测试")
+    parser.add_argument("--characters", type=int, default=1000)
+    parser.add_argument("--edges-per-character", type=int, default=8)
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3, help="每项取最好成绩的重复次数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--base-url", help="运行中的服务地址，指定时测量接口实际传输")
+    parser.add_argument("--novel-id", type=int, help="接口模式使用的小说ID")
+    parser.add_argument("--output", help="结果JSON的输出路径，不指定时打印到标准输出")
+    args = parser.parse_args()
+
+    if args.base_url:
+        if args.novel_id is None:
+            parser.error("接口模式需要 --novel-id")
+        report = {"mode": "wire", "results": measure_wire(args.base_url, args.novel_id, args.repeat)}
+    else:
+        from app.models import schemas
+        rng = random.Random(args.seed)
+        graph = build_graph(args.characters, args.edges_per_character, rng)
+        timeline = build_timeline(args.events, args.characters, rng)
+        report = {
+            "mode": "local",
+            "results": [
+                measure_local("relationship-graph", graph, schemas.RelationshipGraphResponse, args.repeat),
+                measure_local("timeline", timeline, schemas.TimelineResponse, args.repeat),
+            ],
+        }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
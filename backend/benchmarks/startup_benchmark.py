@@ -0,0 +1,129 @@
+"""
+启动耗时基准测试：测量工作进程从启动解释器到能够处理请求的时间
+
+每一轮启动一个全新的Python进程，分别记录：
+- import_seconds：导入main模块的耗时
+- startup_seconds：执行lifespan启动步骤（建表等）的耗时
+- ready_seconds：从进程开始执行到第一个请求返回的总耗时
+可选地用 -X importtime 统计导入耗时最多的顶层包，用于定位新引入的重量级依赖。
+
+用法:
+    python benchmarks/startup_benchmark.py
+    python benchmarks/startup_benchmark.py --rounds 10 --importtime --output startup.json
+    python benchmarks/startup_benchmark.py --budget 1.0   # 中位数超过1秒时退出码为1
+
+数据库使用临时文件。需要安装服务端依赖。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Any, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中执行，输出一行JSON
+CHILD_SCRIPT = """
+import json, logging, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+logging.disable(logging.WARNING)
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    ready = time.perf_counter()
+    client.get("/")
+    first_response = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - started,
+    "startup_seconds": ready - imported,
+    "ready_seconds": first_response - started
+}))
+"""
+
+def child_environment(workdir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "USE_SQLITE": "true",
+        "SQLITE_PATH": os.path.join(workdir, "startup.db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.db"),
+    })
+    return env
+
+def run_round(env: Dict[str, str]) -> Dict[str, float]:
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"启动失败:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def import_profile(env: Dict[str, str], top: int) -> List[Dict[str, Any]]:
+    """按顶层包汇总 -X importtime 的自身耗时"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    totals: Dict[str, int] = defaultdict(int)
+    for line in completed.stderr.splitlines():
+        # 格式: import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line.split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].split(":")[1])
+        except ValueError:
+            continue
+        totals[parts[2].strip().split(".")[0]] += self_us
+    ranked = sorted(totals.items(), key=lambda item: -item[1])[:top]
+    return [{"package": name, "seconds": round(us / 1e6, 4)} for name, us in ranked]
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "median": round(statistics.median(values), 4),
+        "min": round(min(values), 4),
+        "max": round(max(values), 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="工作进程启动耗时基准测试")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true", help="统计各顶层包的导入耗时")
+    parser.add_argument("--top", type=int, default=15, help="导入耗时排行的条数")
+    parser.add_argument("--budget", type=float, help="ready_seconds中位数的上限（秒），超出时退出码为1")
+    parser.add_argument("--output", help="结果JSON的输出路径，不指定时打印到标准输出")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="novel_ai_startup_")
+    env = child_environment(workdir)
+    # 第一轮会创建数据表并预热文件系统缓存，不计入结果
+    run_round(env)
+    rounds = [run_round(env) for _ in range(args.rounds)]
+
+    report: Dict[str, Any] = {
+        "rounds": args.rounds,
+        **{key: summarize([r[key] for r in rounds]) for key in ("import_seconds", "startup_seconds", "ready_seconds")},
+    }
+    if args.importtime:
+        report["slowest_imports"] = import_profile(env, args.top)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.budget is not None and report["ready_seconds"]["median"] > args.budget:
+        print(f"启动耗时 {report['ready_seconds']['median']}s 超出预算 {args.budget}s", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
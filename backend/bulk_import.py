@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量导入小说
+
+遍历目录下的txt文件，在进程池中完成解码和章节切分，主进程通过写队列按批写入数据库：
+- 每部小说一个事务，章节按 --batch-size 分批executemany插入
+- 导入进度写入清单文件（JSON Lines），中断后重新执行同一命令会跳过已导入的文件
+- 可选地在导入完成后对新导入的小说执行角色、地点、事件分析（--analyze）
+
+文件名作为书名（去掉《》），形如 "书名 作者：某某.txt" 时同时解析作者；
+否则在正文开头查找 "作者：某某"，都没有时使用 --author。
+编码依次尝试 UTF-8 和 GB18030。
+
+用法:
+    python bulk_import.py /data/novels
+    python bulk_import.py /data/novels --workers 8 --batch-size 1000 --manifest import.jsonl
+    python bulk_import.py /data/novels --analyze characters,locations --analysis-concurrency 4
+
+向量索引需要另行构建，本工具只写入小说和章节。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.chapter_splitter import chapter_records
+
+logger = logging.getLogger("bulk_import")
+
+ENCODINGS = ("utf-8-sig", "gb18030")
+ANALYSIS_JOBS = ("characters", "locations", "events")
+
+_FILENAME_PATTERN = re.compile(r"^《?(?P<title>[^》]+?)》?(?:\s*[-_ ]?\s*(?:作者[:：]|by\s+)(?P<author>.+))?$", re.IGNORECASE)
+_AUTHOR_LINE = re.compile(r"^[ \t　]*作者[:：][ \t　]*(?P<author>[^\s]{1,50})", re.MULTILINE)
+
+def find_files(root: str, suffix: str) -> List[str]:
+    """递归查找指定后缀的文件，按相对路径排序保证每次顺序一致"""
+    paths = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.lower().endswith(suffix):
+                paths.append(os.path.relpath(os.path.join(directory, name), root))
+    return sorted(paths)
+
+def decode(data: bytes) -> str:
+    for encoding in ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="replace")
+
+def prepare_novel(root: str, path: str, default_author: str) -> Dict[str, Any]:
+    """在工作进程中读取文件、解析书名作者并切分章节"""
+    with open(os.path.join(root, path), "rb") as f:
+        text = decode(f.read())
+
+    stem = os.path.splitext(os.path.basename(path))[0].strip()
+    match = _FILENAME_PATTERN.match(stem)
+    title = (match.group("title") if match else stem).strip() or stem
+    author = match.group("author").strip() if match and match.group("author") else None
+    if not author:
+        # 只在开头几千字中查找作者行
+        line = _AUTHOR_LINE.search(text, 0, 2000)
+        author = line.group("author") if line else default_author
+
+    chapters = [
+        {"title": chapter_title[:255], "content": content, "word_count": len(content)}
+        for chapter_title, content in chapter_records(text, title_override=title)
+    ]
+    return {"path": path, "title": title[:255], "author": author[:100], "chapters": chapters, "chars": len(text)}
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+class Manifest:
+    """导入清单，每行一条JSON记录，同一文件以最后一条记录为准"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 中断时可能留下不完整的最后一行
+                        continue
+                    self.entries[entry["path"]] = {**self.entries.get(entry["path"], {}), **entry}
+        self._file = open(path, "a", encoding="utf-8")
+        # 不完整的最后一行没有换行符，先补上，避免新记录接在它后面一起被丢弃
+        if self._file.tell() and not _ends_with_newline(path):
+            self._file.write("\n")
+
+    def record(self, path: str, **fields: Any) -> None:
+        entry = {"path": path, **fields}
+        self.entries[path] = {**self.entries.get(path, {}), **entry}
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+class Progress:
+    """按时间间隔输出进度和预计剩余时间"""
+
+    def __init__(self, total: int, interval: float = 5.0):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.chapters = 0
+        self.chars = 0
+        self.started = time.perf_counter()
+        self._last_report = 0.0
+
+    def update(self, chapters: int = 0, chars: int = 0, failed: bool = False) -> None:
+        self.done += 1
+        self.failed += int(failed)
+        self.chapters += chapters
+        self.chars += chars
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval or self.done == self.total:
+            self._last_report = now
+            self.report()
+
+    def report(self) -> None:
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        remaining = (self.total - self.done) / rate if rate else 0.0
+        logger.info(
+            f"[{self.done}/{self.total}] {self.done / max(self.total, 1):.1%} "
+            f"{rate * 60:.1f}本/分钟 {self.chars / max(elapsed, 1e-9) / 1e6:.2f}M字/秒 "
+            f"章节{self.chapters} 失败{self.failed} 预计剩余{time.strftime('%H:%M:%S', time.gmtime(remaining))}"
+        )
+
+def resolve_pending(db, manifest: Manifest) -> None:
+    """处理上次中断时正在写入的小说
+
+    pending记录中带有flush后分配的小说ID：该小说存在说明事务已提交，补记为已导入；
+    不存在说明事务已回滚，重新导入。替换旧小说时新小说可能复用旧小说的ID，无法判断事务
+    是否已提交，同样重新导入（会再次替换，结果一致）。
+    """
+    from app.models import novel
+
+    for path, entry in list(manifest.entries.items()):
+        if entry.get("status") != "pending":
+            continue
+        existing = db.get(novel.Novel, entry.get("novel_id")) if entry.get("novel_id") else None
+        if existing is not None and existing.title == entry.get("title") and existing.id != entry.get("replaces"):
+            chapters = db.query(novel.Chapter).filter(novel.Chapter.novel_id == existing.id).count()
+            manifest.record(
+                path, status="imported", novel_id=existing.id, chapters=chapters,
+                size=entry.get("size"), mtime=entry.get("mtime"), replaces=None, analyzed=[]
+            )
+        else:
+            manifest.record(path, status="retry")
+
+def replaced_novel_id(entry: Dict[str, Any]) -> Optional[int]:
+    """文件修改后重新导入时需要替换的旧小说ID
+
+    已导入的记录直接取其小说ID；替换过程中断或失败时，pending记录中的小说ID是未提交的新小说，
+    旧小说ID保存在replaces字段中。导入失败时replaces记录的是失败前最后一次提交的小说ID。
+    """
+    if entry.get("status") == "imported":
+        return entry.get("novel_id")
+    return entry.get("replaces")
+
+def record_failure(manifest: Manifest, path: str, error: str) -> None:
+    """记录导入失败，同时记下失败前最后一次提交的小说ID
+
+    已导入的文件修改后重新导入失败时，下次重新导入仍会替换该小说，不会再插入一部重复的小说。
+    """
+    manifest.record(path, status="failed", error=error, replaces=replaced_novel_id(manifest.entries.get(path, {})))
+
+def write_novel(
+    db,
+    prepared: Dict[str, Any],
+    batch_size: int,
+    manifest: Manifest,
+    stat: Dict[str, Any],
+    replaces: Optional[int] = None
+) -> int:
+    """在一个事务中写入小说和全部章节，返回小说ID
+
+    指定replaces时在同一事务中删除旧小说，文件修改后重新导入不会产生重复的小说。
+    """
+    from sqlalchemy import insert
+    from app.models import novel
+
+    if replaces is not None:
+        previous = db.get(novel.Novel, replaces)
+        if previous is not None:
+            db.delete(previous)
+            db.flush()
+
+    db_novel = novel.Novel(title=prepared["title"], author=prepared["author"])
+    db.add(db_novel)
+    db.flush()
+    manifest.record(prepared["path"], status="pending", novel_id=db_novel.id, title=prepared["title"], replaces=replaces, **stat)
+
+    rows = [
+        {"novel_id": db_novel.id, "number": number, **chapter}
+        for number, chapter in enumerate(prepared["chapters"], 1)
+    ]
+    for start in range(0, len(rows), batch_size):
+        db.execute(insert(novel.Chapter), rows[start:start + batch_size])
+    db.commit()
+    return db_novel.id
+
+def iter_prepared(root: str, paths: List[str], workers: int, default_author: str) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """在进程池中准备小说，按完成顺序产出 (路径, 结果, 错误)
+
+    同时在途的任务数限制为进程数的两倍，避免大目录下一次性占用过多内存。
+    """
+    pending_paths = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+
+        def submit_next() -> None:
+            path = next(pending_paths, None)
+            if path is not None:
+                futures[executor.submit(prepare_novel, root, path, default_author)] = path
+
+        for _ in range(workers * 2):
+            submit_next()
+        while futures:
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                path = futures.pop(future)
+                submit_next()
+                try:
+                    yield path, future.result(), None
+                except Exception as e:
+                    yield path, None, str(e)
+
+async def run_analysis(manifest: Manifest, jobs: List[str], concurrency: int, force_refresh: bool) -> None:
+    """对已导入但尚未完成分析的小说执行分析任务，以批量优先级调用大模型"""
+    from app.core.database import SessionLocal
+    from app.core.llm_scheduler import llm_priority, PRIORITY_BULK
+    from app.services import character_analysis_service, event_analysis_service, location_analysis_service
+
+    handlers = {
+        "characters": character_analysis_service.analyze_novel_characters,
+        "locations": location_analysis_service.analyze_novel_locations,
+        "events": event_analysis_service.get_novel_events,
+    }
+    tasks = [
+        (path, entry["novel_id"], job)
+        for path, entry in manifest.entries.items()
+        if entry.get("status") == "imported"
+        for job in jobs
+        if job not in entry.get("analyzed", [])
+    ]
+    if not tasks:
+        return
+    logger.info(f"开始分析: {len(tasks)}个任务，并发{concurrency}")
+    semaphore = asyncio.Semaphore(concurrency)
+    progress = Progress(len(tasks))
+
+    async def run_one(path: str, novel_id: int, job: str) -> None:
+        async with semaphore:
+            db = SessionLocal()
+            try:
+                with llm_priority(PRIORITY_BULK):
+                    await handlers[job](db=db, novel_id=novel_id, force_refresh=force_refresh)
+                analyzed = manifest.entries[path].get("analyzed", []) + [job]
+                manifest.record(path, analyzed=analyzed)
+                progress.update()
+            except Exception as e:
+                logger.error(f"分析失败: {path} ({job}): {str(e)}")
+                manifest.record(path, analysis_error=f"{job}: {str(e)}")
+                progress.update(failed=True)
+            finally:
+                db.close()
+
+    await asyncio.gather(*(run_one(*task) for task in tasks))
+
+def main():
+    parser = argparse.ArgumentParser(description="批量导入目录下的小说txt文件")
+    parser.add_argument("directory", help="小说文件所在目录，递归查找")
+    parser.add_argument("--suffix", default=".txt", help="小说文件后缀")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="切分章节的进程数")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批插入的章节数")
+    parser.add_argument("--manifest", default="bulk_import_manifest.jsonl", help="导入清单路径，用于断点续传")
+    parser.add_argument("--author", default="佚名", help="无法解析作者时使用的默认作者")
+    parser.add_argument("--limit", type=int, help="最多导入的文件数")
+    parser.add_argument("--analyze", default="", help=f"导入后执行的分析，逗号分隔，可选: {','.join(ANALYSIS_JOBS)}")
+    parser.add_argument("--analysis-concurrency", type=int, default=2, help="同时分析的任务数")
+    parser.add_argument("--force-refresh", action="store_true", help="分析时忽略已有结果")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    jobs = [job.strip() for job in args.analyze.split(",") if job.strip()]
+    unknown = [job for job in jobs if job not in ANALYSIS_JOBS]
+    if unknown:
+        parser.error(f"不支持的分析任务: {', '.join(unknown)}")
+
+    from app.core.database import SessionLocal, run_write
+    from app.core.init_app import init_database
+
+    init_database()
+    manifest = Manifest(args.manifest)
+    db = SessionLocal()
+    try:
+        resolve_pending(db, manifest)
+
+        # 大小和修改时间都未变化的已导入文件直接跳过
+        paths = []
+        stats: Dict[str, Dict[str, Any]] = {}
+        for path in find_files(args.directory, args.suffix.lower()):
+            st = os.stat(os.path.join(args.directory, path))
+            stats[path] = {"size": st.st_size, "mtime": st.st_mtime_ns}
+            entry = manifest.entries.get(path, {})
+            if entry.get("status") == "imported" and entry.get("size") == st.st_size and entry.get("mtime") == st.st_mtime_ns:
+                continue
+            paths.append(path)
+        if args.limit is not None:
+            paths = paths[:args.limit]
+        logger.info(f"共{len(stats)}个文件，待导入{len(paths)}个，进程数{args.workers}")
+
+        progress = Progress(len(paths))
+        for path, prepared, error in iter_prepared(args.directory, paths, args.workers, args.author):
+            if error is None:
+                try:
+                    replaces = replaced_novel_id(manifest.entries.get(path, {}))
+                    novel_id = run_write(write_novel, db, prepared, args.batch_size, manifest, stats[path], replaces)
+                    # 重新导入的是新小说，之前的分析结果随旧小说一起删除
+                    manifest.record(path, status="imported", novel_id=novel_id, chapters=len(prepared["chapters"]), replaces=None, analyzed=[], **stats[path])
+                    progress.update(chapters=len(prepared["chapters"]), chars=prepared["chars"])
+                    continue
+                except Exception as e:
+                    db.rollback()
+                    error = str(e)
+            logger.error(f"导入失败: {path}: {error}")
+            record_failure(manifest, path, error)
+            progress.update(failed=True)
+    except KeyboardInterrupt:
+        # 中断时写线程可能仍在用这个会话写入，回滚同样经写队列执行，排在该写操作完成之后
+        run_write(db.rollback)
+        logger.warning(f"导入已中断，重新执行相同命令可继续，清单: {args.manifest}")
+        sys.exit(130)
+    finally:
+        db.close()
+
+    if jobs:
+        asyncio.run(run_analysis(manifest, jobs, args.analysis_concurrency, args.force_refresh))
+    manifest.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core import metrics
+from app.core.compression import CompressionMiddleware
+from app.core.init_app import init_app, lifespan
+from app.core.responses import FastJSONResponse
 
+# 建表和外部服务连接在lifespan中执行，导入本模块不访问数据库
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # 设置CORS
@@ -15,8 +22,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],  # 列表分页游标和缓存校验头需要对前端可见
 )
 
+# 按Accept-Encoding压缩响应（br/gzip）
+if settings.RESPONSE_COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.RESPONSE_COMPRESSION_MIN_SIZE)
+
 # 导入路由
 from app.api.api_v1.api import api_router
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -25,12 +37,14 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 async def root():
     return {"message": "长篇小说智能分析系统API服务已启动"}
 
-# 执行初始化
-from app.core.database import Base, engine
-from app.core.init_app import init_app
+if settings.METRICS_ENABLED:
+    # 按路由模板记录接口耗时
+    app.add_middleware(metrics.RequestMetricsMiddleware)
 
-# 创建表
-Base.metadata.create_all(bind=engine)
+    @app.get("/metrics", include_in_schema=False)
+    def export_metrics():
+        """Prometheus格式的运行指标"""
+        return Response(content=metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
 
 # 初始化应用
 init_app(app)
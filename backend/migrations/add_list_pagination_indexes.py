@@ -0,0 +1,36 @@
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, inspect, text
+from app.core.config import settings
+
+# 列表接口游标分页使用的复合索引: (表名, 索引名, 列)
+INDEXES = [
+    ("chapters", "ix_chapters_novel_number", ("novel_id", "number")),
+    ("characters", "ix_characters_novel_id", ("novel_id", "id")),
+]
+
+def migrate():
+    """
+    添加章节、角色列表游标分页所需复合索引的迁移
+    """
+    # 创建引擎
+    engine = create_engine(settings.SQLALCHEMY_DATABASE_URI)
+    inspector = inspect(engine)
+    
+    with engine.connect() as conn:
+        for table, name, columns in INDEXES:
+            # 检查索引是否已存在
+            existing = {index["name"] for index in inspector.get_indexes(table)}
+            if name in existing:
+                print(f"索引{name}已存在，无需添加")
+                continue
+            conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+            print(f"已成功添加索引{name}")
+        conn.commit()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,32 @@
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, Table, MetaData, text
+from app.core.config import settings
+
+def migrate():
+    """
+    添加小说数据版本字段的迁移
+    """
+    # 创建引擎和元数据
+    engine = create_engine(settings.SQLALCHEMY_DATABASE_URI)
+    metadata = MetaData()
+    
+    # 绑定novels表
+    novels = Table('novels', metadata, autoload_with=engine)
+    
+    # 检查字段是否已存在
+    if 'data_version' not in novels.columns:
+        # 添加data_version字段，已有小说从版本1开始
+        with engine.connect() as conn:
+            conn.execute(text("ALTER TABLE novels ADD COLUMN data_version INTEGER NOT NULL DEFAULT 1"))
+            conn.commit()
+            print("已成功添加novels.data_version字段")
+    else:
+        print("novels.data_version字段已存在，无需添加")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,42 @@
+"""
+创建角色档案表和角色出场表，并根据现有的章节角色记录回填
+"""
+import logging
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.database import Base, engine, SessionLocal
+from app.models import novel
+from app.services import character_profile_service
+
+# 设置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate():
+    """创建表并回填所有小说的角色档案"""
+    Base.metadata.create_all(
+        bind=engine,
+        tables=[novel.CharacterProfile.__table__, novel.CharacterAppearance.__table__]
+    )
+    logger.info("角色档案表和出场表已创建")
+
+    db = SessionLocal()
+    try:
+        novel_ids = [row[0] for row in db.query(novel.Novel.id).all()]
+        for novel_id in novel_ids:
+            count = character_profile_service.rebuild_profiles(db, novel_id)
+            db.commit()
+            logger.info(f"小说 {novel_id} 回填了 {count} 个角色档案")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"回填角色档案失败: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,41 @@
+"""
+创建分层摘要表（summary_nodes）
+
+摘要需要调用LLM生成，不在迁移中回填；通过 POST /api/v1/analysis/summary-tree/{novel_id} 按需构建。
+已有的全书梗概节点（旧版本position为0）改为哨兵值，章节序号为0的章节摘要不受影响。
+"""
+import logging
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import update
+
+from app.core.database import Base, engine
+from app.models import novel
+from app.services.summary_service import CHAPTER_LEVEL, ROOT_POSITION
+
+# 设置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate():
+    """创建分层摘要表"""
+    Base.metadata.create_all(bind=engine, tables=[novel.SummaryNode.__table__])
+    logger.info("分层摘要表已创建")
+
+    # 章节层以上的段序号从1开始，position为0的只有旧版本的全书梗概
+    nodes = novel.SummaryNode.__table__
+    with engine.begin() as conn:
+        result = conn.execute(
+            update(nodes)
+            .where(nodes.c.position == 0, nodes.c.level > CHAPTER_LEVEL)
+            .values(position=ROOT_POSITION)
+        )
+    if result.rowcount:
+        logger.info(f"已更新{result.rowcount}个全书梗概节点的position")
+
+if __name__ == "__main__":
+    migrate()
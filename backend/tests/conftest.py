@@ -0,0 +1,38 @@
+"""
+测试环境
+
+在导入服务端代码之前设置环境变量，使用临时目录中的SQLite数据库和向量缓存文件，
+不读写backend目录下的novel_ai.db。需要数据库的测试使用db夹具，每个测试前重建数据表。
+"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix="novel_ai_tests_")
+os.environ.update({
+    "USE_SQLITE": "true",
+    "SQLITE_PATH": os.path.join(_workdir, "test.db"),
+    "EMBEDDING_CACHE_PATH": os.path.join(_workdir, "embedding_cache.db"),
+    "OPENAI_API_KEY": "test",
+    "USE_MOCK_DATA": "false",
+})
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+@pytest.fixture
+def db():
+    pytest.importorskip("pydantic")
+    pytest.importorskip("sqlalchemy")
+    from app.core.database import Base, SessionLocal, engine
+    from app.models import novel  # noqa: F401  注册模型的数据表
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
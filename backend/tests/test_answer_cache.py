@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pydantic")
+
+from app.core.answer_cache import SemanticAnswerCache, normalize_question
+
+
+def test_normalize_question():
+    assert normalize_question("张三 是谁？") == normalize_question("张三是谁")
+
+
+def test_exact_and_semantic_lookup():
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=10, ttl=0)
+    answer = {"answer": "主角", "sources": [1]}
+    cache.store(1, True, 3, "张三是谁？", [1.0, 0.0], answer)
+
+    exact = cache.lookup_exact(1, True, 3, "张三是谁")
+    assert exact == answer
+    # 返回副本，调用方修改不影响缓存
+    exact["sources"].append(2)
+    assert cache.lookup_exact(1, True, 3, "张三是谁")["sources"] == [1]
+
+    assert cache.lookup(1, True, 3, [0.99, 0.05]) == answer
+    assert cache.lookup(1, True, 3, [0.0, 1.0]) is None
+    # 问答模式和小说分开缓存
+    assert cache.lookup(1, False, 3, [1.0, 0.0]) is None
+    assert cache.lookup(2, True, 3, [1.0, 0.0]) is None
+
+
+def test_content_version_change_and_invalidate():
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=10, ttl=0)
+    cache.store(1, True, 3, "张三是谁", [1.0, 0.0], {"answer": "主角"})
+    assert cache.lookup(1, True, 4, [1.0, 0.0]) is None
+    # 版本变化后旧答案已作废，回到旧版本也不会命中
+    assert cache.lookup_exact(1, True, 3, "张三是谁") is None
+
+    cache.store(1, True, 4, "张三是谁", [1.0, 0.0], {"answer": "主角"})
+    cache.invalidate(1)
+    assert cache.lookup(1, True, 4, [1.0, 0.0]) is None
+
+
+def test_oldest_entries_are_evicted():
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=2, ttl=0)
+    cache.store(1, True, 1, "甲", [1.0, 0.0, 0.0], {"answer": "甲"})
+    cache.store(1, True, 1, "乙", [0.0, 1.0, 0.0], {"answer": "乙"})
+    cache.store(1, True, 1, "丙", [0.0, 0.0, 1.0], {"answer": "丙"})
+    assert cache.lookup_exact(1, True, 1, "甲") is None
+    assert cache.lookup_exact(1, True, 1, "丙") == {"answer": "丙"}
+    assert cache.lookup(1, True, 1, [0.0, 1.0, 0.0]) == {"answer": "乙"}
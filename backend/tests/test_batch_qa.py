@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("numpy")
+pytest.importorskip("sqlalchemy")
+
+from app.core.answer_cache import answer_cache
+from app.core.openai_client import OpenAIClient
+from app.models import novel
+from app.services import qa_service
+
+QUESTIONS = ["主角是谁？", "结局如何？", "这个问题会失败"]
+
+
+def run_batch(db, novel_id):
+    async def collect():
+        return [result async for result in qa_service.answer_questions_batch(db, novel_id, QUESTIONS, use_rag=False)]
+
+    return sorted(asyncio.run(collect()), key=lambda result: result["index"])
+
+
+def test_batch_answers_each_question_and_caches_successes(db, monkeypatch):
+    db_novel = novel.Novel(title="测试小说", author="佚名")
+    db.add(db_novel)
+    db.commit()
+    answer_cache.invalidate(db_novel.id)
+    calls = []
+
+    async def get_embeddings(texts):
+        # 两两正交的向量，不同问题之间不会语义命中
+        return [[1.0 if i == j else 0.0 for j in range(len(texts))] for i in range(len(texts))]
+
+    async def chat_completion(messages, **kwargs):
+        question = messages[-1]["content"]
+        calls.append(question)
+        if "失败" in question:
+            raise RuntimeError("模型请求失败")
+        return {"choices": [{"message": {"content": f"回答：{question}"}}]}
+
+    monkeypatch.setattr(OpenAIClient, "get_embeddings", get_embeddings)
+    monkeypatch.setattr(OpenAIClient, "chat_completion", chat_completion)
+
+    first = run_batch(db, db_novel.id)
+    assert [result["index"] for result in first] == [0, 1, 2]
+    assert first[0]["answer"] == "回答：主角是谁？" and first[0]["cached"] is False
+    assert first[1]["answer"] == "回答：结局如何？"
+    # 单个问题失败只返回错误，不影响整批
+    assert first[2]["error"] == "模型请求失败"
+    assert sorted(calls) == sorted(QUESTIONS)
+
+    # 再次提问时成功的问题直接从缓存返回，失败的问题重新请求
+    calls.clear()
+    second = run_batch(db, db_novel.id)
+    assert second[0]["cached"] is True and second[0]["answer"] == first[0]["answer"]
+    assert second[1]["cached"] is True
+    assert "error" in second[2]
+    assert calls == ["这个问题会失败"]
@@ -0,0 +1,54 @@
+import json
+
+from bulk_import import Manifest, record_failure, replaced_novel_id
+
+
+def test_manifest_resume_merges_records_and_ignores_truncated_line(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    manifest = Manifest(path)
+    manifest.record("a.txt", status="pending", novel_id=3, size=10, mtime=1.0)
+    manifest.record("a.txt", status="imported", chapters=5)
+    manifest.record("b.txt", status="failed", error="编码错误")
+    manifest.close()
+    # 中断时留下的不完整行
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"path": "c.txt", "sta')
+
+    resumed = Manifest(path)
+    try:
+        assert resumed.entries["a.txt"] == {
+            "path": "a.txt", "status": "imported", "novel_id": 3, "size": 10, "mtime": 1.0, "chapters": 5
+        }
+        assert resumed.entries["b.txt"]["status"] == "failed"
+        assert "c.txt" not in resumed.entries
+
+        resumed.record("b.txt", status="retry")
+    finally:
+        resumed.close()
+    with open(path, encoding="utf-8") as f:
+        last = f.read().splitlines()[-1]
+    assert json.loads(last) == {"path": "b.txt", "status": "retry"}
+
+
+def test_replaced_novel_id():
+    assert replaced_novel_id({"status": "imported", "novel_id": 7}) == 7
+    # 替换中断时pending记录的novel_id是未提交的新小说，旧小说ID在replaces中
+    assert replaced_novel_id({"status": "pending", "novel_id": 9, "replaces": 7}) == 7
+    assert replaced_novel_id({"status": "retry", "replaces": None}) is None
+    assert replaced_novel_id({"status": "failed"}) is None
+
+
+def test_failure_after_import_keeps_the_committed_novel(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.jsonl"))
+    try:
+        manifest.record("a.txt", status="imported", novel_id=7, replaces=None)
+        # 文件修改后重新切分失败
+        record_failure(manifest, "a.txt", "解码错误")
+        assert replaced_novel_id(manifest.entries["a.txt"]) == 7
+
+        # 替换写入失败：pending记录中的小说ID未提交，仍替换原来的小说
+        manifest.record("a.txt", status="pending", novel_id=9, replaces=7)
+        record_failure(manifest, "a.txt", "磁盘已满")
+        assert replaced_novel_id(manifest.entries["a.txt"]) == 7
+    finally:
+        manifest.close()
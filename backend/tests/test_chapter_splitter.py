@@ -0,0 +1,49 @@
+from app.core.chapter_splitter import chapter_records, parse_chinese_number
+
+
+def test_heading_requires_separator():
+    # “第三回合”不是章节标题，留在上一章正文中
+    text = "第一章 初见\n内容\n第三回合结束\n更多\n第二章 再会\n结尾\n"
+    assert chapter_records(text) == [
+        ("第一章 初见", "内容\n第三回合结束\n更多"),
+        ("第二章 再会", "结尾"),
+    ]
+
+
+def test_bare_headings_with_crlf_line_endings():
+    text = "第一章\r\n内容一\r\n第二章\r\n内容二\r\n"
+    assert chapter_records(text) == [("第一章", "内容一"), ("第二章", "内容二")]
+
+
+def test_volume_heading_and_prologue_prepended_to_first_chapter():
+    text = (
+        "第一卷 风起\n卷首语：天下大乱。\n"
+        "第一章 出山\n正文一\n"
+        "第二章 下山\n正文二\n"
+        "第二卷 云涌\n"
+        "第三章 入城\n正文三\n"
+    )
+    assert chapter_records(text) == [
+        ("第一章 出山", "第一卷 风起\n卷首语：天下大乱。\n\n正文一"),
+        ("第二章 下山", "正文二"),
+        ("第三章 入城", "第二卷 云涌\n\n正文三"),
+    ]
+
+
+def test_trailing_volume_with_prologue_is_kept():
+    text = "第一章 开端\n内容\n第二卷 尾声\n后记文字\n"
+    assert chapter_records(text) == [
+        ("第一章 开端", "内容"),
+        ("第二卷 尾声", "后记文字"),
+    ]
+
+
+def test_preamble_and_single_chapter_titles():
+    assert chapter_records("序\n开头\n第一章 开端\n内容\n") == [("前言", "序\n开头"), ("第一章 开端", "内容")]
+    assert chapter_records("只是一段话") == [("第1章", "只是一段话")]
+    assert chapter_records("只是一段话", title_override="短篇") == [("短篇", "只是一段话")]
+
+
+def test_parse_chinese_number():
+    assert parse_chinese_number("一百二十三") == 123
+    assert parse_chinese_number("12") == 12
@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip("pydantic")
+pytest.importorskip("sqlalchemy")
+
+from app.models import novel
+from app.services import character_profile_service
+
+
+def make_novel(db, chapter_count):
+    db_novel = novel.Novel(title="测试小说", author="佚名")
+    db.add(db_novel)
+    db.flush()
+    chapters = [
+        novel.Chapter(novel_id=db_novel.id, number=number, title=f"第{number}章", content="")
+        for number in range(1, chapter_count + 1)
+    ]
+    db.add_all(chapters)
+    db.flush()
+    return db_novel, chapters
+
+
+def record(db, index, chapter, name, **fields):
+    character = novel.Character(novel_id=index.novel_id, chapter_id=chapter.id, name=name, **fields)
+    db.add(character)
+    return index.record(character, chapter)
+
+
+def test_record_aggregates_appearances_by_name(db):
+    db_novel, (first, second, _) = make_novel(db, 3)
+    index = character_profile_service.CharacterProfileIndex(db, db_novel.id)
+
+    record(db, index, second, "张三", alias=["三哥"], description="剑客", importance=2)
+    record(db, index, first, "张三", alias=["小张"], description="年轻的剑客", importance=4)
+    # 同一章节重复返回的角色只记一次出场
+    profile = record(db, index, first, "张三", importance=1)
+    db.commit()
+
+    assert len(index.profiles) == 1
+    assert profile.appearance_count == 2
+    assert profile.first_chapter_id == first.id and profile.first_chapter_number == 1
+    assert profile.alias == ["三哥", "小张"]
+    assert profile.description == "年轻的剑客"
+    assert profile.importance == 4
+
+    characters = character_profile_service.list_profiles(db, db_novel.id)
+    assert [c["name"] for c in characters] == ["张三"]
+    assert characters[0]["chapters"] == [first.id, second.id]
+
+
+def test_removing_chapters_recomputes_or_deletes_profiles(db):
+    db_novel, (first, second, third) = make_novel(db, 3)
+    index = character_profile_service.CharacterProfileIndex(db, db_novel.id)
+    record(db, index, first, "张三", importance=5)
+    record(db, index, third, "张三", importance=2)
+    record(db, index, second, "李四")
+    db.commit()
+
+    character_profile_service.remove_appearances(db, db_novel.id, [first.id, second.id])
+    db.commit()
+
+    profiles = {p.name: p for p in db.query(novel.CharacterProfile).filter_by(novel_id=db_novel.id)}
+    # 只在被清除章节出场的档案被删除，其余档案按剩余出场重算
+    assert set(profiles) == {"张三"}
+    assert profiles["张三"].first_chapter_id == third.id
+    assert profiles["张三"].appearance_count == 1
+    assert profiles["张三"].importance == 2
+
+    # 新建索引时读到的是重算后的档案
+    assert set(character_profile_service.CharacterProfileIndex(db, db_novel.id).profiles) == {"张三"}
@@ -0,0 +1,67 @@
+import asyncio
+import gzip
+
+import pytest
+
+pytest.importorskip("pydantic")
+
+from app.core import compression
+
+
+def test_choose_encoding(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression.choose_encoding("br, gzip;q=0.5") == "gzip"
+    assert compression.choose_encoding("gzip;q=0, deflate") is None
+    assert compression.choose_encoding("*") == "gzip"
+    assert compression.choose_encoding("") is None
+
+
+def test_tag_etag():
+    assert compression.tag_etag(b'"1-2-abc"', "gzip") == b'"1-2-abc-gzip"'
+    assert compression.tag_etag(b'W/"1-2-abc"', "gzip") == b'W/"1-2-abc"'
+
+
+def run_middleware(status, headers, body, accept="gzip", minimum_size=10):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        # 分两段发送，中间件应缓冲完整响应体
+        await send({"type": "http.response.body", "body": body[:3], "more_body": True})
+        await send({"type": "http.response.body", "body": body[3:]})
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", accept.encode("latin-1"))]}
+    asyncio.run(compression.CompressionMiddleware(app, minimum_size=minimum_size)(scope, None, send))
+    return messages
+
+
+def test_middleware_compresses_and_tags_etag(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    body = "人物关系".encode("utf-8") * 50
+    start, message = run_middleware(200, [(b"content-type", b"application/json"), (b"etag", b'"1-2-abc"')], body)
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"etag"] == b'"1-2-abc-gzip"'
+    assert headers[b"content-length"] == str(len(message["body"])).encode("latin-1")
+    assert gzip.decompress(message["body"]) == body
+
+    # 304响应不带响应体，ETag与对应的200响应一致
+    start, message = run_middleware(304, [(b"etag", b'"1-2-abc"')], b"")
+    assert dict(start["headers"])[b"etag"] == b'"1-2-abc-gzip"'
+    assert message["body"] == b""
+
+
+def test_middleware_skips_small_and_streaming_responses(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    start, message = run_middleware(200, [(b"content-type", b"application/json"), (b"etag", b'"a"')], b"{}")
+    assert b"content-encoding" not in dict(start["headers"])
+    assert dict(start["headers"])[b"etag"] == b'"a"'
+    assert message["body"] == b"{}"
+
+    body = b'data: {"a": 1}\n\n' * 10
+    messages = run_middleware(200, [(b"content-type", b"text/event-stream")], body)
+    assert len(messages) == 3
+    assert b"".join(m.get("body", b"") for m in messages[1:]) == body
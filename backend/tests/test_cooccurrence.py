@@ -0,0 +1,46 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from app.core import cooccurrence
+
+
+def presence(pairs, n_entities, n_units):
+    entity_index = np.array([entity for entity, _ in pairs], dtype=np.int64)
+    unit_index = np.array([unit for _, unit in pairs], dtype=np.int64)
+    return cooccurrence.PresenceMatrix.from_pairs(entity_index, unit_index, n_entities, np.arange(1, n_units + 1))
+
+
+def test_window_larger_than_unit_count_is_clamped():
+    matrix = presence([(0, 0), (1, 2)], 3, 3)
+    assert matrix.cooccurrence()[0, 1] == 0
+
+    wide = matrix.cooccurrence(10).toarray()
+    # 窗口覆盖全部单元：两个角色在每个单元都在场
+    assert wide[0, 1] == 3
+    assert wide[0, 0] == wide[1, 1] == 3
+    assert not wide[2].any()
+    np.testing.assert_array_equal(wide, matrix.cooccurrence(2).toarray())
+
+
+def test_window_without_units_returns_empty_counts():
+    matrix = presence([], 2, 0)
+    counts = matrix.cooccurrence(3)
+    assert counts.shape == (2, 2)
+    assert counts.nnz == 0
+
+
+def test_zero_weight_pairs_are_kept():
+    # 两个角色在所有单元都共现时pmi为0，仍然保留这一对
+    counts = presence([(0, 0), (0, 1), (1, 0), (1, 1)], 2, 2).cooccurrence()
+    weighted = cooccurrence.weight(counts, 2, "pmi")
+    assert weighted.nnz == 2
+    assert weighted[0, 1] == weighted[1, 0] == 0
+    assert cooccurrence.weight(counts, 2, "dice")[0, 1] == pytest.approx(1.0)
+
+
+def test_unknown_weighting_rejected():
+    counts = presence([(0, 0)], 1, 1).cooccurrence()
+    with pytest.raises(ValueError):
+        cooccurrence.weight(counts, 1, "tfidf")
@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip("pydantic")
+
+from app.core.embedding_cache import EmbeddingCache
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    cache = EmbeddingCache(path, memory_items=1)
+    cache.put_many("m", ["甲", "乙"], [[0.5, 0.25], [1.0, -2.0]])
+
+    # 内存层只保留最近的一条，另一条从磁盘读取
+    assert cache.get_many("m", ["乙", "甲", "丙"]) == [[1.0, -2.0], [0.5, 0.25], None]
+    assert cache.stats() == {"memory_items": 1, "memory_hits": 1, "disk_hits": 1, "misses": 1}
+
+    # 不同模型的向量不可混用，重复文本只查询一次
+    assert cache.get_many("other", ["甲"]) == [None]
+    reopened = EmbeddingCache(path, memory_items=10)
+    assert reopened.get_many("m", ["甲", "甲"]) == [[0.5, 0.25], [0.5, 0.25]]
+    assert reopened.stats()["disk_hits"] == 2
+
+
+def test_vectors_are_stored_as_float16(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.db"), memory_items=10)
+    cache.put_many("m", ["甲"], [[0.1]])
+    memory = cache.get_many("m", ["甲"])[0]
+    disk = EmbeddingCache(cache.path, memory_items=10).get_many("m", ["甲"])[0]
+    # 两级缓存返回的精度一致
+    assert memory == disk
+    assert memory[0] == pytest.approx(0.1, abs=1e-3)
+
+
+def test_unreadable_cache_file_counts_as_miss(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "missing" / "embeddings.db"), memory_items=10)
+    cache.put_many("m", ["甲"], [[1.0]])
+    assert cache.get_many("m", ["甲", "乙"]) == [[1.0], None]
@@ -0,0 +1,90 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import delete
+from starlette.requests import Request
+
+from app.core import http_cache
+from app.models import novel
+
+
+def make_request(path, if_none_match=None):
+    headers = [(b"host", b"testserver")]
+    if if_none_match is not None:
+        headers.append((b"if-none-match", if_none_match.encode("latin-1")))
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": headers})
+
+
+def test_matching_etag_returns_304_without_building():
+    http_cache.response_cache.clear()
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {"characters": ["张三"]}
+
+    first = http_cache.cached_json_response(make_request("/novels/1/characters"), 1, 5, build)
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and first.body == b'{"characters":["\xe5\xbc\xa0\xe4\xb8\x89"]}'
+
+    # 压缩中间件追加的编码后缀在比较时忽略
+    for tag in (etag, etag[:-1] + '-gzip"', f'"other", W/{etag}'):
+        response = http_cache.cached_json_response(make_request("/novels/1/characters", tag), 1, 5, build)
+        assert response.status_code == 304 and response.headers["etag"] == etag
+
+    # 客户端没有缓存时命中进程内缓存，也不重新计算
+    assert http_cache.cached_json_response(make_request("/novels/1/characters"), 1, 5, build).body == first.body
+    assert len(builds) == 1
+
+    # 数据版本变化后ETag变化，旧的ETag不再匹配
+    changed = http_cache.cached_json_response(make_request("/novels/1/characters", etag), 1, 6, build)
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert len(builds) == 2
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = http_cache.RenderedResponseCache(max_entries=2, max_bytes=1000)
+    cache.put("a", "1", b"a")
+    cache.put("b", "1", b"b")
+    assert cache.get("a", "1") == b"a"
+    cache.put("c", "1", b"c")
+    assert cache.get("b", "1") is None
+    assert cache.get("a", "2") is None and len(cache) == 1
+
+
+def data_version(db, novel_id):
+    db.expire_all()
+    return db.get(novel.Novel, novel_id).data_version
+
+
+def test_writes_bump_the_novel_data_version(db):
+    first, second = novel.Novel(title="甲", author="佚名"), novel.Novel(title="乙", author="佚名")
+    db.add_all([first, second])
+    db.commit()
+    assert data_version(db, first.id) == 1
+    updated_at = db.get(novel.Novel, first.id).updated_at
+
+    chapter = novel.Chapter(novel_id=first.id, number=1, title="第一章", content="正文")
+    db.add(chapter)
+    db.commit()
+    assert data_version(db, first.id) == 2
+
+    # 没有novel_id的对象沿多对一关系找到所属小说
+    db.add(novel.TextChunk(chapter_id=chapter.id, content="正文", start_char=0, end_char=2))
+    db.commit()
+    assert data_version(db, first.id) == 3
+
+    # 批量语句按WHERE条件中的小说ID递增
+    db.execute(delete(novel.Character).where(novel.Character.novel_id == first.id))
+    db.commit()
+    assert data_version(db, first.id) == 4
+
+    # 只影响所属小说，派生数据的写入不改变小说的修改时间
+    assert data_version(db, second.id) == 1
+    assert db.get(novel.Novel, first.id).updated_at == updated_at
+
+    db.add(novel.Chapter(novel_id=second.id, number=1, title="第一章", content="正文"))
+    db.rollback()
+    assert data_version(db, second.id) == 1
@@ -0,0 +1,53 @@
+from app.core.json_stream import JSONArrayStreamDecoder
+
+
+def feed_in_chunks(decoder, text, size):
+    results = []
+    for i in range(0, len(text), size):
+        results += decoder.feed(text[i:i + size])
+    return results
+
+
+def test_keyed_arrays_decoded_across_chunks():
+    text = (
+        '```json\n{"nodes": [{"id": 1, "name": "甲"}, {"id": 2, "name": "乙"}], '
+        '"edges": [{"source": 1, "target": 2, "note": "a]}"}]}\n```'
+    )
+    decoder = JSONArrayStreamDecoder(("nodes", "edges"))
+    assert feed_in_chunks(decoder, text, 3) == [
+        ("nodes", {"id": 1, "name": "甲"}),
+        ("nodes", {"id": 2, "name": "乙"}),
+        ("edges", {"source": 1, "target": 2, "note": "a]}"}),
+    ]
+    assert decoder.complete
+
+
+def test_elements_emitted_as_soon_as_they_close():
+    decoder = JSONArrayStreamDecoder()
+    assert decoder.feed('[{"a": 1}, {"b": ') == [(None, {"a": 1})]
+    assert decoder.feed('2}]') == [(None, {"b": 2})]
+
+
+def test_malformed_element_is_skipped():
+    decoder = JSONArrayStreamDecoder()
+    assert decoder.feed('[{"a": 1}, {"c": oops}, {"d": 4}]') == [(None, {"a": 1}), (None, {"d": 4})]
+    assert decoder.skipped == 1
+
+
+def test_truncated_output_keeps_complete_elements():
+    decoder = JSONArrayStreamDecoder()
+    assert decoder.feed('[{"a": 1}, {"b": 2') == [(None, {"a": 1})]
+    assert not decoder.complete
+
+
+def test_brackets_in_preamble_are_not_arrays():
+    text = '注意[重要]：以下是结果 [ 见附录]\n[\n  {"a": 1}, {"b": 2}]'
+    for size in (1, 2, 5, len(text)):
+        decoder = JSONArrayStreamDecoder()
+        assert feed_in_chunks(decoder, text, size) == [(None, {"a": 1}), (None, {"b": 2})]
+        assert decoder.complete
+
+    decoder = JSONArrayStreamDecoder()
+    assert decoder.feed("[") == []
+    assert decoder.feed(" ]") == []
+    assert decoder.complete
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from app.core import llm_scheduler
+from app.core.config import settings
+from app.core.openai_client import OpenAIClient
+
+
+def test_token_bucket_wait_time():
+    bucket = llm_scheduler.TokenBucket(60)
+    bucket.consume(60)
+    # 每秒补充1个令牌
+    assert bucket.wait_time(2) == pytest.approx(2, abs=0.1)
+    bucket.refund(60)
+    assert bucket.wait_time(1000) == 0.0
+
+
+def test_waiting_requests_dequeue_by_priority():
+    async def scenario():
+        limiter = llm_scheduler.ModelLimiter("test-model", 1000, 10 ** 6)
+        limiter.concurrency = 1
+        order = []
+
+        async def request(name, priority):
+            await limiter.acquire(10, priority)
+            order.append(name)
+
+        await limiter.acquire(10, llm_scheduler.PRIORITY_NORMAL)
+        waiting = [
+            asyncio.ensure_future(request("bulk", llm_scheduler.PRIORITY_BULK)),
+            asyncio.ensure_future(request("interactive", llm_scheduler.PRIORITY_INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 1 and order == []
+
+        limiter.release()
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*waiting)
+        return order
+
+    assert asyncio.run(scenario()) == ["interactive", "bulk"]
+
+
+def test_transient_errors_are_retried():
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("连接被重置")
+        return "ok"
+
+    async def scenario():
+        scheduler = llm_scheduler.LLMScheduler()
+        result = await scheduler.run("test-model", call, estimated_tokens=10, retry_delay=0.001)
+        return result, scheduler.limiter("test-model").in_flight
+
+    assert asyncio.run(scenario()) == ("ok", 0)
+    assert len(calls) == 3
+
+
+def test_hold_slot_keeps_the_slot_until_released():
+    async def scenario():
+        scheduler = llm_scheduler.LLMScheduler()
+        limiter = scheduler.limiter("test-model")
+        result, release = await scheduler.run("test-model", lambda: "stream", estimated_tokens=10, hold_slot=True)
+        held = limiter.in_flight
+        release()
+        release()
+        return result, held, limiter.in_flight
+
+    assert asyncio.run(scenario()) == ("stream", 1, 0)
+
+
+def test_stream_releases_the_slot_after_the_response_is_read(monkeypatch):
+    monkeypatch.setattr(settings, "USE_MOCK_DATA", False)
+    may_finish = threading.Event()
+
+    class FakeStream:
+        def __iter__(self):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="第一段"))])
+            may_finish.wait(5)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="第二段"))])
+
+        def close(self):
+            may_finish.set()
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: FakeStream())))
+    monkeypatch.setattr(OpenAIClient, "_get_client", lambda: client)
+    monkeypatch.setattr(llm_scheduler, "scheduler", llm_scheduler.LLMScheduler())
+    limiter = llm_scheduler.scheduler.limiter(settings.OPENAI_API_MODEL)
+
+    async def scenario():
+        pieces, held = [], None
+        async for piece in OpenAIClient.stream_chat_completion([{"role": "user", "content": "你好"}]):
+            if not pieces:
+                # 读取线程还在等待后续内容，槽位仍被占用
+                held = limiter.in_flight
+                may_finish.set()
+            pieces.append(piece)
+        return pieces, held, limiter.in_flight
+
+    assert asyncio.run(scenario()) == (["第一段", "第二段"], 1, 0)
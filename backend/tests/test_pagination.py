@@ -0,0 +1,59 @@
+import base64
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+
+from app.core.pagination import decode_cursor, encode_cursor, keyset_after, next_cursor, parse_fields
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor([42, "第十章"])
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 2) == [42, "第十章"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-base64!!",
+    encode_cursor([1, 2]),
+    # 不是列表的JSON
+    base64.urlsafe_b64encode(b'{"id":1}').decode("ascii"),
+])
+def test_invalid_cursor_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 1)
+
+
+def test_parse_fields():
+    assert parse_fields(None, ["id", "title"]) is None
+    assert parse_fields(" title,id,title ", ["id", "title"]) == ["title", "id"]
+    with pytest.raises(ValueError):
+        parse_fields("content", ["id", "title"])
+
+
+def test_keyset_pages_cover_every_row_once(db):
+    from app.models import novel
+
+    db_novel = novel.Novel(title="测试小说", author="佚名")
+    db.add(db_novel)
+    db.flush()
+    # 章节序号重复时由ID决定顺序
+    for number in (1, 2, 2, 3, 4):
+        db.add(novel.Chapter(novel_id=db_novel.id, number=number, title=f"第{number}章", content=""))
+    db.commit()
+
+    key_fields = ["number", "id"]
+    seen, cursor = [], None
+    while True:
+        query = db.query(novel.Chapter).filter(novel.Chapter.novel_id == db_novel.id)
+        if cursor:
+            query = query.filter(keyset_after(
+                [novel.Chapter.number, novel.Chapter.id], decode_cursor(cursor, len(key_fields))
+            ))
+        rows = query.order_by(novel.Chapter.number, novel.Chapter.id).limit(2).all()
+        seen += [(row.number, row.id) for row in rows]
+        cursor = next_cursor(rows, 2, key_fields)
+        if cursor is None:
+            break
+    assert seen == sorted(seen) and len(seen) == 5 and len(set(seen)) == 5
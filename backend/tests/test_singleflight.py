@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("fastapi")
+
+from app.core.singleflight import SingleFlight
+
+
+def test_identical_requests_share_one_run():
+    calls = []
+
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def analyze():
+            calls.append(1)
+            await release.wait()
+            return {"characters": 3}
+
+        waiters = [asyncio.ensure_future(flight.do(("characters", 1), analyze)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        # 完成后再次请求重新执行
+        results.append(await flight.do(("characters", 1), analyze))
+        return results
+
+    assert asyncio.run(scenario()) == [{"characters": 3}] * 4
+    assert len(calls) == 2
+
+
+def test_errors_reach_every_waiter():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0)
+            raise ValueError("小说不存在")
+
+        return await asyncio.gather(*(flight.do("key", fail) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [str(error) for error in results] == ["小说不存在", "小说不存在"]
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_run():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def analyze():
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("key", analyze))
+        second = asyncio.ensure_future(flight.do("key", analyze))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        return await second, first.cancelled()
+
+    assert asyncio.run(scenario()) == ("done", True)
+
+
+def test_different_keys_with_the_same_exclusive_key_run_one_at_a_time():
+    async def scenario():
+        flight = SingleFlight()
+        running = {1: 0, 2: 0}
+        peak = {1: 0, 2: 0, "total": 0}
+
+        def analyze(novel_id):
+            async def run():
+                running[novel_id] += 1
+                peak[novel_id] = max(peak[novel_id], running[novel_id])
+                peak["total"] = max(peak["total"], running[1] + running[2])
+                await asyncio.sleep(0.01)
+                running[novel_id] -= 1
+            return run
+
+        await asyncio.gather(
+            flight.do(("analyze", 1), analyze(1), ("characters", 1)),
+            flight.do(("analyze", 1, "force"), analyze(1), ("characters", 1)),
+            flight.do(("analyze", 2), analyze(2), ("characters", 2)),
+        )
+        return peak
+
+    # 同一小说的两个操作依次执行，另一部小说的操作可以与之并行
+    assert asyncio.run(scenario()) == {1: 1, 2: 1, "total": 2}
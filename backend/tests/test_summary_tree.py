@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+
+from app.core.config import settings
+from app.core.openai_client import OpenAIClient
+from app.models import novel
+from app.services import novel_service, summary_service
+
+
+@pytest.fixture
+def summarized(db, monkeypatch):
+    """五章的小说，每两章一个情节段，模型调用替换为返回输入长度的假摘要"""
+    monkeypatch.setattr(settings, "SUMMARY_ARC_SIZE", 2)
+    calls = []
+
+    async def summarize_text(text, instruction, max_tokens=None):
+        calls.append(instruction)
+        return f"摘要{len(text)}"
+
+    monkeypatch.setattr(OpenAIClient, "summarize_text", summarize_text)
+    db_novel = novel.Novel(title="测试小说", author="佚名")
+    db.add(db_novel)
+    db.commit()
+    db.add_all([
+        novel.Chapter(novel_id=db_novel.id, number=number, title=f"第{number}章", content="正文" * number)
+        for number in range(1, 6)
+    ])
+    db.commit()
+    return db_novel.id, calls
+
+
+def build(db, novel_id):
+    return asyncio.run(summary_service.build_summary_tree(db, novel_id))
+
+
+def test_build_and_reuse(db, summarized):
+    novel_id, calls = summarized
+    stats = build(db, novel_id)
+    # 5个章节摘要、3个情节段摘要和1个全书梗概
+    assert (stats["chapters"], stats["levels"], stats["generated"], stats["reused"]) == (5, 3, 9, 0)
+    assert len(calls) == 9
+
+    tree = summary_service.get_summary_tree(db, novel_id)
+    assert tree["up_to_date"]
+    root = summary_service.get_root_node(db, novel_id)
+    assert (root.level, root.position, root.start_number, root.end_number) == (2, summary_service.ROOT_POSITION, 1, 5)
+    assert [node["position"] for node in tree["nodes"] if node["level"] == summary_service.ARC_LEVEL] == [1, 2, 3]
+
+    stats = build(db, novel_id)
+    assert (stats["generated"], stats["reused"], stats["removed"]) == (0, 9, 0)
+    assert len(calls) == 9
+
+
+def test_changed_chapter_regenerates_its_ancestors(db, summarized):
+    novel_id, calls = summarized
+    build(db, novel_id)
+
+    chapter = db.query(novel.Chapter).filter(novel.Chapter.novel_id == novel_id, novel.Chapter.number == 5).one()
+    chapter.content = "新的正文"
+    novel_service.bump_content_version(db, novel_id)
+    db.commit()
+    # 章节变化后旧摘要不再用作上下文
+    assert summary_service.build_compact_context(db, novel_id) is None
+
+    stats = build(db, novel_id)
+    # 第5章、第3个情节段和全书梗概重新生成
+    assert (stats["generated"], stats["reused"]) == (3, 6)
+    assert summary_service.build_compact_context(db, novel_id).startswith("【全书梗概】\n")
+
+
+def test_removed_chapters_drop_stale_nodes(db, summarized):
+    novel_id, calls = summarized
+    build(db, novel_id)
+
+    db.query(novel.Chapter).filter(novel.Chapter.novel_id == novel_id, novel.Chapter.number >= 4).delete()
+    novel_service.bump_content_version(db, novel_id)
+    db.commit()
+
+    stats = build(db, novel_id)
+    # 第4、5章和第3个情节段被删除，第2个情节段只剩第3章，需要重新生成
+    assert stats["removed"] == 3
+    assert stats["chapters"] == 3
+    tree = summary_service.get_summary_tree(db, novel_id)
+    assert [(node["level"], node["position"]) for node in tree["nodes"]] == [(0, 1), (0, 2), (0, 3), (1, 1), (1, 2), (2, -1)]
@@ -44,12 +44,12 @@ export default {
     })
   },
   
-  // 获取小说章节列表
-  getNovelChapters(novelId) {
+  // 获取小说章节列表，params可指定fields只返回部分字段、cursor分页
+  getNovelChapters(novelId, params = {}) {
     return request({
       url: `/chapters`,
       method: 'get',
-      params: { novel_id: novelId }
+      params: { novel_id: novelId, ...params }
     })
   },
   